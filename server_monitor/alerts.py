@@ -1,13 +1,18 @@
 from dataclasses import dataclass
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import Deque, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
 from enum import Enum
+from bisect import bisect_right
+from collections import deque
 import logging
+import time
 from datetime import datetime
+from hot_tier import hot_tier
+from parsers import unique_devices, DISK_DEVICE_FIELDS, SENSOR_DEVICE_FIELDS
 
 logger = logging.getLogger(__name__)
 
 if TYPE_CHECKING:
-    from notifications import EmailNotifier, WebhookNotifier
+    from notifications import NotificationDispatcher
 
 class AlertSeverity(Enum):
     LOW = "low"
@@ -33,6 +38,8 @@ class AlertRule:
     severity: AlertSeverity
     enabled: bool = True
     description: str = ""
+    for_duration: float = 0.0  # 超过阈值持续多少秒后才触发
+    hysteresis: float = 0.0  # 触发后数值低于 阈值-hysteresis 才自动恢复
 
 @dataclass
 class Alert:
@@ -48,217 +55,253 @@ class Alert:
     acknowledged: bool = False
     acknowledged_by: Optional[str] = None
     acknowledged_at: Optional[datetime] = None
+    rule_name: str = ""
+    device: str = ""
+    status: str = "firing"  # firing / resolved
+    resolved_at: Optional[datetime] = None
+
+# 各类告警的消息模板
+ALERT_MESSAGES = {
+    AlertType.CPU_USAGE: "CPU usage is {value:.2f}% which exceeds threshold of {threshold}%",
+    AlertType.MEMORY_USAGE: "Memory usage is {value:.2f}% which exceeds threshold of {threshold}%",
+    AlertType.DISK_USAGE: "Disk usage on {device} is {value}% which exceeds threshold of {threshold}%",
+    AlertType.GPU_UTILIZATION: "GPU {device} utilization is {value}% which exceeds threshold of {threshold}%",
+    AlertType.TEMPERATURE: "Temperature sensor {device} is {value}°C which exceeds threshold of {threshold}°C",
+    AlertType.CUSTOM_COMMAND: "Custom command failed: {device}. Error: {error}",
+}
+
+# 可以从内存热层回溯持续时间的告警类型及其时序指标名（设备与告警的设备一致）
+ALERT_SERIES = {
+    AlertType.CPU_USAGE: 'cpu_percent',
+    AlertType.MEMORY_USAGE: 'memory_percent',
+    AlertType.DISK_USAGE: 'disk_percent',
+    AlertType.GPU_UTILIZATION: 'gpu_utilization',
+    AlertType.TEMPERATURE: 'temperature',
+}
+
+class CompiledRule:
+    """编译后的规则：预先计算触发值和恢复值"""
+    __slots__ = ('rule', 'fire_at', 'clear_below')
+
+    def __init__(self, rule: AlertRule):
+        self.rule = rule
+        if rule.alert_type == AlertType.CUSTOM_COMMAND:
+            # 自定义命令：失败记为1，成功记为0，只要失败就触发
+            self.fire_at = 1.0
+            self.clear_below = 1.0
+        else:
+            self.fire_at = rule.threshold_value
+            self.clear_below = rule.threshold_value - max(rule.hysteresis, 0.0)
+
+class RuleTable:
+    """同一告警类型的规则按触发值升序排列，二分查找出当前数值满足的所有规则"""
+    __slots__ = ('thresholds', 'rules')
+
+    def __init__(self, compiled: List[CompiledRule]):
+        compiled.sort(key=lambda c: c.fire_at)
+        self.thresholds = [c.fire_at for c in compiled]
+        self.rules = compiled
+
+    def matching(self, value: float) -> List[CompiledRule]:
+        return self.rules[:bisect_right(self.thresholds, value)]
+
+class RuleState:
+    """(服务器, 规则, 设备) 的告警状态"""
+    __slots__ = ('pending_since', 'last_seen', 'alert')
+
+    def __init__(self, now: float):
+        self.pending_since = now
+        self.last_seen = now
+        self.alert: Optional[Alert] = None
 
 class AlertManager:
     """告警管理器"""
-    def __init__(self):
+    def __init__(self, history_size: int = 1000):
         self.rules: List[AlertRule] = []
-        self.active_alerts: List[Alert] = []
-        self.history: List[Alert] = []
+        self.history: Deque[Alert] = deque(maxlen=history_size)
         self.alert_callbacks = []  # 用于通知回调函数
 
+        # 按告警类型编译的规则表
+        self._tables: Dict[AlertType, RuleTable] = {}
+        self._compiled: Dict[str, CompiledRule] = {}
+        # (服务器, 规则名, 设备) -> 状态
+        self._states: Dict[Tuple[str, str, str], RuleState] = {}
+        # (服务器, 告警类型, 设备) -> 处于等待或触发状态的规则名，用于判断恢复
+        self._open: Dict[Tuple[str, AlertType, str], Set[str]] = {}
+        # 告警ID -> 活跃告警
+        self._active_by_id: Dict[str, Alert] = {}
+
+    @property
+    def active_alerts(self) -> List[Alert]:
+        return list(self._active_by_id.values())
+
     def add_rule(self, rule: AlertRule):
-        """添加告警规则"""
+        """添加告警规则（同名规则会被替换）"""
+        self.rules = [r for r in self.rules if r.name != rule.name]
         self.rules.append(rule)
+        self._compile()
         logger.info(f"Added alert rule: {rule.name}")
 
     def remove_rule(self, rule_name: str):
-        """移除告警规则"""
+        """移除告警规则，并清除该规则的告警状态"""
         self.rules = [rule for rule in self.rules if rule.name != rule_name]
+        self._compile()
+        for key in [key for key in self._states if key[1] == rule_name]:
+            state = self._states.pop(key)
+            if state.alert is not None:
+                self._active_by_id.pop(state.alert.id, None)
+        for names in self._open.values():
+            names.discard(rule_name)
         logger.info(f"Removed alert rule: {rule_name}")
 
-    def evaluate_metrics(self, server_name: str, metrics_data: Dict):
-        """评估指标并触发告警"""
-        # 检查CPU使用率
-        cpu_percent = metrics_data.get('system_resources', {}).get('cpu_percent')
-        if cpu_percent is not None:
-            self._check_cpu_usage(server_name, cpu_percent)
-
-        # 检查内存使用率
-        memory_used = metrics_data.get('system_resources', {}).get('memory_used')
-        memory_total = metrics_data.get('system_resources', {}).get('memory_total')
-        if memory_used is not None and memory_total is not None and memory_total > 0:
-            memory_percent = (memory_used / memory_total) * 100
-            self._check_memory_usage(server_name, memory_percent)
-
-        # 检查磁盘使用率
-        disk_info = metrics_data.get('system_resources', {}).get('disk_info', [])
-        if disk_info is not None:
-            for disk in disk_info:
-                if 'percent' in disk:
-                    self._check_disk_usage(server_name, disk['percent'], disk.get('mount_point', 'unknown'))
-
-        # 检查GPU使用率
-        gpu_info = metrics_data.get('gpu_info', [])
-        if gpu_info is not None:
-            for gpu in gpu_info:
-                if 'utilization' in gpu:
-                    self._check_gpu_utilization(server_name, gpu['utilization'], gpu.get('index', 'unknown'))
-
-        # 检查温度
-        temp_info = metrics_data.get('system_resources', {}).get('hardware_temp_info', [])
-        if temp_info is not None:
-            for temp in temp_info:
-                if 'temperature' in temp:
-                    self._check_temperature(server_name, temp['temperature'], temp.get('sensor_name', 'unknown'))
-
-        # 检查自定义命令
-        custom_commands = metrics_data.get('system_resources', {}).get('custom_command_results', [])
-        if custom_commands is not None:
-            for cmd_result in custom_commands:
-                if not cmd_result.get('success', True):
-                    self._check_custom_command_failure(server_name, cmd_result)
-
-    def _check_cpu_usage(self, server_name: str, cpu_percent: float):
-        """检查CPU使用率"""
-        for rule in self.rules:
-            if rule.alert_type == AlertType.CPU_USAGE and rule.enabled:
-                if cpu_percent >= rule.threshold_value:
-                    alert = Alert(
-                        id=f"cpu_{server_name}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.CPU_USAGE,
-                        message=f"CPU usage is {cpu_percent:.2f}% which exceeds threshold of {rule.threshold_value}%",
-                        severity=rule.severity,
-                        current_value=cpu_percent,
-                        threshold_value=rule.threshold_value,
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _check_memory_usage(self, server_name: str, memory_percent: float):
-        """检查内存使用率"""
-        for rule in self.rules:
-            if rule.alert_type == AlertType.MEMORY_USAGE and rule.enabled:
-                if memory_percent >= rule.threshold_value:
-                    alert = Alert(
-                        id=f"memory_{server_name}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.MEMORY_USAGE,
-                        message=f"Memory usage is {memory_percent:.2f}% which exceeds threshold of {rule.threshold_value}%",
-                        severity=rule.severity,
-                        current_value=memory_percent,
-                        threshold_value=rule.threshold_value,
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _check_disk_usage(self, server_name: str, disk_percent: float, mount_point: str):
-        """检查磁盘使用率"""
-        for rule in self.rules:
-            if rule.alert_type == AlertType.DISK_USAGE and rule.enabled:
-                if disk_percent >= rule.threshold_value:
-                    alert = Alert(
-                        id=f"disk_{server_name}_{mount_point}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.DISK_USAGE,
-                        message=f"Disk usage on {mount_point} is {disk_percent}% which exceeds threshold of {rule.threshold_value}%",
-                        severity=rule.severity,
-                        current_value=disk_percent,
-                        threshold_value=rule.threshold_value,
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _check_gpu_utilization(self, server_name: str, gpu_util: int, gpu_index: str):
-        """检查GPU使用率"""
-        for rule in self.rules:
-            if rule.alert_type == AlertType.GPU_UTILIZATION and rule.enabled:
-                if gpu_util >= rule.threshold_value:
-                    alert = Alert(
-                        id=f"gpu_{server_name}_{gpu_index}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.GPU_UTILIZATION,
-                        message=f"GPU {gpu_index} utilization is {gpu_util}% which exceeds threshold of {rule.threshold_value}%",
-                        severity=rule.severity,
-                        current_value=gpu_util,
-                        threshold_value=rule.threshold_value,
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _check_temperature(self, server_name: str, temperature: float, sensor_name: str):
-        """检查温度"""
-        for rule in self.rules:
-            if rule.alert_type == AlertType.TEMPERATURE and rule.enabled:
-                if temperature >= rule.threshold_value:
-                    alert = Alert(
-                        id=f"temp_{server_name}_{sensor_name}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.TEMPERATURE,
-                        message=f"Temperature sensor {sensor_name} is {temperature}°C which exceeds threshold of {rule.threshold_value}°C",
-                        severity=rule.severity,
-                        current_value=temperature,
-                        threshold_value=rule.threshold_value,
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _check_custom_command_failure(self, server_name: str, cmd_result: Dict):
-        """检查自定义命令失败"""
+    def min_threshold(self, alert_type: AlertType) -> Optional[float]:
+        """该类型已启用规则中最低的触发值，没有规则时返回None"""
+        table = self._tables.get(alert_type)
+        return table.thresholds[0] if table is not None and table.thresholds else None
+
+    def _compile(self):
+        """将启用的规则编译为按告警类型索引的查找表"""
+        by_type: Dict[AlertType, List[CompiledRule]] = {}
+        self._compiled = {}
         for rule in self.rules:
-            if rule.alert_type == AlertType.CUSTOM_COMMAND and rule.enabled:
-                # 对于自定义命令失败类型的告警，只要命令失败就触发
-                if not cmd_result.get('success', True):
-                    alert = Alert(
-                        id=f"custom_cmd_{server_name}_{cmd_result.get('command', 'unknown')}_{datetime.utcnow().timestamp()}",
-                        server_name=server_name,
-                        alert_type=AlertType.CUSTOM_COMMAND,
-                        message=f"Custom command failed: {cmd_result.get('command', 'unknown')}. Error: {cmd_result.get('error_message', 'Unknown error')}",
-                        severity=rule.severity,
-                        current_value=0,  # 对于失败的命令，当前值设为0
-                        threshold_value=0,  # 对于失败的命令，阈值设为0
-                        timestamp=datetime.utcnow()
-                    )
-                    self._trigger_alert(alert)
-
-    def _trigger_alert(self, alert: 'Alert'):
-        """触发告警"""
-        # 检查是否已存在相同的活跃告警
-        existing_alert = next(
-            (a for a in self.active_alerts
-             if a.server_name == alert.server_name
-             and a.alert_type == alert.alert_type
-             and a.current_value == alert.current_value),
-            None
-        )
+            if rule.enabled:
+                compiled = CompiledRule(rule)
+                self._compiled[rule.name] = compiled
+                by_type.setdefault(rule.alert_type, []).append(compiled)
+        self._tables = {alert_type: RuleTable(rules) for alert_type, rules in by_type.items()}
+
+    @staticmethod
+    def _extract_values(metrics_data: Dict) -> List[Tuple[AlertType, str, float, Optional[Dict]]]:
+        """一次遍历采集结果，提取所有可告警的数值: [(告警类型, 设备, 数值, 附加信息)]"""
+        values = []
+        system_resources = metrics_data.get('system_resources') or {}
+
+        cpu_percent = system_resources.get('cpu_percent')
+        if cpu_percent is not None:
+            values.append((AlertType.CPU_USAGE, '', cpu_percent, None))
 
-        if existing_alert:
-            # 如果已存在相同告警，不重复触发
-            return
+        memory_used = system_resources.get('memory_used')
+        memory_total = system_resources.get('memory_total')
+        if memory_used is not None and memory_total:
+            values.append((AlertType.MEMORY_USAGE, '', (memory_used / memory_total) * 100, None))
 
-        logger.warning(f"Triggering alert: {alert.message}")
+        # 设备键与时序序列一致（同名的挂载点、传感器各自唯一）
+        disks = system_resources.get('disk_info') or []
+        for disk, device in zip(disks, unique_devices(disks, DISK_DEVICE_FIELDS)):
+            if disk.get('percent') is not None:
+                values.append((AlertType.DISK_USAGE, device, disk['percent'], None))
 
-        # 添加到活跃告警列表
-        self.active_alerts.append(alert)
+        for gpu in metrics_data.get('gpu_info') or []:
+            if gpu.get('utilization') is not None:
+                values.append((AlertType.GPU_UTILIZATION, str(gpu.get('index', 'unknown')), gpu['utilization'], None))
 
-        # 添加到历史记录
-        self.history.append(alert)
+        temps = system_resources.get('hardware_temp_info') or []
+        for temp, device in zip(temps, unique_devices(temps, SENSOR_DEVICE_FIELDS)):
+            if temp.get('temperature') is not None:
+                values.append((AlertType.TEMPERATURE, device, temp['temperature'], None))
 
-        # 获取通知器实例
-        try:
-            email_notifier, webhook_notifier = get_notifiers()
+        for cmd_result in system_resources.get('custom_command_results') or []:
+            failed = not cmd_result.get('success', True)
+            values.append((AlertType.CUSTOM_COMMAND, cmd_result.get('command', 'unknown'), 1.0 if failed else 0.0,
+                           {'error': cmd_result.get('error_message', 'Unknown error')}))
 
-            # 发送邮件通知
-            try:
-                email_notifier.send_alert_email(alert)
-            except Exception as e:
-                logger.error(f"Error sending email notification: {e}")
+        return values
 
-            # 发送Webhook通知 - 在后台任务中执行
-            try:
-                import asyncio
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 如果事件循环正在运行，创建任务
-                    loop.create_task(self._send_webhook_notification(alert, webhook_notifier))
-                else:
-                    # 如果事件循环未运行，直接运行
-                    asyncio.run(self._send_webhook_notification(alert, webhook_notifier))
-            except Exception as e:
-                logger.error(f"Error scheduling webhook notification: {e}")
+    def evaluate_metrics(self, server_name: str, metrics_data: Dict):
+        """评估指标并触发/恢复告警（每个数值只查找同类型的规则表）"""
+        timestamp = metrics_data.get('timestamp')
+        now = timestamp if isinstance(timestamp, (int, float)) else time.time()
+
+        for alert_type, device, value, extra in self._extract_values(metrics_data):
+            table = self._tables.get(alert_type)
+            open_key = (server_name, alert_type, device)
+            open_rules = self._open.get(open_key)
+            if table is None and not open_rules:
+                continue
+
+            matched_names = set()
+            for compiled in (table.matching(value) if table is not None else []):
+                rule = compiled.rule
+                matched_names.add(rule.name)
+                key = (server_name, rule.name, device)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = RuleState(now)
+                    if rule.for_duration > 0 and alert_type in ALERT_SERIES:
+                        # 新规则或调低阈值时，内存热层中已持续超过阈值的时间也计入 for_duration
+                        state.pending_since = hot_tier.breach_start(
+                            (server_name, ALERT_SERIES[alert_type], device), compiled.fire_at, now)
+                    open_rules = self._open.setdefault(open_key, set())
+                    open_rules.add(rule.name)
+                state.last_seen = now
+
+                if state.alert is not None:
+                    state.alert.current_value = value
+                elif now - state.pending_since >= rule.for_duration:
+                    state.alert = self._fire(server_name, rule, device, value, extra)
+
+            # 不再满足触发条件的规则：等待中的直接取消，已触发的低于恢复值时自动恢复
+            if open_rules:
+                for rule_name in list(open_rules - matched_names):
+                    key = (server_name, rule_name, device)
+                    state = self._states.get(key)
+                    compiled = self._compiled.get(rule_name)
+                    if state is None or compiled is None:
+                        open_rules.discard(rule_name)
+                        continue
+                    state.last_seen = now
+                    if state.alert is None:
+                        del self._states[key]
+                        open_rules.discard(rule_name)
+                    elif value < compiled.clear_below:
+                        self._resolve(state.alert, value)
+                        del self._states[key]
+                        open_rules.discard(rule_name)
+                    else:
+                        # 处于滞回区间内，保持触发状态
+                        state.alert.current_value = value
+
+    def _fire(self, server_name: str, rule: AlertRule, device: str, value: float, extra: Optional[Dict]) -> Alert:
+        """生成并触发告警"""
+        fired_at = datetime.utcnow()
+        message = ALERT_MESSAGES.get(rule.alert_type, "{value} exceeds threshold of {threshold}").format(
+            value=value, threshold=rule.threshold_value, device=device, **(extra or {})
+        )
+        alert = Alert(
+            id=f"{rule.alert_type.value}_{server_name}_{device}_{fired_at.timestamp()}".replace(' ', '_'),
+            server_name=server_name,
+            alert_type=rule.alert_type,
+            message=message,
+            severity=rule.severity,
+            current_value=value,
+            threshold_value=rule.threshold_value,
+            timestamp=fired_at,
+            rule_name=rule.name,
+            device=device
+        )
+        self._trigger_alert(alert)
+        return alert
+
+    def _resolve(self, alert: Alert, value: float):
+        """自动恢复告警"""
+        alert.status = "resolved"
+        alert.resolved_at = datetime.utcnow()
+        alert.current_value = value
+        self._active_by_id.pop(alert.id, None)
+        logger.info(f"Alert resolved: {alert.message}")
+
+    def _trigger_alert(self, alert: Alert):
+        """触发告警"""
+        logger.warning(f"Triggering alert: {alert.message}")
+
+        self._active_by_id[alert.id] = alert
+        self.history.append(alert)
+
+        # 通知只放入分发队列，由后台任务合并发送，不阻塞告警评估
+        try:
+            get_notification_dispatcher().submit(alert)
         except Exception as e:
-            logger.error(f"Error getting notifiers: {e}")
+            logger.error(f"Error queueing alert notification: {e}")
 
         # 调用所有注册的回调函数
         for callback in self.alert_callbacks:
@@ -267,29 +310,17 @@ class AlertManager:
             except Exception as e:
                 logger.error(f"Error in alert callback: {e}")
 
-    async def _send_webhook_notification(self, alert: 'Alert', webhook_notifier: 'WebhookNotifier'):
-        """异步发送Webhook通知"""
-        try:
-            await webhook_notifier.send_alert_webhook(alert)
-        except Exception as e:
-            logger.error(f"Error sending webhook notification: {e}")
-
     def acknowledge_alert(self, alert_id: str, user: str = "system"):
-        """确认告警"""
-        for alert in self.active_alerts:
-            if alert.id == alert_id:
-                alert.acknowledged = True
-                alert.acknowledged_by = user
-                alert.acknowledged_at = datetime.utcnow()
-                
-                # 从活跃告警中移除，移到历史记录
-                self.active_alerts.remove(alert)
-                self.history.append(alert)
-                
-                logger.info(f"Alert {alert_id} acknowledged by {user}")
-                return True
-        
-        return False
+        """确认告警（告警保持活跃，直到指标恢复后自动解除）"""
+        alert = self._active_by_id.get(alert_id)
+        if alert is None:
+            return False
+
+        alert.acknowledged = True
+        alert.acknowledged_by = user
+        alert.acknowledged_at = datetime.utcnow()
+        logger.info(f"Alert {alert_id} acknowledged by {user}")
+        return True
 
     def register_callback(self, callback_func):
         """注册告警回调函数"""
@@ -300,36 +331,57 @@ class AlertManager:
         return self.active_alerts
 
     def get_alert_history(self, limit: int = 100) -> List[Alert]:
-        """获取告警历史"""
-        return self.history[-limit:]
-
-    def clear_resolved_alerts(self):
-        """清除已解决的告警"""
-        # 这里可以实现逻辑来清除那些指标已回到正常范围的告警
-        pass
-
-def get_notifiers():
-    """延迟导入通知器以避免循环导入"""
-    from notifications import email_notifier, webhook_notifier
-    return email_notifier, webhook_notifier
+        """获取告警历史（最多保留 history_size 条）"""
+        history = list(self.history)
+        return history[-limit:] if limit else history
+
+    def clear_resolved_alerts(self, max_age: float = 3600, now: Optional[float] = None) -> int:
+        """
+        清理长时间未收到数据的告警状态（如设备已移除、服务器已下线），对应的活跃告警标记为已恢复
+        由采集调度器定期调用，返回清理的状态数
+        """
+        now = time.time() if now is None else now
+        stale = [key for key, state in self._states.items() if now - state.last_seen > max_age]
+        for key in stale:
+            server_name, rule_name, device = key
+            state = self._states.pop(key)
+            if state.alert is not None:
+                self._resolve(state.alert, state.alert.current_value)
+                open_key = (server_name, state.alert.alert_type, device)
+            else:
+                compiled = self._compiled.get(rule_name)
+                open_key = (server_name, compiled.rule.alert_type, device) if compiled else None
+            open_rules = self._open.get(open_key)
+            if open_rules is not None:
+                open_rules.discard(rule_name)
+                if not open_rules:
+                    del self._open[open_key]
+        if stale:
+            logger.info(f"Cleared {len(stale)} stale alert states")
+        return len(stale)
+
+def get_notification_dispatcher() -> 'NotificationDispatcher':
+    """延迟导入通知分发器以避免循环导入"""
+    from notifications import notification_dispatcher
+    return notification_dispatcher
 
 # 创建全局告警管理器实例
 alert_manager = AlertManager()
 
 # 预设一些默认告警规则
 default_rules = [
-    AlertRule("High CPU Usage", AlertType.CPU_USAGE, 80.0, AlertSeverity.HIGH, description="CPU usage exceeds 80%"),
-    AlertRule("Critical CPU Usage", AlertType.CPU_USAGE, 95.0, AlertSeverity.CRITICAL, description="CPU usage exceeds 95%"),
-    AlertRule("High Memory Usage", AlertType.MEMORY_USAGE, 85.0, AlertSeverity.HIGH, description="Memory usage exceeds 85%"),
-    AlertRule("Critical Memory Usage", AlertType.MEMORY_USAGE, 95.0, AlertSeverity.CRITICAL, description="Memory usage exceeds 95%"),
-    AlertRule("High Disk Usage", AlertType.DISK_USAGE, 85.0, AlertSeverity.HIGH, description="Disk usage exceeds 85%"),
-    AlertRule("Critical Disk Usage", AlertType.DISK_USAGE, 95.0, AlertSeverity.CRITICAL, description="Disk usage exceeds 95%"),
-    AlertRule("High GPU Utilization", AlertType.GPU_UTILIZATION, 90.0, AlertSeverity.HIGH, description="GPU utilization exceeds 90%"),
-    AlertRule("High Temperature", AlertType.TEMPERATURE, 75.0, AlertSeverity.HIGH, description="Temperature exceeds 75°C"),
-    AlertRule("Critical Temperature", AlertType.TEMPERATURE, 85.0, AlertSeverity.CRITICAL, description="Temperature exceeds 85°C"),
+    AlertRule("High CPU Usage", AlertType.CPU_USAGE, 80.0, AlertSeverity.HIGH, description="CPU usage exceeds 80% for 1 minute", for_duration=60, hysteresis=5),
+    AlertRule("Critical CPU Usage", AlertType.CPU_USAGE, 95.0, AlertSeverity.CRITICAL, description="CPU usage exceeds 95% for 30 seconds", for_duration=30, hysteresis=5),
+    AlertRule("High Memory Usage", AlertType.MEMORY_USAGE, 85.0, AlertSeverity.HIGH, description="Memory usage exceeds 85%", for_duration=30, hysteresis=3),
+    AlertRule("Critical Memory Usage", AlertType.MEMORY_USAGE, 95.0, AlertSeverity.CRITICAL, description="Memory usage exceeds 95%", hysteresis=2),
+    AlertRule("High Disk Usage", AlertType.DISK_USAGE, 85.0, AlertSeverity.HIGH, description="Disk usage exceeds 85%", hysteresis=2),
+    AlertRule("Critical Disk Usage", AlertType.DISK_USAGE, 95.0, AlertSeverity.CRITICAL, description="Disk usage exceeds 95%", hysteresis=1),
+    AlertRule("High GPU Utilization", AlertType.GPU_UTILIZATION, 90.0, AlertSeverity.HIGH, description="GPU utilization exceeds 90% for 5 minutes", for_duration=300, hysteresis=10),
+    AlertRule("High Temperature", AlertType.TEMPERATURE, 75.0, AlertSeverity.HIGH, description="Temperature exceeds 75°C for 30 seconds", for_duration=30, hysteresis=3),
+    AlertRule("Critical Temperature", AlertType.TEMPERATURE, 85.0, AlertSeverity.CRITICAL, description="Temperature exceeds 85°C", hysteresis=3),
     AlertRule("Custom Command Failure", AlertType.CUSTOM_COMMAND, 0.0, AlertSeverity.MEDIUM, description="Custom command fails to execute")
 ]
 
 # 添加默认规则
 for rule in default_rules:
-    alert_manager.add_rule(rule)
\ No newline at end of file
+    alert_manager.add_rule(rule)
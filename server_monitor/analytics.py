@@ -1,221 +1,373 @@
-from db import get_server_metrics
-from datetime import datetime, timedelta
-import statistics
-from typing import Dict, List, Any
+from rollup import rollup_manager, downsample, grid_step
+from tsdb import ts_store
+from datetime import datetime
+import numpy as np
+import time
+from typing import Dict, List, Any, Iterable, Tuple
+
+# 可视化接口返回的最大数据点数
+MAX_VISUALIZATION_POINTS = 500
+# 趋势分析读取的最大数据点数（超过时自动使用汇总层级）
+MAX_ANALYSIS_POINTS = 1000
+# 指数加权移动平均的平滑系数
+EWMA_ALPHA = 0.1
+# 变点检测：均值变化超过噪声标准差的倍数才视为变点
+CHANGE_POINT_SIGMA = 3.0
+# 变点两侧的最少点数
+CHANGE_POINT_MIN_SIZE = 10
+# 最多返回的变点数量
+MAX_CHANGE_POINTS = 5
+# 线性回归得到的窗口内总变化小于该比例的标准差时视为平稳
+TREND_STABLE_RATIO = 0.5
+
+# 分析报告中的各项指标: 字段名 -> (指标名, 标签, 是否按设备细分)
+ANALYSIS_METRICS = {
+    "cpu_analysis": ('cpu_percent', "CPU", False),
+    "memory_analysis": ('memory_used', "memory", False),
+    "gpu_analysis": ('gpu_utilization', "GPU", True),
+    "disk_analysis": ('disk_percent', "disk", True),
+    "temperature_analysis": ('temperature', "temperature", True)
+}
+
+
+class SeriesWindow:
+    """一条序列在分析窗口内的数据（NumPy数组）"""
+    __slots__ = ('timestamps', 'values', 'counts', 'mins', 'maxs', 'resolution')
+
+    def __init__(self, series: Dict[str, List]):
+        values = np.array([np.nan if v is None else v for v in series['values']], dtype=float)
+        valid = ~np.isnan(values)
+        self.timestamps = np.asarray(series['timestamps'], dtype=float)[valid]
+        self.values = values[valid]
+        self.counts = np.asarray(series['count'], dtype=float)[valid]
+        self.mins = np.asarray(series['min'], dtype=float)[valid]
+        self.maxs = np.asarray(series['max'], dtype=float)[valid]
+        self.resolution = series['tier']
+
+    def __len__(self):
+        return len(self.values)
+
+
+def load_windows(server_names: List[str], metrics: Iterable[str], hours: int, device_metrics: Iterable[str] = (),
+                 max_points: int = MAX_ANALYSIS_POINTS) -> Dict[Tuple[str, str, str], SeriesWindow]:
+    """
+    一次读取多台服务器、多个指标的分析窗口：metrics 的主机级序列和 device_metrics 的所有设备级序列
+    所有序列使用同一层级，通过一次 scan 读取，不再逐台服务器、逐个设备查询
+    返回: {序列键: SeriesWindow}
+    """
+    end_time = time.time()
+    series = ts_store.match_series(list(metrics), server_names, None)
+    device_metrics = list(device_metrics)
+    if device_metrics:
+        series.update(ts_store.match_series(device_metrics, server_names, ['*']))
+    data = rollup_manager.scan_auto(series, end_time - hours * 3600, end_time, max_points)
+    return {key: SeriesWindow(series_data) for key, series_data in data.items()}
+
+
+def ewma(values: np.ndarray, alpha: float = EWMA_ALPHA) -> float:
+    """最后一个点的指数加权移动平均（权重向量一次计算）"""
+    n = len(values)
+    weights = (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=float)
+    weights[1:] *= alpha  # 第一个点作为初始值保留 (1-alpha)^(n-1) 权重
+    return float(np.dot(weights, values))
+
+
+def regression_slope(timestamps: np.ndarray, values: np.ndarray) -> float:
+    """最小二乘线性回归斜率（每小时变化量）"""
+    if len(values) < 2:
+        return 0.0
+    x = (timestamps - timestamps[0]) / 3600.0
+    x_centered = x - x.mean()
+    denominator = np.dot(x_centered, x_centered)
+    if denominator == 0:
+        return 0.0
+    return float(np.dot(x_centered, values - values.mean()) / denominator)
+
+
+def detect_change_points(timestamps: np.ndarray, values: np.ndarray,
+                         sigma_threshold: float = CHANGE_POINT_SIGMA,
+                         min_size: int = CHANGE_POINT_MIN_SIZE,
+                         max_points: int = MAX_CHANGE_POINTS) -> List[Dict[str, Any]]:
+    """
+    均值变点检测（二分分割）
+    每个区间用前缀和一次算出所有切分位置的两侧均值差，取增益最大的位置；
+    均值差超过噪声标准差（由一阶差分的MAD稳健估计）的 sigma_threshold 倍才接受
+    """
+    n = len(values)
+    if n < 2 * min_size:
+        return []
+
+    diffs = np.diff(values)
+    noise = 1.4826 * np.median(np.abs(diffs - np.median(diffs))) / np.sqrt(2)
+    if noise == 0:
+        noise = np.std(values) or 1e-9
+
+    found = []
+    segments = [(0, n)]
+    while segments and len(found) < max_points:
+        lo, hi = segments.pop()
+        segment = values[lo:hi]
+        size = hi - lo
+        if size < 2 * min_size:
+            continue
+
+        prefix = np.cumsum(segment)
+        k = np.arange(min_size, size - min_size + 1)
+        left_mean = prefix[k - 1] / k
+        right_mean = (prefix[-1] - prefix[k - 1]) / (size - k)
+        gain = k * (size - k) / size * (left_mean - right_mean) ** 2
+        best = int(np.argmax(gain))
+        shift = right_mean[best] - left_mean[best]
+        if abs(shift) < sigma_threshold * noise:
+            continue
+
+        split = lo + int(k[best])
+        found.append({
+            "timestamp": datetime.fromtimestamp(timestamps[split]).isoformat(),
+            "before": round(float(left_mean[best]), 2),
+            "after": round(float(right_mean[best]), 2)
+        })
+        segments.append((lo, split))
+        segments.append((split, hi))
+
+    found.sort(key=lambda point: point["timestamp"])
+    return found
+
+
+def compute_statistics(window: SeriesWindow) -> Dict[str, Any]:
+    """对一个窗口一次性计算全部统计量"""
+    values = window.values
+    counts = window.counts
+    total_count = float(counts.sum())
+
+    # 汇总层级的每个点代表多个原始样本，按样本数加权
+    average = float(np.dot(values, counts) / total_count) if total_count else float(values.mean())
+    std = float(values.std())
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    slope = regression_slope(window.timestamps, values)
+
+    duration_hours = (window.timestamps[-1] - window.timestamps[0]) / 3600.0 if len(values) > 1 else 0.0
+    total_change = slope * duration_hours
+    if len(values) < 2 or abs(total_change) <= TREND_STABLE_RATIO * std:
+        trend = "stable"
+    else:
+        trend = "increasing" if total_change > 0 else "decreasing"
+
+    return {
+        "average": round(average, 2),
+        "min": float(window.mins.min()),
+        "max": float(window.maxs.max()),
+        "current": float(values[-1]),  # 最新值
+        "std": round(std, 2),
+        "percentiles": {
+            "p50": round(float(p50), 2),
+            "p90": round(float(p90), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2)
+        },
+        "ewma": round(ewma(values), 2),
+        "slope_per_hour": round(slope, 4),
+        "trend": trend,
+        "change_points": detect_change_points(window.timestamps, values),
+        "data_points": int(total_count),
+        "resolution": window.resolution
+    }
+
+
+def stack_windows(windows: List[SeriesWindow]) -> Dict[str, np.ndarray]:
+    """把多个窗口右对齐堆叠为二维数组（较短的窗口在前面补NaN），每行最后一列都是最新的点"""
+    width = max(len(window) for window in windows)
+    stacked = {}
+    for attr in ('timestamps', 'values', 'counts', 'mins', 'maxs'):
+        matrix = np.full((len(windows), width), np.nan)
+        for row, window in enumerate(windows):
+            if len(window):
+                matrix[row, width - len(window):] = getattr(window, attr)
+        stacked[attr] = matrix
+    return stacked
+
+
+def compute_device_statistics(windows: List[SeriesWindow]) -> List[Dict[str, Any]]:
+    """
+    多个非空窗口（如一台服务器的所有GPU）的概要统计，在堆叠的二维数组上按行一次计算
+    各字段与 compute_statistics 的同名字段相同
+    """
+    stacked = stack_windows(windows)
+    timestamps, values, counts = stacked['timestamps'], stacked['values'], stacked['counts']
+    rows = np.arange(len(windows))
+    lengths = np.array([len(window) for window in windows])
+    width = values.shape[1]
+
+    total_count = np.nansum(counts, axis=1)
+    means = np.nanmean(values, axis=1)
+    average = np.where(total_count > 0, np.nansum(values * counts, axis=1) / np.maximum(total_count, 1e-300), means)
+    std = np.nanstd(values, axis=1)
+    percentiles = np.nanpercentile(values, [50, 90, 95, 99], axis=1)
+
+    # 最小二乘斜率（每小时变化量）
+    x = (timestamps - timestamps[rows, width - lengths][:, None]) / 3600.0
+    x_centered = x - np.nanmean(x, axis=1, keepdims=True)
+    denominator = np.nansum(x_centered * x_centered, axis=1)
+    numerator = np.nansum(x_centered * (values - means[:, None]), axis=1)
+    slope = np.where((lengths > 1) & (denominator > 0), numerator / np.where(denominator > 0, denominator, 1.0), 0.0)
+
+    # 指数加权移动平均：每行第一个点保留 (1-alpha)^(n-1) 权重
+    weights = np.tile(EWMA_ALPHA * (1 - EWMA_ALPHA) ** np.arange(width - 1, -1, -1, dtype=float), (len(windows), 1))
+    weights[rows, width - lengths] = (1 - EWMA_ALPHA) ** (lengths - 1)
+    smoothed = np.nansum(weights * values, axis=1)
+
+    duration_hours = np.where(lengths > 1, (timestamps[:, -1] - timestamps[rows, width - lengths]) / 3600.0, 0.0)
+    total_change = slope * duration_hours
+    stable = (lengths < 2) | (np.abs(total_change) <= TREND_STABLE_RATIO * std)
+
+    mins = np.nanmin(stacked['mins'], axis=1)
+    maxs = np.nanmax(stacked['maxs'], axis=1)
+    results = []
+    for row in rows:
+        results.append({
+            "average": round(float(average[row]), 2),
+            "min": float(mins[row]),
+            "max": float(maxs[row]),
+            "current": float(values[row, -1]),
+            "percentiles": {name: round(float(percentiles[i, row]), 2)
+                            for i, name in enumerate(("p50", "p90", "p95", "p99"))},
+            "ewma": round(float(smoothed[row]), 2),
+            "slope_per_hour": round(float(slope[row]), 4),
+            "trend": "stable" if stable[row] else ("increasing" if total_change[row] > 0 else "decreasing")
+        })
+    return results
+
+
+def _device_sort_key(device: str):
+    return (0, int(device), '') if device.isdigit() else (1, 0, device)
+
+
+def _analyze_metrics(server_names: List[str], hours: int,
+                     metrics: Dict[str, Tuple[str, str, bool]]) -> Dict[str, Dict[str, Any]]:
+    """
+    一次读取多台服务器的多个指标（及其设备级序列）并计算统计信息
+    :param metrics: 字段名 -> (指标名, 标签, 是否按设备细分)，同 ANALYSIS_METRICS
+    返回: {服务器名: {字段名: 分析结果}}
+    """
+    windows = load_windows(server_names, {metric for metric, _, _ in metrics.values()}, hours,
+                           {metric for metric, _, per_device in metrics.values() if per_device})
+    device_windows: Dict[Tuple[str, str], List[Tuple[str, SeriesWindow]]] = {}
+    for (server_name, metric, device), window in windows.items():
+        if device and len(window):
+            device_windows.setdefault((server_name, metric), []).append((device, window))
+
+    reports = {}
+    for server_name in server_names:
+        report = reports[server_name] = {}
+        for field, (metric, label, per_device) in metrics.items():
+            window = windows.get((server_name, metric, ''))
+            if window is None or not len(window):
+                report[field] = {"error": f"No {label} data available"}
+                continue
+
+            analysis = compute_statistics(window)
+            devices = sorted(device_windows.get((server_name, metric), []), key=lambda item: _device_sort_key(item[0]))
+            if per_device and devices:
+                stats = compute_device_statistics([device_window for _, device_window in devices])
+                analysis["devices"] = {device: device_stats for (device, _), device_stats in zip(devices, stats)}
+            report[field] = analysis
+    return reports
+
+
+def _analyze_series(server_name: str, metric: str, hours: int, label: str,
+                    per_device: bool = False) -> Dict[str, Any]:
+    """读取单条序列（及其设备级序列）并计算统计信息"""
+    return _analyze_metrics([server_name], hours, {metric: (metric, label, per_device)})[server_name][metric]
+
 
 def analyze_cpu_trend(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
     """分析CPU使用率趋势"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=1000)
-    
-    if not metrics:
-        return {"error": "No data available"}
-    
-    cpu_values = [m['cpu_percent'] for m in metrics if m['cpu_percent'] is not None]
-    
-    if not cpu_values:
-        return {"error": "No CPU data available"}
-    
-    analysis = {
-        "average": round(statistics.mean(cpu_values), 2),
-        "min": min(cpu_values),
-        "max": max(cpu_values),
-        "current": cpu_values[0],  # 最新值
-        "trend": "increasing" if len(cpu_values) > 1 and cpu_values[0] > cpu_values[1] else "decreasing",
-        "data_points": len(cpu_values)
-    }
-    
-    return analysis
+    return _analyze_series(server_name, 'cpu_percent', hours, "CPU")
 
 def analyze_memory_trend(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
     """分析内存使用率趋势"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=1000)
-    
-    if not metrics:
-        return {"error": "No data available"}
-    
-    memory_values = [m['memory_used'] for m in metrics if m['memory_used'] is not None]
-    
-    if not memory_values:
-        return {"error": "No memory data available"}
-    
-    analysis = {
-        "average": round(statistics.mean(memory_values), 2),
-        "min": min(memory_values),
-        "max": max(memory_values),
-        "current": memory_values[0],  # 最新值
-        "trend": "increasing" if len(memory_values) > 1 and memory_values[0] > memory_values[1] else "decreasing",
-        "data_points": len(memory_values)
-    }
-    
-    return analysis
+    return _analyze_series(server_name, 'memory_used', hours, "memory")
 
 def analyze_gpu_trend(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
-    """分析GPU使用率趋势"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=1000)
-    
-    if not metrics:
-        return {"error": "No data available"}
-    
-    gpu_values = [m['gpu_utilization'] for m in metrics if m['gpu_utilization'] is not None]
-    
-    if not gpu_values:
-        return {"error": "No GPU data available"}
-    
-    analysis = {
-        "average": round(statistics.mean(gpu_values), 2),
-        "min": min(gpu_values),
-        "max": max(gpu_values),
-        "current": gpu_values[0],  # 最新值
-        "trend": "increasing" if len(gpu_values) > 1 and gpu_values[0] > gpu_values[1] else "decreasing",
-        "data_points": len(gpu_values)
-    }
-    
-    return analysis
+    """分析GPU使用率趋势（含逐GPU细分）"""
+    return _analyze_series(server_name, 'gpu_utilization', hours, "GPU", per_device=True)
 
 def analyze_disk_trend(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
-    """分析磁盘使用率趋势"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=1000)
-    
-    if not metrics:
-        return {"error": "No data available"}
-    
-    # 从磁盘信息中提取使用率
-    disk_usage_values = []
-    for m in metrics:
-        if m['disk_info']:
-            # 计算所有磁盘分区的平均使用率
-            total_usage = 0
-            count = 0
-            for disk in m['disk_info']:
-                if 'percent' in disk:
-                    total_usage += disk['percent']
-                    count += 1
-            if count > 0:
-                avg_usage = total_usage / count
-                disk_usage_values.append(avg_usage)
-    
-    if not disk_usage_values:
-        return {"error": "No disk data available"}
-    
-    analysis = {
-        "average": round(statistics.mean(disk_usage_values), 2),
-        "min": min(disk_usage_values),
-        "max": max(disk_usage_values),
-        "current": disk_usage_values[0],  # 最新值
-        "trend": "increasing" if len(disk_usage_values) > 1 and disk_usage_values[0] > disk_usage_values[1] else "decreasing",
-        "data_points": len(disk_usage_values)
-    }
-    
-    return analysis
+    """分析磁盘使用率趋势（所有分区的平均使用率，含逐挂载点细分）"""
+    return _analyze_series(server_name, 'disk_percent', hours, "disk", per_device=True)
 
 def analyze_temperature_trend(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
-    """分析温度趋势"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=1000)
-    
-    if not metrics:
-        return {"error": "No data available"}
-    
-    # 从硬件温度信息中提取温度值
-    temp_values = []
-    for m in metrics:
-        if m['hardware_temp_info']:
-            # 计算所有传感器的平均温度
-            total_temp = 0
-            count = 0
-            for temp_info in m['hardware_temp_info']:
-                if 'temperature' in temp_info:
-                    total_temp += temp_info['temperature']
-                    count += 1
-            if count > 0:
-                avg_temp = total_temp / count
-                temp_values.append(avg_temp)
-    
-    if not temp_values:
-        return {"error": "No temperature data available"}
-    
-    analysis = {
-        "average": round(statistics.mean(temp_values), 2),
-        "min": min(temp_values),
-        "max": max(temp_values),
-        "current": temp_values[0],  # 最新值
-        "trend": "increasing" if len(temp_values) > 1 and temp_values[0] > temp_values[1] else "decreasing",
-        "data_points": len(temp_values)
-    }
-    
-    return analysis
+    """分析温度趋势（所有传感器的平均温度，含逐传感器细分）"""
+    return _analyze_series(server_name, 'temperature', hours, "temperature", per_device=True)
 
 def get_comprehensive_analysis(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
-    """获取综合分析报告"""
+    """获取综合分析报告（所有序列一次读取）"""
     analysis = {
         "server_name": server_name,
         "analysis_period_hours": hours,
-        "timestamp": datetime.utcnow().isoformat(),
-        "cpu_analysis": analyze_cpu_trend(session, server_name, hours),
-        "memory_analysis": analyze_memory_trend(session, server_name, hours),
-        "gpu_analysis": analyze_gpu_trend(session, server_name, hours),
-        "disk_analysis": analyze_disk_trend(session, server_name, hours),
-        "temperature_analysis": analyze_temperature_trend(session, server_name, hours)
+        "timestamp": datetime.utcnow().isoformat()
     }
-    
+    analysis.update(_analyze_metrics([server_name], hours, ANALYSIS_METRICS)[server_name])
+
     return analysis
 
+def get_batch_analysis(session, server_names: List[str], hours: int = 24) -> Dict[str, Any]:
+    """批量获取多台服务器的综合分析报告（所有服务器的序列一次读取）"""
+    timestamp = datetime.utcnow().isoformat()
+    reports = _analyze_metrics(server_names, hours, ANALYSIS_METRICS)
+    return {
+        "analysis_period_hours": hours,
+        "timestamp": timestamp,
+        "servers": {
+            server_name: {
+                "server_name": server_name,
+                "analysis_period_hours": hours,
+                "timestamp": timestamp,
+                **reports[server_name]
+            }
+            for server_name in server_names
+        }
+    }
+
 def get_visualization_data(session, server_name: str, hours: int = 24) -> Dict[str, Any]:
     """获取用于可视化的数据"""
-    start_time = datetime.utcnow() - timedelta(hours=hours)
-    metrics = get_server_metrics(session, server_name, start_time=start_time, limit=500)  # 限制数据点数量以提高性能
-    
-    if not metrics:
+    series_names = {
+        "cpu_data": 'cpu_percent',
+        "memory_data": 'memory_used',
+        "gpu_data": 'gpu_utilization',
+        "disk_data": 'disk_percent',
+        "temperature_data": 'temperature'
+    }
+
+    end_time = time.time()
+    start_time = end_time - hours * 3600
+    # 每条序列只读取一次（按时间范围选择汇总层级，点数不超过上限）
+    series_list = {field: rollup_manager.query_auto(server_name, metric, start_time=start_time, end_time=end_time,
+                                                    max_points=MAX_VISUALIZATION_POINTS)
+                   for field, metric in series_names.items()}
+    all_timestamps = set()
+    for series in series_list.values():
+        all_timestamps.update(series['timestamps'])
+
+    if not all_timestamps:
         return {"error": "No data available"}
-    
+
+    # 各序列的原始时间戳不同时合并到同一时间网格，保证对齐后点数仍不超过上限且覆盖整个时间范围
+    if len(all_timestamps) > MAX_VISUALIZATION_POINTS:
+        step = grid_step(start_time, end_time, MAX_VISUALIZATION_POINTS)
+        series_list = {field: downsample(series, step) for field, series in series_list.items()}
+        all_timestamps = set()
+        for series in series_list.values():
+            all_timestamps.update(series['timestamps'])
+
+    series_maps = {field: dict(zip(series['timestamps'], series['values'])) for field, series in series_list.items()}
     # 按时间排序（从旧到新）
-    metrics.sort(key=lambda x: x['timestamp'])
-    
+    timestamps = sorted(all_timestamps)
+
     visualization_data = {
-        "timestamps": [m['timestamp'] for m in metrics],
-        "cpu_data": [m['cpu_percent'] if m['cpu_percent'] is not None else 0 for m in metrics],
-        "memory_data": [m['memory_used'] if m['memory_used'] is not None else 0 for m in metrics],
-        "gpu_data": [m['gpu_utilization'] if m['gpu_utilization'] is not None else 0 for m in metrics],
-        "disk_data": [],
-        "temperature_data": []
+        "timestamps": [datetime.fromtimestamp(ts).isoformat() for ts in timestamps]
     }
-    
-    # 处理磁盘数据 - 计算平均使用率
-    for m in metrics:
-        if m['disk_info']:
-            total_usage = 0
-            count = 0
-            for disk in m['disk_info']:
-                if 'percent' in disk:
-                    total_usage += disk['percent']
-                    count += 1
-            if count > 0:
-                avg_usage = total_usage / count
-                visualization_data['disk_data'].append(avg_usage)
-            else:
-                visualization_data['disk_data'].append(0)
-        else:
-            visualization_data['disk_data'].append(0)
-    
-    # 处理温度数据 - 计算平均温度
-    for m in metrics:
-        if m['hardware_temp_info']:
-            total_temp = 0
-            count = 0
-            for temp_info in m['hardware_temp_info']:
-                if 'temperature' in temp_info:
-                    total_temp += temp_info['temperature']
-                    count += 1
-            if count > 0:
-                avg_temp = total_temp / count
-                visualization_data['temperature_data'].append(avg_temp)
-            else:
-                visualization_data['temperature_data'].append(0)
-        else:
-            visualization_data['temperature_data'].append(0)
-    
-    return visualization_data
\ No newline at end of file
+    for field, value_map in series_maps.items():
+        visualization_data[field] = [value_map.get(ts, 0) for ts in timestamps]
+
+    return visualization_data
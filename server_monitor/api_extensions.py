@@ -110,14 +110,16 @@ async def get_system_health(current_user: User = Depends(get_current_active_user
 @router.get("/api/plugins/list")
 @require_permission(Permission.VIEW_PLUGINS)
 async def get_installed_plugins(current_user: User = Depends(get_current_active_user)):
-    """获取已安装的插件列表"""
+    """获取已安装的插件列表（含各插件的执行延迟、错误/超时统计和自动禁用状态）"""
     try:
         plugins_info = []
-        for plugin in plugin_manager.get_enabled_plugins():
+        for plugin in plugin_manager.get_initialized_plugins():
+            plugin_name = plugin.__class__.__name__
             plugins_info.append({
-                "name": plugin.__class__.__name__,
+                "name": plugin_name,
                 "initialized": plugin.initialized,
-                "metadata": plugin.metadata.__dict__ if plugin.metadata else None
+                "metadata": plugin.metadata.__dict__ if plugin.metadata else None,
+                "stats": plugin_manager.plugin_stats(plugin_name)
             })
 
         return {"plugins": plugins_info}
@@ -126,6 +128,15 @@ async def get_installed_plugins(current_user: User = Depends(get_current_active_
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/api/plugins/{plugin_name}/enable")
+@require_permission(Permission.MANAGE_PLUGINS)
+async def enable_plugin(plugin_name: str, current_user: User = Depends(get_current_active_user)):
+    """重新启用被自动禁用的插件"""
+    if not plugin_manager.enable_plugin(plugin_name):
+        raise HTTPException(status_code=404, detail=f"Plugin {plugin_name} not found")
+    return {"message": f"Plugin {plugin_name} enabled"}
+
+
 @router.post("/api/plugins/reload")
 @require_permission(Permission.MANAGE_PLUGINS)
 async def reload_plugins(current_user: User = Depends(get_current_active_user)):
@@ -209,23 +220,46 @@ async def get_servers_resources_comparison(current_user: User = Depends(get_curr
 
 @router.get("/api/stats/api")
 async def get_api_statistics(current_user: User = Depends(get_current_active_user)):
-    """获取API统计信息（简化版）"""
+    """获取API统计信息：请求数、活跃WebSocket连接、各路由平均响应时间和错误率，以及采集链路各阶段耗时"""
     try:
-        # 这里可以集成实际的API统计，比如使用中间件收集数据
-        stats = ApiStats(
-            total_requests=0,  # 实际实现中需要从统计系统获取
-            active_connections=0,  # 实际实现中需要从连接池获取
-            response_times={},  # 实际实现中需要从统计系统获取
-            error_rates={}  # 实际实现中需要从统计系统获取
-        )
-        return stats
+        return collect_api_stats()
     except Exception as e:
         logger.error(f"Error getting API statistics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# 注册定时任务来收集API统计信息
-async def collect_api_stats():
-    """收集API统计信息的后台任务"""
-    # 这里可以实现实际的统计收集逻辑
-    pass
\ No newline at end of file
+def collect_api_stats() -> ApiStats:
+    """
+    由自监控指标汇总API统计信息
+    response_times 为各路由的平均响应时间（毫秒），error_rates 为各路由 5xx 响应的比例
+    """
+    from instrumentation import metrics, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+    from broadcast import broadcast_hub
+
+    totals: Dict[str, float] = {}
+    errors: Dict[str, float] = {}
+    for (method, route, status), count in list(HTTP_REQUESTS.values.items()):
+        key = f"{method} {route}"
+        totals[key] = totals.get(key, 0) + count
+        if status.startswith('5'):
+            errors[key] = errors.get(key, 0) + count
+
+    response_times = {
+        f"{method} {route}": round(state[-2] / state[-1] * 1000, 3)
+        for (method, route), state in list(HTTP_REQUEST_SECONDS.series.items()) if state[-1]
+    }
+
+    snapshot = metrics.snapshot()
+    return ApiStats(
+        total_requests=int(sum(totals.values())),
+        active_connections=broadcast_hub.subscriber_count(),
+        response_times=response_times,
+        error_rates={key: round(errors.get(key, 0) / total, 4) for key, total in totals.items()},
+        pipeline={
+            'stages': {name: entries for name, entries in snapshot['histograms'].items()
+                       if not name.startswith('http_')},
+            'counters': {name: values for name, values in snapshot['counters'].items()
+                         if not name.startswith('http_')},
+            'queues': snapshot['gauges']
+        }
+    )
@@ -0,0 +1,521 @@
+"""
+监控数据批量导出/导入（Parquet / Arrow IPC）
+
+把指定服务器和时间范围内的 server_metrics 记录以及时序存储中的逐设备序列导出为按服务器和日期分区的文件，
+供容量规划等离线分析使用（pyarrow.dataset、pandas、DuckDB、Spark 都可以直接读取），不再逐页调用 /api/history：
+- 数据库记录按服务器流式读取，每 chunk_rows 行写入一个 Parquet 行组 / Arrow 记录批次，内存占用与时间范围无关
+- JSON 列（磁盘、网络、进程等）按数据库中的原始文本写出，不做解码再编码
+- 时序序列逐块解码后按点写出（每行一个数据点）
+
+目录结构（Hive 风格分区，日期为数据库时间戳所用的本地日期）：
+    <out>/manifest.json
+    <out>/server_metrics/server=<name>/date=<YYYY-MM-DD>/part-00000.parquet
+    <out>/series/server=<name>/date=<YYYY-MM-DD>/part-00000.parquet
+
+导入时按文件逐批次读取，写回 server_metrics 表和时序存储的数据块，可用于在另一套环境中回放历史数据；
+默认跳过数据库中已存在的记录和已被数据块覆盖的时间段，重复导入同一份归档不会产生重复数据。
+导入序列后按导入的时间范围重新计算 1m/5m/1h 汇总层级，长时间范围的查询可以直接使用导入的数据。
+
+pyarrow 是可选依赖（pip install pyarrow），只有导出/导入时需要。
+
+用法：
+    python archive.py export ./archive --servers gpu01,gpu02 --start 2026-09-01 --end 2026-10-01
+    python archive.py export ./archive --format arrow
+    python archive.py import ./archive
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import select
+
+from db import (MetricSeries, Server, create_database, get_or_create_server, insert_metric_chunks,
+                insert_metrics_records, select_metric_chunks, select_server_metrics)
+from tsdb import ts_store, encode_chunk, to_epoch, CHUNK_MAX_POINTS, TimeValue
+from rollup import rollup_manager, RollupManager
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖：只有导出/导入时需要
+    pa = ipc = pq = None
+
+logger = logging.getLogger(__name__)
+
+# 归档格式版本，schema 有不兼容变更时递增
+SCHEMA_VERSION = 1
+# 支持的文件格式及扩展名
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+# 每个行组/记录批次的行数
+DEFAULT_CHUNK_ROWS = 65536
+
+METRICS_DATASET = 'server_metrics'
+SERIES_DATASET = 'series'
+
+# server_metrics 的数值列及其 Arrow 类型名
+METRICS_NUMERIC_COLUMNS = (
+    ('cpu_percent', 'float64'),
+    ('memory_used', 'float64'),
+    ('memory_total', 'float64'),
+    ('gpu_utilization', 'int32'),
+    ('gpu_memory_used', 'int32'),
+    ('gpu_memory_total', 'int32'),
+    ('gpu_temperature', 'int32'),
+)
+# 以JSON文本保存的列，原样导出
+METRICS_JSON_COLUMNS = ('disk_info', 'network_info', 'process_info', 'hardware_temp_info',
+                        'ollama_models', 'custom_command_results')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for archive export/import (pip install pyarrow)")
+
+
+def metrics_schema():
+    """server_metrics 归档的固定 schema（timestamp 与数据库一致，为不带时区的本地时间）"""
+    _require_pyarrow()
+    fields = [pa.field('server', pa.string(), nullable=False),
+              pa.field('timestamp', pa.timestamp('us'), nullable=False)]
+    fields += [pa.field(name, getattr(pa, type_name)()) for name, type_name in METRICS_NUMERIC_COLUMNS]
+    fields += [pa.field(name, pa.string()) for name in METRICS_JSON_COLUMNS]
+    return pa.schema(fields, metadata={b'server_monitor.dataset': METRICS_DATASET.encode(),
+                                       b'server_monitor.schema_version': str(SCHEMA_VERSION).encode()})
+
+
+def series_schema():
+    """时序序列归档的固定 schema（每行一个数据点，timestamp 为UTC毫秒）"""
+    _require_pyarrow()
+    return pa.schema([
+        pa.field('server', pa.string(), nullable=False),
+        pa.field('metric', pa.string(), nullable=False),
+        pa.field('device', pa.string(), nullable=False),
+        pa.field('timestamp', pa.timestamp('ms', tz='UTC'), nullable=False),
+        pa.field('value', pa.float64(), nullable=False),
+    ], metadata={b'server_monitor.dataset': SERIES_DATASET.encode(),
+                 b'server_monitor.schema_version': str(SCHEMA_VERSION).encode()})
+
+
+def _day_of(epoch: float) -> Tuple[str, float]:
+    """时间戳所在的本地日期，以及下一个本地零点的时间戳"""
+    day = datetime.fromtimestamp(epoch).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.strftime('%Y-%m-%d'), (day + timedelta(days=1)).timestamp()
+
+
+class PartitionedWriter:
+    """
+    按 (服务器, 日期) 分区增量写入一个数据集
+    每个分区的行先进入缓冲区，满 chunk_rows 行写出一个行组/记录批次；分区文件在 close_server/close 时关闭
+    """
+
+    def __init__(self, root: str, dataset: str, schema, fmt: str = 'parquet',
+                 compression: str = 'zstd', chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.root = root
+        self.dataset = dataset
+        self.schema = schema
+        self.fmt = fmt
+        self.compression = compression
+        self.chunk_rows = chunk_rows
+        self.files: List[Dict] = []
+        self.rows = 0
+        self._buffers: Dict[Tuple[str, str], Dict[str, list]] = {}
+        self._writers: Dict[Tuple[str, str], Tuple[object, object, Dict]] = {}
+
+    def append(self, server: str, day: str, columns: Dict[str, list]):
+        """追加一批行（列名 -> 值列表，不含 server 列）"""
+        buffer = self._buffers.get((server, day))
+        if buffer is None:
+            buffer = self._buffers[(server, day)] = {name: [] for name in columns}
+        for name, values in columns.items():
+            buffer[name].extend(values)
+        if len(next(iter(buffer.values()))) >= self.chunk_rows:
+            self._flush(server, day)
+
+    def _open(self, server: str, day: str):
+        relative = os.path.join(self.dataset, f"server={quote(server, safe='')}", f"date={day}",
+                                f"part-00000{FORMATS[self.fmt]}")
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.fmt == 'parquet':
+            sink = None
+            writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        else:
+            sink = pa.OSFile(path, 'wb')
+            options = ipc.IpcWriteOptions(compression=self.compression if self.compression != 'none' else None)
+            writer = ipc.new_file(sink, self.schema, options=options)
+        entry = {'path': relative.replace(os.sep, '/'), 'server': server, 'date': day, 'rows': 0}
+        self.files.append(entry)
+        self._writers[(server, day)] = (writer, sink, entry)
+        return self._writers[(server, day)]
+
+    def _flush(self, server: str, day: str):
+        buffer = self._buffers.pop((server, day), None)
+        if not buffer:
+            return
+        count = len(next(iter(buffer.values())))
+        if not count:
+            return
+        writer, _, entry = self._writers.get((server, day)) or self._open(server, day)
+        table = pa.Table.from_pydict({'server': [server] * count, **buffer}, schema=self.schema)
+        writer.write_table(table)
+        entry['rows'] += count
+        self.rows += count
+
+    def close_server(self, server: str):
+        """写出并关闭一台服务器的所有分区"""
+        for key in [key for key in self._buffers if key[0] == server]:
+            self._flush(*key)
+        for key in [key for key in self._writers if key[0] == server]:
+            writer, sink, _ = self._writers.pop(key)
+            writer.close()
+            if sink is not None:
+                sink.close()
+
+    def close(self):
+        for server in {key[0] for key in [*self._buffers, *self._writers]}:
+            self.close_server(server)
+
+
+def export_archive(out_dir: str, session_factory, servers: Optional[List[str]] = None,
+                   start_time: TimeValue = None, end_time: TimeValue = None, fmt: str = 'parquet',
+                   compression: str = 'zstd', chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                   datasets: Iterable[str] = (METRICS_DATASET, SERIES_DATASET), store=ts_store) -> Dict:
+    """
+    导出归档（阻塞调用）
+    :param servers: 服务器名列表，None 表示数据库中的所有服务器
+    :param start_time/end_time: 时间范围（datetime 或Unix时间戳），None 表示不限
+    返回写入 manifest.json 的清单
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported archive format: {fmt}")
+    started = time.time()
+    start = to_epoch(start_time)
+    end = to_epoch(end_time)
+    datasets = list(datasets)
+    if SERIES_DATASET in datasets and store.session_factory is None:
+        # 未绑定的时序存储只能看到内存中的头部块，导出的序列会是空的
+        raise RuntimeError("Time series store is not bound to a database, cannot export series")
+    os.makedirs(out_dir, exist_ok=True)
+
+    session = session_factory()
+    try:
+        server_query = session.query(Server.id, Server.name)
+        if servers:
+            server_query = server_query.filter(Server.name.in_(servers))
+        server_ids = {name: server_id for server_id, name in server_query.order_by(Server.name)}
+        metric_names = [name for (name,) in session.query(MetricSeries.metric).distinct()]
+    finally:
+        session.close()
+
+    manifest_datasets = {}
+    if METRICS_DATASET in datasets:
+        writer = PartitionedWriter(out_dir, METRICS_DATASET, metrics_schema(), fmt, compression, chunk_rows)
+        for name, server_id in server_ids.items():
+            _export_server_metrics(writer, session_factory, name, server_id, start, end, chunk_rows)
+            writer.close_server(name)
+        writer.close()
+        manifest_datasets[METRICS_DATASET] = {'rows': writer.rows, 'files': writer.files}
+
+    if SERIES_DATASET in datasets:
+        writer = PartitionedWriter(out_dir, SERIES_DATASET, series_schema(), fmt, compression, chunk_rows)
+        for name in server_ids:
+            if metric_names:
+                _export_server_series(writer, store, name, metric_names, start, end)
+            writer.close_server(name)
+        writer.close()
+        manifest_datasets[SERIES_DATASET] = {'rows': writer.rows, 'files': writer.files}
+
+    manifest = {
+        'schema_version': SCHEMA_VERSION,
+        'format': fmt,
+        'compression': compression,
+        'created_at': datetime.now().isoformat(),
+        'start': datetime.fromtimestamp(start).isoformat() if start is not None else None,
+        'end': datetime.fromtimestamp(end).isoformat() if end is not None else None,
+        'servers': list(server_ids),
+        'datasets': manifest_datasets
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    summary = ', '.join(f"{name}: {dataset['rows']} rows" for name, dataset in manifest_datasets.items())
+    logger.info(f"Exported {summary} for {len(server_ids)} servers in {time.time() - started:.1f}s")
+    return manifest
+
+
+def _export_server_metrics(writer: PartitionedWriter, session_factory, server_name: str, server_id: int,
+                           start: Optional[float], end: Optional[float], chunk_rows: int):
+    """流式读取一台服务器的 server_metrics 记录（只选需要的列，不构造ORM对象）"""
+    names = ['timestamp'] + [name for name, _ in METRICS_NUMERIC_COLUMNS] + list(METRICS_JSON_COLUMNS)
+
+    session = session_factory()
+    try:
+        metrics = select_server_metrics(session, [server_id],
+                                        datetime.fromtimestamp(start) if start is not None else None,
+                                        datetime.fromtimestamp(end) if end is not None else None,
+                                        columns=names + ['id'])
+        query = session.execute(select(*(metrics.c[name] for name in names)).order_by(
+            metrics.c.timestamp.asc(), metrics.c.id.asc()).execution_options(yield_per=min(chunk_rows, 10000)))
+
+        day, next_day = None, None
+        batch: Dict[str, list] = {name: [] for name in names}
+        for row in query:
+            timestamp = row[0]
+            if day is None or timestamp.timestamp() >= next_day:
+                if batch['timestamp']:
+                    writer.append(server_name, day, batch)
+                    batch = {name: [] for name in names}
+                day, next_day = _day_of(timestamp.timestamp())
+            for name, value in zip(names, row):
+                batch[name].append(value)
+            if len(batch['timestamp']) >= chunk_rows:
+                writer.append(server_name, day, batch)
+                batch = {name: [] for name in names}
+        if batch['timestamp']:
+            writer.append(server_name, day, batch)
+    finally:
+        session.close()
+
+
+def _export_server_series(writer: PartitionedWriter, store, server_name: str, metric_names: List[str],
+                          start: Optional[float], end: Optional[float]):
+    """逐条序列、逐个数据块导出一台服务器的所有主机级和设备级序列"""
+    series = store.match_series(metric_names, [server_name], None)
+    series.update(store.match_series(metric_names, [server_name], ['*']))
+    start_ms = int(start * 1000) if start is not None else None
+    end_ms = int(end * 1000) if end is not None else None
+
+    for key in sorted(series):
+        _, metric, device = key
+        for timestamps, values in store.iter_chunks(key, series[key], start, end):
+            # 按窗口截取（数据块可能跨越窗口边界）
+            lo = bisect_left(timestamps, start_ms) if start_ms is not None else 0
+            hi = bisect_left(timestamps, end_ms + 1) if end_ms is not None else len(timestamps)
+            # 按本地日期切分（一个数据块最多跨越一个零点）
+            while lo < hi:
+                day, next_day = _day_of(timestamps[lo] / 1000.0)
+                split = min(hi, bisect_left(timestamps, int(next_day * 1000), lo))
+                count = split - lo
+                writer.append(server_name, day, {
+                    'metric': [metric] * count,
+                    'device': [device] * count,
+                    'timestamp': timestamps[lo:split],
+                    'value': values[lo:split]
+                })
+                lo = split
+
+
+def _read_batches(path: str, fmt: str, batch_rows: int):
+    """逐批次读取一个归档文件"""
+    if fmt == 'parquet':
+        parquet_file = pq.ParquetFile(path)
+        yield from parquet_file.iter_batches(batch_size=batch_rows)
+    else:
+        with pa.memory_map(path, 'r') as source:
+            reader = ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index)
+
+
+def import_archive(archive_dir: str, session_factory, store=ts_store, skip_existing: bool = True,
+                   datasets: Iterable[str] = (METRICS_DATASET, SERIES_DATASET),
+                   batch_rows: int = DEFAULT_CHUNK_ROWS,
+                   rollups: Optional[RollupManager] = rollup_manager) -> Dict:
+    """
+    导入归档（阻塞调用），返回各数据集导入/跳过的行数
+    skip_existing=True 时跳过数据库中已有的记录（同一服务器同一时间戳）和已被数据块覆盖的时间段
+    rollups 不为None时，导入序列后重新计算导入范围内的汇总桶（rollups 应使用同一个时序存储）
+    """
+    _require_pyarrow()
+    with open(os.path.join(archive_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('schema_version', 0) > SCHEMA_VERSION:
+        raise ValueError(f"Archive schema version {manifest.get('schema_version')} is newer than "
+                         f"supported version {SCHEMA_VERSION}")
+
+    started = time.time()
+    fmt = manifest.get('format', 'parquet')
+    result = {}
+    for dataset in datasets:
+        entry = manifest.get('datasets', {}).get(dataset)
+        if not entry:
+            continue
+        stats = {'imported': 0, 'skipped': 0, 'files': 0}
+        imported_ranges: Dict[Tuple[str, str, str], List[float]] = {}
+        for file_entry in entry['files']:
+            path = os.path.join(archive_dir, *file_entry['path'].split('/'))
+            for batch in _read_batches(path, fmt, batch_rows):
+                columns = batch.to_pydict()
+                if dataset == METRICS_DATASET:
+                    imported, skipped = _import_metrics_batch(session_factory, columns, skip_existing)
+                else:
+                    imported, skipped = _import_series_batch(session_factory, store, columns, skip_existing,
+                                                             imported_ranges)
+                stats['imported'] += imported
+                stats['skipped'] += skipped
+            stats['files'] += 1
+        if dataset == SERIES_DATASET and rollups is not None:
+            stats['rollup_buckets'] = sum(rollups.rebuild(key, lo, hi) for key, (lo, hi) in imported_ranges.items())
+        result[dataset] = stats
+    logger.info(f"Imported archive {archive_dir} in {time.time() - started:.1f}s: {result}")
+    return result
+
+
+def _import_metrics_batch(session_factory, columns: Dict[str, list], skip_existing: bool) -> Tuple[int, int]:
+    """一个批次写回 server_metrics（按服务器分组，一个事务批量插入）"""
+    rows_by_server: Dict[str, List[int]] = {}
+    for index, server_name in enumerate(columns['server']):
+        rows_by_server.setdefault(server_name, []).append(index)
+
+    fields = ['timestamp'] + [name for name, _ in METRICS_NUMERIC_COLUMNS] + list(METRICS_JSON_COLUMNS)
+    imported = skipped = 0
+    session = session_factory()
+    try:
+        for server_name, indexes in rows_by_server.items():
+            server_id = get_or_create_server(session, server_name).id
+            existing = set()
+            if skip_existing:
+                timestamps = [columns['timestamp'][i] for i in indexes]
+                metrics = select_server_metrics(session, [server_id], min(timestamps), max(timestamps),
+                                                columns=['timestamp'])
+                existing = {timestamp for (timestamp,) in session.execute(select(metrics.c.timestamp))}
+            records = []
+            for i in indexes:
+                if columns['timestamp'][i] in existing:
+                    skipped += 1
+                    continue
+                record = {name: columns[name][i] for name in fields}
+                record['server_id'] = server_id
+                records.append(record)
+            insert_metrics_records(session, records)
+            imported += len(records)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return imported, skipped
+
+
+def _add_chunk(session, series_id: int, points: List[Tuple[int, float]]):
+    timestamps = [ts for ts, _ in points]
+    insert_metric_chunks(session, [{
+        'series_id': series_id,
+        'start_time': timestamps[0] / 1000.0,
+        'end_time': timestamps[-1] / 1000.0,
+        'count': len(points),
+        'data': encode_chunk(timestamps, [value for _, value in points])
+    }])
+
+
+def _import_series_batch(session_factory, store, columns: Dict[str, list], skip_existing: bool,
+                         imported_ranges: Dict[Tuple[str, str, str], List[float]]) -> Tuple[int, int]:
+    """
+    一个批次写回时序存储：按序列分组，每 CHUNK_MAX_POINTS 个点编码为一个数据块
+    imported_ranges 累计各序列导入的时间范围（秒），用于之后重新计算汇总
+    """
+    points: Dict[Tuple[str, str, str], List[Tuple[int, float]]] = {}
+    for server_name, metric, device, timestamp, value in zip(columns['server'], columns['metric'], columns['device'],
+                                                             columns['timestamp'], columns['value']):
+        # timestamp('ms', tz='UTC') 转为Python对象时是带时区的 datetime
+        ts_ms = int(round(timestamp.timestamp() * 1000))
+        points.setdefault((server_name, metric, device), []).append((ts_ms, value))
+
+    imported = skipped = 0
+    session = session_factory()
+    try:
+        for key, series_points in points.items():
+            series_points.sort()
+            series_id = store.get_series_id(session, key)
+            ranges = []
+            if skip_existing:
+                lo, hi = series_points[0][0] / 1000.0, series_points[-1][0] / 1000.0
+                chunks = select_metric_chunks(session, [series_id], lo, hi, columns=('start_time', 'end_time'))
+                ranges = sorted((int(round(s * 1000)), int(round(e * 1000))) for s, e in session.execute(
+                    select(chunks.c.start_time, chunks.c.end_time)))
+                if ranges:
+                    kept = [p for p in series_points if not any(s <= p[0] <= e for s, e in ranges)]
+                    skipped += len(series_points) - len(kept)
+                    series_points = kept
+
+            # 已有数据块之间的空隙各自成块，新块的时间范围不与已有块重叠
+            range_starts = [s for s, _ in ranges]
+            chunk: List[Tuple[int, float]] = []
+            for point in series_points:
+                if chunk and (len(chunk) >= CHUNK_MAX_POINTS or
+                              bisect_left(range_starts, point[0]) != bisect_left(range_starts, chunk[-1][0])):
+                    _add_chunk(session, series_id, chunk)
+                    chunk = []
+                chunk.append(point)
+            if chunk:
+                _add_chunk(session, series_id, chunk)
+            if series_points:
+                lo, hi = series_points[0][0] / 1000.0, series_points[-1][0] / 1000.0
+                span = imported_ranges.setdefault(key, [lo, hi])
+                span[0], span[1] = min(span[0], lo), max(span[1], hi)
+            imported += len(series_points)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return imported, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export/import monitoring data as Parquet or Arrow IPC archives')
+    parser.add_argument('--db', default='sqlite:///monitoring.db', help='database URL')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='export server_metrics and time series to an archive')
+    export_parser.add_argument('out', help='output directory')
+    export_parser.add_argument('--servers', help='comma separated server names (default: all)')
+    export_parser.add_argument('--start', help='start time (ISO format, local time)')
+    export_parser.add_argument('--end', help='end time (ISO format, local time)')
+    export_parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    export_parser.add_argument('--compression', default='zstd', help='zstd, lz4, snappy (parquet only) or none')
+    export_parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                               help='rows per row group / record batch')
+    export_parser.add_argument('--datasets', default=f'{METRICS_DATASET},{SERIES_DATASET}',
+                               help='datasets to export')
+
+    import_parser = subparsers.add_parser('import', help='load an archive back into the database')
+    import_parser.add_argument('archive', help='archive directory (containing manifest.json)')
+    import_parser.add_argument('--no-skip-existing', action='store_true',
+                               help='insert rows even if the same timestamps already exist')
+    import_parser.add_argument('--datasets', default=f'{METRICS_DATASET},{SERIES_DATASET}',
+                               help='datasets to import')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    _, Session = create_database(args.db)
+    ts_store.bind(Session)
+    datasets = [name.strip() for name in args.datasets.split(',') if name.strip()]
+
+    if args.command == 'export':
+        manifest = export_archive(
+            args.out, Session,
+            servers=[name.strip() for name in args.servers.split(',')] if args.servers else None,
+            start_time=datetime.fromisoformat(args.start) if args.start else None,
+            end_time=datetime.fromisoformat(args.end) if args.end else None,
+            fmt=args.format, compression=args.compression, chunk_rows=args.chunk_rows, datasets=datasets)
+        for name, dataset in manifest['datasets'].items():
+            print(f"{name}: {dataset['rows']} rows in {len(dataset['files'])} files")
+    else:
+        result = import_archive(args.archive, Session, skip_existing=not args.no_skip_existing, datasets=datasets)
+        for name, stats in result.items():
+            print(f"{name}: imported {stats['imported']}, skipped {stats['skipped']} from {stats['files']} files"
+                  + (f", rebuilt {stats['rollup_buckets']} rollup buckets" if 'rollup_buckets' in stats else ''))
+
+
+if __name__ == '__main__':
+    main()
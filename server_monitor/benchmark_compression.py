@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+压缩方式基准测试：对比逐帧最佳压缩、预置字典逐帧压缩、连接级流式压缩的压缩率和CPU耗时
+
+用法:
+    python benchmark_compression.py                  # 使用模拟的 collect_all 载荷
+    python benchmark_compression.py --samples a.jsonl  # 每行一个 collect_all 结果的JSON
+    python benchmark_compression.py --frames 600
+"""
+import argparse
+import copy
+import json
+import random
+import time
+import zlib
+
+from compression import compressor, train_dictionary, StreamingCompressor, StreamingDecompressor
+from delta import diff, delta_message, keyframe_message
+from parsers import (CustomCommandResult, DiskInfo, DiskIOInfo, GPUInfo, GPUMemoryInfo, HardwareTempInfo,
+                     NetworkInfo, OllamaModelInfo, ProcessInfo, SystemResourceInfo)
+
+
+def make_payloads(count: int, seed: int = 42):
+    """
+    生成连续相似的模拟 collect_all 载荷
+    各字段由解析器的数据类序列化得到，与实际采集结果的结构一致
+    """
+    rng = random.Random(seed)
+    system_resources = SystemResourceInfo(
+        cpu_percent=30.0,
+        memory_used=200.0,
+        memory_total=1007.5,
+        load_average=[12.5, 11.8, 10.9],
+        disk_info=[DiskInfo(f'/dev/nvme{i}n1', '3.5T', '1.2T', '2.3T', 34, f'/data{i}') for i in range(4)],
+        network_info=[NetworkInfo(name, 10 ** 9, 10 ** 9, 10 ** 6, 10 ** 6, 0.0, 0.0)
+                      for name in ('eth0', 'eth1', 'ib0', 'lo')],
+        disk_io=[DiskIOInfo(f'nvme{i}n1', 0.0, 0.0, 0.0, 0.0, 0.0) for i in range(4)],
+        process_info=[ProcessInfo(str(2000 + i), 'train', 5.0, 1.0, f'python train.py --rank {i}')
+                      for i in range(20)],
+        hardware_temp_info=[HardwareTempInfo(f'Core {i}', 55.0, device='coretemp-isa-0000') for i in range(8)],
+        custom_command_results=[CustomCommandResult('uptime', ' 10:00:00 up 42 days,  3 users', True, 0.01)]
+    )
+    base = {
+        'server_name': 'gpu-node-01',
+        'timestamp': 1767225600.0,
+        'ollama_models': [OllamaModelInfo('llama3:8b', '8B', '6.7 GB', '100% GPU').to_dict()],
+        'gpu_info': [GPUInfo(
+            index=i,
+            name='NVIDIA A100-SXM4-80GB',
+            utilization=50,
+            memory_info=GPUMemoryInfo(40000, 81920),
+            temperature=60,
+            processes=[{'pid': str(1000 + i * 10 + j), 'process_name': 'python', 'memory_used': 8000}
+                       for j in range(3)]
+        ).to_dict() for i in range(8)],
+        'system_resources': system_resources.to_dict()
+    }
+
+    payloads = []
+    current = base
+    for n in range(count):
+        current = copy.deepcopy(current)
+        current['timestamp'] = base['timestamp'] + n
+        for gpu in current['gpu_info']:
+            gpu['utilization'] = max(0, min(100, gpu['utilization'] + rng.randint(-5, 5)))
+            gpu['temperature'] = max(30, min(90, gpu['temperature'] + rng.randint(-1, 1)))
+            gpu['memory_info']['used'] += rng.randint(-100, 100)
+        resources = current['system_resources']
+        resources['cpu_percent'] = round(max(0.0, min(100.0, resources['cpu_percent'] + rng.uniform(-3, 3))), 1)
+        resources['memory_used'] = round(resources['memory_used'] + rng.uniform(-1, 1), 2)
+        resources['load_average'] = [round(max(0.0, load + rng.uniform(-0.5, 0.5)), 2)
+                                     for load in resources['load_average']]
+        for net in resources['network_info']:
+            net['receive_rate'] = float(rng.randint(0, 10 ** 7))
+            net['transmit_rate'] = float(rng.randint(0, 10 ** 7))
+            net['receive_bytes'] += int(net['receive_rate'])
+            net['transmit_bytes'] += int(net['transmit_rate'])
+        for io in resources['disk_io']:
+            io['read_bytes_rate'] = round(rng.uniform(0, 5e8), 1)
+            io['write_bytes_rate'] = round(rng.uniform(0, 2e8), 1)
+            io['busy_percent'] = round(rng.uniform(0, 100), 1)
+        for temp in resources['hardware_temp_info']:
+            temp['temperature'] = round(max(30.0, min(95.0, temp['temperature'] + rng.uniform(-1, 1))), 1)
+        for proc in resources['process_info']:
+            proc['cpu_percent'] = round(rng.uniform(0, 100), 1)
+        payloads.append(current)
+    return payloads
+
+
+def load_payloads(path: str):
+    """从JSONL文件读取真实载荷"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(name, payloads, encode, decode=None):
+    """执行一种压缩方式并统计结果"""
+    raw_bytes = sum(len(json.dumps(p, ensure_ascii=False).encode('utf-8')) for p in payloads)
+    started = time.perf_counter()
+    outputs = [encode(p) for p in payloads]
+    elapsed = time.perf_counter() - started
+    out_bytes = sum(len(o) for o in outputs)
+
+    if decode is not None:
+        for payload, output in zip(payloads, outputs):
+            decode(payload, output)
+
+    print(f"{name:<36} {out_bytes:>10} {out_bytes / raw_bytes:>8.2%} "
+          f"{out_bytes / len(payloads):>10.1f} {elapsed / len(payloads) * 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark monitoring payload compression')
+    parser.add_argument('--samples', help='JSONL file with one collect_all payload per line')
+    parser.add_argument('--frames', type=int, default=300, help='number of simulated frames')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.samples) if args.samples else make_payloads(args.frames)
+    # 前一部分用于训练字典，其余用于测试
+    split = max(1, len(payloads) // 10)
+    training, payloads = payloads[:split], payloads[split:]
+    zdict = train_dictionary(training)
+
+    raw_bytes = sum(len(json.dumps(p, ensure_ascii=False).encode('utf-8')) for p in payloads)
+    print(f"frames: {len(payloads)}, raw bytes: {raw_bytes}, avg frame: {raw_bytes / len(payloads):.1f} B, "
+          f"dictionary: {len(zdict)} B")
+    print(f"{'method':<36} {'bytes':>10} {'ratio':>8} {'B/frame':>10} {'us/frame':>10}")
+
+    run('per-frame gzip', payloads,
+        lambda p: compressor.compress_with_best_method(p)[0])
+
+    def dict_encode(p):
+        c = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+        return c.compress(json.dumps(p, ensure_ascii=False).encode('utf-8')) + c.flush()
+    run('per-frame deflate + preset dict', payloads, dict_encode)
+
+    streamer = StreamingCompressor()
+    inflater = StreamingDecompressor()
+    run('streaming deflate (full frames)', payloads,
+        lambda p: streamer.compress(json.dumps(p, ensure_ascii=False) + '\n'),
+        lambda p, o: inflater.decompress(o))
+
+    streamer = StreamingCompressor(zdict=zdict)
+    inflater = StreamingDecompressor(zdict=zdict)
+    run('streaming deflate + preset dict', payloads,
+        lambda p: streamer.compress(json.dumps(p, ensure_ascii=False) + '\n'),
+        lambda p, o: inflater.decompress(o))
+
+    # 增量协议 + 流式压缩（实时面板实际使用的组合）
+    previous = [None]
+
+    def delta_encode(p):
+        if previous[0] is None:
+            text = keyframe_message(0, p)
+        else:
+            text = delta_message(0, 1, previous[0], p)
+        previous[0] = p
+        return streamer.compress(text + '\n')
+    streamer = StreamingCompressor()
+    run('streaming deflate + delta frames', payloads, delta_encode)
+
+
+if __name__ == '__main__':
+    main()
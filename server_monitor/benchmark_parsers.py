@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+解析器基准测试：在录制的探测输出上测量每个解析器的吞吐量（次/秒、MB/秒）
+
+用法:
+    python benchmark_parsers.py                    # 使用内置的模拟输出
+    python benchmark_parsers.py --local            # 在本机执行探测命令录制输出
+    python benchmark_parsers.py --samples outputs/ # 目录下每个探测一个文件: <段名>.txt
+    python benchmark_parsers.py --seconds 0.5
+"""
+import argparse
+import os
+import subprocess
+import time
+
+from parsers import (
+    parse_top, parse_free, parse_df, parse_network_stats, parse_processes, parse_hardware_temps,
+    parse_proc_stat_cpu, parse_meminfo, parse_diskstats, parse_proc_pid_stat, HostParser
+)
+
+
+def make_outputs(processes: int = 300, disks: int = 4, gpus: int = 8):
+    """生成一台GPU服务器的模拟探测输出"""
+    outputs = {}
+    outputs['top'] = (
+        "top - 10:00:00 up 30 days,  2:00,  1 user,  load average: 3.10, 2.90, 2.80\n"
+        f"Tasks: {processes} total,   2 running, {processes - 2} sleeping,   0 stopped,   0 zombie\n"
+        "%Cpu(s): 25.3 us,  3.1 sy,  0.0 ni, 71.2 id,  0.2 wa,  0.0 hi,  0.2 si,  0.0 st\n"
+        "MiB Mem : 1031680.0 total, 500000.0 free, 205000.0 used, 326680.0 buff/cache\n"
+        "MiB Swap:      0.0 total,      0.0 free,      0.0 used. 820000.0 avail Mem\n"
+    )
+    outputs['free'] = (
+        "              total        used        free      shared  buff/cache   available\n"
+        "Mem:           1007         200         488           1         319         800\n"
+        "Swap:             0           0           0\n"
+    )
+    outputs['proc_stat'] = "cpu  123456789 1234 23456789 987654321 123456 0 34567 0 0 0\n"
+    outputs['meminfo'] = (
+        "MemTotal:       1056440320 kB\n"
+        "MemFree:        499712000 kB\n"
+        "MemAvailable:   839680000 kB\n"
+    )
+    outputs['loadavg'] = "3.10 2.90 2.80 2/1530 123456\n"
+    outputs['df'] = "Filesystem      Size  Used Avail Use% Mounted on\n" + "".join(
+        f"/dev/nvme{i}n1p1  3.5T  1.2T  2.3T  34% /data{i}\n" for i in range(disks))
+    outputs['net_dev'] = (
+        "Inter-|   Receive                                                |  Transmit\n"
+        " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+    ) + "".join(
+        f"  {name}: 123456789012 98765432    0    0    0     0          0         0 "
+        f"98765432101 87654321    0    0    0     0       0          0\n"
+        for name in ('lo', 'eth0', 'eth1', 'ib0'))
+    outputs['diskstats'] = "".join(
+        f" 259       {i * 2} nvme{i}n1 12345678 1234 987654321 234567 23456789 3456 876543210 345678 0 456789 580245 0 0 0 0\n"
+        f" 259       {i * 2 + 1} nvme{i}n1p1 12345000 1234 987650000 234500 23456000 3456 876540000 345600 0 456700 580100 0 0 0 0\n"
+        for i in range(disks)) + "   7       0 loop0 100 0 200 10 0 0 0 0 0 10 10 0 0 0 0\n"
+    outputs['proc_pid_stat'] = "".join(
+        f"{1000 + i} {i * 137} python train.py\n" if i % 3 == 0 else f"{1000 + i} {i * 11} kworker/{i % 64}:1\n"
+        for i in range(processes))
+    outputs['processes'] = "USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND\n" + "".join(
+        f"train     {1000 + i * 3}  {99 - i * 4}.5  1.2 123456789 1234567 ?    Rl   Jan01 123:45 "
+        f"python train.py --rank {i} --config configs/large.yaml\n"
+        for i in range(19))
+    outputs['hardware_temps'] = "".join(
+        f"coretemp-isa-000{s}\nAdapter: ISA adapter\n" + "".join(
+            f"Core {c}:        +{50 + c % 10}.0°C  (high = +80.0°C, crit = +100.0°C)\n" for c in range(16)) + "\n"
+        for s in range(2))
+    outputs['nvidia_smi_static'] = "".join(f"{i}, NVIDIA A100-SXM4-80GB, 81920\n" for i in range(gpus))
+    outputs['nvidia_smi_basic'] = "".join(f"{i}, {40 + i}, {30000 + i * 100}, {55 + i}\n" for i in range(gpus))
+    outputs['nvidia_smi_proc'] = "".join(f"{2000 + i}, python, 30000\n" for i in range(gpus))
+    return outputs
+
+
+def record_local_outputs():
+    """在本机执行采集使用的探测命令，录制输出（top/free 用于与旧解析方式对比）"""
+    from monitor import AGGREGATED_COMMANDS
+    commands = dict(AGGREGATED_COMMANDS)
+    commands['top'] = 'top -bn1 | head -n 5'
+    commands['free'] = 'free -g'
+    outputs = {}
+    for name, command in commands.items():
+        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        if result.stdout:
+            outputs[name] = result.stdout
+    return outputs
+
+
+def load_outputs(directory: str):
+    """从目录读取录制的探测输出，文件名为 <段名>.txt"""
+    outputs = {}
+    for filename in os.listdir(directory):
+        if filename.endswith('.txt'):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                outputs[filename[:-4]] = f.read()
+    return outputs
+
+
+def _copies(text: str):
+    """两份内容相同但对象不同的输出，交替传入以绕过 HostParser 的同对象缓存"""
+    return [text, ''.join([text[:1], text[1:]])]
+
+
+def run(name, outputs, probes, call, seconds):
+    """在给定时长内重复调用解析函数并统计吞吐量"""
+    if any(probe not in outputs for probe in probes):
+        print(f"{name:<40} {'(no recorded output)':>10}")
+        return
+    size = sum(len(outputs[probe].encode('utf-8')) for probe in probes)
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(100):
+            call(calls)
+            calls += 1
+        if time.perf_counter() >= deadline:
+            break
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {size:>10} {calls / elapsed:>12.0f} {size * calls / elapsed / 1e6:>10.1f} "
+          f"{elapsed / calls * 1e6:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark probe output parsers')
+    parser.add_argument('--samples', help='directory with one recorded output per probe (<name>.txt)')
+    parser.add_argument('--local', action='store_true', help='record probe outputs on this host')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time budget per parser')
+    args = parser.parse_args()
+
+    if args.samples:
+        outputs = load_outputs(args.samples)
+    elif args.local:
+        outputs = record_local_outputs()
+    else:
+        outputs = make_outputs()
+
+    print(f"probes: {len(outputs)}, recorded bytes: {sum(len(o.encode('utf-8')) for o in outputs.values())}")
+    print(f"{'parser':<40} {'bytes':>10} {'calls/s':>12} {'MB/s':>10} {'us/call':>10}")
+
+    # 无状态解析函数
+    stateless = [
+        ('parse_top (old cpu/memory)', 'top', parse_top),
+        ('parse_free (old memory fallback)', 'free', parse_free),
+        ('parse_proc_stat_cpu', 'proc_stat', parse_proc_stat_cpu),
+        ('parse_meminfo', 'meminfo', parse_meminfo),
+        ('parse_df', 'df', parse_df),
+        ('parse_network_stats', 'net_dev', parse_network_stats),
+        ('parse_diskstats', 'diskstats', parse_diskstats),
+        ('parse_proc_pid_stat', 'proc_pid_stat', parse_proc_pid_stat),
+        ('parse_processes', 'processes', parse_processes),
+        ('parse_hardware_temps', 'hardware_temps', parse_hardware_temps),
+    ]
+    for name, probe, func in stateless:
+        run(name, outputs, [probe], lambda i, probe=probe, func=func: func(outputs[probe]), args.seconds)
+
+    # HostParser 增量解析（每次传入新的输出对象，包含差值和速率计算）
+    host = HostParser()
+    variants = {probe: _copies(text) for probe, text in outputs.items()}
+
+    def fresh(probe, i):
+        return variants[probe][i % 2]
+
+    run('HostParser.cpu_percent', outputs, ['proc_stat'],
+        lambda i: host.cpu_percent(fresh('proc_stat', i)), args.seconds)
+    run('HostParser.memory', outputs, ['meminfo'],
+        lambda i: host.memory(fresh('meminfo', i)), args.seconds)
+    run('HostParser.network (with rates)', outputs, ['net_dev'],
+        lambda i: host.network(fresh('net_dev', i), float(i)), args.seconds)
+    run('HostParser.disk_io', outputs, ['diskstats'],
+        lambda i: host.disk_io(fresh('diskstats', i), float(i)), args.seconds)
+    run('HostParser.processes (ps + /proc)', outputs, ['processes', 'proc_pid_stat'],
+        lambda i: host.processes(fresh('processes', i), fresh('proc_pid_stat', i), float(i)), args.seconds)
+    if 'nvidia_smi_static' in outputs:
+        host.update_gpu_static(outputs['nvidia_smi_static'])
+    run('HostParser.gpus (cached static info)', outputs, ['nvidia_smi_basic', 'nvidia_smi_proc'],
+        lambda i: host.gpus(fresh('nvidia_smi_basic', i), fresh('nvidia_smi_proc', i)), args.seconds)
+
+    # 未到期探测复用上一次输出时直接命中缓存
+    run('HostParser.processes (reused output)', outputs, ['processes', 'proc_pid_stat'],
+        lambda i: host.processes(outputs['processes'], outputs['proc_pid_stat']), args.seconds)
+
+
+if __name__ == '__main__':
+    main()
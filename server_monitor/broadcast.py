@@ -0,0 +1,232 @@
+"""
+采集调度与广播中心
+
+每个服务器只有一个后台采集任务，采集结果发布到广播中心的主题上：
+- "<server_name>"   单个服务器的最新采集结果
+- "all"             所有服务器最新结果的汇总
+- "live:<server>"   远程采样代理推送的实时状态
+
+WebSocket 和 REST 接口只订阅/读取最新帧，采集代价与查看者数量无关；
+新加入的订阅者会立即收到缓存的最后一帧。
+"""
+import asyncio
+import json
+import time
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from instrumentation import SERIALIZE_SECONDS, COMPRESS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ALL_SERVERS_TOPIC = "all"
+# 清理过期告警状态的任务名和最长检查间隔（秒）
+ALERT_SWEEP_TASK = "alert_sweep"
+ALERT_SWEEP_INTERVAL = 60.0
+
+
+class Frame:
+    """一帧广播数据，序列化和压缩结果在所有订阅者之间共享"""
+    __slots__ = ('seq', 'data', 'timestamp', '_text', '_compressed', '_keyframe_text', '_delta_texts')
+
+    def __init__(self, seq: int, data: Any):
+        self.seq = seq
+        self.data = data
+        self.timestamp = time.time()
+        self._text: Optional[str] = None
+        self._compressed = None
+        self._keyframe_text: Optional[str] = None
+        self._delta_texts: Dict[int, str] = {}
+
+    def text(self) -> str:
+        """JSON文本（只序列化一次）"""
+        if self._text is None:
+            started = time.perf_counter()
+            self._text = json.dumps(self.data, ensure_ascii=False)
+            SERIALIZE_SECONDS.since(started, 'frame')
+        return self._text
+
+    def compressed(self):
+        """压缩结果 (压缩数据, 方法, 压缩率)（只压缩一次）"""
+        if self._compressed is None:
+            from compression import compressor
+            started = time.perf_counter()
+            self._compressed = compressor.compress_text(self.text())
+            COMPRESS_SECONDS.since(started, self._compressed[1])
+        return self._compressed
+
+    def keyframe_text(self) -> str:
+        """增量协议的关键帧消息文本（只序列化一次）"""
+        if self._keyframe_text is None:
+            from delta import keyframe_message
+            started = time.perf_counter()
+            self._keyframe_text = keyframe_message(self.seq, self.data)
+            SERIALIZE_SECONDS.since(started, 'keyframe')
+        return self._keyframe_text
+
+    def delta_text(self, base: 'Frame') -> str:
+        """相对 base 帧的增量消息文本，按 base 序号缓存供所有订阅者共享"""
+        text = self._delta_texts.get(base.seq)
+        if text is None:
+            from delta import delta_message
+            started = time.perf_counter()
+            text = delta_message(base.seq, self.seq, base.data, self.data)
+            SERIALIZE_SECONDS.since(started, 'delta')
+            self._delta_texts[base.seq] = text
+        return text
+
+
+class BroadcastHub:
+    """发布/订阅中心，每个主题缓存最新一帧"""
+    def __init__(self):
+        self._latest: Dict[str, Frame] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._seq = 0
+
+    def publish(self, topic: str, data: Any, text: str = None) -> Frame:
+        """发布一帧数据到主题；text 为已有的JSON文本（如分片工作进程转发的结果），避免重复序列化"""
+        self._seq += 1
+        frame = Frame(self._seq, data)
+        frame._text = text
+        self._latest[topic] = frame
+
+        for queue in self._subscribers.get(topic, ()):
+            # 订阅者只需要最新帧，处理不过来时丢弃旧帧
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(frame)
+        return frame
+
+    def latest(self, topic: str) -> Optional[Frame]:
+        """获取主题的最新一帧"""
+        return self._latest.get(topic)
+
+    def latest_data(self, topic: str) -> Optional[Any]:
+        """获取主题最新一帧的数据"""
+        frame = self._latest.get(topic)
+        return frame.data if frame is not None else None
+
+    async def subscribe(self, topic: str) -> AsyncIterator[Frame]:
+        """订阅主题（异步生成器），先产出缓存的最后一帧"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            frame = self._latest.get(topic)
+            if frame is not None:
+                yield frame
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[topic].discard(queue)
+
+    def subscriber_count(self, topic: str = None) -> int:
+        """订阅者数量"""
+        if topic is not None:
+            return len(self._subscribers.get(topic, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+class CollectionScheduler:
+    """为每个服务器运行一个后台采集任务，并定期发布所有服务器的汇总帧"""
+    def __init__(self, monitor, hub: BroadcastHub):
+        self.monitor = monitor
+        self.hub = hub
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        """启动所有采集任务"""
+        for server_name in self.monitor.collectors:
+            if server_name not in self.tasks:
+                self.tasks[server_name] = asyncio.create_task(self._run_server(server_name))
+        if ALL_SERVERS_TOPIC not in self.tasks:
+            self.tasks[ALL_SERVERS_TOPIC] = asyncio.create_task(self._run_aggregate())
+        self._start_alert_sweep()
+        logger.info(f"Collection scheduler started for {len(self.monitor.collectors)} servers")
+
+    async def stop(self):
+        """停止所有采集任务"""
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+
+    def _interval(self) -> float:
+        from config import config
+        return config.monitoring.refresh_interval
+
+    async def _collect(self, collector) -> Dict:
+        """执行一次采集（含写库和告警评估）"""
+        return await collector.collect_all()
+
+    def _emit(self, server_name: str, data: Dict):
+        """发布一次采集结果"""
+        self.hub.publish(server_name, data)
+
+    def polling_stats(self) -> Dict:
+        """各服务器探测调度器的统计"""
+        return {name: collector.poller.stats() for name, collector in self.monitor.collectors.items()}
+
+    async def _run_server(self, server_name: str):
+        """单个服务器的采集循环（按探测调度器的到期时间或固定频率）"""
+        collector = self.monitor.collectors[server_name]
+        while True:
+            started = time.monotonic()
+            try:
+                data = await self._collect(collector)
+                self._emit(server_name, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduled collection failed for {server_name}: {e}")
+                self._emit(server_name, {'server_name': server_name, 'error': str(e)})
+
+            # 启用自适应调度时睡眠到下一个探测到期，否则按固定频率
+            poller = getattr(collector, 'poller', None)
+            if poller is not None and poller.enabled:
+                await asyncio.sleep(poller.next_delay())
+            else:
+                elapsed = time.monotonic() - started
+                await asyncio.sleep(max(0.0, self._interval() - elapsed))
+
+    def _start_alert_sweep(self):
+        """启动清理过期告警状态的后台任务"""
+        if ALERT_SWEEP_TASK not in self.tasks:
+            self.tasks[ALERT_SWEEP_TASK] = asyncio.create_task(self._run_alert_sweep())
+
+    async def _run_alert_sweep(self):
+        """定期清理长时间未收到数据的告警状态（服务器下线或设备移除后告警不会再被评估）"""
+        from alerts import alert_manager
+        from config import config
+        while True:
+            stale_after = config.monitoring.alert_stale_after
+            await asyncio.sleep(min(ALERT_SWEEP_INTERVAL, stale_after / 4))
+            try:
+                alert_manager.clear_resolved_alerts(stale_after)
+            except Exception as e:
+                logger.error(f"Error clearing stale alert states: {e}")
+
+    async def _run_aggregate(self):
+        """定期将各服务器的最新帧汇总发布到 all 主题"""
+        last_seqs: Dict[str, int] = {}
+        while True:
+            try:
+                seqs = {}
+                combined = {}
+                for server_name in self.monitor.collectors:
+                    frame = self.hub.latest(server_name)
+                    if frame is not None:
+                        seqs[server_name] = frame.seq
+                        combined[server_name] = frame.data
+                if combined and seqs != last_seqs:
+                    self.hub.publish(ALL_SERVERS_TOPIC, combined)
+                    last_seqs = seqs
+            except Exception as e:
+                logger.error(f"Error publishing aggregate frame: {e}")
+            await asyncio.sleep(self._interval())
+
+
+# 全局广播中心实例
+broadcast_hub = BroadcastHub()
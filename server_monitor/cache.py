@@ -1,83 +1,187 @@
 import asyncio
+import json
+import sys
 import time
-from typing import Any, Dict, Optional, Callable
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
 from threading import Lock
-import hashlib
-import json
-from datetime import datetime, timedelta
+
+# 缓存键：(前缀, 服务器名, 其它参数...)，按前两项建立索引以支持按服务器/按前缀失效
+CacheKey = Tuple[Any, ...]
+
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """估算缓存值占用的字节数（按JSON编码长度，不可JSON编码时使用 sys.getsizeof）"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
 
 class LRUCache:
     """
     LRU (Least Recently Used) 缓存实现
+    - 有序字典保存访问顺序，命中时移到末尾、淘汰时从头部弹出，均为 O(1)
+    - 同时限制条目数和总字节数（max_bytes 为 None 时只限制条目数）
+    - 键为元组时按 (前缀, 服务器名) 建立索引，可按服务器或前缀失效
+    - get_or_load：同一个键并发未命中时只执行一次加载，其余调用等待同一结果
     """
-    def __init__(self, capacity: int = 1000, ttl: int = 300):  # 默认容量1000，TTL 5分钟
+    def __init__(self, capacity: int = 1000, ttl: int = 300, max_bytes: Optional[int] = None):  # 默认容量1000，TTL 5分钟
         self.capacity = capacity
         self.ttl = ttl  # Time To Live (秒)
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.access_order = {}  # 记录访问顺序
+        self.max_bytes = max_bytes
+        # 键 -> (值, 写入时间, 字节数)
+        self.cache: 'OrderedDict[Any, Tuple[Any, float, int]]' = OrderedDict()
+        self._groups: Dict[Tuple, Set] = {}
+        self._inflight: Dict[Any, asyncio.Future] = {}
         self.lock = Lock()
+        self.bytes = 0
         self.hits = 0
         self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _group(key) -> Tuple:
+        return key[:2] if isinstance(key, tuple) else (key,)
 
     def _is_expired(self, timestamp: float) -> bool:
         """检查缓存项是否过期"""
         return time.time() - timestamp > self.ttl
 
-    def get(self, key: str) -> Optional[Any]:
-        """获取缓存值"""
+    def _remove(self, key):
+        """删除一项（调用方持有锁）"""
+        _, _, size = self.cache.pop(key)
+        self.bytes -= size
+        group = self._groups.get(self._group(key))
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[self._group(key)]
+
+    def _lookup(self, key):
         with self.lock:
-            if key in self.cache:
-                entry = self.cache[key]
-                if self._is_expired(entry['timestamp']):
+            entry = self.cache.get(key)
+            if entry is not None:
+                if self._is_expired(entry[1]):
                     # 删除过期项
-                    del self.cache[key]
-                    del self.access_order[key]
-                    self.misses += 1
-                    return None
-                
-                # 更新访问时间
-                self.access_order[key] = time.time()
-                self.hits += 1
-                return entry['value']
-            
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
             self.misses += 1
-            return None
+            return _MISSING
+
+    def get(self, key) -> Optional[Any]:
+        """获取缓存值"""
+        value = self._lookup(key)
+        return None if value is _MISSING else value
+
+    def put(self, key, value: Any, size: Optional[int] = None) -> bool:
+        """设置缓存值；单个值超过字节预算时不缓存，返回 False"""
+        if size is None:
+            size = estimate_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.delete(key)
+            return False
 
-    def put(self, key: str, value: Any):
-        """设置缓存值"""
         with self.lock:
-            # 检查是否已存在，如果是，更新访问时间
             if key in self.cache:
-                self.access_order[key] = time.time()
-            else:
-                # 检查容量限制
-                if len(self.cache) >= self.capacity:
-                    # 找到最久未使用的项
-                    oldest_key = min(self.access_order.keys(), key=lambda k: self.access_order[k])
-                    del self.cache[oldest_key]
-                    del self.access_order[oldest_key]
-            
-            # 添加新项
-            self.cache[key] = {
-                'value': value,
-                'timestamp': time.time()
-            }
-            self.access_order[key] = time.time()
-
-    def delete(self, key: str) -> bool:
+                self._remove(key)
+            self.cache[key] = (value, time.time(), size)
+            self.bytes += size
+            self._groups.setdefault(self._group(key), set()).add(key)
+
+            # 从最久未使用的一端淘汰，直到满足条目数和字节预算
+            while len(self.cache) > self.capacity or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._remove(next(iter(self.cache)))
+                self.evictions += 1
+        return True
+
+    async def get_or_load(self, key, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        获取缓存值，未命中时调用 loader 加载并写入缓存
+        同一个键正在加载时等待该次加载的结果（single-flight），加载失败时异常传递给所有等待者且不缓存
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 负责加载的调用被取消，由本调用重新加载
+                return await self.get_or_load(key, loader)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def delete(self, key) -> bool:
         """删除缓存项"""
         with self.lock:
             if key in self.cache:
-                del self.cache[key]
-                del self.access_order[key]
+                self._remove(key)
                 return True
             return False
 
+    def invalidate(self, *prefix) -> int:
+        """删除键以 prefix 开头的所有缓存项（如 ('history', 'gpu-01')），返回删除的数量"""
+        with self.lock:
+            if len(prefix) >= 2:
+                candidates = list(self._groups.get(prefix[:2], ()))
+            else:
+                candidates = [key for group, keys in self._groups.items()
+                              if group[:len(prefix)] == prefix for key in keys]
+            removed = 0
+            for key in candidates:
+                parts = key if isinstance(key, tuple) else (key,)
+                if parts[:len(prefix)] == prefix:
+                    self._remove(key)
+                    removed += 1
+            return removed
+
+    def invalidate_server(self, server_name: str) -> int:
+        """删除指定服务器的所有缓存项（键的第二项为服务器名），返回删除的数量"""
+        with self.lock:
+            candidates = [key for group, keys in self._groups.items()
+                          if len(group) > 1 and group[1] == server_name for key in keys]
+            for key in candidates:
+                self._remove(key)
+            return len(candidates)
+
     def clear(self):
         """清空缓存"""
         with self.lock:
             self.cache.clear()
-            self.access_order.clear()
+            self._groups.clear()
+            self.bytes = 0
             self.hits = 0
             self.misses = 0
 
@@ -85,29 +189,30 @@ class LRUCache:
         """获取缓存统计信息"""
         total_requests = self.hits + self.misses
         hit_rate = self.hits / total_requests if total_requests > 0 else 0
-        
+
         return {
             'size': len(self.cache),
             'capacity': self.capacity,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
             'hits': self.hits,
             'misses': self.misses,
             'hit_rate': hit_rate,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'coalesced': self.coalesced,
+            'loading': len(self._inflight),
             'ttl': self.ttl
         }
 
     def cleanup_expired(self):
         """清理过期的缓存项"""
         with self.lock:
-            expired_keys = []
             current_time = time.time()
-            
-            for key, entry in self.cache.items():
-                if current_time - entry['timestamp'] > self.ttl:
-                    expired_keys.append(key)
-            
+            expired_keys = [key for key, entry in self.cache.items() if current_time - entry[1] > self.ttl]
             for key in expired_keys:
-                del self.cache[key]
-                del self.access_order[key]
+                self._remove(key)
+            self.expirations += len(expired_keys)
 
 
 class CacheManager:
@@ -116,40 +221,53 @@ class CacheManager:
     """
     def __init__(self):
         # 为不同类型的数据创建不同的缓存实例
-        self.server_metrics_cache = LRUCache(capacity=500, ttl=60)  # 服务器指标缓存，60秒TTL
-        self.history_cache = LRUCache(capacity=200, ttl=300)  # 历史数据缓存，5分钟TTL
-        self.analysis_cache = LRUCache(capacity=100, ttl=120)  # 分析结果缓存，2分钟TTL
-        self.config_cache = LRUCache(capacity=50, ttl=600)  # 配置缓存，10分钟TTL
-        
+        self.server_metrics_cache = LRUCache(capacity=500, ttl=60, max_bytes=32 * 1024 * 1024)  # 服务器指标缓存，60秒TTL
+        self.history_cache = LRUCache(capacity=200, ttl=300, max_bytes=128 * 1024 * 1024)  # 历史数据缓存，5分钟TTL
+        self.analysis_cache = LRUCache(capacity=100, ttl=120, max_bytes=64 * 1024 * 1024)  # 分析结果缓存，2分钟TTL
+        self.config_cache = LRUCache(capacity=50, ttl=600, max_bytes=4 * 1024 * 1024)  # 配置缓存，10分钟TTL
+
         # 启动定期清理任务
         self.cleanup_task = None
 
+    def configure(self, cache_config):
+        """按配置设置各缓存的字节预算（MB）"""
+        mb = 1024 * 1024
+        self.server_metrics_cache.max_bytes = int(cache_config.server_metrics_max_mb * mb)
+        self.history_cache.max_bytes = int(cache_config.history_max_mb * mb)
+        self.analysis_cache.max_bytes = int(cache_config.analysis_max_mb * mb)
+        self.config_cache.max_bytes = int(cache_config.config_max_mb * mb)
+
+    def _caches(self) -> Dict[str, LRUCache]:
+        return {
+            'server_metrics': self.server_metrics_cache,
+            'history': self.history_cache,
+            'analysis': self.analysis_cache,
+            'config': self.config_cache
+        }
+
     async def start_cleanup_task(self):
         """启动定期清理任务"""
         if self.cleanup_task is None:
             self.cleanup_task = asyncio.create_task(self._periodic_cleanup())
-    
+
     async def _periodic_cleanup(self):
         """定期清理过期缓存"""
         while True:
             try:
                 await asyncio.sleep(30)  # 每30秒清理一次
-                self.server_metrics_cache.cleanup_expired()
-                self.history_cache.cleanup_expired()
-                self.analysis_cache.cleanup_expired()
-                self.config_cache.cleanup_expired()
+                for cache in self._caches().values():
+                    cache.cleanup_expired()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 print(f"Error in cache cleanup: {e}")
 
-    def get_cache_key(self, prefix: str, *args, **kwargs) -> str:
+    def get_cache_key(self, prefix: str, *args, **kwargs) -> CacheKey:
         """
-        生成缓存键
+        生成结构化缓存键：(前缀, 参数..., 排序后的关键字参数...)
+        第一个参数约定为服务器名，便于按服务器失效
         """
-        # 将参数转换为字符串并生成哈希值以确保键的唯一性和长度可控
-        params_str = f"{prefix}:{args}:{sorted(kwargs.items())}"
-        return hashlib.md5(params_str.encode()).hexdigest()
+        return (prefix, *args, *sorted(kwargs.items()))
 
     def get_server_metrics(self, server_name: str, duration_hours: int = 1) -> Optional[Any]:
         """获取服务器指标缓存"""
@@ -161,6 +279,12 @@ class CacheManager:
         key = self.get_cache_key("server_metrics", server_name, duration_hours)
         self.server_metrics_cache.put(key, data)
 
+    async def load_server_metrics(self, server_name: str, loader: Callable[[], Awaitable[Any]],
+                                  duration_hours: int = 1) -> Any:
+        """获取服务器指标缓存，未命中时加载（并发请求只采集一次）"""
+        key = self.get_cache_key("server_metrics", server_name, duration_hours)
+        return await self.server_metrics_cache.get_or_load(key, loader)
+
     def get_history_data(self, server_name: str, start_time: str, end_time: str, limit: int) -> Optional[Any]:
         """获取历史数据缓存"""
         key = self.get_cache_key("history", server_name, start_time, end_time, limit)
@@ -171,6 +295,12 @@ class CacheManager:
         key = self.get_cache_key("history", server_name, start_time, end_time, limit)
         self.history_cache.put(key, data)
 
+    async def load_history_data(self, server_name: str, start_time: str, end_time: str, limit: int,
+                                loader: Callable[[], Awaitable[Any]]) -> Any:
+        """获取历史数据缓存，未命中时加载（并发请求只查询一次）"""
+        key = self.get_cache_key("history", server_name, start_time, end_time, limit)
+        return await self.history_cache.get_or_load(key, loader)
+
     def get_analysis_data(self, server_name: str, hours: int) -> Optional[Any]:
         """获取分析数据缓存"""
         key = self.get_cache_key("analysis", server_name, hours)
@@ -181,6 +311,12 @@ class CacheManager:
         key = self.get_cache_key("analysis", server_name, hours)
         self.analysis_cache.put(key, data)
 
+    async def load_analysis_data(self, server_name: str, hours: int, loader: Callable[[], Awaitable[Any]],
+                                 kind: str = "analysis") -> Any:
+        """获取分析/可视化数据缓存，未命中时加载（并发请求只计算一次）"""
+        key = self.get_cache_key(kind, server_name, hours)
+        return await self.analysis_cache.get_or_load(key, loader)
+
     def get_config(self, config_name: str) -> Optional[Any]:
         """获取配置缓存"""
         key = self.get_cache_key("config", config_name)
@@ -192,19 +328,23 @@ class CacheManager:
         self.config_cache.put(key, data)
 
     def invalidate_server_metrics(self, server_name: str):
-        """使服务器指标缓存失效"""
-        # 由于我们使用哈希键，无法直接按前缀删除，所以我们清空整个缓存
-        # 在实际应用中，可以维护一个服务器名称到键的映射
-        self.server_metrics_cache.clear()
+        """使服务器指标缓存失效（同时删除包含该服务器的所有服务器汇总）"""
+        self.server_metrics_cache.invalidate("server_metrics", server_name)
+        self.server_metrics_cache.invalidate("server_metrics", "all_servers")
+
+    def invalidate_server(self, server_name: str) -> int:
+        """删除所有缓存中指定服务器的数据，返回删除的数量"""
+        removed = sum(cache.invalidate_server(server_name) for cache in self._caches().values())
+        self.server_metrics_cache.invalidate("server_metrics", "all_servers")
+        return removed
+
+    def invalidate_prefix(self, *prefix) -> int:
+        """删除所有缓存中键以 prefix 开头的数据（如 invalidate_prefix('analysis')），返回删除的数量"""
+        return sum(cache.invalidate(*prefix) for cache in self._caches().values())
 
     def get_all_stats(self) -> Dict[str, Any]:
         """获取所有缓存的统计信息"""
-        return {
-            'server_metrics': self.server_metrics_cache.get_stats(),
-            'history': self.history_cache.get_stats(),
-            'analysis': self.analysis_cache.get_stats(),
-            'config': self.config_cache.get_stats()
-        }
+        return {name: cache.get_stats() for name, cache in self._caches().items()}
 
     async def close(self):
         """关闭缓存管理器"""
@@ -217,4 +357,4 @@ class CacheManager:
 
 
 # 全局缓存管理器实例
-cache_manager = CacheManager()
\ No newline at end of file
+cache_manager = CacheManager()
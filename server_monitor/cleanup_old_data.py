@@ -1,53 +1,57 @@
-import sqlite3
-from datetime import datetime
-
-# 连接到数据库
-conn = sqlite3.connect('D:/AI_Projects/server_monitor/monitoring.db')
-cursor = conn.cursor()
-
-# 检查当前数据分布
-print("Checking current data distribution...")
-
-# 统计错误时间戳的数据（1970年代的数据）
-cursor.execute("""
-    SELECT COUNT(*) 
-    FROM server_metrics 
-    WHERE timestamp < '1990-01-01'
-""")
-old_data_count = cursor.fetchone()[0]
-
-print(f"Records with incorrect timestamps (< 1990): {old_data_count}")
-
-# 统计正确时间戳的数据（1990年以后的数据）
-cursor.execute("""
-    SELECT COUNT(*) 
-    FROM server_metrics 
-    WHERE timestamp >= '1990-01-01'
-""")
-correct_data_count = cursor.fetchone()[0]
-
-print(f"Records with correct timestamps (>= 1990): {correct_data_count}")
-
-# 如果有错误的数据，自动删除
-if old_data_count > 0:
-    print(f"\nFound {old_data_count} records with incorrect timestamps.")
-    print("Deleting records with incorrect timestamps...")
-
-    # 删除错误时间戳的数据
-    cursor.execute("""
-        DELETE FROM server_metrics
-        WHERE timestamp < '1990-01-01'
-    """)
-
-    conn.commit()
-    print(f"Deleted {old_data_count} records with incorrect timestamps.")
-
-    # 验证删除结果
-    cursor.execute("SELECT COUNT(*) FROM server_metrics")
-    remaining_count = cursor.fetchone()[0]
-    print(f"Remaining records in database: {remaining_count}")
-else:
-    print("No records with incorrect timestamps found.")
-
-# 关闭连接
-conn.close()
\ No newline at end of file
+"""
+离线执行一次数据保留策略清理
+
+与服务运行时的后台清理（retention.py）相同：按配置的保留天数整天删除过期数据（分批短事务），
+增量回收空闲页并执行WAL检查点。错误时间戳（1970年代）的记录早于任何过期边界，也会一并删除。
+
+用法：
+    python cleanup_old_data.py                       # 使用 config.yaml 中的 monitoring.retention（需 enabled: true）
+    python cleanup_old_data.py --db sqlite:///monitoring.db --raw-days 7    # 只清理命令行指定的层级
+    python cleanup_old_data.py --vacuum              # 清理后完整 VACUUM 并切换为增量 auto_vacuum（锁库，需停止服务）
+"""
+import argparse
+import json
+import logging
+
+from config import config
+from db import create_database
+from retention import retention_manager
+from tsdb import ts_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the retention policy to the monitoring database once')
+    parser.add_argument('--db', default='sqlite:///monitoring.db', help='database URL')
+    parser.add_argument('--raw-days', type=int, help='override monitoring.retention.raw_days')
+    parser.add_argument('--series-days', type=int, help='override monitoring.retention.series_days')
+    parser.add_argument('--max-db-size-mb', type=float, help='override monitoring.retention.max_db_size_mb')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='run a full VACUUM afterwards and switch to incremental auto_vacuum (locks the database)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    settings = config.monitoring.retention
+    if not settings.enabled:
+        # 保留策略未开启时不使用配置中的保留天数，只清理命令行明确指定的层级
+        settings = settings.model_copy(update={'raw_days': 0, 'series_days': 0, 'rollup_days': {},
+                                               'max_db_size_mb': 0.0})
+    overrides = {'raw_days': args.raw_days, 'series_days': args.series_days,
+                 'max_db_size_mb': args.max_db_size_mb}
+    settings = settings.model_copy(update={name: value for name, value in overrides.items() if value is not None})
+
+    engine, Session = create_database(args.db)
+    # 归档时从时序存储读取序列（汇总管理器也通过它访问数据库），必须绑定到同一个数据库
+    ts_store.bind(Session)
+    retention_manager.configure(settings)
+    retention_manager.bind(engine, Session, ts_store)
+
+    print("Database before:", retention_manager.database_size())
+    result = retention_manager.run_once()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.vacuum:
+        retention_manager.vacuum()
+    print("Database after:", retention_manager.database_size())
+
+
+if __name__ == '__main__':
+    main()
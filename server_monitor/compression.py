@@ -1,7 +1,8 @@
 import gzip
 import json
 import zlib
-from typing import Union, Dict, Any
+import hashlib
+from typing import Union, Dict, Any, List, Optional
 import pickle
 import base64
 
@@ -61,32 +62,112 @@ class DataCompressor:
         compressed_size = len(compressed_data)
         return compressed_size / original_size if original_size > 0 else 0
     
+    @staticmethod
+    def compress_text(text: str, method: str = 'gzip') -> tuple:
+        """
+        压缩已序列化的JSON文本（广播帧复用共享的序列化结果，不再重复序列化）
+        :param text: JSON文本
+        :param method: 压缩方法 ('gzip', 'zlib')
+        :return: (压缩数据, 压缩方法, 压缩比率)
+        """
+        raw = text.encode('utf-8')
+        if method == 'gzip':
+            compressed = gzip.compress(raw)
+        elif method == 'zlib':
+            compressed = zlib.compress(raw)
+        else:
+            raise ValueError(f"Unsupported compression method: {method}")
+        return compressed, method, len(compressed) / len(raw) if raw else 0
+
     @staticmethod
     def compress_with_best_method(data: Dict[str, Any]) -> tuple:
         """
-        使用最佳方法压缩数据
+        压缩数据（逐帧压缩的旧协议，前端使用pako按gzip解压）
+        只序列化一次、只压缩一次；需要更高压缩率的连接使用 StreamingCompressor
         :param data: 要压缩的数据
-        :param return_method: 是否返回使用的压缩方法
         :return: (压缩数据, 压缩方法, 压缩比率)
         """
-        methods = ['gzip', 'zlib']
-        best_method = 'gzip'
-        best_compressed = DataCompressor.compress_json(data, 'gzip')
-        best_ratio = len(best_compressed) / len(json.dumps(data).encode('utf-8'))
-        
-        for method in methods[1:]:
-            try:
-                compressed = DataCompressor.compress_json(data, method)
-                ratio = len(compressed) / len(json.dumps(data).encode('utf-8'))
-                if ratio < best_ratio:
-                    best_method = method
-                    best_compressed = compressed
-                    best_ratio = ratio
-            except:
-                continue
-        
-        return best_compressed, best_method, best_ratio
+        return DataCompressor.compress_text(json.dumps(data, separators=(',', ':')))
+
+
+def train_dictionary(samples: List[Union[Dict[str, Any], str]], size: int = 32768) -> bytes:
+    """
+    根据历史载荷（如 collect_all 结果）构建deflate预置字典
+    zlib优先匹配字典末尾的内容，因此按从旧到新的顺序拼接样本并保留末尾 size 字节
+    :param samples: 样本数据（字典或JSON文本），按时间从旧到新排列
+    :param size: 字典最大字节数（deflate窗口为32KB）
+    :return: 预置字典字节
+    """
+    parts = []
+    for sample in samples:
+        if not isinstance(sample, str):
+            sample = json.dumps(sample, ensure_ascii=False)
+        parts.append(sample.encode('utf-8'))
+    return b''.join(parts)[-size:]
+
+
+class StreamingCompressor:
+    """
+    每个连接一个的流式压缩器
+    使用持续存在的raw deflate上下文，每条消息以 Z_SYNC_FLUSH 结束，
+    后续消息可以引用之前消息中的重复内容，连续相似的监控帧压缩率远高于逐帧独立压缩
+    """
+    def __init__(self, level: int = 6, zdict: Optional[bytes] = None):
+        if zdict:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, payload: Union[str, bytes]) -> bytes:
+        """压缩一条消息，返回可立即发送的完整字节块"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        chunk = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.bytes_in += len(payload)
+        self.bytes_out += len(chunk)
+        return chunk
+
+    @property
+    def ratio(self) -> float:
+        """累计压缩比率 (压缩后大小 / 原始大小)"""
+        return self.bytes_out / self.bytes_in if self.bytes_in else 0
+
+
+class StreamingDecompressor:
+    """与 StreamingCompressor 对应的流式解压器（客户端/测试使用）"""
+    def __init__(self, zdict: Optional[bytes] = None):
+        if zdict:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=zdict)
+        else:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def decompress(self, chunk: bytes) -> str:
+        """解压一条消息"""
+        return self._decompressor.decompress(chunk).decode('utf-8')
+
+
+class DictionaryRegistry:
+    """按ID保存最近训练的预置字典，客户端通过ID在握手时声明使用哪个字典"""
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._dictionaries: Dict[str, bytes] = {}
+
+    def register(self, zdict: bytes) -> str:
+        """登记字典，返回字典ID（内容哈希）"""
+        dict_id = hashlib.sha1(zdict).hexdigest()[:16]
+        self._dictionaries.pop(dict_id, None)
+        self._dictionaries[dict_id] = zdict
+        while len(self._dictionaries) > self.max_entries:
+            self._dictionaries.pop(next(iter(self._dictionaries)))
+        return dict_id
+
+    def get(self, dict_id: str) -> Optional[bytes]:
+        """按ID获取字典，不存在时返回None"""
+        return self._dictionaries.get(dict_id)
 
 
 # 全局压缩器实例
-compressor = DataCompressor()
\ No newline at end of file
+compressor = DataCompressor()
+dictionary_registry = DictionaryRegistry()
\ No newline at end of file
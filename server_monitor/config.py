@@ -1,7 +1,7 @@
 import yaml
 import os
 import re
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 from pathlib import Path
 
@@ -62,6 +62,126 @@ class CustomCommandConfig(BaseModel):
     interval: int = 60  # 执行间隔（秒）
 
 
+class RemoteAgentConfig(BaseModel):
+    enabled: bool = False  # 是否启用远程采样代理（需要远程主机安装python3）
+    interval: float = 0.5  # 代理采样间隔（秒）
+    keyframe_interval: int = 60  # 每隔多少帧发送一次完整关键帧
+    store_samples: bool = True  # 是否将代理采样写入时序存储（代理在线时CPU、内存和GPU序列只由代理写入）
+
+
+class IngestConfig(BaseModel):
+    queue_size: int = 10000  # 写入队列最大样本数，满时丢弃最旧的样本
+    batch_size: int = 500  # 每批最多写入的样本数
+    flush_interval: float = 1.0  # 未凑满一批时的最长等待时间（秒）
+
+
+class SSHPoolConfig(BaseModel):
+    connect_timeout: float = 10.0  # 单个连接的超时时间（秒）
+    startup_budget: float = 15.0  # 启动时并行连接所有服务器的最长等待时间（秒），超时的在后台继续连接
+    keepalive_interval: float = 30.0  # SSH保活间隔（秒）
+    max_channels: int = 8  # 每台主机同时打开的最大通道数，包括代理、docker events 等长期占用的流（需小于sshd的MaxSessions）
+    breaker_threshold: int = 3  # 连续连接失败多少次后熔断
+    breaker_reset_timeout: float = 10.0  # 熔断后首次重试前的冷却时间（秒），之后按指数退避
+    breaker_max_reset_timeout: float = 300.0  # 最大冷却时间（秒）
+    health_check_interval: float = 30.0  # 后台重连/RTT测量/空闲清理的间隔（秒）
+    health_check_timeout: float = 5.0  # RTT测量命令的超时时间（秒）
+    max_idle_time: float = 300.0  # 空闲多久后断开连接（秒）
+
+
+class PollingConfig(BaseModel):
+    enabled: bool = True  # 是否按探测命令自适应调度（关闭时每轮执行全部探测）
+    # 各探测命令的基础间隔（秒），未列出的使用 refresh_interval，自定义命令使用其 interval
+    probe_intervals: Dict[str, float] = {
+        'nvidia_smi_proc': 5.0,
+        'ollama_ps': 10.0,
+        'nvidia_smi_static': 3600.0,
+        'host_facts': 86400.0,
+        'df': 60.0,
+        'processes': 5.0,
+        'hardware_temps': 30.0
+    }
+    min_interval: float = 0.5  # 加速后的最小间隔（秒）
+    jitter: float = 0.1  # 随机抖动比例
+    fast_factor: float = 0.5  # 接近告警阈值或变化快时的间隔倍数
+    near_threshold_margin: float = 0.1  # 数值达到 阈值*(1-margin) 视为接近阈值
+    fast_change: float = 5.0  # 相邻两次采集变化超过该值视为变化快
+    idle_change: float = 1.0  # 相邻两次采集变化小于该值视为平稳
+    idle_after: int = 5  # 连续平稳多少次后间隔翻倍
+    max_idle_factor: float = 4.0  # 平稳时最多放慢的倍数
+    max_backoff: float = 60.0  # 主机不可达时的最大重试间隔（秒）
+
+
+class ShardingConfig(BaseModel):
+    enabled: bool = False  # 是否启用分片多进程采集（服务器较多、单进程采集超过刷新间隔时启用）
+    workers: int = 0  # 工作进程数，0 表示CPU核数（不超过服务器数量）
+    queue_size: int = 100  # 工作进程待发送结果的队列长度，API进程处理不过来时丢弃最旧的结果
+    stats_interval: float = 5.0  # 工作进程上报调度和连接池统计的间隔（秒）
+    max_restart_backoff: float = 60.0  # 工作进程退出后重启的最大退避时间（秒）
+
+
+class DockerConfig(BaseModel):
+    enabled: bool = True  # 是否在后台维护各主机的Docker清单（关闭时查询接口按需刷新）
+    use_sudo: bool = True  # 执行docker命令时是否使用sudo
+    mode: str = "events"  # events: 跟随 docker events 增量更新; poll: 定期全量刷新
+    poll_interval: float = 60.0  # poll 模式的刷新间隔（秒），也是事件流不可用时的最长重试间隔
+    resync_interval: float = 300.0  # events 模式下全量校正的间隔（秒）
+    stats_interval: float = 2.0  # 有订阅者时容器资源统计的推送间隔（秒）
+
+
+class PluginsConfig(BaseModel):
+    default_timeout: float = 2.0  # 插件钩子的默认超时时间（秒），插件可在 METADATA 中单独声明
+    default_max_concurrency: int = 4  # 每个插件同时执行的默认最大调用数，已满时跳过本次调用
+    worker_threads: int = 4  # 同步插件使用的工作线程数
+    max_consecutive_failures: int = 5  # 连续失败（出错或超时）多少次后自动禁用插件，0 表示不禁用
+
+
+class HotTierConfig(BaseModel):
+    enabled: bool = True  # 是否在内存中保存最近一个窗口的全分辨率数据，覆盖范围内的查询不访问数据库
+    window: float = 600.0  # 内存中保存的时间窗口（秒）
+    max_points_per_series: int = 2048  # 每条序列环形缓冲区的最大点数（按窗口和采集间隔计算，不超过此值）
+    records_per_server: int = 300  # 每台服务器在内存中保存的最近完整采样记录数（/api/history 使用）
+    warm_up: bool = True  # 启动时从磁盘预热最近一个窗口
+
+
+class FleetCliConfig(BaseModel):
+    max_concurrency: int = 32  # 批量命令同时执行的主机数上限（请求中的 concurrency 不能超过此值）
+    default_concurrency: int = 16  # 请求未指定 concurrency 时同时执行的主机数
+    default_timeout: float = 60.0  # 每台主机上命令的默认超时时间（秒）
+    max_timeout: float = 600.0  # 请求可指定的最长超时时间（秒）
+    max_output_bytes: int = 1024 * 1024  # 每台主机回传的最大输出字节数，超出部分截断
+
+
+class RetentionConfig(BaseModel):
+    enabled: bool = False  # 是否在后台按保留天数定期删除过期数据（默认关闭，开启后超过保留天数的历史会被永久删除）
+    interval: float = 3600.0  # 清理周期（秒）
+    raw_days: int = 14  # server_metrics 完整采样记录保留天数（<= 0 表示不清理）
+    series_days: int = 14  # 全分辨率时序数据块保留天数
+    rollup_days: Dict[str, int] = {'1m': 30, '5m': 180, '1h': 730}  # 各汇总层级保留天数
+    max_db_size_mb: float = 0.0  # 有效数据大小上限（MB），超过时提前删除最旧的整天原始数据，0 表示不限制
+    min_days: int = 1  # 容量限制下至少保留的最近天数
+    archive_dir: str = ""  # 非空时过期的原始数据先按天导出为 Parquet 归档再删除（需要 pyarrow）
+    batch_size: int = 2000  # 每个删除事务的最大行数
+    batch_pause: float = 0.05  # 删除批次之间的暂停（秒），让出写锁
+    vacuum_pages: int = 512  # 每步增量回收的页数
+
+
+class NotificationDispatchConfig(BaseModel):
+    queue_size: int = 1000  # 待发送告警队列最大长度
+    coalesce_window: float = 10.0  # 合并窗口（秒），窗口内的告警合并为一封摘要邮件/一次批量Webhook
+    max_batch: int = 50  # 每个批次最多包含的告警数
+    outbox_path: str = "notification_outbox.jsonl"  # 发送失败批次的重试队列文件
+    max_retries: int = 8  # 最大尝试次数
+    retry_base_delay: float = 5.0  # 首次重试间隔（秒），之后按指数退避
+    retry_max_delay: float = 600.0  # 最大重试间隔（秒）
+
+
+class CacheConfig(BaseModel):
+    server_metrics_max_mb: float = 32.0  # 实时采集结果缓存的内存预算（MB）
+    history_max_mb: float = 128.0  # 历史数据缓存的内存预算（MB）
+    analysis_max_mb: float = 64.0  # 分析/可视化结果缓存的内存预算（MB）
+    config_max_mb: float = 4.0  # 配置缓存的内存预算（MB）
+
+
 class OllamaConfig(BaseModel):
     enabled: bool = True
     endpoint: str = "http://localhost:11434"
@@ -79,6 +199,21 @@ class MonitoringConfig(BaseModel):
     )
     webhook_notifications: WebhookNotificationConfig = WebhookNotificationConfig()
     enable_compression: bool = False  # 是否启用数据压缩
+    delta_keyframe_interval: int = 30  # 增量协议下每隔多少帧发送一次关键帧
+    alert_stale_after: float = 600.0  # 超过多少秒未收到数据的告警状态被清理（服务器下线、设备移除），活跃告警自动恢复
+    collection_mode: str = "script"  # script: 单个脚本一次往返并发采集; batch: 逐条命令执行
+    agent: RemoteAgentConfig = RemoteAgentConfig()
+    ingest: IngestConfig = IngestConfig()
+    polling: PollingConfig = PollingConfig()
+    ssh_pool: SSHPoolConfig = SSHPoolConfig()
+    notification_dispatch: NotificationDispatchConfig = NotificationDispatchConfig()
+    sharding: ShardingConfig = ShardingConfig()
+    cache: CacheConfig = CacheConfig()
+    docker: DockerConfig = DockerConfig()
+    plugins: PluginsConfig = PluginsConfig()
+    fleet_cli: FleetCliConfig = FleetCliConfig()
+    hot_tier: HotTierConfig = HotTierConfig()
+    retention: RetentionConfig = RetentionConfig()
 
 
 class AppConfig(BaseModel):
@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy import event, create_engine, func, inspect, select, text, union_all, Column, Integer, String, Float, DateTime, Text, ForeignKey, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import re
+import threading
 
 Base = declarative_base()
 
@@ -19,7 +21,11 @@ class Server(Base):
     metrics = relationship("ServerMetrics", back_populates="server")
 
 class ServerMetrics(Base):
+    """完整采样记录；新数据写入按天分区的 server_metrics_p<YYYYMMDD> 表，本表只保存分区之前的旧数据"""
     __tablename__ = 'server_metrics'
+    __table_args__ = (
+        Index('ix_server_metrics_server_time', 'server_id', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True)
     server_id = Column(Integer, ForeignKey('servers.id'), nullable=False)
@@ -59,93 +65,382 @@ class ServerMetrics(Base):
     # 关系
     server = relationship("Server", back_populates="metrics")
 
+
+class MetricSeries(Base):
+    """时序存储中的一条序列（服务器 + 指标名 + 设备）"""
+    __tablename__ = 'metric_series'
+    __table_args__ = (
+        UniqueConstraint('server_id', 'metric', 'device', name='uq_metric_series_key'),
+        # 按设备查询（如某个GPU的所有指标）
+        Index('ix_metric_series_server_device', 'server_id', 'device', 'metric'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    server_id = Column(Integer, ForeignKey('servers.id'), nullable=False)
+    metric = Column(String(128), nullable=False)
+    device = Column(String(255), nullable=False, default='')  # 空字符串表示主机级指标
+
+
+class MetricChunk(Base):
+    """
+    时序存储的压缩数据块，每块保存一段时间窗口内的时间戳列和数值列
+    新数据块按结束时间写入按天分区的 metric_chunks_p<YYYYMMDD> 表，本表只保存分区之前的旧数据
+    """
+    __tablename__ = 'metric_chunks'
+    __table_args__ = (
+        Index('ix_metric_chunks_series_time', 'series_id', 'start_time', 'end_time'),
+        # 保留策略按时间删除过期数据块
+        Index('ix_metric_chunks_end_time', 'end_time'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    series_id = Column(Integer, ForeignKey('metric_series.id'), nullable=False)
+    start_time = Column(Float, nullable=False)  # Unix时间戳（秒）
+    end_time = Column(Float, nullable=False)    # Unix时间戳（秒）
+    count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # delta-of-delta时间戳 + XOR压缩数值
+
+
+class MetricRollup(Base):
+    """时序数据的降采样汇总（按层级和时间桶）"""
+    __tablename__ = 'metric_rollups'
+    __table_args__ = (
+        UniqueConstraint('series_id', 'tier', 'bucket_start', name='uq_metric_rollup_bucket'),
+        # 保留策略按层级和时间删除过期汇总
+        Index('ix_metric_rollups_tier_bucket', 'tier', 'bucket_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    series_id = Column(Integer, ForeignKey('metric_series.id'), nullable=False)
+    tier = Column(String(8), nullable=False)  # 1m / 5m / 1h
+    bucket_start = Column(Float, nullable=False)  # Unix时间戳（秒）
+    count = Column(Integer, nullable=False)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    sum_value = Column(Float)
+    p95_value = Column(Float)
+
+
+# ---------------------------------------------------------------------------
+# 按天分区
+# ---------------------------------------------------------------------------
+
+# 分区表的主键从 日期序号 << PARTITION_ID_BITS 开始，不同分区（以及基表中的旧数据）的ID不会重复
+PARTITION_ID_BITS = 32
+
+
+def _epoch(value):
+    """datetime 或Unix时间戳（秒）转为时间戳，None 原样返回"""
+    if value is None:
+        return None
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+class DailyPartitions:
+    """
+    按本地日期分区的原始数据表
+    每天一张与基表结构相同的分区表（<基表名>_p<YYYYMMDD>，列、索引和外键相同），写入时按时间列路由到所在日期的分区，
+    查询时只读取与时间范围重叠的分区，保留策略过期时整表删除，不再逐行删除和维护索引。
+    基表只保存启用分区之前写入的旧数据，查询时始终包含在内，由保留策略按行清理。
+    """
+    def __init__(self, base, time_column: str, lookahead: float = 0.0):
+        self.base = base
+        self.time_column = time_column
+        # 行的时间可能早于分区日期的最大跨度（数据块按结束时间分区，开始时间可能在前一天）
+        self.lookahead = lookahead
+        self._pattern = re.compile(rf'^{re.escape(base.name)}_p(\d{{8}})$')
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def partition_name(self, epoch: float) -> str:
+        return f"{self.base.name}_p{datetime.fromtimestamp(epoch).strftime('%Y%m%d')}"
+
+    def _table(self, name: str):
+        """分区的 Table 对象（与基表共用 MetaData，外键可以解析）"""
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                table = self.base.metadata.tables.get(name)
+                if table is None:
+                    table = self.base.to_metadata(self.base.metadata, name=name)
+                    table.dialect_kwargs['sqlite_autoincrement'] = True
+                    for index in table.indexes:
+                        index.name = index.name.replace(self.base.name, name, 1)
+                self._tables[name] = table
+            return table
+
+    def table_for(self, connection, epoch: float):
+        """时间戳所在日期的分区，不存在时在当前事务中创建"""
+        name = self.partition_name(epoch)
+        table = self._table(name)
+        if not inspect(connection).has_table(name):
+            table.create(connection, checkfirst=True)
+            if connection.dialect.name == 'sqlite':
+                day = datetime.strptime(name[-8:], '%Y%m%d').toordinal()
+                connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                                   {'name': name, 'seq': day << PARTITION_ID_BITS})
+        return table
+
+    def partitions(self, connection):
+        """数据库中已有的分区 [(日期零点, 下一个零点, Table)]，按日期升序"""
+        result = []
+        for name in inspect(connection).get_table_names():
+            match = self._pattern.match(name)
+            if match:
+                day = datetime.strptime(match.group(1), '%Y%m%d')
+                result.append((day.timestamp(), (day + timedelta(days=1)).timestamp(), self._table(name)))
+        return sorted(result, key=lambda item: item[0])
+
+    def tables(self, connection, start=None, end=None):
+        """可能包含时间范围内数据的表：基表和日期与范围重叠的分区"""
+        start, end = _epoch(start), _epoch(end)
+        tables = [self.base]
+        for day_start, day_end, table in self.partitions(connection):
+            if (start is None or day_end > start) and (end is None or day_start <= end + self.lookahead):
+                tables.append(table)
+        return tables
+
+    def union(self, connection, build, start=None, end=None):
+        """
+        对时间范围内的每张表执行 build(table) 得到查询，合并为一个子查询
+        过滤条件写在 build 中，在每个分区内使用分区自己的索引
+        """
+        selects = [build(table) for table in self.tables(connection, start, end)]
+        return (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+    def insert(self, connection, rows):
+        """按时间列把行写入各自日期的分区（同一分区的行一次批量插入）"""
+        by_name = {}
+        for row in rows:
+            by_name.setdefault(self.partition_name(_epoch(row[self.time_column])), []).append(row)
+        for group in by_name.values():
+            table = self.table_for(connection, _epoch(group[0][self.time_column]))
+            connection.execute(table.insert(), group)
+
+    def drop(self, connection, table) -> int:
+        """整表删除一个分区，返回删除的行数"""
+        rows = connection.execute(select(func.count()).select_from(table)).scalar() or 0
+        table.drop(connection)
+        with self._lock:
+            self._tables.pop(table.name, None)
+            self.base.metadata.remove(table)
+        return rows
+
+
+# server_metrics 按记录时间分区；数据块按结束时间分区，开始时间最多早一天
+metrics_partitions = DailyPartitions(ServerMetrics.__table__, 'timestamp')
+chunk_partitions = DailyPartitions(MetricChunk.__table__, 'end_time', lookahead=24 * 3600)
+
+
+def select_server_metrics(session, server_ids, start_time=None, end_time=None, columns=None, where=None):
+    """
+    server_metrics 时间范围内所有分区（含基表中的旧数据）合并成的子查询
+    :param columns: 只选取的列名，默认为所有列
+    :param where: where(table) 返回附加的过滤条件列表
+    """
+    def build(table):
+        query = select(*(table.c[name] for name in columns)) if columns else select(table)
+        query = query.where(table.c.server_id.in_(list(server_ids)))
+        if start_time:
+            query = query.where(table.c.timestamp >= start_time)
+        if end_time:
+            query = query.where(table.c.timestamp <= end_time)
+        if where is not None:
+            query = query.where(*where(table))
+        return query
+    return metrics_partitions.union(session.connection(), build, start_time, end_time)
+
+
+def select_metric_chunks(session, series_ids, start=None, end=None, columns=('series_id', 'start_time', 'data')):
+    """metric_chunks 中与时间窗口（秒）重叠的数据块，合并所有相关分区为一个子查询"""
+    def build(table):
+        query = select(*(table.c[name] for name in columns)).where(table.c.series_id.in_(list(series_ids)))
+        if start is not None:
+            query = query.where(table.c.end_time >= start)
+        if end is not None:
+            query = query.where(table.c.start_time <= end)
+        return query
+    return chunk_partitions.union(session.connection(), build, start, end)
+
+
+def insert_metrics_records(session, records):
+    """批量写入 server_metrics 记录（build_metrics_record 的结果），按日期路由到分区，由调用方提交"""
+    if records:
+        metrics_partitions.insert(session.connection(), records)
+
+
+def insert_metric_chunks(session, chunks):
+    """批量写入数据块（series_id/start_time/end_time/count/data），按结束时间路由到分区，由调用方提交"""
+    if chunks:
+        chunk_partitions.insert(session.connection(), chunks)
+
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    """
+    SQLite使用WAL日志，读写互不阻塞，提交时不再每次fsync主数据库文件
+    检查点后WAL文件截断到 journal_size_limit；新建的数据库使用增量 auto_vacuum，
+    删除过期数据后可以分步归还空闲页（已有数据库需执行一次 VACUUM 才能切换，见 retention.py）
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA journal_size_limit=67108864")
+    cursor.close()
+
 def create_database(db_url="sqlite:///monitoring.db"):
     """创建数据库引擎和表"""
     engine = create_engine(db_url)
+    if db_url.startswith("sqlite:///"):
+        event.listen(engine, "connect", _enable_sqlite_wal)
     Base.metadata.create_all(engine)
+    # create_all 不会为已存在的表补建索引，旧数据库在这里补齐
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     Session = sessionmaker(bind=engine)
     return engine, Session
 
-def store_server_metrics(session, server_name, metrics_data):
-    """存储服务器监控指标到数据库"""
-    # 首先查找或创建服务器记录
+def get_or_create_server(session, server_name):
+    """查找或创建服务器记录"""
     server = session.query(Server).filter(Server.name == server_name).first()
     if not server:
         # 从配置中获取服务器信息（这里简化处理，实际应用中需要从配置获取完整信息）
         server = Server(name=server_name, host="unknown", username="unknown")
         session.add(server)
         session.commit()
-    
-    # 创建指标记录
-    metric_record = ServerMetrics(
-        server_id=server.id,
-        timestamp=datetime.fromtimestamp(metrics_data.get('timestamp', datetime.utcnow().timestamp())),
-        cpu_percent=metrics_data.get('system_resources', {}).get('cpu_percent'),
-        memory_used=metrics_data.get('system_resources', {}).get('memory_used'),
-        memory_total=metrics_data.get('system_resources', {}).get('memory_total'),
-        gpu_utilization=None,  # 从gpu_info中提取
-        gpu_memory_used=None,  # 从gpu_info中提取
-        gpu_memory_total=None,  # 从gpu_info中提取
-        gpu_temperature=None,   # 从gpu_info中提取
-        disk_info=json.dumps(metrics_data.get('system_resources', {}).get('disk_info', [])),
-        network_info=json.dumps(metrics_data.get('system_resources', {}).get('network_info', [])),
-        process_info=json.dumps(metrics_data.get('system_resources', {}).get('process_info', [])),
-        hardware_temp_info=json.dumps(metrics_data.get('system_resources', {}).get('hardware_temp_info', [])),
-        ollama_models=json.dumps(metrics_data.get('ollama_models', [])),
-        custom_command_results=json.dumps(metrics_data.get('system_resources', {}).get('custom_command_results', []))
-    )
-    
+    return server
+
+def build_metrics_record(server_id, metrics_data):
+    """将一次采集结果转换为 ServerMetrics 的列值字典（供单条写入和批量插入使用）"""
+    system_resources = metrics_data.get('system_resources', {})
+    record = {
+        'server_id': server_id,
+        'timestamp': datetime.fromtimestamp(metrics_data.get('timestamp', datetime.utcnow().timestamp())),
+        'cpu_percent': system_resources.get('cpu_percent'),
+        'memory_used': system_resources.get('memory_used'),
+        'memory_total': system_resources.get('memory_total'),
+        'gpu_utilization': None,  # 从gpu_info中提取
+        'gpu_memory_used': None,  # 从gpu_info中提取
+        'gpu_memory_total': None,  # 从gpu_info中提取
+        'gpu_temperature': None,   # 从gpu_info中提取
+        'disk_info': json.dumps(system_resources.get('disk_info', [])),
+        'network_info': json.dumps(system_resources.get('network_info', [])),
+        'process_info': json.dumps(system_resources.get('process_info', [])),
+        'hardware_temp_info': json.dumps(system_resources.get('hardware_temp_info', [])),
+        'ollama_models': json.dumps(metrics_data.get('ollama_models', [])),
+        'custom_command_results': json.dumps(system_resources.get('custom_command_results', []))
+    }
+
     # 如果有GPU信息，提取相关信息
     gpu_info_list = metrics_data.get('gpu_info', [])
     if gpu_info_list:
-        # 取第一个GPU的信息作为代表（实际应用中可能需要处理多个GPU）
+        # 取第一个GPU的信息作为代表，逐GPU的历史数据见时序存储中按设备区分的序列
         gpu_info = gpu_info_list[0]
-        metric_record.gpu_utilization = gpu_info.get('utilization')
+        record['gpu_utilization'] = gpu_info.get('utilization')
         if 'memory_info' in gpu_info:
-            metric_record.gpu_memory_used = gpu_info['memory_info'].get('used')
-            metric_record.gpu_memory_total = gpu_info['memory_info'].get('total')
-        metric_record.gpu_temperature = gpu_info.get('temperature')
-    
-    session.add(metric_record)
+            record['gpu_memory_used'] = gpu_info['memory_info'].get('used')
+            record['gpu_memory_total'] = gpu_info['memory_info'].get('total')
+        record['gpu_temperature'] = gpu_info.get('temperature')
+
+    return record
+
+def store_server_metrics(session, server_name, metrics_data):
+    """存储服务器监控指标到数据库"""
+    # 首先查找或创建服务器记录
+    server = get_or_create_server(session, server_name)
+
+    insert_metrics_records(session, [build_metrics_record(server.id, metrics_data)])
     session.commit()
 
 def get_server_metrics(session, server_name, start_time=None, end_time=None, limit=100):
     """获取服务器的历史监控指标"""
-    query = session.query(ServerMetrics).join(Server).filter(Server.name == server_name)
-    
-    if start_time:
-        query = query.filter(ServerMetrics.timestamp >= start_time)
-    if end_time:
-        query = query.filter(ServerMetrics.timestamp <= end_time)
-    
+    server = session.query(Server).filter(Server.name == server_name).first()
+    if not server:
+        return []
+
+    metrics = select_server_metrics(session, [server.id], start_time, end_time)
     # 按时间倒序排列，获取最新的记录
-    records = query.order_by(ServerMetrics.timestamp.desc()).limit(limit).all()
-    
-    # 转换为字典格式
-    result = []
-    for record in records:
-        record_dict = {
-            'id': record.id,
-            'timestamp': record.timestamp.isoformat(),
-            'cpu_percent': record.cpu_percent,
-            'memory_used': record.memory_used,
-            'memory_total': record.memory_total,
-            'gpu_utilization': record.gpu_utilization,
-            'gpu_memory_used': record.gpu_memory_used,
-            'gpu_memory_total': record.gpu_memory_total,
-            'gpu_temperature': record.gpu_temperature,
-            'disk_info': json.loads(record.disk_info) if record.disk_info else [],
-            'network_info': json.loads(record.network_info) if record.network_info else [],
-            'process_info': json.loads(record.process_info) if record.process_info else [],
-            'hardware_temp_info': json.loads(record.hardware_temp_info) if record.hardware_temp_info else [],
-            'ollama_models': json.loads(record.ollama_models) if record.ollama_models else [],
-            'custom_command_results': json.loads(record.custom_command_results) if record.custom_command_results else []
-        }
-        result.append(record_dict)
-    
+    records = session.execute(select(metrics).order_by(metrics.c.timestamp.desc()).limit(limit)).all()
+
+    return [_metrics_record_to_dict(record) for record in records]
+
+
+def get_all_server_metrics(session, server_names, start_time=None, end_time=None, limit=100):
+    """
+    一条SQL查询获取多台服务器的历史监控指标（每台服务器最新的 limit 条）
+    使用 ROW_NUMBER() 窗口函数按服务器分区，不再逐台服务器查询
+    """
+    names_by_id = {server_id: name for server_id, name in
+                   session.query(Server.id, Server.name).filter(Server.name.in_(server_names))}
+    result = {name: [] for name in server_names}
+    if not names_by_id:
+        return result
+
+    metrics = select_server_metrics(session, names_by_id, start_time, end_time)
+    row_number = func.row_number().over(
+        partition_by=metrics.c.server_id,
+        order_by=metrics.c.timestamp.desc()
+    ).label('row_number')
+    ranked = select(metrics, row_number).subquery()
+
+    rows = session.execute(select(ranked).filter(ranked.c.row_number <= limit).order_by(
+        ranked.c.server_id, ranked.c.timestamp.desc())).all()
+
+    for record in rows:
+        result[names_by_id[record.server_id]].append(_metrics_record_to_dict(record))
     return result
 
 
+def _metrics_record_to_dict(record):
+    """将 server_metrics 记录转换为字典格式"""
+    return {
+        'id': record.id,
+        'timestamp': record.timestamp.isoformat(),
+        'cpu_percent': record.cpu_percent,
+        'memory_used': record.memory_used,
+        'memory_total': record.memory_total,
+        'gpu_utilization': record.gpu_utilization,
+        'gpu_memory_used': record.gpu_memory_used,
+        'gpu_memory_total': record.gpu_memory_total,
+        'gpu_temperature': record.gpu_temperature,
+        'disk_info': json.loads(record.disk_info) if record.disk_info else [],
+        'network_info': json.loads(record.network_info) if record.network_info else [],
+        'process_info': json.loads(record.process_info) if record.process_info else [],
+        'hardware_temp_info': json.loads(record.hardware_temp_info) if record.hardware_temp_info else [],
+        'ollama_models': json.loads(record.ollama_models) if record.ollama_models else [],
+        'custom_command_results': json.loads(record.custom_command_results) if record.custom_command_results else []
+    }
+
+
+def metrics_sample_to_dict(metrics_data):
+    """
+    将一次采集结果直接转换为与 _metrics_record_to_dict 相同格式的字典（供内存热层使用）
+    记录尚未落盘，id 为 None；列表字段直接引用采集结果，不经过 JSON 序列化
+    """
+    system_resources = metrics_data.get('system_resources', {})
+    gpu_info_list = metrics_data.get('gpu_info') or []
+    gpu_info = gpu_info_list[0] if gpu_info_list else {}
+    memory_info = gpu_info.get('memory_info') or {}
+    return {
+        'id': None,
+        'timestamp': datetime.fromtimestamp(metrics_data.get('timestamp', datetime.utcnow().timestamp())).isoformat(),
+        'cpu_percent': system_resources.get('cpu_percent'),
+        'memory_used': system_resources.get('memory_used'),
+        'memory_total': system_resources.get('memory_total'),
+        'gpu_utilization': gpu_info.get('utilization'),
+        'gpu_memory_used': memory_info.get('used'),
+        'gpu_memory_total': memory_info.get('total'),
+        'gpu_temperature': gpu_info.get('temperature'),
+        'disk_info': system_resources.get('disk_info', []),
+        'network_info': system_resources.get('network_info', []),
+        'process_info': system_resources.get('process_info', []),
+        'hardware_temp_info': system_resources.get('hardware_temp_info', []),
+        'ollama_models': metrics_data.get('ollama_models', []),
+        'custom_command_results': system_resources.get('custom_command_results', [])
+    }
+
+
 def get_server_performance_summary(session, server_name: str, start_time=None, end_time=None):
     """获取服务器性能摘要"""
     # 首先获取服务器ID
@@ -154,15 +449,10 @@ def get_server_performance_summary(session, server_name: str, start_time=None, e
         return None
 
     # 查询指标
-    query = session.query(ServerMetrics).filter(ServerMetrics.server_id == server.id)
-
-    if start_time:
-        query = query.filter(ServerMetrics.timestamp >= start_time)
-    if end_time:
-        query = query.filter(ServerMetrics.timestamp <= end_time)
+    records = select_server_metrics(session, [server.id], start_time, end_time)
 
     # 获取所有匹配的指标
-    metrics = query.order_by(ServerMetrics.timestamp.asc()).all()
+    metrics = session.execute(select(records).order_by(records.c.timestamp.asc())).all()
 
     if not metrics:
         return None
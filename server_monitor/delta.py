@@ -0,0 +1,119 @@
+"""
+WebSocket 增量帧协议
+
+客户端通过 ?protocol=delta 启用。服务器先发送关键帧，之后发送相对上一帧的字段级补丁：
+    {"type": "keyframe", "seq": 12, "data": {...}}
+    {"type": "delta", "seq": 13, "base": 12, "set": [[path, value], ...], "unset": [path, ...]}
+path 为键/下标组成的数组。客户端发现 base 与自己持有的 seq 不一致时，
+发送 {"type": "resync"} 请求下一帧改为关键帧。
+
+序号使用广播帧的全局序号，相同 (base, seq) 的补丁文本在所有订阅者之间共享。
+"""
+import json
+from typing import Any, List, Tuple
+
+Path = List[Any]
+
+
+def diff(old: Any, new: Any, path: Path = None) -> Tuple[List[Tuple[Path, Any]], List[Path]]:
+    """
+    计算两个JSON兼容对象之间的字段级差异
+    返回: (set列表 [(路径, 新值)], unset列表 [路径])
+    字典逐键比较；长度相同的列表逐项比较；其余情况整体替换
+    """
+    path = path or []
+    sets: List[Tuple[Path, Any]] = []
+    unsets: List[Path] = []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                sets.append((path + [key], value))
+            elif old[key] != value:
+                child_sets, child_unsets = diff(old[key], value, path + [key])
+                sets.extend(child_sets)
+                unsets.extend(child_unsets)
+        for key in old:
+            if key not in new:
+                unsets.append(path + [key])
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            if old_item != new_item:
+                child_sets, child_unsets = diff(old_item, new_item, path + [index])
+                sets.extend(child_sets)
+                unsets.extend(child_unsets)
+    elif old != new:
+        sets.append((path, new))
+
+    return sets, unsets
+
+
+def apply_patch(obj: Any, sets: List[Tuple[Path, Any]], unsets: List[Path]) -> Any:
+    """将补丁应用到对象上（就地修改），返回修改后的对象"""
+    for path, value in sets:
+        if not path:
+            obj = value
+            continue
+        target = obj
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+    for path in unsets:
+        target = obj
+        for key in path[:-1]:
+            target = target[key]
+        if isinstance(target, dict):
+            target.pop(path[-1], None)
+    return obj
+
+
+def keyframe_message(seq: int, data: Any) -> str:
+    """构建关键帧消息文本"""
+    return json.dumps({'type': 'keyframe', 'seq': seq, 'data': data}, ensure_ascii=False)
+
+
+def delta_message(base_seq: int, seq: int, old: Any, new: Any) -> str:
+    """构建增量帧消息文本"""
+    sets, unsets = diff(old, new)
+    message = {'type': 'delta', 'seq': seq, 'base': base_seq, 'set': sets}
+    if unsets:
+        message['unset'] = unsets
+    return json.dumps(message, ensure_ascii=False)
+
+
+class DeltaEncoder:
+    """每个订阅者一个编码器，记录该订阅者最后收到的帧"""
+    def __init__(self, keyframe_interval: int = 30):
+        self.keyframe_interval = keyframe_interval
+        self._last_frame = None
+        self._since_keyframe = 0
+        self._force_keyframe = False
+
+    def request_keyframe(self):
+        """下一帧强制发送关键帧（客户端请求重新同步时调用）"""
+        self._force_keyframe = True
+
+    def encode(self, frame) -> str:
+        """将广播帧编码为关键帧或相对上一帧的增量帧"""
+        send_keyframe = (
+            self._last_frame is None
+            or self._force_keyframe
+            or self._since_keyframe >= self.keyframe_interval
+        )
+
+        text = None
+        if not send_keyframe:
+            text = frame.delta_text(self._last_frame)
+            # 补丁比完整帧还大时改发关键帧
+            if len(text) >= len(frame.keyframe_text()):
+                text = None
+
+        if text is None:
+            text = frame.keyframe_text()
+            self._since_keyframe = 0
+            self._force_keyframe = False
+        else:
+            self._since_keyframe += 1
+
+        self._last_frame = frame
+        return text
@@ -0,0 +1,442 @@
+"""
+Docker 清单
+
+每台主机在API进程内维护一份容器和镜像清单，通过共享的SSH连接池更新：
+- events 模式：启动时全量读取一次（docker ps -a / docker images），之后跟随 docker events 长连接，
+  只重新读取发生变化的容器（短时间内的多个事件合并为一次查询）或镜像列表，并定期全量校正
+- poll 模式（或事件流不可用时）：按 poll_interval 定期全量刷新
+跨主机的容器/镜像查询直接读取清单，支持过滤和分页，不再每个请求执行一次远程命令。
+
+容器资源统计（docker stats）只在有订阅者时采集，发布到广播中心的 "docker:<server>" 主题，
+仪表盘通过 WebSocket 订阅推送，而不是每次打开页面都重新轮询。
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+from broadcast import broadcast_hub
+
+logger = logging.getLogger(__name__)
+
+CONTAINERS_COMMAND = "docker ps -a --no-trunc --format '{{json .}}'"
+IMAGES_COMMAND = "docker images --no-trunc --format '{{json .}}'"
+STATS_COMMAND = "docker stats --no-stream --no-trunc --format '{{json .}}'"
+EVENTS_COMMAND = "docker events --format '{{json .}}' --filter type=container --filter type=image"
+
+# 不改变容器清单的事件
+IGNORED_CONTAINER_ACTIONS = ('exec_', 'attach', 'resize', 'top', 'copy', 'archive-path', 'export', 'commit')
+# 事件合并窗口（秒）
+EVENT_DEBOUNCE = 0.5
+# 分页的最大页大小
+MAX_PAGE_SIZE = 1000
+
+
+def stats_topic(server_name: str) -> str:
+    """容器资源统计的广播主题"""
+    return f"docker:{server_name}"
+
+
+def _json_lines(output: str) -> List[Dict]:
+    records = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def _parse_labels(labels: str) -> Dict[str, str]:
+    result = {}
+    for item in (labels or '').split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            result[key.strip()] = value.strip()
+    return result
+
+
+def _container_state(record: Dict) -> str:
+    """容器状态（旧版本 docker ps 没有 State 字段，由 Status 推断）"""
+    if record.get('State'):
+        return record['State']
+    status = record.get('Status', '')
+    if '(Paused)' in status:
+        return 'paused'
+    if status.startswith('Up'):
+        return 'running'
+    if status.startswith('Exited'):
+        return 'exited'
+    if status.startswith('Restarting'):
+        return 'restarting'
+    return status.split(' ', 1)[0].lower() if status else 'unknown'
+
+
+def parse_container(server_name: str, record: Dict) -> Dict:
+    """docker ps 的一行JSON转换为清单中的容器记录"""
+    full_id = record.get('ID', '')
+    return {
+        'server': server_name,
+        'id': full_id[:12],
+        'full_id': full_id,
+        'name': record.get('Names', ''),
+        'image': record.get('Image', ''),
+        'command': record.get('Command', '').strip('"'),
+        'state': _container_state(record),
+        'status': record.get('Status', ''),
+        'ports': record.get('Ports', ''),
+        'created': record.get('CreatedAt', ''),
+        'labels': _parse_labels(record.get('Labels', '')),
+        'networks': record.get('Networks', '')
+    }
+
+
+def parse_image(server_name: str, record: Dict) -> Dict:
+    """docker images 的一行JSON转换为清单中的镜像记录"""
+    full_id = record.get('ID', '')
+    repository = record.get('Repository', '')
+    tag = record.get('Tag', '')
+    return {
+        'server': server_name,
+        'id': full_id.split(':', 1)[-1][:12],
+        'full_id': full_id,
+        'repository': repository,
+        'tag': tag,
+        'dangling': repository == '<none>' and tag == '<none>',
+        'size': record.get('Size', ''),
+        'created': record.get('CreatedAt', '')
+    }
+
+
+def _percent(value: str) -> Optional[float]:
+    try:
+        return float(str(value).rstrip('%'))
+    except ValueError:
+        return None
+
+
+def parse_stats(record: Dict) -> Dict:
+    """docker stats 的一行JSON转换为容器资源统计"""
+    try:
+        pids = int(record.get('PIDs', 0))
+    except ValueError:
+        pids = None
+    return {
+        'id': record.get('ID', record.get('Container', ''))[:12],
+        'name': record.get('Name', ''),
+        'cpu_percent': _percent(record.get('CPUPerc', '')),
+        'memory_percent': _percent(record.get('MemPerc', '')),
+        'memory_usage': record.get('MemUsage', ''),
+        'net_io': record.get('NetIO', ''),
+        'block_io': record.get('BlockIO', ''),
+        'pids': pids
+    }
+
+
+class DockerHost:
+    """一台主机的容器和镜像清单"""
+    def __init__(self, server_name: str, client):
+        self.server_name = server_name
+        self.client = client
+        self.containers: Dict[str, Dict] = {}
+        self.images: Dict[tuple, Dict] = {}
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.last_error: Optional[str] = None
+        self.events_connected = False
+        self.events_received = 0
+        self.incremental_updates = 0
+        self.full_refreshes = 0
+        self.dirty_containers: set = set()
+        self.images_dirty = False
+        self.refresh_lock = asyncio.Lock()
+
+    def stats(self) -> Dict:
+        return {
+            'loaded': self.loaded,
+            'containers': len(self.containers),
+            'running': sum(1 for c in self.containers.values() if c['state'] == 'running'),
+            'images': len(self.images),
+            'last_refresh_age': round(time.time() - self.last_refresh, 1) if self.last_refresh else None,
+            'last_error': self.last_error,
+            'events_connected': self.events_connected,
+            'events_received': self.events_received,
+            'incremental_updates': self.incremental_updates,
+            'full_refreshes': self.full_refreshes
+        }
+
+
+class DockerInventory:
+    """所有主机的Docker清单：后台增量维护、跨主机查询和按需推送的容器资源统计"""
+    def __init__(self):
+        self.hosts: Dict[str, DockerHost] = {}
+        self.settings = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def configure(self, settings):
+        self.settings = settings
+
+    def _settings(self):
+        if self.settings is None:
+            from config import config
+            self.settings = config.monitoring.docker
+        return self.settings
+
+    def register(self, ssh_pool):
+        """为连接池中的每台主机建立清单（不启动后台任务）"""
+        for server_name, client in ssh_pool.connections.items():
+            if server_name not in self.hosts:
+                self.hosts[server_name] = DockerHost(server_name, client)
+
+    def start(self, ssh_pool):
+        """注册主机并启动后台维护任务和统计推送任务"""
+        self.register(ssh_pool)
+        if not self._settings().enabled:
+            return
+        for server_name, host in self.hosts.items():
+            if server_name not in self.tasks:
+                self.tasks[server_name] = asyncio.create_task(self._run_host(host))
+                self.tasks[f"stats:{server_name}"] = asyncio.create_task(self._stats_loop(host))
+        logger.info(f"Docker inventory started for {len(self.hosts)} servers ({self._settings().mode} mode)")
+
+    async def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+
+    # -- 远程命令 -------------------------------------------------------------
+
+    async def _run(self, host: DockerHost, command: str) -> Optional[str]:
+        success, stdout, stderr = await host.client.execute_command(command, use_sudo=self._settings().use_sudo)
+        if not success:
+            host.last_error = (stderr or 'docker command failed').strip()[:500]
+            return None
+        return stdout
+
+    async def refresh(self, host: DockerHost, max_age: Optional[float] = None) -> bool:
+        """全量刷新一台主机的容器和镜像清单；max_age 内已刷新过时直接返回（并发的按需刷新只执行一次）"""
+        async with host.refresh_lock:
+            if max_age is not None and host.loaded and time.time() - host.last_refresh < max_age:
+                return True
+            containers_output, images_output = await asyncio.gather(
+                self._run(host, CONTAINERS_COMMAND), self._run(host, IMAGES_COMMAND))
+            if containers_output is None or images_output is None:
+                return False
+            host.containers = {c['id']: c for c in
+                               (parse_container(host.server_name, r) for r in _json_lines(containers_output))}
+            host.images = {(i['id'], i['repository'], i['tag']): i for i in
+                           (parse_image(host.server_name, r) for r in _json_lines(images_output))}
+            host.dirty_containers.clear()
+            host.images_dirty = False
+            host.loaded = True
+            host.last_refresh = time.time()
+            host.last_error = None
+            host.full_refreshes += 1
+            return True
+
+    async def _refresh_containers(self, host: DockerHost, container_ids: List[str]):
+        """只重新读取发生变化的容器（已删除的容器从清单中移除）"""
+        filters = ' '.join(f"--filter id={cid}" for cid in container_ids)
+        output = await self._run(host, f"docker ps -a --no-trunc {filters} --format '{{{{json .}}}}'")
+        if output is None:
+            host.dirty_containers.update(container_ids)
+            return
+        found = {c['id']: c for c in (parse_container(host.server_name, r) for r in _json_lines(output))}
+        for cid in container_ids:
+            short_id = cid[:12]
+            if short_id in found:
+                host.containers[short_id] = found[short_id]
+            else:
+                host.containers.pop(short_id, None)
+        host.incremental_updates += 1
+
+    async def _refresh_images(self, host: DockerHost):
+        output = await self._run(host, IMAGES_COMMAND)
+        if output is None:
+            host.images_dirty = True
+            return
+        host.images = {(i['id'], i['repository'], i['tag']): i for i in
+                       (parse_image(host.server_name, r) for r in _json_lines(output))}
+        host.incremental_updates += 1
+
+    # -- 后台维护 -------------------------------------------------------------
+
+    async def _run_host(self, host: DockerHost):
+        """维护一台主机的清单：全量刷新后跟随事件流；事件流不可用时按退避重试（最长 poll_interval）"""
+        settings = self._settings()
+        backoff = 1.0
+        while True:
+            try:
+                if await self.refresh(host):
+                    backoff = 1.0
+                    if settings.mode == 'events':
+                        await self._follow_events(host)
+                    else:
+                        await asyncio.sleep(settings.poll_interval)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                host.last_error = str(e)
+                logger.debug(f"Docker inventory error on {host.server_name}: {e}")
+            finally:
+                host.events_connected = False
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, settings.poll_interval)
+
+    async def _follow_events(self, host: DockerHost):
+        """跟随 docker events，变化的容器/镜像由合并任务批量刷新；流结束时返回"""
+        flusher = asyncio.create_task(self._flush_loop(host))
+        try:
+            async for line in host.client.stream_lines(EVENTS_COMMAND, use_sudo=self._settings().use_sudo):
+                host.events_connected = True
+                self._on_event(host, line)
+        finally:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+
+    def _on_event(self, host: DockerHost, line: str):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        host.events_received += 1
+        event_type = event.get('Type')
+        action = event.get('Action') or event.get('status') or ''
+        if event_type == 'container':
+            if action.startswith(IGNORED_CONTAINER_ACTIONS):
+                return
+            container_id = event.get('id') or event.get('Actor', {}).get('ID')
+            if container_id:
+                host.dirty_containers.add(container_id)
+        elif event_type == 'image':
+            host.images_dirty = True
+
+    async def _flush_loop(self, host: DockerHost):
+        """合并窗口内的事件批量刷新，并定期全量校正"""
+        settings = self._settings()
+        while True:
+            await asyncio.sleep(EVENT_DEBOUNCE)
+            if time.time() - host.last_refresh > settings.resync_interval:
+                await self.refresh(host)
+                continue
+            if host.dirty_containers:
+                container_ids = sorted(host.dirty_containers)
+                host.dirty_containers.clear()
+                await self._refresh_containers(host, container_ids)
+            if host.images_dirty:
+                host.images_dirty = False
+                await self._refresh_images(host)
+
+    async def _stats_loop(self, host: DockerHost):
+        """有订阅者时定期采集容器资源统计并发布"""
+        settings = self._settings()
+        topic = stats_topic(host.server_name)
+        while True:
+            if not broadcast_hub.subscriber_count(topic):
+                await asyncio.sleep(1)
+                continue
+            started = time.monotonic()
+            try:
+                output = await self._run(host, STATS_COMMAND)
+                if output is None:
+                    broadcast_hub.publish(topic, {'server': host.server_name, 'error': host.last_error})
+                else:
+                    broadcast_hub.publish(topic, {
+                        'server': host.server_name,
+                        'timestamp': time.time(),
+                        'containers': [parse_stats(r) for r in _json_lines(output)]
+                    })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error collecting Docker stats on {host.server_name}: {e}")
+            await asyncio.sleep(max(0.0, settings.stats_interval - (time.monotonic() - started)))
+
+    # -- 查询 -----------------------------------------------------------------
+
+    async def ensure_loaded(self, server_name: str) -> Optional[DockerHost]:
+        """
+        返回主机清单；尚未加载，或未启用后台维护且超过 poll_interval 未刷新时先刷新一次
+        主机不存在时返回None
+        """
+        host = self.hosts.get(server_name)
+        if host is None:
+            return None
+        await self.refresh(host, max_age=math.inf if self.tasks else self._settings().poll_interval)
+        return host
+
+    def _selected_hosts(self, servers: Optional[List[str]]) -> List[DockerHost]:
+        names = servers if servers else sorted(self.hosts)
+        return [self.hosts[name] for name in names if name in self.hosts]
+
+    @staticmethod
+    def _page(items: List[Dict], offset: int, limit: int) -> Dict:
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        return {'total': len(items), 'offset': offset, 'limit': limit, 'items': items[offset:offset + limit]}
+
+    async def query_containers(self, servers: Optional[List[str]] = None, state: Optional[str] = None,
+                               name: Optional[str] = None, image: Optional[str] = None,
+                               label: Optional[str] = None, offset: int = 0, limit: int = 100) -> Dict:
+        """
+        跨主机查询容器
+        :param state: 容器状态（running/exited/paused...），逗号分隔表示多个
+        :param name: 名称包含的子串；image 同理
+        :param label: key 或 key=value
+        """
+        hosts = self._selected_hosts(servers)
+        await asyncio.gather(*(self.ensure_loaded(host.server_name) for host in hosts))
+        states = {s.strip() for s in state.split(',')} if state else None
+        label_key, _, label_value = (label or '').partition('=')
+
+        items = []
+        for host in hosts:
+            for container in host.containers.values():
+                if states and container['state'] not in states:
+                    continue
+                if name and name not in container['name']:
+                    continue
+                if image and image not in container['image']:
+                    continue
+                if label_key and (label_key not in container['labels']
+                                  or (label_value and container['labels'][label_key] != label_value)):
+                    continue
+                items.append(container)
+        items.sort(key=lambda c: (c['server'], c['name']))
+        result = self._page(items, offset, limit)
+        result['errors'] = {h.server_name: h.last_error for h in hosts if h.last_error and not h.loaded}
+        return result
+
+    async def query_images(self, servers: Optional[List[str]] = None, repository: Optional[str] = None,
+                           dangling: Optional[bool] = None, offset: int = 0, limit: int = 100) -> Dict:
+        """跨主机查询镜像（repository 为包含的子串）"""
+        hosts = self._selected_hosts(servers)
+        await asyncio.gather(*(self.ensure_loaded(host.server_name) for host in hosts))
+
+        items = []
+        for host in hosts:
+            for image in host.images.values():
+                if repository and repository not in image['repository']:
+                    continue
+                if dangling is not None and image['dangling'] != dangling:
+                    continue
+                items.append(image)
+        items.sort(key=lambda i: (i['server'], i['repository'], i['tag']))
+        result = self._page(items, offset, limit)
+        result['errors'] = {h.server_name: h.last_error for h in hosts if h.last_error and not h.loaded}
+        return result
+
+    def stats(self) -> Dict:
+        return {name: host.stats() for name, host in sorted(self.hosts.items())}
+
+
+# 全局Docker清单实例
+docker_inventory = DockerInventory()
@@ -0,0 +1,239 @@
+"""
+批量 Web CLI（/ws/fleet/cli）
+
+一条命令在选定的多台主机上并发执行，复用SSH连接池中的长连接（每台主机一个通道，受连接池的
+并发通道数限制），整体耗时取决于最慢的主机而不是所有主机之和。
+输出逐行回传，按主机打标签交错发送；每台主机结束时单独报告退出码、耗时和状态，
+最后发送汇总。同时执行的主机数受 concurrency 限制，超时只影响单台主机，取消会关闭所有远程进程。
+
+消息格式（服务器 -> 客户端）：
+    {"type": "start", "command", "servers": [...], "missing": [...], "concurrency", "timeout"}
+    {"type": "output", "server", "stream": "stdout"|"stderr", "data"}
+    {"type": "exit", "server", "status": "ok"|"failed"|"timeout"|"error"|"cancelled",
+     "exit_code", "duration", "truncated", "error"}
+    {"type": "done", "duration", "cancelled", "summary": {<status>: <count>}, "failed": [...]}
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 发送队列中每次合并发送的最大事件数
+MAX_BATCH_EVENTS = 500
+
+
+class FleetRun:
+    """一次批量命令的执行过程"""
+
+    def __init__(self, settings, command: str, targets: list, send: Callable[[Dict[str, Any]], Awaitable[None]],
+                 use_sudo: bool, concurrency: int, timeout: float):
+        self.settings = settings
+        self.command = command
+        self.targets = targets  # [(server_name, client)]
+        self.send = send
+        self.use_sudo = use_sudo
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.results: Dict[str, str] = {}
+        self.cancel_event = asyncio.Event()
+
+    def emit(self, event: Dict[str, Any]):
+        self.queue.put_nowait(event)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    async def _sender(self):
+        """
+        发送循环：一次取出队列中已有的全部事件，同一主机同一输出流的连续行合并为一条消息，
+        输出很多时减少WebSocket帧数
+        """
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            finished = False
+            while len(batch) < MAX_BATCH_EVENTS and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+
+            merged: List[Dict[str, Any]] = []
+            for item in batch:
+                last = merged[-1] if merged else None
+                if (item['type'] == 'output' and last is not None and last['type'] == 'output'
+                        and last['server'] == item['server'] and last['stream'] == item['stream']):
+                    last['data'] += item['data']
+                else:
+                    merged.append(dict(item) if item['type'] == 'output' else item)
+            for item in merged:
+                await self.send(item)
+            if finished:
+                return
+
+    async def _run_host(self, server_name: str, client, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            started = time.perf_counter()
+            output_bytes = 0
+            truncated = False
+
+            def on_output(stream: str, line: str):
+                nonlocal output_bytes, truncated
+                if truncated:
+                    return
+                output_bytes += len(line)
+                if output_bytes > self.settings.max_output_bytes:
+                    truncated = True
+                    self.emit({'type': 'output', 'server': server_name, 'stream': 'stderr',
+                               'data': f"[输出超过 {self.settings.max_output_bytes} 字节，其余部分已截断]\n"})
+                    return
+                self.emit({'type': 'output', 'server': server_name, 'stream': stream, 'data': line})
+
+            result = {'type': 'exit', 'server': server_name, 'exit_code': None, 'error': None}
+            try:
+                exit_code = await asyncio.wait_for(
+                    client.run_streaming(self.command, on_output, self.use_sudo), self.timeout)
+                result['exit_code'] = exit_code
+                result['status'] = 'ok' if exit_code == 0 else 'failed'
+            except asyncio.TimeoutError:
+                result['status'] = 'timeout'
+                result['error'] = f"Timed out after {self.timeout}s"
+            except asyncio.CancelledError:
+                result['status'] = 'cancelled'
+                raise
+            except Exception as e:
+                result['status'] = 'error'
+                result['error'] = str(e) or type(e).__name__
+            finally:
+                result['duration'] = round(time.perf_counter() - started, 3)
+                result['truncated'] = truncated
+                self.results[server_name] = result['status']
+                self.emit(result)
+
+    async def run(self) -> Dict[str, Any]:
+        """执行命令直到所有主机结束或被取消，返回汇总"""
+        started = time.perf_counter()
+        sender = asyncio.create_task(self._sender())
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._run_host(name, client, semaphore)) for name, client in self.targets]
+        finished = asyncio.gather(*tasks, return_exceptions=True)
+        cancel_waiter = asyncio.create_task(self.cancel_event.wait())
+        try:
+            await asyncio.wait([finished, cancel_waiter], return_when=asyncio.FIRST_COMPLETED)
+            cancelled = not finished.done()
+            for task in tasks:
+                task.cancel()
+            await finished
+
+            # 取消时还未开始执行的主机也报告为 cancelled
+            for name, _ in self.targets:
+                if name not in self.results:
+                    self.results[name] = 'cancelled'
+                    self.emit({'type': 'exit', 'server': name, 'status': 'cancelled', 'exit_code': None,
+                               'error': None, 'duration': 0.0, 'truncated': False})
+
+            summary: Dict[str, int] = {}
+            for status in self.results.values():
+                summary[status] = summary.get(status, 0) + 1
+            done = {
+                'type': 'done',
+                'duration': round(time.perf_counter() - started, 3),
+                'cancelled': cancelled,
+                'summary': summary,
+                'failed': sorted(name for name, status in self.results.items() if status != 'ok')
+            }
+            self.emit(done)
+            self.emit(None)
+            await sender
+            return done
+        finally:
+            cancel_waiter.cancel()
+            for task in tasks:
+                task.cancel()
+            if not sender.done():
+                sender.cancel()
+
+
+class FleetCommandRunner:
+    """批量命令执行器，按配置限制并发主机数、超时和输出大小"""
+
+    def __init__(self):
+        self.settings = None
+        self.active_runs = 0
+        self.total_runs = 0
+
+    def configure(self, settings):
+        self.settings = settings
+
+    def _settings(self):
+        if self.settings is None:
+            from config import config
+            self.settings = config.monitoring.fleet_cli
+        return self.settings
+
+    @staticmethod
+    def resolve_servers(pool, servers) -> Tuple[list, List[str]]:
+        """
+        解析目标主机：servers 为主机名列表，为空或 "*" 时表示连接池中的所有主机
+        返回: ([(server_name, client)], 不存在的主机名列表)
+        """
+        if not servers or servers == '*' or servers == ['*']:
+            return list(pool.connections.items()), []
+        if isinstance(servers, str):
+            servers = [name.strip() for name in servers.split(',') if name.strip()]
+        targets, missing = [], []
+        for name in dict.fromkeys(servers):
+            client = pool.get_client(name)
+            if client is None:
+                missing.append(name)
+            else:
+                targets.append((name, client))
+        return targets, missing
+
+    def prepare(self, pool, request: Dict[str, Any], send) -> Tuple[Optional[FleetRun], Dict[str, Any]]:
+        """
+        根据客户端请求创建一次执行，返回 (FleetRun, start 消息)
+        没有可执行的主机时 FleetRun 为 None
+        """
+        settings = self._settings()
+        command = str(request.get('command', '')).strip()
+        targets, missing = self.resolve_servers(pool, request.get('servers'))
+
+        concurrency = int(request.get('concurrency') or settings.default_concurrency)
+        concurrency = max(1, min(concurrency, settings.max_concurrency))
+        timeout = float(request.get('timeout') or settings.default_timeout)
+        timeout = max(1.0, min(timeout, settings.max_timeout))
+
+        start = {
+            'type': 'start',
+            'command': command,
+            'servers': [name for name, _ in targets],
+            'missing': missing,
+            'concurrency': concurrency,
+            'timeout': timeout
+        }
+        if not command or not targets:
+            return None, start
+        run = FleetRun(settings, command, targets, send, bool(request.get('use_sudo', False)), concurrency, timeout)
+        return run, start
+
+    async def execute(self, run: FleetRun) -> Dict[str, Any]:
+        self.active_runs += 1
+        self.total_runs += 1
+        try:
+            done = await run.run()
+            logger.info(f"Fleet command '{run.command}' finished on {len(run.targets)} servers "
+                        f"in {done['duration']}s: {done['summary']}")
+            return done
+        finally:
+            self.active_runs -= 1
+
+
+# 全局批量命令执行器
+fleet_runner = FleetCommandRunner()
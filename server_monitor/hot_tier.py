@@ -0,0 +1,308 @@
+"""
+最近数据的内存热层
+
+每条序列 (服务器, 指标, 设备) 一个定长环形缓冲区（NumPy 数组），保存最近 window 秒的全分辨率数据；
+每台服务器另有一个定长环形缓冲区保存最近的完整采样记录（与 get_server_metrics 返回的格式相同）。
+样本在提交到后台写入队列时同步写入热层，比落盘更早可见。
+
+每个缓冲区记录覆盖起点 covered_from：不早于该时间的数据点全部在内存中。
+查询窗口落在覆盖范围内时直接读内存，不访问数据库；更早的部分才回落到磁盘。
+启动时从磁盘预热最近一个窗口，重启后最近的数据仍可从内存读取。
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tsdb import extract_sample_metrics, to_epoch, TimeValue
+from db import metrics_sample_to_dict
+
+logger = logging.getLogger(__name__)
+
+SeriesKey = Tuple[str, str, str]
+
+
+def _to_ms_precision(epoch: float) -> float:
+    """与时序存储一样按毫秒取整，内存和磁盘中同一个点的时间戳完全一致"""
+    return round(epoch * 1000) / 1000.0
+
+
+class RingBuffer:
+    """定长环形缓冲区：时间戳（秒）和数值两列，写满后覆盖最旧的点"""
+    __slots__ = ('timestamps', 'values', 'capacity', 'size', 'next', 'covered_from')
+
+    def __init__(self, capacity: int, covered_from: float):
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.size = 0
+        self.next = 0
+        self.covered_from = covered_from
+
+    def last_timestamp(self) -> Optional[float]:
+        return float(self.timestamps[self.next - 1]) if self.size else None
+
+    def append(self, timestamp: float, value: float) -> bool:
+        """追加一个点；时间戳必须单调递增（与时序存储一致，乱序点丢弃）"""
+        if self.size and timestamp <= self.timestamps[self.next - 1]:
+            return False
+        if self.size == self.capacity:
+            # 覆盖最旧的点，覆盖起点前移到剩余最旧的点
+            self.covered_from = max(self.covered_from, float(self.timestamps[(self.next + 1) % self.capacity]))
+        else:
+            self.size += 1
+        self.timestamps[self.next] = timestamp
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        return True
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间升序返回 (时间戳, 数值)"""
+        if self.size < self.capacity:
+            return self.timestamps[:self.size], self.values[:self.size]
+        return (np.concatenate((self.timestamps[self.next:], self.timestamps[:self.next])),
+                np.concatenate((self.values[self.next:], self.values[:self.next])))
+
+    def window(self, start: Optional[float], end: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """时间窗口 [start, end] 内的点（副本）"""
+        timestamps, values = self.ordered()
+        lo = int(np.searchsorted(timestamps, start, 'left')) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, end, 'right')) if end is not None else len(timestamps)
+        return timestamps[lo:hi].copy(), values[lo:hi].copy()
+
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+
+class RecordRing:
+    """一台服务器最近的完整采样记录（按时间升序）"""
+    __slots__ = ('records', 'covered_from')
+
+    def __init__(self, capacity: int, covered_from: float):
+        self.records: Deque[Tuple[float, Dict]] = deque(maxlen=capacity)
+        self.covered_from = covered_from
+
+    def append(self, timestamp: float, record: Dict):
+        if self.records and timestamp <= self.records[-1][0]:
+            return
+        if len(self.records) == self.records.maxlen:
+            self.covered_from = max(self.covered_from, self.records[1][0] if len(self.records) > 1 else timestamp)
+        self.records.append((timestamp, record))
+
+
+class HotTier:
+    """
+    内存热层
+    序列数据按 (服务器, 指标, 设备) 保存在 RingBuffer 中，完整记录按服务器保存在 RecordRing 中
+    """
+
+    def __init__(self):
+        self.settings = None
+        self.enabled = True
+        self.capacity = 1200
+        self.records_capacity = 300
+        self.window = 600.0
+        # 热层开始接收数据的时间：此后的数据点全部在内存中（预热后前移一个窗口）
+        self.since = _to_ms_precision(time.time())
+        self._series: Dict[SeriesKey, RingBuffer] = {}
+        self._records: Dict[str, RecordRing] = {}
+        self._lock = threading.Lock()
+
+        # 读取统计：memory 完全由内存提供，partial 内存+磁盘，disk 完全回落到磁盘
+        self.reads = {'memory': 0, 'partial': 0, 'disk': 0}
+        self.record_reads = {'memory': 0, 'disk': 0}
+
+    def configure(self, settings, sample_interval: float):
+        """
+        应用配置（在开始采集前调用）
+        每条序列的容量按窗口和最短采集间隔计算，不超过 max_points_per_series
+        """
+        self.settings = settings
+        self.enabled = settings.enabled
+        self.window = settings.window
+        needed = int(math.ceil(settings.window / max(sample_interval, 0.01))) + 1
+        self.capacity = max(2, min(needed, settings.max_points_per_series))
+        self.records_capacity = max(1, settings.records_per_server)
+        with self._lock:
+            self._series.clear()
+            self._records.clear()
+            self.since = _to_ms_precision(time.time())
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def _append_point(self, key: SeriesKey, timestamp: float, value: float):
+        ring = self._series.get(key)
+        if ring is None:
+            ring = self._series[key] = RingBuffer(self.capacity, self.since)
+        ring.append(timestamp, value)
+
+    def append_sample(self, server_name: str, metrics_data: Dict, store_row: bool = True):
+        """
+        写入一次采集结果（与提交到写入队列的样本相同）
+        store_row=False 的样本（远程代理的高频采样）只写入序列，不进入完整记录
+        """
+        if not self.enabled:
+            return
+        epoch = to_epoch(metrics_data.get('timestamp')) or time.time()
+        timestamp = _to_ms_precision(epoch)
+        points = extract_sample_metrics(metrics_data)
+        record = metrics_sample_to_dict(metrics_data) if store_row else None
+        with self._lock:
+            for metric, device, value in points:
+                self._append_point((server_name, metric, device), timestamp, value)
+            if record is not None:
+                ring = self._records.get(server_name)
+                if ring is None:
+                    ring = self._records[server_name] = RecordRing(self.records_capacity, self.since)
+                ring.append(epoch, record)
+
+    def warm_up(self, store, session_factory):
+        """
+        启动时从磁盘读取所有服务器最近一个窗口的数据（阻塞调用，应在开始采集前于线程池中执行）
+        预热完成后覆盖起点前移一个窗口
+        """
+        if not self.enabled or session_factory is None:
+            return
+        from db import MetricSeries, Server, get_all_server_metrics
+
+        started = time.time()
+        window_start = _to_ms_precision(started - self.window)
+        session = session_factory()
+        try:
+            metric_names = [name for (name,) in session.query(MetricSeries.metric).distinct()]
+            server_names = [name for (name,) in session.query(Server.name)]
+            history = get_all_server_metrics(session, server_names, datetime.fromtimestamp(window_start),
+                                             None, self.records_capacity) if server_names else {}
+        finally:
+            session.close()
+
+        series = store.match_series(metric_names, None, None) if metric_names else {}
+        if metric_names:
+            series.update(store.match_series(metric_names, None, ['*']))
+        data = store.scan(series, window_start, started)
+
+        with self._lock:
+            self.since = window_start
+            points = 0
+            for key, (timestamps, values) in data.items():
+                for timestamp, value in zip(timestamps, values):
+                    self._append_point(key, timestamp, value)
+                points += len(timestamps)
+            for server_name, records in history.items():
+                ring = self._records[server_name] = RecordRing(self.records_capacity, window_start)
+                # get_all_server_metrics 按时间倒序返回
+                for record in reversed(records):
+                    ring.append(datetime.fromisoformat(record['timestamp']).timestamp(), record)
+                if len(records) >= self.records_capacity and ring.records:
+                    # 窗口内的记录多于容量时，只有保留下来的部分是完整的
+                    ring.covered_from = max(ring.covered_from, ring.records[0][0])
+            # 预热本身的读取不计入统计
+            self.reads = {'memory': 0, 'partial': 0, 'disk': 0}
+        logger.info(f"Hot tier warmed up with {points} points of {len(data)} series "
+                    f"in {time.time() - started:.2f}s")
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def coverage(self, key: SeriesKey) -> Optional[float]:
+        """序列在内存中的覆盖起点（秒），热层关闭时返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            ring = self._series.get(key)
+            return ring.covered_from if ring is not None else self.since
+
+    def read(self, key: SeriesKey, start: Optional[float], end: Optional[float]) -> Tuple[List[float], List[float]]:
+        """读取内存中 [start, end] 的数据点，返回 (时间戳列表, 数值列表)"""
+        with self._lock:
+            ring = self._series.get(key)
+            if ring is None:
+                return [], []
+            timestamps, values = ring.window(start, end)
+        return timestamps.tolist(), values.tolist()
+
+    def count_read(self, source: str):
+        self.reads[source] += 1
+
+    def recent_records(self, server_name: str, start_time: TimeValue = None, end_time: TimeValue = None,
+                       limit: int = 100) -> Optional[List[Dict]]:
+        """
+        从内存读取完整采样记录（与 get_server_metrics 的结果相同：时间倒序，最多 limit 条）
+        内存中的记录不足以给出完整结果时返回 None，由调用方查询数据库
+        """
+        if not self.enabled:
+            return None
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        with self._lock:
+            ring = self._records.get(server_name)
+            covered_from = ring.covered_from if ring is not None else self.since
+            result = []
+            if ring is not None:
+                for timestamp, record in reversed(ring.records):
+                    if end is not None and timestamp > end:
+                        continue
+                    if start is not None and timestamp < start:
+                        break
+                    result.append(record)
+                    if len(result) >= limit:
+                        break
+        # 已取满 limit 条，或查询起点在覆盖范围内，结果与数据库一致
+        if len(result) >= limit or (start is not None and start >= covered_from):
+            self.record_reads['memory'] += 1
+            return result
+        self.record_reads['disk'] += 1
+        return None
+
+    def breach_start(self, key: SeriesKey, threshold: float, now: float) -> float:
+        """
+        序列末尾连续不低于 threshold 的一段的起始时间，用于告警持续时间判断
+        （新规则或阈值调整后，已持续超过阈值的时间也计入 for_duration）
+        最新的点不超过阈值或序列不在内存中时返回 now
+        """
+        if not self.enabled:
+            return now
+        with self._lock:
+            ring = self._series.get(key)
+            if ring is None or not ring.size:
+                return now
+            timestamps, values = ring.ordered()
+        below = np.flatnonzero(values < threshold)
+        if len(below) == 0:
+            return min(float(timestamps[0]), now)
+        first = int(below[-1]) + 1
+        if first >= len(values):
+            return now
+        return min(float(timestamps[first]), now)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            series = len(self._series)
+            points = sum(ring.size for ring in self._series.values())
+            nbytes = sum(ring.nbytes() for ring in self._series.values())
+            records = sum(len(ring.records) for ring in self._records.values())
+        return {
+            'enabled': self.enabled,
+            'window_seconds': self.window,
+            'capacity_per_series': self.capacity,
+            'records_per_server': self.records_capacity,
+            'covered_since': datetime.fromtimestamp(self.since).isoformat(),
+            'series': series,
+            'points': points,
+            'bytes': nbytes,
+            'records': records,
+            'reads': dict(self.reads),
+            'record_reads': dict(self.record_reads)
+        }
+
+
+# 全局内存热层实例
+hot_tier = HotTier()
@@ -0,0 +1,219 @@
+"""
+后台批量写入（write-behind）
+
+采集任务只把样本放入有界队列，由独立的写入线程批量插入 server_metrics（按天分区）
+并写入时序存储，采集和WebSocket推送的延迟不再受SQLite提交/fsync影响。
+
+队列满时丢弃最旧的样本（监控数据新鲜度优先），丢弃数量等背压指标
+可以通过 stats() 查看。样本在提交时同步写入内存热层，最近的数据无需等待落盘即可查询。
+"""
+import threading
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from db import get_or_create_server, build_metrics_record, insert_metrics_records
+from tsdb import ts_store
+from hot_tier import hot_tier
+from rollup import rollup_manager
+from instrumentation import DB_WRITE_SECONDS, DB_ROWS_WRITTEN
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsWriter:
+    """有界队列 + 写入线程，按批次将采集样本落盘"""
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = None
+
+        self._queue: Deque[Tuple[str, Dict, bool]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._busy = False
+        self._server_ids: Dict[str, int] = {}
+
+        # 背压与吞吐统计
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.high_watermark = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def bind(self, session_factory):
+        """绑定数据库会话工厂"""
+        self.session_factory = session_factory
+
+    def configure(self, max_queue: int, batch_size: int, flush_interval: float):
+        """应用配置（在 start 之前调用）"""
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def start(self):
+        """启动写入线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+        logger.info("Metrics writer started")
+
+    def stop(self, timeout: float = 10.0):
+        """停止写入线程，写完队列中剩余的样本（阻塞调用）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # 线程未启动或超时退出时，在当前线程写完剩余样本
+        self._drain()
+        logger.info("Metrics writer stopped")
+
+    def submit(self, server_name: str, metrics_data: Dict, store_row: bool = True) -> bool:
+        """
+        提交一个采集样本（非阻塞）
+        store_row=False 时只写入时序存储（如远程代理的高频采样）
+        返回False表示队列已满、丢弃了最旧的样本
+        """
+        hot_tier.append_sample(server_name, metrics_data, store_row)
+
+        accepted = True
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+                accepted = False
+            self._queue.append((server_name, metrics_data, store_row))
+            self.enqueued += 1
+            self.high_watermark = max(self.high_watermark, len(self._queue))
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        if not accepted and (self.dropped == 1 or self.dropped % 1000 == 0):
+            logger.warning(f"Metrics write queue full ({self.max_queue}), dropped {self.dropped} samples so far")
+        return accepted
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待队列中已有的样本全部写完，返回是否在超时前完成"""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.1))
+        return True
+
+    def stats(self) -> Dict:
+        """队列深度、吞吐和背压指标"""
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            'queued': queued,
+            'max_queue': self.max_queue,
+            'high_watermark': self.high_watermark,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'batches': self.batches,
+            'last_batch_size': self.last_batch_size,
+            'last_batch_ms': round(self.last_batch_seconds * 1000, 2),
+            'running': self._thread is not None and self._thread.is_alive()
+        }
+
+    def _take_batch(self):
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _run(self):
+        """写入线程主循环：凑满一批或等待 flush_interval 后写入"""
+        while True:
+            with self._cond:
+                if not self._queue and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                if not self._queue:
+                    if self._stopping:
+                        return
+                    continue
+                batch = self._take_batch()
+                self._busy = True
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._write_batch(batch)
+
+    def _server_id(self, session, server_name: str) -> int:
+        """服务器ID缓存，避免每个样本都查询 Server 表"""
+        server_id = self._server_ids.get(server_name)
+        if server_id is None:
+            server_id = get_or_create_server(session, server_name).id
+            self._server_ids[server_name] = server_id
+        return server_id
+
+    def _write_batch(self, batch):
+        """一个事务批量插入 server_metrics 记录，再写入时序存储"""
+        started = time.perf_counter()
+        rows = [(name, data) for name, data, store_row in batch if store_row]
+
+        if rows and self.session_factory is not None:
+            session = self.session_factory()
+            try:
+                records = [build_metrics_record(self._server_id(session, name), data) for name, data in rows]
+                insert_metrics_records(session, records)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                self._server_ids.clear()
+                self.errors += 1
+                logger.error(f"Error writing {len(rows)} metrics rows: {e}")
+            finally:
+                session.close()
+
+        for name, data, _ in batch:
+            try:
+                ts_store.append_sample(name, data)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error storing metrics to time series store: {e}")
+
+        # 本批关闭的汇总桶在一个事务中写入（不在时序存储的锁内访问数据库）
+        try:
+            rollup_manager.persist()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error persisting rollups: {e}")
+
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_batch_seconds = DB_WRITE_SECONDS.since(started)
+        DB_ROWS_WRITTEN.inc(amount=len(batch))
+
+
+# 全局写入器实例
+metrics_writer = MetricsWriter()
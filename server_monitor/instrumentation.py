@@ -0,0 +1,287 @@
+"""
+采集链路自监控指标
+
+进程内的低开销计数器、直方图和仪表，记录采集链路各阶段的耗时和队列深度：
+SSH通道/各探测命令耗时、解析、序列化/压缩、数据库写入、告警评估、WebSocket发送等。
+每次观测只做一次二分查找和几次累加；仪表在抓取时才通过回调读取当前值。
+通过 /metrics（Prometheus 文本格式）和 /api/stats/api 暴露，用于定位哪个阶段超出了刷新间隔。
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 默认直方图桶上限（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增计数器"""
+    __slots__ = ('name', 'help', 'label_names', 'values', '_lock')
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+
+class Histogram:
+    """固定桶直方图，每个标签组合保存 [各桶计数..., 总和, 总数]"""
+    __slots__ = ('name', 'help', 'label_names', 'buckets', 'series', '_lock')
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.series.get(label_values)
+            if state is None:
+                state = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def since(self, started: float, *label_values) -> float:
+        """记录从 started（time.perf_counter()）到现在的耗时，返回耗时"""
+        elapsed = time.perf_counter() - started
+        self.observe(elapsed, *label_values)
+        return elapsed
+
+
+def histogram_quantile(buckets: Tuple[float, ...], counts: List[float], q: float) -> Optional[float]:
+    """由桶计数估算分位数（桶内线性插值，与Prometheus的 histogram_quantile 一致）"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(list(buckets) + [math.inf], counts):
+        if cumulative + count >= rank:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * ((rank - cumulative) / count if count else 0)
+        cumulative += count
+        lower = bound
+    return lower
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Tuple[str, Tuple[str, ...], Callable]] = {}
+        # 其它进程（分片采集的工作进程）上报的指标状态
+        self.remote_states: Dict[str, Dict] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        metric = self.counters.get(name)
+        if metric is None:
+            metric = self.counters[name] = Counter(name, help_text, label_names)
+        return metric
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = self.histograms.get(name)
+        if metric is None:
+            metric = self.histograms[name] = Histogram(name, help_text, label_names, buckets)
+        return metric
+
+    def gauge(self, name: str, help_text: str, callback: Callable, label_names: Tuple[str, ...] = ()):
+        """
+        注册仪表：抓取时调用 callback 读取当前值
+        有标签时 callback 返回 {标签值元组: 数值}，否则返回数值
+        """
+        self.gauges[name] = (help_text, label_names, callback)
+
+    def _gauge_values(self, label_names, callback) -> Dict[Tuple[str, ...], float]:
+        try:
+            value = callback()
+        except Exception:
+            return {}
+        if label_names:
+            return {tuple(key): val for key, val in (value or {}).items() if val is not None}
+        return {(): value} if value is not None else {}
+
+    # -- 跨进程合并 ---------------------------------------------------------
+
+    def export_state(self) -> Dict:
+        """导出计数器和直方图的原始状态（可JSON序列化），供其它进程合并"""
+        return {
+            'counters': {name: {'help': c.help, 'labels': list(c.label_names),
+                                'values': [[list(k), v] for k, v in c.values.items()]}
+                         for name, c in self.counters.items()},
+            'histograms': {name: {'help': h.help, 'labels': list(h.label_names), 'buckets': list(h.buckets),
+                                  'series': [[list(k), list(v)] for k, v in h.series.items()]}
+                           for name, h in self.histograms.items()}
+        }
+
+    def set_remote_state(self, source: str, state: Dict):
+        self.remote_states[source] = state
+
+    def _merged(self):
+        """本进程和其它进程上报的指标合并后的视图"""
+        counters = {name: (c.help, c.label_names, dict(c.values)) for name, c in self.counters.items()}
+        histograms = {name: (h.help, h.label_names, h.buckets, {k: list(v) for k, v in h.series.items()})
+                      for name, h in self.histograms.items()}
+        for state in list(self.remote_states.values()):
+            for name, data in state.get('counters', {}).items():
+                entry = counters.setdefault(name, (data['help'], tuple(data['labels']), {}))
+                for key, value in data['values']:
+                    entry[2][tuple(key)] = entry[2].get(tuple(key), 0.0) + value
+            for name, data in state.get('histograms', {}).items():
+                entry = histograms.setdefault(name, (data['help'], tuple(data['labels']), tuple(data['buckets']), {}))
+                if tuple(data['buckets']) != entry[2]:
+                    continue
+                for key, values in data['series']:
+                    current = entry[3].get(tuple(key))
+                    entry[3][tuple(key)] = values if current is None else [a + b for a, b in zip(current, values)]
+        return counters, histograms
+
+    # -- 输出 ---------------------------------------------------------------
+
+    def render_prometheus(self, prefix: str = 'server_monitor_') -> str:
+        """Prometheus 文本格式"""
+        counters, histograms = self._merged()
+        lines = []
+        for name, (help_text, label_names, values) in sorted(counters.items()):
+            full = f'{prefix}{name}'
+            lines.append(f'# HELP {full} {help_text}')
+            lines.append(f'# TYPE {full} counter')
+            for key, value in sorted(values.items()):
+                lines.append(f'{full}{_format_labels(label_names, key)} {_format_value(value)}')
+        for name, (help_text, label_names, buckets, series) in sorted(histograms.items()):
+            full = f'{prefix}{name}'
+            lines.append(f'# HELP {full} {help_text}')
+            lines.append(f'# TYPE {full} histogram')
+            for key, state in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(list(buckets) + [math.inf], state[:-2]):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f'{full}_bucket{_format_labels(label_names, key, le)} {cumulative}')
+                lines.append(f'{full}_sum{_format_labels(label_names, key)} {_format_value(round(state[-2], 6))}')
+                lines.append(f'{full}_count{_format_labels(label_names, key)} {state[-1]}')
+        for name, (help_text, label_names, callback) in sorted(self.gauges.items()):
+            full = f'{prefix}{name}'
+            lines.append(f'# HELP {full} {help_text}')
+            lines.append(f'# TYPE {full} gauge')
+            for key, value in sorted(self._gauge_values(label_names, callback).items()):
+                lines.append(f'{full}{_format_labels(label_names, key)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """JSON格式的汇总：直方图给出次数、平均值和估算的 p50/p95/p99（毫秒）"""
+        counters, histograms = self._merged()
+        result = {'histograms': {}, 'counters': {}, 'gauges': {}}
+        for name, (_, label_names, buckets, series) in sorted(histograms.items()):
+            entries = {}
+            for key, state in sorted(series.items()):
+                counts, total, count = state[:-2], state[-2], state[-1]
+                label = ','.join(f'{n}={v}' for n, v in zip(label_names, key)) or 'all'
+                entries[label] = {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 3) if count else None,
+                    **{f'p{int(q * 100)}_ms': (round(v * 1000, 3) if v is not None else None)
+                       for q in (0.5, 0.95, 0.99)
+                       for v in [histogram_quantile(buckets, counts, q)]}
+                }
+            result['histograms'][name] = entries
+        for name, (_, label_names, values) in sorted(counters.items()):
+            result['counters'][name] = {
+                (','.join(f'{n}={v}' for n, v in zip(label_names, key)) or 'all'): value
+                for key, value in sorted(values.items())
+            }
+        for name, (_, label_names, callback) in sorted(self.gauges.items()):
+            result['gauges'][name] = {
+                (','.join(f'{n}={v}' for n, v in zip(label_names, key)) or 'all'): value
+                for key, value in sorted(self._gauge_values(label_names, callback).items())
+            }
+        return result
+
+
+class RequestMetricsMiddleware:
+    """ASGI中间件：按路由模板记录HTTP请求数、状态码和耗时（路由模板作为标签，避免路径参数导致标签爆炸）"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            HTTP_REQUEST_SECONDS.since(started, scope['method'], route)
+            HTTP_REQUESTS.inc(scope['method'], route, str(status[0]))
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# 采集链路各阶段
+SSH_CHANNEL_SECONDS = metrics.histogram(
+    'ssh_channel_seconds', 'SSH channel round trip including channel wait', ('server', 'kind'))
+SSH_CHANNEL_WAIT_SECONDS = metrics.histogram(
+    'ssh_channel_wait_seconds', 'Time waiting for a free SSH channel slot', ('server',))
+PROBE_SECONDS = metrics.histogram(
+    'probe_seconds', 'Per-probe command execution time on the remote host', ('server', 'probe'))
+COLLECT_SECONDS = metrics.histogram(
+    'collect_seconds', 'Full collection cycle (SSH, parse, serialize)', ('server',))
+COLLECT_OVERRUNS = metrics.counter(
+    'collect_overruns_total', 'Collection cycles longer than the refresh interval', ('server',))
+PARSE_SECONDS = metrics.histogram('parse_seconds', 'Parsing probe outputs', ('server',))
+SERIALIZE_SECONDS = metrics.histogram(
+    'serialize_seconds', 'Serializing collection results and broadcast frames', ('stage',))
+COMPRESS_SECONDS = metrics.histogram('compress_seconds', 'Compressing frames for WebSocket clients', ('method',))
+DB_WRITE_SECONDS = metrics.histogram('db_write_seconds', 'Write-behind batch commit time')
+DB_ROWS_WRITTEN = metrics.counter('db_samples_written_total', 'Samples written by the write-behind writer')
+ALERT_EVAL_SECONDS = metrics.histogram('alert_evaluation_seconds', 'Alert rule evaluation per sample')
+PLUGIN_SECONDS = metrics.histogram('plugin_seconds', 'Plugin hook execution time', ('plugin', 'hook'))
+WS_SEND_SECONDS = metrics.histogram('websocket_send_seconds', 'WebSocket message send time', ('mode',))
+WS_MESSAGES = metrics.counter('websocket_messages_total', 'WebSocket messages sent', ('mode',))
+HTTP_REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'HTTP request latency', ('method', 'route'))
+HTTP_REQUESTS = metrics.counter('http_requests_total', 'HTTP requests', ('method', 'route', 'status'))
@@ -1,28 +1,43 @@
 import asyncio
 import json
+import time
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Dict
 from config import config
 from ssh_client import ssh_pool
 from monitor import MultiServerMonitor
-from db import get_server_metrics
-from analytics import get_comprehensive_analysis, get_visualization_data
+from broadcast import broadcast_hub, CollectionScheduler, ALL_SERVERS_TOPIC
+from sharding import ShardedCollectionScheduler
+from delta import DeltaEncoder
+from db import get_server_metrics, get_all_server_metrics
+from tsdb import ts_store
+from hot_tier import hot_tier
+from ingest import metrics_writer
+from rollup import rollup_manager
+from query import MetricQuery, execute_query, execute_queries
+from analytics import get_comprehensive_analysis, get_batch_analysis, get_visualization_data
 from alerts import alert_manager, AlertRule, AlertSeverity, AlertType
-from notifications import email_notifier, webhook_notifier, setup_email_notifier_from_config, setup_webhook_notifier_from_config
+from notifications import email_notifier, webhook_notifier, notification_dispatcher, setup_email_notifier_from_config, setup_webhook_notifier_from_config
 from auth import authenticate_user, create_access_token, User, Token
 from fastapi import Depends
 from datetime import timedelta
 from fastapi import status
 import logging
 import jwt
-from compression import compressor
+from compression import compressor, StreamingCompressor, train_dictionary, dictionary_registry
 from cache import cache_manager
 from api_extensions import router as api_extensions_router
 from plugins import plugin_manager
+from docker_inventory import docker_inventory, stats_topic as docker_stats_topic
+from fleet_cli import fleet_runner
+from retention import retention_manager
+from instrumentation import (
+    metrics as self_metrics, RequestMetricsMiddleware, COMPRESS_SECONDS, WS_SEND_SECONDS, WS_MESSAGES
+)
 import subprocess
 import shlex
 
@@ -41,6 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按路由记录请求数和耗时（自监控指标）
+app.add_middleware(RequestMetricsMiddleware)
+
 # 包含API扩展路由
 app.include_router(api_extensions_router)
 
@@ -52,20 +70,97 @@ templates = Jinja2Templates(directory="templates")
 
 # 初始化监控器
 monitor = None
+collection_scheduler = None
+
+def _register_queue_gauges():
+    """注册自监控的队列深度仪表（抓取时读取当前值）"""
+    self_metrics.gauge('ingest_queue_depth', 'Samples waiting in the write-behind queue',
+                       lambda: metrics_writer.stats()['queued'])
+    self_metrics.gauge('notification_queue_depth', 'Alert notifications waiting to be dispatched',
+                       lambda: notification_dispatcher.stats()['queued'])
+    self_metrics.gauge('websocket_subscribers', 'Active broadcast subscribers (WebSocket streams)',
+                       broadcast_hub.subscriber_count)
+    self_metrics.gauge('ssh_channels_in_flight', 'Open SSH channels per server',
+                       lambda: {(name, ): client.in_flight for name, client in ssh_pool.connections.items()},
+                       ('server',))
+    self_metrics.gauge('ssh_channels_waiting', 'Commands waiting for a free SSH channel per server',
+                       lambda: {(name, ): client.waiting for name, client in ssh_pool.connections.items()},
+                       ('server',))
+    self_metrics.gauge('hot_tier_bytes', 'Memory used by the in-memory hot tier ring buffers',
+                       lambda: hot_tier.stats()['bytes'])
+    self_metrics.gauge('fleet_cli_active_runs', 'Fleet CLI commands currently running',
+                       lambda: fleet_runner.active_runs)
+    self_metrics.gauge('database_live_bytes', 'Bytes of live data in the metrics database (excluding free pages)',
+                       lambda: (retention_manager.size or {}).get('live_bytes'))
+    if isinstance(collection_scheduler, ShardedCollectionScheduler):
+        self_metrics.gauge('shard_outbox_depth', 'Results queued in each shard worker for the API process',
+                           lambda: {(str(shard.index), ): shard.worker_stats.get('queued', 0)
+                                    for shard in collection_scheduler.shards},
+                           ('shard',))
+
 
 @app.on_event("startup")
 async def startup_event():
-    global monitor
+    global monitor, collection_scheduler
+    sharding = config.monitoring.sharding
     logger.info("Initializing SSH connections...")
-    await ssh_pool.initialize_connections(config.servers)
+    # 分片模式下由工作进程各自维护SSH连接，API进程只在交互式命令需要时连接
+    await ssh_pool.initialize_connections(config.servers, connect=not sharding.enabled)
     monitor = MultiServerMonitor(ssh_pool)
     logger.info("SSH connections initialized")
 
+    # 最近数据的内存热层，在开始采集前从磁盘预热最近一个窗口
+    hot_tier_config = config.monitoring.hot_tier
+    agent_config = config.monitoring.agent
+    sample_interval = config.monitoring.refresh_interval
+    if agent_config.enabled and agent_config.store_samples:
+        sample_interval = min(sample_interval, agent_config.interval)
+    hot_tier.configure(hot_tier_config, sample_interval)
+    ts_store.attach_hot_tier(hot_tier)
+    if hot_tier_config.enabled and hot_tier_config.warm_up:
+        try:
+            await asyncio.to_thread(hot_tier.warm_up, ts_store, monitor.Session)
+        except Exception as e:
+            logger.error(f"Error warming up hot tier: {e}")
+
+    # 每个服务器一个后台采集任务，结果通过广播中心分发给所有订阅者
+    if sharding.enabled:
+        collection_scheduler = ShardedCollectionScheduler(monitor, broadcast_hub, sharding)
+    else:
+        collection_scheduler = CollectionScheduler(monitor, broadcast_hub)
+    collection_scheduler.start()
+    _register_queue_gauges()
+
+    # 后台维护各主机的Docker清单
+    docker_inventory.configure(config.monitoring.docker)
+    docker_inventory.start(ssh_pool)
+
+    # 批量Web CLI的并发/超时限制
+    fleet_runner.configure(config.monitoring.fleet_cli)
+
+    # 后台按保留天数删除过期数据并回收空间
+    retention_manager.configure(config.monitoring.retention)
+    retention_manager.bind(monitor.engine, monitor.Session, ts_store)
+    try:
+        await asyncio.to_thread(retention_manager.refresh_size)
+    except Exception as e:
+        logger.error(f"Error reading database size: {e}")
+    retention_manager.start()
+
+    # 启动远程采样代理
+    if config.monitoring.agent.enabled:
+        monitor.start_agents()
+
+    # 启动告警通知分发器
+    await notification_dispatcher.start()
+
     # 初始化缓存管理器
+    cache_manager.configure(config.monitoring.cache)
     await cache_manager.start_cleanup_task()
     logger.info("Cache manager initialized")
 
     # 初始化插件系统
+    plugin_manager.configure(config.monitoring.plugins)
     plugin_manager.load_plugins()
     plugin_manager.initialize_plugins()
     logger.info("Plugin system initialized")
@@ -73,10 +168,25 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if collection_scheduler is not None:
+        await collection_scheduler.stop()
+    if monitor is not None:
+        await monitor.stop_agents()
+    await docker_inventory.stop()
+    await retention_manager.stop()
+
+    await notification_dispatcher.stop()
+    plugin_manager.shutdown()
+
     logger.info("Closing SSH connections...")
     await ssh_pool.close_all_connections()
     logger.info("SSH connections closed")
 
+    # 写完后台写入队列中剩余的样本，再将时序存储中尚未落盘的数据写入数据库
+    await asyncio.to_thread(metrics_writer.stop)
+    ts_store.flush()
+    rollup_manager.flush()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -85,9 +195,94 @@ async def read_root(request: Request):
 
 
 
+async def _send_frame(websocket: WebSocket, frame, label: str) -> str:
+    """发送一帧广播数据（序列化和压缩结果在订阅者之间共享），返回发送方式"""
+    # 检查是否启用压缩
+    if hasattr(config.monitoring, 'enable_compression') and config.monitoring.enable_compression:
+        # 使用压缩发送数据
+        compressed_data, method, ratio = frame.compressed()
+        logger.debug(f"Compression ratio for {label}: {ratio:.2%} using {method}")
+
+        # 发送压缩标记和数据
+        await websocket.send_bytes(compressed_data)
+        return 'compressed'
+    else:
+        # 不压缩，直接发送JSON
+        await websocket.send_text(frame.text())
+        return 'json'
+
+
+async def _receive_control_messages(websocket: WebSocket, encoder: DeltaEncoder):
+    """接收客户端控制消息（增量协议下客户端可请求重新同步）"""
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                payload = json.loads(message)
+            except ValueError:
+                continue
+            if isinstance(payload, dict) and payload.get('type') == 'resync':
+                encoder.request_keyframe()
+    except Exception:
+        # 客户端断开连接，发送循环会在下一次发送时退出
+        pass
+
+
+async def _stream_topic(websocket: WebSocket, topic: str, label: str, compress: bool = True):
+    """
+    将广播主题推送到WebSocket
+    客户端使用 ?protocol=delta 时发送关键帧+字段级增量帧，否则每次发送完整帧；
+    使用 ?compression=deflate 时所有消息经连接级流式压缩后以二进制帧发送
+    """
+    encoder = None
+    receiver = None
+    if websocket.query_params.get('protocol') == 'delta':
+        encoder = DeltaEncoder(config.monitoring.delta_keyframe_interval)
+        receiver = asyncio.create_task(_receive_control_messages(websocket, encoder))
+
+    # ?compression=deflate 使用连接级流式压缩上下文，可选 &dict=<id> 指定预置字典
+    stream = None
+    if websocket.query_params.get('compression') == 'deflate':
+        dict_id = websocket.query_params.get('dict')
+        zdict = dictionary_registry.get(dict_id) if dict_id else None
+        if dict_id and zdict is None:
+            # 字典已过期，通知客户端改为不使用字典
+            await websocket.send_text(json.dumps({"type": "compression", "method": "deflate", "dict": None}))
+        stream = StreamingCompressor(zdict=zdict)
+
+    try:
+        async for frame in broadcast_hub.subscribe(topic):
+            # 发送耗时包含编码（帧的序列化结果在订阅者之间共享，只有第一个订阅者付出序列化代价）
+            started = time.perf_counter()
+            if stream is not None:
+                # 消息以换行结尾，客户端可按行切分解压后的字节流
+                text = encoder.encode(frame) if encoder is not None else frame.text()
+                compress_started = time.perf_counter()
+                payload = stream.compress(text + '\n')
+                COMPRESS_SECONDS.since(compress_started, 'deflate_stream')
+                await websocket.send_bytes(payload)
+                mode = 'deflate_stream'
+            elif encoder is not None:
+                await websocket.send_text(encoder.encode(frame))
+                mode = 'delta'
+            elif compress:
+                mode = await _send_frame(websocket, frame, label)
+            else:
+                await websocket.send_text(frame.text())
+                mode = 'json'
+            WS_SEND_SECONDS.since(started, mode)
+            WS_MESSAGES.inc(mode)
+    except Exception as e:
+        logger.error(f"WebSocket error for {label}: {e}")
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        await websocket.close()
+
+
 @app.websocket("/ws/{server_name}")
 async def websocket_endpoint(websocket: WebSocket, server_name: str):
-    """WebSocket端点，用于实时推送服务器监控数据"""
+    """WebSocket端点，用于实时推送服务器监控数据（订阅后台采集结果）"""
     await websocket.accept()
 
     # 检查服务器是否存在
@@ -96,59 +291,27 @@ async def websocket_endpoint(websocket: WebSocket, server_name: str):
         await websocket.close()
         return
 
-    try:
-        while True:
-            # 定期发送监控数据
-            data = await monitor.collect_from_server(server_name)
-
-            # 检查是否启用压缩
-            if hasattr(config.monitoring, 'enable_compression') and config.monitoring.enable_compression:
-                # 使用压缩发送数据
-                compressed_data, method, ratio = compressor.compress_with_best_method(data)
-                logger.debug(f"Compression ratio for {server_name}: {ratio:.2%} using {method}")
-
-                # 发送压缩标记和数据
-                await websocket.send_bytes(compressed_data)
-            else:
-                # 不压缩，直接发送JSON
-                await websocket.send_text(json.dumps(data, ensure_ascii=False))
-
-            # 等待配置的刷新间隔
-            await asyncio.sleep(config.monitoring.refresh_interval)
-    except Exception as e:
-        logger.error(f"WebSocket error for {server_name}: {e}")
-    finally:
-        await websocket.close()
+    await _stream_topic(websocket, server_name, server_name)
 
 
 @app.websocket("/ws-all")
 async def websocket_all_endpoint(websocket: WebSocket):
-    """WebSocket端点，用于实时推送所有服务器的监控数据"""
+    """WebSocket端点，用于实时推送所有服务器的监控数据（订阅后台采集结果）"""
     await websocket.accept()
+    await _stream_topic(websocket, ALL_SERVERS_TOPIC, "all servers")
 
-    try:
-        while True:
-            # 收集所有服务器的数据
-            data = await monitor.collect_from_all_servers()
-
-            # 检查是否启用压缩
-            if hasattr(config.monitoring, 'enable_compression') and config.monitoring.enable_compression:
-                # 使用压缩发送数据
-                compressed_data, method, ratio = compressor.compress_with_best_method(data)
-                logger.debug(f"Compression ratio for all servers: {ratio:.2%} using {method}")
 
-                # 发送压缩标记和数据
-                await websocket.send_bytes(compressed_data)
-            else:
-                # 不压缩，直接发送JSON
-                await websocket.send_text(json.dumps(data, ensure_ascii=False))
+@app.websocket("/ws/live/{server_name}")
+async def websocket_live_endpoint(websocket: WebSocket, server_name: str):
+    """WebSocket端点，转发远程采样代理推送的亚秒级实时数据"""
+    await websocket.accept()
 
-            # 等待配置的刷新间隔
-            await asyncio.sleep(config.monitoring.refresh_interval)
-    except Exception as e:
-        logger.error(f"WebSocket error for all servers: {e}")
-    finally:
+    if not config.monitoring.agent.enabled or server_name not in monitor.collectors:
+        await websocket.send_text(json.dumps({"error": f"Live agent stream not available for {server_name}"}))
         await websocket.close()
+        return
+
+    await _stream_topic(websocket, f"live:{server_name}", f"live {server_name}", compress=False)
 
 
 @app.get("/api/servers")
@@ -169,6 +332,11 @@ async def get_server_data(server_name: str):
     if monitor is None:
         return {"error": "Monitor not initialized"}
 
+    # 优先返回后台采集的最新结果
+    latest = broadcast_hub.latest_data(server_name)
+    if latest is not None:
+        return latest
+
     # 使用缓存版本的方法
     return await monitor.collect_from_server_cached(server_name)
 
@@ -179,6 +347,11 @@ async def get_all_servers_data():
     if monitor is None:
         return {"error": "Monitor not initialized"}
 
+    # 优先返回后台采集的最新结果
+    latest = broadcast_hub.latest_data(ALL_SERVERS_TOPIC)
+    if latest is not None:
+        return latest
+
     # 使用缓存版本的方法
     return await monitor.collect_from_all_servers_cached()
 
@@ -189,37 +362,200 @@ async def health_check():
     return {"status": "healthy", "message": "Server monitor is running"}
 
 
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    """获取后台批量写入队列的深度、吞吐和丢弃统计"""
+    return metrics_writer.stats()
+
+
+@app.get("/api/ssh/pool")
+async def get_ssh_pool_stats():
+    """获取SSH连接池指标（连接状态、熔断器、RTT、失败次数、通道排队深度）"""
+    return ssh_pool.stats()
+
+
+@app.get("/api/polling/stats")
+async def get_polling_stats():
+    """获取各服务器各探测命令的当前采集间隔和执行统计"""
+    if collection_scheduler is None:
+        return {}
+    return collection_scheduler.polling_stats()
+
+
+@app.get("/api/sharding/stats")
+async def get_sharding_stats():
+    """获取分片采集各工作进程的状态、重启次数和结果转发统计"""
+    if isinstance(collection_scheduler, ShardedCollectionScheduler):
+        return collection_scheduler.stats()
+    return {"enabled": False}
+
+
+@app.get("/metrics")
+async def get_self_metrics():
+    """采集链路自监控指标（Prometheus 文本格式）：各阶段耗时直方图、请求计数和队列深度"""
+    return Response(content=self_metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """获取各查询缓存的条目数、内存占用、命中率、淘汰次数和合并的并发加载次数"""
+    return cache_manager.get_all_stats()
+
+
+@app.get("/api/hot-tier/stats")
+async def get_hot_tier_stats():
+    """获取内存热层的窗口、序列数、内存占用以及内存/磁盘读取次数"""
+    return hot_tier.stats()
+
+
+@app.get("/api/retention/stats")
+async def get_retention_stats():
+    """获取保留策略的过期边界、删除/归档统计、最长删除批次耗时和数据库大小"""
+    return await asyncio.to_thread(retention_manager.stats)
+
+
+@app.post("/api/retention/run")
+async def run_retention():
+    """立即执行一次保留策略清理"""
+    try:
+        return await asyncio.to_thread(retention_manager.run_once)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/notifications/stats")
+async def get_notification_stats():
+    """获取告警通知分发队列、发送和重试统计"""
+    return notification_dispatcher.stats()
+
+
 # 历史数据API端点
 @app.get("/api/history/{server_name}")
-async def get_history_data(server_name: str, start_time: str = None, end_time: str = None, limit: int = 100):
-    """获取服务器的历史监控数据"""
+async def get_history_data(server_name: str, start_time: str = None, end_time: str = None, limit: int = 100,
+                           metrics: str = None, max_points: int = None, device: str = ""):
+    """
+    获取服务器的历史监控数据
+    :param metrics: 逗号分隔的指标名（如 cpu_percent,memory_used），指定后从时序存储按列返回
+    :param max_points: 期望的最大点数，指定后自动选择满足分辨率的最粗汇总层级
+    :param device: 设备（GPU序号、挂载点、网卡名、传感器名），默认为主机级序列
+    """
     try:
         from datetime import datetime
         start_dt = datetime.fromisoformat(start_time) if start_time else None
         end_dt = datetime.fromisoformat(end_time) if end_time else None
 
-        # 生成缓存键
-        cache_key = f"{server_name}:{start_time}:{end_time}:{limit}"
+        if metrics:
+            metric_names = [m.strip() for m in metrics.split(',') if m.strip()]
+            if max_points:
+                series = {
+                    metric: rollup_manager.query_auto(server_name, metric, start_dt, end_dt, max_points, device)
+                    for metric in metric_names
+                }
+            else:
+                series = ts_store.query_many(server_name, metric_names, start_dt, end_dt, device)
+            return {"server_name": server_name, "device": device, "series": series}
 
-        # 尝试从缓存获取数据
-        cached_data = cache_manager.get_history_data(server_name, start_time or "", end_time or "", limit)
-        if cached_data is not None:
-            logger.debug(f"Cache hit for history data: {cache_key}")
-            return cached_data
+        # 最近的记录直接从内存热层读取，窗口超出热层覆盖范围时才查询数据库
+        recent = hot_tier.recent_records(server_name, start_dt, end_dt, limit)
+        if recent is not None:
+            return {"server_name": server_name, "history": recent}
 
-        session = monitor.Session()
-        history_data = get_server_metrics(session, server_name, start_dt, end_dt, limit)
-        session.close()
+        def load():
+            session = monitor.Session()
+            try:
+                return {"server_name": server_name,
+                        "history": get_server_metrics(session, server_name, start_dt, end_dt, limit)}
+            finally:
+                session.close()
+
+        # 使用缓存，并发的相同请求只查询一次（查询在线程池中执行）
+        return await cache_manager.load_history_data(server_name, start_time or "", end_time or "", limit,
+                                                     lambda: asyncio.to_thread(load))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/series/{server_name}")
+async def get_series_data(server_name: str, metric: str = None, device: str = "",
+                          start_time: str = None, end_time: str = None):
+    """
+    从时序存储查询单条序列；不指定metric时返回该服务器的序列列表；
+    device=* 时返回该指标所有设备的序列
+    """
+    try:
+        if not metric:
+            return {"server_name": server_name, "series": ts_store.list_series(server_name)}
+
+        from datetime import datetime
+        start_dt = datetime.fromisoformat(start_time) if start_time else None
+        end_dt = datetime.fromisoformat(end_time) if end_time else None
+
+        if device == "*":
+            return {
+                "server_name": server_name,
+                "metric": metric,
+                "devices": ts_store.query_devices(server_name, metric, start_dt, end_dt)
+            }
+
+        timestamps, values = ts_store.query(server_name, metric, start_dt, end_dt, device)
+        return {
+            "server_name": server_name,
+            "metric": metric,
+            "device": device,
+            "timestamps": timestamps,
+            "values": values
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/query")
+async def query_metrics(metric: str, servers: str = None, devices: str = None, hours: float = None,
+                        start_time: str = None, end_time: str = None, interval: int = 0,
+                        aggregations: str = "avg", group_by: str = "server,device", resolution: str = "auto"):
+    """
+    结构化指标查询：按服务器/设备过滤、时间范围、分组间隔计算聚合（avg/min/max/sum/count/last/p50/p90/p95/p99）
+    例: /api/query?metric=gpu_utilization&devices=*&hours=6&interval=300&aggregations=avg,max,p95
+    """
+    try:
+        query = MetricQuery.from_dict({
+            "metric": metric, "servers": servers, "devices": devices, "hours": hours,
+            "start": start_time, "end": end_time, "interval": interval,
+            "aggregations": aggregations, "group_by": group_by, "resolution": resolution
+        })
+        # 扫描和聚合在线程池中执行，不阻塞事件循环
+        return await asyncio.to_thread(execute_query, query)
+    except Exception as e:
+        return {"error": str(e)}
 
-        # 将结果存入缓存
-        result = {"server_name": server_name, "history": history_data}
-        cache_manager.set_history_data(server_name, start_time or "", end_time or "", limit, result)
 
-        return result
+@app.post("/api/query")
+async def query_metrics_batch(request: dict):
+    """批量结构化查询，请求体: {"queries": [{"metric": ..., "interval": ..., "aggregations": [...]}, ...]}"""
+    try:
+        queries = request.get("queries")
+        if queries is None:
+            queries = [request]
+        return {"results": await asyncio.to_thread(execute_queries, queries)}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/api/compression/dictionary")
+async def get_compression_dictionary():
+    """
+    根据各主题最新帧训练deflate预置字典
+    客户端以 ?compression=deflate&dict=<X-Dictionary-Id> 连接WebSocket时使用同一字典
+    """
+    samples = [frame.text() for frame in
+               (broadcast_hub.latest(server_name) for server_name in monitor.collectors)
+               if frame is not None]
+    zdict = train_dictionary(samples)
+    dict_id = dictionary_registry.register(zdict)
+    return Response(content=zdict, media_type="application/octet-stream",
+                    headers={"X-Dictionary-Id": dict_id})
+
+
 @app.get("/api/history-all")
 async def get_all_history_data(start_time: str = None, end_time: str = None, limit: int = 100):
     """获取所有服务器的历史监控数据"""
@@ -228,12 +564,22 @@ async def get_all_history_data(start_time: str = None, end_time: str = None, lim
         start_dt = datetime.fromisoformat(start_time) if start_time else None
         end_dt = datetime.fromisoformat(end_time) if end_time else None
 
+        # 内存热层能给出完整结果的服务器直接读内存，其余服务器通过一条SQL查询读取，每台服务器最多 limit 条
         all_history = {}
-        for server_name in config.servers:
+        remaining = []
+        for server in config.servers:
+            recent = hot_tier.recent_records(server.name, start_dt, end_dt, limit)
+            if recent is None:
+                remaining.append(server.name)
+            else:
+                all_history[server.name] = recent
+        if remaining:
             session = monitor.Session()
-            history_data = get_server_metrics(session, server_name.name, start_dt, end_dt, limit)
-            session.close()
-            all_history[server_name.name] = history_data
+            try:
+                all_history.update(get_all_server_metrics(session, remaining, start_dt, end_dt, limit))
+            finally:
+                session.close()
+            all_history = {server.name: all_history[server.name] for server in config.servers}
 
         return {"history": all_history}
     except Exception as e:
@@ -245,20 +591,35 @@ async def get_all_history_data(start_time: str = None, end_time: str = None, lim
 async def get_analysis_data(server_name: str, hours: int = 24):
     """获取服务器的历史数据分析"""
     try:
-        # 尝试从缓存获取数据
-        cached_data = cache_manager.get_analysis_data(server_name, hours)
-        if cached_data is not None:
-            logger.debug(f"Cache hit for analysis data: {server_name}:{hours}")
-            return cached_data
+        def load():
+            session = monitor.Session()
+            try:
+                return get_comprehensive_analysis(session, server_name, hours)
+            finally:
+                session.close()
 
-        session = monitor.Session()
-        analysis = get_comprehensive_analysis(session, server_name, hours)
-        session.close()
+        # 使用缓存，并发的相同请求只计算一次（统计计算在线程池中执行）
+        return await cache_manager.load_analysis_data(server_name, hours, lambda: asyncio.to_thread(load))
+    except Exception as e:
+        return {"error": str(e)}
 
-        # 将结果存入缓存
-        cache_manager.set_analysis_data(server_name, hours, analysis)
 
-        return analysis
+@app.get("/api/analysis-batch")
+async def get_batch_analysis_data(servers: str = None, hours: int = 24):
+    """
+    批量获取多台服务器的历史数据分析
+    :param servers: 逗号分隔的服务器名，默认所有服务器
+    """
+    try:
+        server_names = [name.strip() for name in servers.split(',') if name.strip()] if servers \
+            else [server.name for server in config.servers]
+
+        session = monitor.Session()
+        try:
+            # 统计计算在线程池中执行，不阻塞事件循环
+            return await asyncio.to_thread(get_batch_analysis, session, server_names, hours)
+        finally:
+            session.close()
     except Exception as e:
         return {"error": str(e)}
 
@@ -267,20 +628,16 @@ async def get_analysis_data(server_name: str, hours: int = 24):
 async def get_visualization_data_api(server_name: str, hours: int = 24):
     """获取用于可视化的数据"""
     try:
-        # 尝从缓存获取数据
-        cached_data = cache_manager.get_analysis_data(server_name, hours)  # 重用分析数据的缓存
-        if cached_data is not None:
-            logger.debug(f"Cache hit for visualization data: {server_name}:{hours}")
-            return cached_data
-
-        session = monitor.Session()
-        vis_data = get_visualization_data(session, server_name, hours)
-        session.close()
-
-        # 将结果存入缓存
-        cache_manager.set_analysis_data(server_name, hours, vis_data)  # 重用分析数据的缓存
-
-        return vis_data
+        def load():
+            session = monitor.Session()
+            try:
+                return get_visualization_data(session, server_name, hours)
+            finally:
+                session.close()
+
+        # 与分析数据共用缓存实例，但使用独立的键前缀（之前两者共用键，会互相返回对方的数据）
+        return await cache_manager.load_analysis_data(server_name, hours, lambda: asyncio.to_thread(load),
+                                                      kind="visualization")
     except Exception as e:
         return {"error": str(e)}
 
@@ -310,7 +667,9 @@ async def add_alert_rule(request: dict):
             threshold_value=float(request["threshold_value"]),
             severity=AlertSeverity(request["severity"]),
             enabled=request.get("enabled", True),
-            description=request.get("description", "")
+            description=request.get("description", ""),
+            for_duration=float(request.get("for_duration", 0)),
+            hysteresis=float(request.get("hysteresis", 0))
         )
         alert_manager.add_rule(rule)
         return {"message": "Alert rule added successfully", "rule": rule.__dict__}
@@ -332,7 +691,8 @@ async def remove_alert_rule(rule_name: str):
 async def get_alert_rules():
     """获取所有告警规则"""
     rules = [{"name": rule.name, "alert_type": rule.alert_type.value, "threshold_value": rule.threshold_value,
-              "severity": rule.severity.value, "enabled": rule.enabled, "description": rule.description}
+              "severity": rule.severity.value, "enabled": rule.enabled, "description": rule.description,
+              "for_duration": rule.for_duration, "hysteresis": rule.hysteresis}
              for rule in alert_manager.rules]
     return {"rules": rules}
 
@@ -462,31 +822,50 @@ async def test_webhook_config():
         return {"error": f"Test failed: {str(e)}"}
 
 
+def _split_servers(servers: str = None):
+    return [name.strip() for name in servers.split(',') if name.strip()] if servers else None
+
+
+@app.get("/api/docker/containers")
+async def query_docker_containers(servers: str = None, state: str = None, name: str = None, image: str = None,
+                                  label: str = None, offset: int = 0, limit: int = 100):
+    """
+    跨服务器查询Docker容器（读取后台维护的清单）
+    :param servers: 逗号分隔的服务器名，默认所有服务器
+    :param state: 容器状态（running/exited/paused...），逗号分隔表示多个
+    :param name: 容器名包含的子串；image 为镜像名包含的子串
+    :param label: 标签 key 或 key=value
+    """
+    return await docker_inventory.query_containers(_split_servers(servers), state, name, image, label, offset, limit)
+
+
+@app.get("/api/docker/images")
+async def query_docker_images(servers: str = None, repository: str = None, dangling: bool = None,
+                              offset: int = 0, limit: int = 100):
+    """跨服务器查询Docker镜像（repository 为包含的子串）"""
+    return await docker_inventory.query_images(_split_servers(servers), repository, dangling, offset, limit)
+
+
+@app.get("/api/docker/stats")
+async def get_docker_inventory_stats():
+    """获取各服务器Docker清单的状态（容器/镜像数、事件流连接、增量/全量刷新次数、最近错误）"""
+    return docker_inventory.stats()
+
+
 @app.get("/api/docker/containers/{server_name}")
 async def get_docker_containers(server_name: str):
-    """获取指定服务器上的Docker容器信息"""
+    """获取指定服务器上正在运行的Docker容器信息"""
     try:
-        client = ssh_pool.get_client(server_name)
-        if not client:
+        host = await docker_inventory.ensure_loaded(server_name)
+        if host is None:
             return {"error": f"Server {server_name} not found or not connected"}
+        if not host.loaded:
+            return {"error": f"Failed to execute docker ps: {host.last_error}"}
 
-        # 执行docker ps命令获取正在运行的容器，使用sudo
-        success, stdout, stderr = await client.execute_command("docker ps --format \"{{.ID}}\\t{{.Names}}\\t{{.Status}}\\t{{.Ports}}\"", use_sudo=True)
-
-        if not success:
-            return {"error": f"Failed to execute docker ps: {stderr}"}
-
-        # 解析输出
-        containers = []
-        if stdout.strip():
-            lines = stdout.strip().split('\n')
-            headers = ["ID", "Name", "Status", "Ports"]
-            for line in lines:
-                values = line.split('\t')
-                if len(values) == len(headers):
-                    container = dict(zip(headers, values))
-                    containers.append(container)
-
+        containers = [
+            {"ID": c['id'], "Name": c['name'], "Status": c['status'], "Ports": c['ports']}
+            for c in sorted(host.containers.values(), key=lambda c: c['name']) if c['state'] == 'running'
+        ]
         return {"containers": containers}
     except Exception as e:
         logger.error(f"Error getting Docker containers for {server_name}: {str(e)}")
@@ -497,33 +876,35 @@ async def get_docker_containers(server_name: str):
 async def get_docker_images(server_name: str):
     """获取指定服务器上的Docker镜像信息"""
     try:
-        client = ssh_pool.get_client(server_name)
-        if not client:
+        host = await docker_inventory.ensure_loaded(server_name)
+        if host is None:
             return {"error": f"Server {server_name} not found or not connected"}
+        if not host.loaded:
+            return {"error": f"Failed to execute docker images: {host.last_error}"}
 
-        # 执行docker images命令获取镜像列表，使用sudo
-        success, stdout, stderr = await client.execute_command("docker images --format \"{{.Repository}}\\t{{.Tag}}\\t{{.ID}}\\t{{.Size}}\"", use_sudo=True)
-
-        if not success:
-            return {"error": f"Failed to execute docker images: {stderr}"}
-
-        # 解析输出
-        images = []
-        if stdout.strip():
-            lines = stdout.strip().split('\n')
-            headers = ["Repository", "Tag", "ID", "Size"]
-            for line in lines:
-                values = line.split('\t')
-                if len(values) == len(headers):
-                    image = dict(zip(headers, values))
-                    images.append(image)
-
+        images = [
+            {"Repository": i['repository'], "Tag": i['tag'], "ID": i['id'], "Size": i['size']}
+            for i in sorted(host.images.values(), key=lambda i: (i['repository'], i['tag']))
+        ]
         return {"images": images}
     except Exception as e:
         logger.error(f"Error getting Docker images for {server_name}: {str(e)}")
         return {"error": str(e)}
 
 
+@app.websocket("/ws/docker/{server_name}")
+async def websocket_docker_stats_endpoint(websocket: WebSocket, server_name: str):
+    """WebSocket端点，推送指定服务器的容器资源统计（有订阅者时才采集）"""
+    await websocket.accept()
+
+    if server_name not in docker_inventory.hosts or not docker_inventory.tasks:
+        await websocket.send_text(json.dumps({"error": f"Docker stats stream not available for {server_name}"}))
+        await websocket.close()
+        return
+
+    await _stream_topic(websocket, docker_stats_topic(server_name), f"docker {server_name}", compress=False)
+
+
 # Web CLI功能相关API端点
 @app.websocket("/ws/cli/{server_name}")
 async def websocket_cli_endpoint(websocket: WebSocket, server_name: str):
@@ -577,6 +958,55 @@ async def websocket_cli_endpoint(websocket: WebSocket, server_name: str):
         await websocket.close()
 
 
+@app.websocket("/ws/fleet/cli")
+async def websocket_fleet_cli_endpoint(websocket: WebSocket):
+    """
+    WebSocket端点，批量Web CLI：一条命令在多台服务器上并发执行，输出按主机打标签逐行推送
+    客户端发送 {"command", "servers": [...] 或 "*", "use_sudo", "concurrency", "timeout"} 开始执行，
+    执行中发送 {"type": "cancel"} 取消；同一连接同时只执行一条命令
+    """
+    await websocket.accept()
+    run = None
+    run_task = None
+
+    async def send(event):
+        await websocket.send_text(json.dumps(event, ensure_ascii=False))
+
+    try:
+        while True:
+            try:
+                request = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await send({"type": "error", "error": "Invalid JSON"})
+                continue
+
+            if request.get("type") == "cancel":
+                if run is not None and not run_task.done():
+                    run.cancel()
+                continue
+            if run_task is not None and not run_task.done():
+                await send({"type": "error", "error": "A command is already running on this connection"})
+                continue
+
+            run, start = fleet_runner.prepare(ssh_pool, request, send)
+            await send(start)
+            if run is None:
+                await send({"type": "error", "error": "Empty command" if not start["command"] else "No matching servers"})
+                continue
+            run_task = asyncio.create_task(fleet_runner.execute(run))
+    except Exception as e:
+        # 客户端断开时 receive_text 抛出异常，正在执行的命令随之取消
+        logger.debug(f"Fleet CLI WebSocket closed: {e}")
+    finally:
+        if run_task is not None:
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+
 @app.get("/api/servers-for-cli")
 async def get_servers_for_cli():
     """获取可用于CLI的服务器列表"""
@@ -596,88 +1026,112 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 
 # GPU历史峰值数据API端点
+GPU_DETAIL_METRICS = ('gpu_memory_used', 'gpu_memory_total', 'gpu_temperature')
+
+
+def _device_sort_key(device: str):
+    """GPU序号按数值排序"""
+    return (0, int(device), '') if device.isdigit() else (1, 0, device)
+
+
+def _legacy_gpu_history_peaks(server_name: str, start_time: float, min_utilization: int):
+    """从 server_metrics 表读取峰值（仅第一个GPU），用于尚未写入按设备序列的旧数据"""
+    from datetime import datetime
+    from sqlalchemy import select
+    from db import Server, select_server_metrics
+
+    session = monitor.Session()
+    try:
+        server = session.query(Server).filter(Server.name == server_name).first()
+        if not server:
+            return []
+        metrics = select_server_metrics(
+            session, [server.id], datetime.fromtimestamp(start_time),
+            where=lambda table: [table.c.gpu_utilization.isnot(None), table.c.gpu_utilization >= min_utilization])
+        records = session.execute(select(metrics).order_by(metrics.c.timestamp.desc())).all()
+        return [{
+            "timestamp": record.timestamp.isoformat(),
+            "gpu_index": "0",
+            "gpu_utilization": record.gpu_utilization,
+            "gpu_memory_used": record.gpu_memory_used,
+            "gpu_memory_total": record.gpu_memory_total,
+            "gpu_temperature": record.gpu_temperature
+        } for record in records]
+    finally:
+        session.close()
+
+
 @app.get("/api/gpu-history-peaks/{server_name}")
-async def get_gpu_history_peaks(server_name: str, hours: int = 24, min_utilization: int = 10):
+async def get_gpu_history_peaks(server_name: str, hours: int = 24, min_utilization: int = 10, gpu: str = None):
     """
-    获取GPU历史峰值数据
+    获取GPU历史峰值数据（逐GPU，从按设备区分的时序序列读取）
     :param server_name: 服务器名称
     :param hours: 查询时间范围（小时）
     :param min_utilization: 最小利用率阈值（百分比）
+    :param gpu: 只查询指定序号的GPU，默认查询所有GPU
     """
     try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import and_
+        import time
+        from datetime import datetime
 
-        # 计算开始时间
-        start_time = datetime.utcnow() - timedelta(hours=hours)
+        start_time = time.time() - hours * 3600
+        # 所有GPU的利用率和详细指标通过一次时序扫描读取
+        series = ts_store.match_series(['gpu_utilization', *GPU_DETAIL_METRICS], [server_name],
+                                       [gpu] if gpu is not None else ['*'])
+        data = ts_store.scan(series, start_time)
+        devices = sorted({device for (_, metric, device) in series if metric == 'gpu_utilization'},
+                         key=_device_sort_key)
 
-        # 获取数据库会话
-        session = monitor.Session()
-
-        # 查询GPU利用率大于阈值的历史数据
-        from db import ServerMetrics, Server
-        query = session.query(ServerMetrics).join(Server).filter(
-            and_(
-                Server.name == server_name,
-                ServerMetrics.timestamp >= start_time,
-                ServerMetrics.gpu_utilization is not None,
-                ServerMetrics.gpu_utilization >= min_utilization
-            )
-        )
-        peak_data = query.order_by(ServerMetrics.timestamp.desc()).all()
-
-        # 添加调试日志
-        logger.info(f"GPU history peaks query for {server_name}: found {len(peak_data)} records with utilization >= {min_utilization}% in last {hours} hours")
-
-        # 额外查询，检查是否有任何GPU数据
-        all_gpu_data = session.query(ServerMetrics).join(Server).filter(
-            and_(
-                Server.name == server_name,
-                ServerMetrics.timestamp >= start_time,
-                ServerMetrics.gpu_utilization is not None
-            )
-        ).count()
-        logger.info(f"Total GPU data points for {server_name} in last {hours} hours: {all_gpu_data}")
-
-        # 再次查询，检查是否有低于阈值的GPU数据
-        low_util_data = session.query(ServerMetrics).join(Server).filter(
-            and_(
-                Server.name == server_name,
-                ServerMetrics.timestamp >= start_time,
-                ServerMetrics.gpu_utilization is not None,
-                ServerMetrics.gpu_utilization < min_utilization
-            )
-        ).count()
-        logger.info(f"GPU data points below threshold ({min_utilization}%) for {server_name}: {low_util_data}")
-
-        # 转换数据格式
         result = []
-        for record in peak_data:
-            result.append({
-                "timestamp": record.timestamp.isoformat(),
-                "gpu_utilization": record.gpu_utilization,
-                "gpu_memory_used": record.gpu_memory_used,
-                "gpu_memory_total": record.gpu_memory_total,
-                "gpu_temperature": record.gpu_temperature
+        gpu_summaries = []
+        for device in devices:
+            timestamps, utilizations = data[(server_name, 'gpu_utilization', device)]
+            if not timestamps:
+                continue
+
+            peaks = [(ts, value) for ts, value in zip(timestamps, utilizations) if value >= min_utilization]
+            gpu_summaries.append({
+                "gpu_index": device,
+                "data_points": len(timestamps),
+                "peak_points": len(peaks),
+                "max_utilization": max(utilizations),
+                "avg_utilization": round(sum(utilizations) / len(utilizations), 2)
             })
+            if not peaks:
+                continue
 
-        # 检查是否有任何GPU数据（不管利用率高低）
-        any_gpu_data = session.query(ServerMetrics).join(Server).filter(
-            and_(
-                Server.name == server_name,
-                ServerMetrics.timestamp >= start_time,
-                ServerMetrics.gpu_utilization.isnot(None)
-            )
-        ).first() is not None
-
-        session.close()
+            # 同一GPU的其它指标与利用率同时采集，按时间戳对齐
+            details = {
+                metric: dict(zip(*data.get((server_name, metric, device), ([], []))))
+                for metric in GPU_DETAIL_METRICS
+            }
+            for ts, value in peaks:
+                result.append({
+                    "timestamp": datetime.fromtimestamp(ts).isoformat(),
+                    "gpu_index": device,
+                    "gpu_utilization": value,
+                    "gpu_memory_used": details['gpu_memory_used'].get(ts),
+                    "gpu_memory_total": details['gpu_memory_total'].get(ts),
+                    "gpu_temperature": details['gpu_temperature'].get(ts)
+                })
+
+        any_gpu_data = bool(gpu_summaries)
+        if not any_gpu_data and gpu in (None, "0"):
+            # 旧数据只有第一个GPU的汇总行
+            result = _legacy_gpu_history_peaks(server_name, start_time, min_utilization)
+            any_gpu_data = bool(result)
+
+        result.sort(key=lambda item: item["timestamp"], reverse=True)
+        logger.info(f"GPU history peaks query for {server_name}: found {len(result)} points with utilization >= {min_utilization}% "
+                    f"across {len(gpu_summaries)} GPUs in last {hours} hours")
 
         response = {
             "server_name": server_name,
             "time_range_hours": hours,
             "min_utilization_threshold": min_utilization,
+            "gpus": gpu_summaries,
             "peak_data": result,
-            "has_gpu_data": len(result) > 0 or any_gpu_data,
+            "has_gpu_data": any_gpu_data,
             "info": f"No GPU utilization peaks found above {min_utilization}% threshold in the last {hours} hours" if len(result) == 0 else "Data available"
         }
 
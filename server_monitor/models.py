@@ -1,9 +1,10 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 class ApiStats(BaseModel):
     total_requests: int
     active_connections: int
     response_times: Dict[str, float]
-    error_rates: Dict[str, float]
\ No newline at end of file
+    error_rates: Dict[str, float]
+    pipeline: Dict[str, Any] = {}
\ No newline at end of file
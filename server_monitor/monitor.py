@@ -1,19 +1,57 @@
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Optional
 from ssh_client import SSHClient
 from parsers import (
     parse_ollama_ps, parse_nvidia_smi, parse_top, parse_free, parse_df, parse_network_stats, parse_processes, parse_hardware_temps,
-    OllamaModelInfo, GPUInfo, SystemResourceInfo, DiskInfo, NetworkInfo, ProcessInfo, CustomCommandResult, HardwareTempInfo
+    OllamaModelInfo, GPUInfo, SystemResourceInfo, DiskInfo, NetworkInfo, ProcessInfo, CustomCommandResult, HardwareTempInfo,
+    HostParser
 )
-from db import store_server_metrics
+from tsdb import ts_store
+from ingest import metrics_writer
+from rollup import rollup_manager  # 注册为时序存储观察者，增量维护汇总层级
 from alerts import alert_manager
 from cache import cache_manager
 from plugins import plugin_manager
+from remote_agent import agent_state_to_metrics
+from broadcast import broadcast_hub
+from polling import AdaptivePoller
+from instrumentation import (
+    PROBE_SECONDS, COLLECT_SECONDS, COLLECT_OVERRUNS, PARSE_SECONDS, SERIALIZE_SECONDS, ALERT_EVAL_SECONDS
+)
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+# 每次采集执行的探测命令（段名 -> 命令）
+# CPU、内存、网络、磁盘I/O和进程CPU直接读取 /proc 原始计数，由 HostParser 计算差值和速率；
+# 主机信息和GPU型号等静态信息只在低频探测中获取
+AGGREGATED_COMMANDS = {
+    'nvidia_smi_static': 'nvidia-smi --query-gpu=index,name,memory.total --format=csv,noheader,nounits',
+    'nvidia_smi_basic': 'nvidia-smi --query-gpu=index,utilization.gpu,memory.used,temperature.gpu --format=csv,noheader,nounits',
+    'nvidia_smi_proc': 'nvidia-smi --query-compute-apps=pid,process_name,used_memory --format=csv,noheader,nounits',
+    'ollama_ps': 'ollama ps',
+    'host_facts': 'getconf CLK_TCK; getconf PAGESIZE; nproc; uname -r',
+    'proc_stat': 'head -n 1 /proc/stat',
+    'meminfo': 'grep -E "^(MemTotal|MemAvailable|MemFree):" /proc/meminfo',
+    'loadavg': 'cat /proc/loadavg',
+    'df': 'df -h',
+    'net_dev': 'cat /proc/net/dev',
+    'diskstats': 'cat /proc/diskstats',
+    'proc_pid_stat': "awk '{i=index($0,\") \"); split(substr($0,i+2),a,\" \"); "
+                     "print $1, a[12]+a[13], substr($0,index($0,\"(\")+1,i-index($0,\"(\")-1)}' "
+                     "/proc/[0-9]*/stat 2>/dev/null || true",
+    'processes': 'ps aux --sort=-%cpu | head -20',
+    'hardware_temps': 'sensors'
+}
+
+
+# 远程采样代理在线时由代理提供数据、轮询跳过的探测（网卡计数仍轮询，用于计算收发速率）
+AGENT_PROBES = frozenset({'proc_stat', 'meminfo', 'loadavg', 'nvidia_smi_basic'})
+# 超过若干个代理采样间隔（且不少于最短时间）未收到帧时视为代理离线，恢复轮询
+AGENT_STALE_INTERVALS = 3
+AGENT_STALE_MIN_SECONDS = 5.0
+
 
 class MonitorCollector:
     def __init__(self, ssh_client: SSHClient, db_session):
@@ -21,7 +59,66 @@ class MonitorCollector:
         self.db_session = db_session
         self.last_collection_time = 0
         self.collection_interval = 1  # 秒
+        # 各探测命令最近一次的输出，未到期的探测复用
+        self._last_outputs: Dict[str, str] = {}
+        self._last_custom_results: Dict[str, CustomCommandResult] = {}
+        # 增量解析器：缓存主机静态信息和上一次的 /proc 计数
+        self.parser = HostParser()
+        self.poller = self._create_poller()
+        # 远程采样代理推送的最新状态
+        self.agent_state: Optional[Dict] = None
+        self.agent_seen = 0.0
+        self.agent_stores_samples = False
+
+    def _create_poller(self) -> AdaptivePoller:
+        """按配置创建探测调度器（自定义命令按各自的 interval 执行）"""
+        from config import config
+        polling = config.monitoring.polling
+        intervals = {name: polling.probe_intervals.get(name, config.monitoring.refresh_interval)
+                     for name in AGGREGATED_COMMANDS}
+        for index, cmd_config in enumerate(cmd for cmd in config.monitoring.custom_commands if cmd.enabled):
+            intervals[f'custom_{index}'] = cmd_config.interval
+        return AdaptivePoller(self.ssh_client.server_config.name, intervals, polling)
     
+    def update_agent_state(self, state: Dict, stores_samples: bool):
+        """记录代理推送的最新状态（stores_samples 表示代理采样会写入时序存储）"""
+        self.agent_state = state
+        self.agent_seen = time.monotonic()
+        self.agent_stores_samples = stores_samples
+
+    def live_agent_state(self) -> Optional[Dict]:
+        """代理在线时返回其最新状态，否则返回None"""
+        from config import config
+        if self.agent_state is None:
+            return None
+        timeout = max(config.monitoring.agent.interval * AGENT_STALE_INTERVALS, AGENT_STALE_MIN_SECONDS)
+        if time.monotonic() - self.agent_seen > timeout:
+            return None
+        return self.agent_state
+
+    def _apply_agent_state(self, result: Dict, state: Dict):
+        """用代理的最新状态覆盖CPU、内存、负载和GPU动态数据（这些探测本轮未执行）"""
+        agent_metrics = agent_state_to_metrics(result['server_name'], result['timestamp'], state)
+        resources = result.setdefault('system_resources', {})
+        for key, value in agent_metrics['system_resources'].items():
+            if key != 'network_info' and value is not None:
+                resources[key] = value
+
+        if not result.get('gpu_info'):
+            result['gpu_info'] = agent_metrics['gpu_info']
+            return
+        agent_gpus = {str(gpu['index']): gpu for gpu in agent_metrics['gpu_info']}
+        for gpu in result['gpu_info']:
+            agent_gpu = agent_gpus.get(str(gpu.get('index')))
+            if agent_gpu is None:
+                continue
+            gpu['utilization'] = agent_gpu['utilization']
+            gpu['temperature'] = agent_gpu['temperature']
+            memory_info = gpu.setdefault('memory_info', {})
+            memory_info['used'] = agent_gpu['memory_info']['used']
+            if agent_gpu['memory_info']['total']:
+                memory_info['total'] = agent_gpu['memory_info']['total']
+
     async def collect_ollama_models(self) -> List[OllamaModelInfo]:
         """收集Ollama模型信息"""
         success, stdout, stderr = await self.ssh_client.execute_command('ollama ps')
@@ -303,84 +400,143 @@ class MonitorCollector:
         else:
             return obj
 
-    async def _execute_aggregated_commands(self):
-        """执行聚合的命令以减少SSH连接次数"""
-        # 定义要执行的命令列表
-        commands = [
-            'nvidia-smi --query-gpu=index,name,utilization.gpu,memory.used,memory.total,temperature.gpu --format=csv,noheader,nounits',
-            'nvidia-smi --query-compute-apps=pid,process_name,used_memory --format=csv,noheader,nounits',
-            'ollama ps',
-            'top -bn1 | head -n 5',
-            'free -g',
-            'df -h',
-            'cat /proc/net/dev',
-            'ps aux --sort=-%cpu | head -20',
-            'sensors'
+    async def _execute_aggregated_commands(self, due: List[str] = None):
+        """
+        执行到期的探测命令以减少SSH往返次数（due 为None时执行全部）
+        返回 (各探测输出, 是否有探测成功)，未到期的探测使用上一次的输出
+        """
+        from config import config
+
+        due = set(AGGREGATED_COMMANDS) | {name for name in self.poller.probes if name.startswith('custom_')} \
+            if due is None else set(due)
+
+        if config.monitoring.collection_mode == 'script':
+            fresh, reachable = await self._execute_collection_script(due)
+        else:
+            # 批量执行命令（每条命令一个SSH通道）
+            commands = {name: cmd for name, cmd in AGGREGATED_COMMANDS.items() if name in due}
+            durations = {}
+            command_outputs = await self.ssh_client.execute_commands_batch(
+                list(commands.values()), durations=durations) if commands else {}
+
+            # 映射回原命令名称
+            fresh = {}
+            reachable = not commands
+            server_name = self.ssh_client.server_config.name
+            for name, cmd in commands.items():
+                if cmd not in command_outputs:
+                    continue
+                if cmd in durations:
+                    PROBE_SECONDS.observe(durations[cmd], server_name, name)
+                success, stdout, stderr = command_outputs[cmd]
+                if success:
+                    fresh[name] = stdout
+                    reachable = True
+                else:
+                    logger.warning(f"Command '{cmd}' failed: {stderr}")
+
+            custom_commands = [cmd for cmd in config.monitoring.custom_commands if cmd.enabled]
+            for index, cmd_config in enumerate(custom_commands):
+                if f'custom_{index}' in due:
+                    self._last_custom_results[f'custom_{index}'] = await self.collect_custom_command(cmd_config.command)
+
+        # 执行失败的到期探测记为空输出（与逐条执行时的行为一致）
+        for name in AGGREGATED_COMMANDS:
+            if name in due:
+                self._last_outputs[name] = fresh.get(name, "")
+
+        results = {name: self._last_outputs.get(name, "") for name in AGGREGATED_COMMANDS}
+        results['custom_command_results'] = [
+            self._last_custom_results[name] for name in sorted(self._last_custom_results, key=lambda n: int(n[7:]))
         ]
+        return results, reachable
 
-        # 批量执行命令
-        command_outputs = await self.ssh_client.execute_commands_batch(commands)
-
-        # 映射回原命令名称
-        results = {
-            'nvidia_smi_basic': "",
-            'nvidia_smi_proc': "",
-            'ollama_ps': "",
-            'top': "",
-            'free': "",
-            'df': "",
-            'net_dev': "",
-            'processes': "",
-            'hardware_temps': ""
-        }
+    async def _execute_collection_script(self, due: set):
+        """
+        将到期的探测命令和自定义命令组装为一个脚本，通过单个SSH通道一次往返执行
+        远程主机上各探测命令并发运行，按段返回的输出交给现有解析函数处理
+        """
+        from config import config
 
-        # 根据命令内容映射结果
-        for cmd, (success, stdout, stderr) in command_outputs.items():
+        sections = {name: cmd for name, cmd in AGGREGATED_COMMANDS.items() if name in due}
+        custom_commands = [cmd for cmd in config.monitoring.custom_commands if cmd.enabled]
+        for index, cmd_config in enumerate(custom_commands):
+            if f'custom_{index}' in due:
+                sections[f'custom_{index}'] = cmd_config.command
+        if not sections:
+            return {}, True
+
+        start_time = time.time()
+        durations = {}
+        section_outputs = await self.ssh_client.execute_script(sections, durations=durations)
+        execution_time = time.time() - start_time
+        server_name = self.ssh_client.server_config.name
+        for name, seconds in durations.items():
+            PROBE_SECONDS.observe(seconds, server_name, name)
+
+        results = {}
+        for name in AGGREGATED_COMMANDS:
+            if name not in sections:
+                continue
+            success, stdout, stderr = section_outputs.get(name, (False, "", "Missing section"))
             if success:
-                if 'nvidia-smi --query-gpu' in cmd:
-                    results['nvidia_smi_basic'] = stdout
-                elif 'nvidia-smi --query-compute-apps' in cmd:
-                    results['nvidia_smi_proc'] = stdout
-                elif 'ollama ps' in cmd:
-                    results['ollama_ps'] = stdout
-                elif 'top -bn1' in cmd:
-                    results['top'] = stdout
-                elif 'free -g' in cmd:
-                    results['free'] = stdout
-                elif 'df -h' in cmd:
-                    results['df'] = stdout
-                elif 'cat /proc/net/dev' in cmd:
-                    results['net_dev'] = stdout
-                elif 'ps aux' in cmd:
-                    results['processes'] = stdout
-                elif 'sensors' in cmd:
-                    results['hardware_temps'] = stdout
+                results[name] = stdout
             else:
-                logger.warning(f"Command '{cmd}' failed: {stderr}")
+                logger.warning(f"Probe '{name}' failed on {self.ssh_client.server_config.name}: {stderr}")
+
+        # 自定义命令随脚本一起执行，执行时间取远程主机记录的耗时（不可用时记为整个脚本的耗时）
+        for index, cmd_config in enumerate(custom_commands):
+            key = f'custom_{index}'
+            if key not in sections:
+                continue
+            success, stdout, stderr = section_outputs.get(key, (False, "", "Missing section"))
+            self._last_custom_results[key] = CustomCommandResult(
+                command=cmd_config.command,
+                output=stdout,
+                success=success,
+                execution_time=durations.get(key, execution_time),
+                error_message=stderr if not success else None
+            )
 
-        return results
+        # 所有段都失败视为主机不可达
+        reachable = any(output[0] for output in section_outputs.values())
+        return results, reachable
 
     async def collect_all(self) -> Dict:
         """收集所有监控信息 - 使用聚合命令以减少SSH连接"""
+        result = await self.collect()
+        if 'error' not in result:
+            await self.process_result(result)
+        return result
+
+    async def collect(self) -> Dict:
+        """
+        执行到期的探测、解析并生成可序列化的采集结果（不写库、不评估告警）
+        分片采集模式下在工作进程中执行，结果转发给API进程后由 process_result 处理
+        """
+        from config import config
+
+        server_name = self.ssh_client.server_config.name
+        cycle_started = time.perf_counter()
+        due = self.poller.due_probes()
+        # 代理在线时跳过它覆盖的探测，改用代理推送的数据
+        agent_state = self.live_agent_state()
+        if agent_state is not None:
+            due = [name for name in due if name not in AGENT_PROBES]
         try:
-            # 执行聚合命令
-            command_results = await self._execute_aggregated_commands()
+            # 执行到期的探测命令
+            command_results, reachable = await self._execute_aggregated_commands(due)
 
             # 并行解析各种数据
+            parse_started = time.perf_counter()
             tasks = [
                 self._parse_ollama_models(command_results.get('ollama_ps', '')),
                 self._parse_gpu_info(
+                    command_results.get('nvidia_smi_static', ''),
                     command_results.get('nvidia_smi_basic', ''),
                     command_results.get('nvidia_smi_proc', '')
                 ),
-                self._parse_system_resources(
-                    command_results.get('top', ''),
-                    command_results.get('free', ''),
-                    command_results.get('df', ''),
-                    command_results.get('net_dev', ''),
-                    command_results.get('processes', ''),
-                    command_results.get('hardware_temps', '')
-                )
+                self._parse_system_resources(command_results)
             ]
 
             ollama_models, gpu_info, system_resources = await asyncio.gather(*tasks, return_exceptions=True)
@@ -398,9 +554,10 @@ class MonitorCollector:
                 logger.error(f"Error parsing system resources: {system_resources}")
                 system_resources = SystemResourceInfo(0.0, 0.0, 0.0)
 
-            # 获取自定义命令结果
-            custom_command_results = await self._execute_custom_commands()
-            system_resources.custom_command_results = custom_command_results
+            PARSE_SECONDS.since(parse_started, server_name)
+
+            # 自定义命令结果已随到期的探测一起执行
+            system_resources.custom_command_results = command_results.get('custom_command_results', [])
 
             result = {
                 'server_name': self.ssh_client.server_config.name,
@@ -419,167 +576,131 @@ class MonitorCollector:
 
             # 使用插件处理数据
             try:
-                result = plugin_manager.process_data_with_plugins(result)
+                result = await plugin_manager.process_data_with_plugins(result)
             except Exception as plugin_error:
                 logger.error(f"Error processing data with plugins: {plugin_error}")
 
-            # 将监控数据存储到数据库
-            try:
-                session = self.db_session()
-                # 确保数据可以被JSON序列化
-                serializable_result = self._make_serializable(result)
-                store_server_metrics(session, self.ssh_client.server_config.name, serializable_result)
-                session.close()
-            except Exception as db_error:
-                logger.error(f"Error storing metrics to database: {db_error}")
-
-            # 评估指标并触发告警
-            try:
-                # 确保数据可以被JSON序列化
-                serializable_result = self._make_serializable(result)
-                alert_manager.evaluate_metrics(self.ssh_client.server_config.name, serializable_result)
-            except Exception as alert_error:
-                logger.error(f"Error evaluating metrics for alerts: {alert_error}")
+            # 确保数据可以被JSON序列化
+            serialize_started = time.perf_counter()
+            serializable_result = self._make_serializable(result)
+            SERIALIZE_SECONDS.since(serialize_started, 'result')
 
-            # 通过插件发送通知
-            try:
-                if 'active_alerts' in result and result['active_alerts']:
-                    await plugin_manager.send_notifications(serializable_result)
-            except Exception as notification_error:
-                logger.error(f"Error sending notifications via plugins: {notification_error}")
+            if agent_state is not None:
+                self._apply_agent_state(serializable_result, agent_state)
+                if self.agent_stores_samples:
+                    # 代理覆盖的序列由代理采样写入，本结果只写入其余序列和数据库行
+                    serializable_result['agent_series'] = True
+
+            # 根据本轮数据调整各探测的采集间隔
+            self.poller.complete(due, serializable_result, reachable)
 
+            # 单轮采集超过刷新间隔时计数，便于定位超时的阶段
+            if COLLECT_SECONDS.since(cycle_started, server_name) > config.monitoring.refresh_interval:
+                COLLECT_OVERRUNS.inc(server_name)
             return serializable_result
         except Exception as e:
             logger.error(f"Error collecting all metrics: {e}")
+            self.poller.complete(due, None, False)
             return {
                 'server_name': self.ssh_client.server_config.name,
                 'error': str(e)
             }
 
-    async def _parse_ollama_models(self, ollama_output: str):
-        """解析Ollama模型输出"""
-        return parse_ollama_ps(ollama_output)
-
-    async def _parse_gpu_info(self, basic_gpu_output: str, proc_gpu_output: str):
-        """解析GPU信息输出"""
-        # 解析GPU基本信息
-        gpus = []
-        basic_lines = basic_gpu_output.strip().split('\n') if basic_gpu_output.strip() else []
-
-        # 解析GPU进程信息
-        process_lines = proc_gpu_output.strip().split('\n') if proc_gpu_output.strip() else []
-        processes_by_gpu = {}
+    async def process_result(self, result: Dict):
+        """处理一次采集结果：提交到后台写入队列、评估告警、通过插件发送通知"""
+        server_name = self.ssh_client.server_config.name
 
-        for line in process_lines:
-            parts = [p.strip() for p in line.split(',')]
-            if len(parts) >= 3:  # pid, process_name, used_memory
-                try:
-                    pid = parts[0]
-                    process_name = parts[1]
-                    memory_used = int(parts[2])
-
-                    # 由于nvidia-smi输出格式，我们可能需要另一种方式来获取GPU索引
-                    # 这里我们暂时将所有进程分配给第一个GPU，后续可改进
-                    gpu_index = 0  # 默认分配给第一个GPU
-
-                    if gpu_index not in processes_by_gpu:
-                        processes_by_gpu[gpu_index] = []
-
-                    processes_by_gpu[gpu_index].append({
-                        'pid': pid,
-                        'process_name': process_name,
-                        'memory_used': memory_used
-                    })
-                except ValueError as e:
-                    logger.error(f"Error parsing GPU process line: {line}, error: {e}")
-
-        for line in basic_lines:
-            parts = [p.strip() for p in line.split(',')]
-            if len(parts) >= 6:  # index, name, util, mem_used, mem_total, temp
-                try:
-                    index = int(parts[0])
-                    name = parts[1]
-                    util = int(parts[2])
-                    mem_used = int(parts[3])
-                    mem_total = int(parts[4])
-                    temp = int(parts[5])
+        # 提交到后台写入队列（批量写入数据库和列式时序存储，不阻塞事件循环）
+        try:
+            metrics_writer.submit(server_name, result)
+        except Exception as db_error:
+            logger.error(f"Error queueing metrics for storage: {db_error}")
 
-                    from parsers import GPUMemoryInfo
-                    memory_info = GPUMemoryInfo(used=mem_used, total=mem_total)
+        # 评估指标并触发告警
+        try:
+            alert_started = time.perf_counter()
+            alert_manager.evaluate_metrics(server_name, result)
+            ALERT_EVAL_SECONDS.since(alert_started)
+        except Exception as alert_error:
+            logger.error(f"Error evaluating metrics for alerts: {alert_error}")
 
-                    # 获取对应GPU的进程信息
-                    processes = processes_by_gpu.get(index, [])
+        # 通过插件发送通知
+        try:
+            if 'active_alerts' in result and result['active_alerts']:
+                await plugin_manager.send_notifications(result)
+        except Exception as notification_error:
+            logger.error(f"Error sending notifications via plugins: {notification_error}")
 
-                    gpu_info = GPUInfo(
-                        index=index,
-                        name=name,
-                        utilization=util,
-                        memory_info=memory_info,
-                        temperature=temp,
-                        processes=processes
-                    )
-                    gpus.append(gpu_info)
-                except ValueError as e:
-                    logger.error(f"Error parsing GPU info line: {line}, error: {e}")
+    async def _parse_ollama_models(self, ollama_output: str):
+        """解析Ollama模型输出"""
+        return parse_ollama_ps(ollama_output)
 
-        return gpus
+    async def _parse_gpu_info(self, static_gpu_output: str, basic_gpu_output: str, proc_gpu_output: str):
+        """解析GPU信息输出（型号和显存总量使用缓存的静态信息）"""
+        self.parser.update_gpu_static(static_gpu_output)
+        return self.parser.gpus(basic_gpu_output, proc_gpu_output)
 
-    async def _parse_system_resources(self, top_output: str, free_output: str, df_output: str = "", net_dev_output: str = "", process_output: str = "", hardware_temps_output: str = ""):
+    async def _parse_system_resources(self, outputs: Dict[str, str]):
         """解析系统资源输出"""
-        # 首先尝试使用top命令的结果
-        if top_output:
-            try:
-                sys_info = parse_top(top_output)
-            except Exception as e:
-                logger.warning(f"Error parsing top output: {e}")
-                sys_info = SystemResourceInfo(0.0, 0.0, 0.0)
-        # 如果top命令失败，尝试使用free命令的结果
-        elif free_output:
-            try:
-                sys_info = parse_free(free_output)
-            except Exception as e:
-                logger.warning(f"Error parsing free output: {e}")
-                sys_info = SystemResourceInfo(0.0, 0.0, 0.0)
-        else:
-            # 如果都失败，返回空信息
-            sys_info = SystemResourceInfo(0.0, 0.0, 0.0)
+        parser = self.parser
+        parser.update_facts(outputs.get('host_facts', ''))
+        now = time.monotonic()
+
+        # CPU和内存来自 /proc/stat 与 /proc/meminfo；旧版本的 top/free 输出仍可解析
+        sys_info = SystemResourceInfo(0.0, 0.0, 0.0)
+        try:
+            if outputs.get('proc_stat'):
+                sys_info.cpu_percent = parser.cpu_percent(outputs['proc_stat']) or 0.0
+            elif outputs.get('top'):
+                sys_info = parse_top(outputs['top'])
+            if outputs.get('meminfo'):
+                memory_used, memory_total = parser.memory(outputs['meminfo'])
+                sys_info.memory_used, sys_info.memory_total = round(memory_used, 2), round(memory_total, 2)
+            elif outputs.get('free') and not sys_info.memory_total:
+                free_info = parse_free(outputs['free'])
+                sys_info.memory_used, sys_info.memory_total = free_info.memory_used, free_info.memory_total
+            if outputs.get('loadavg'):
+                sys_info.load_average = parser.load_average(outputs['loadavg'])
+        except Exception as e:
+            logger.warning(f"Error parsing cpu/memory output: {e}")
 
         # 解析磁盘信息
-        if df_output:
+        if outputs.get('df'):
             try:
-                disk_info = parse_df(df_output)
-                sys_info.disk_info = disk_info
+                sys_info.disk_info = parse_df(outputs['df'])
             except Exception as e:
                 logger.warning(f"Error parsing df output: {e}")
 
-        # 解析网络信息
-        if net_dev_output:
+        # 解析网络信息（含收发速率）
+        if outputs.get('net_dev'):
             try:
-                network_info = parse_network_stats(net_dev_output)
-                sys_info.network_info = network_info
+                sys_info.network_info = parser.network(outputs['net_dev'], now)
             except Exception as e:
                 logger.warning(f"Error parsing network stats output: {e}")
 
-        # 解析进程信息
-        if process_output:
+        # 解析磁盘I/O速率
+        if outputs.get('diskstats'):
             try:
-                process_info = parse_processes(process_output)
-                sys_info.process_info = process_info
+                sys_info.disk_io = parser.disk_io(outputs['diskstats'], now)
+            except Exception as e:
+                logger.warning(f"Error parsing diskstats output: {e}")
+
+        # 解析进程信息（CPU占用由 /proc/<pid>/stat 差值计算）
+        if outputs.get('processes') or outputs.get('proc_pid_stat'):
+            try:
+                sys_info.process_info = parser.processes(outputs.get('processes', ''),
+                                                         outputs.get('proc_pid_stat', ''), now)
             except Exception as e:
                 logger.warning(f"Error parsing process output: {e}")
 
         # 解析硬件温度信息
-        if hardware_temps_output:
+        if outputs.get('hardware_temps'):
             try:
-                temp_info = parse_hardware_temps(hardware_temps_output)
-                sys_info.hardware_temp_info = temp_info
+                sys_info.hardware_temp_info = parse_hardware_temps(outputs['hardware_temps'])
             except Exception as e:
                 logger.warning(f"Error parsing hardware temps output: {e}")
 
-        # 自定义命令结果需要在运行时获取，不能通过解析预执行的输出
-        # 因此这里不处理自定义命令结果
-        # 自定义命令结果会在collect_system_resources中单独获取
-
+        # 自定义命令结果随到期的探测一起执行，在 collect_all 中填充
         return sys_info
 
 
@@ -592,67 +713,86 @@ class MultiServerMonitor:
 
         # 初始化数据库
         self.engine, self.Session = create_database()
+        ts_store.bind(self.Session)
+
+        # 后台批量写入线程
+        from config import config
+        ingest_config = config.monitoring.ingest
+        metrics_writer.bind(self.Session)
+        metrics_writer.configure(ingest_config.queue_size, ingest_config.batch_size, ingest_config.flush_interval)
+        metrics_writer.start()
 
         # 初始化所有收集器
         for server_name, ssh_client in self.ssh_pool.connections.items():
             self.collectors[server_name] = MonitorCollector(ssh_client, self.Session)
 
-    async def collect_from_server_cached(self, server_name: str) -> Dict:
-        """从指定服务器收集监控数据 - 使用缓存"""
-        # 尝试从缓存获取数据
-        cached_data = cache_manager.get_server_metrics(server_name)
-        if cached_data is not None:
-            logger.debug(f"Cache hit for server: {server_name}")
-            return cached_data
-
-        collector = self.collectors.get(server_name)
-        if not collector:
-            return {'error': f'No collector found for server: {server_name}'}
-
-        data = await collector.collect_all()
+        # 远程采样代理
+        self.agent_tasks: Dict[str, asyncio.Task] = {}
 
-        # 将结果存入缓存
-        cache_manager.set_server_metrics(server_name, data=data)
-
-        return data
-
-    async def collect_from_all_servers_cached(self) -> Dict:
-        """从所有服务器收集监控数据 - 使用缓存"""
-        # 尝试从缓存获取数据
-        cached_data = cache_manager.get_server_metrics("all_servers")
-        if cached_data is not None:
-            logger.debug("Cache hit for all servers")
-            return cached_data
+    def start_agents(self):
+        """为所有服务器启动远程采样代理，以推送流代替轮询"""
+        from config import config
+        agent_config = config.monitoring.agent
 
-        results = {}
+        for server_name, collector in self.collectors.items():
+            if server_name not in self.agent_tasks:
+                self.agent_tasks[server_name] = asyncio.create_task(
+                    self._consume_agent(server_name, collector.ssh_client, agent_config)
+                )
+        logger.info(f"Started remote sampling agents for {len(self.agent_tasks)} servers")
+
+    async def _consume_agent(self, server_name: str, ssh_client: SSHClient, agent_config):
+        """
+        消费一个服务器的代理流，断开后按指数退避重启
+        代理在线期间收集器跳过代理覆盖的探测；网卡计数仍由轮询写入，代理采样只写入 AGENT_SERIES
+        """
+        collector = self.collectors[server_name]
+        backoff = 1
+        while True:
+            try:
+                async for _, state in ssh_client.stream_agent(agent_config.interval, agent_config.keyframe_interval):
+                    backoff = 1
+                    # 使用本地接收时间，避免远程主机时钟偏差
+                    metrics = agent_state_to_metrics(server_name, time.time(), state)
+                    broadcast_hub.publish(f"live:{server_name}", metrics)
+                    collector.update_agent_state(state, agent_config.store_samples)
+
+                    if agent_config.store_samples:
+                        sample = dict(metrics, system_resources=dict(metrics['system_resources'], network_info=[]))
+                        metrics_writer.submit(server_name, sample, store_row=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Agent stream error for {server_name}: {e}")
 
-        # 并行收集所有服务器的数据
-        tasks = []
-        server_names = []
+            logger.warning(f"Agent stream for {server_name} ended, restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
 
-        for server_name, collector in self.collectors.items():
-            tasks.append(collector.collect_all())
-            server_names.append(server_name)
+    async def stop_agents(self):
+        """停止所有远程采样代理"""
+        for task in self.agent_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.agent_tasks.values(), return_exceptions=True)
+        self.agent_tasks.clear()
 
-        try:
-            collected_data = await asyncio.gather(*tasks, return_exceptions=True)
+    async def stream_server(self, server_name: str):
+        """订阅指定服务器代理推送的实时状态（异步生成器）"""
+        async for frame in broadcast_hub.subscribe(f"live:{server_name}"):
+            yield frame.data
 
-            for i, data in enumerate(collected_data):
-                server_name = server_names[i]
-                if isinstance(data, Exception):
-                    logger.error(f"Error collecting data from {server_name}: {data}")
-                    results[server_name] = {'error': str(data)}
-                else:
-                    results[server_name] = data
+    async def collect_from_server_cached(self, server_name: str) -> Dict:
+        """从指定服务器收集监控数据 - 使用缓存（并发的未命中请求只采集一次）"""
+        collector = self.collectors.get(server_name)
+        if not collector:
+            return {'error': f'No collector found for server: {server_name}'}
 
-        except Exception as e:
-            logger.error(f"Error in multi-server collection: {e}")
+        return await cache_manager.load_server_metrics(server_name, collector.collect_all)
 
-        # 将结果存入缓存
-        cache_manager.set_server_metrics("all_servers", data=results)
+    async def collect_from_all_servers_cached(self) -> Dict:
+        """从所有服务器收集监控数据 - 使用缓存（并发的未命中请求只采集一次）"""
+        return await cache_manager.load_server_metrics("all_servers", self.collect_from_all_servers)
 
-        return results
-    
     async def collect_from_all_servers(self) -> Dict:
         """从所有服务器收集监控数据"""
         results = {}
@@ -1,9 +1,14 @@
 import smtplib
 import ssl
+import os
+import json
+import time
+import asyncio
 import aiohttp
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional, TYPE_CHECKING
+from typing import Deque, Dict, List, Optional, TYPE_CHECKING
 import logging
 from dataclasses import dataclass
 
@@ -12,6 +17,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# 摘要邮件标题使用批次中最高的严重级别
+SEVERITY_ORDER = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
 @dataclass
 class EmailConfig:
     smtp_server: str
@@ -39,22 +47,65 @@ class EmailNotifier:
             logger.warning("Email notifier is not configured or disabled")
             return False
 
+        subject = f"[{alert.severity.value.upper()}] Server Alert: {alert.message[:50]}..."
+        if self._send_message(subject, self._create_text_body(alert), self._create_html_body(alert)):
+            logger.info(f"Alert email sent successfully for alert {alert.id}")
+            return True
+        return False
+
+    def send_digest_email(self, alerts: List[dict]) -> bool:
+        """将一个时间窗口内的多条告警（alert_to_payload 的结果）合并为一封摘要邮件发送"""
+        if not self.enabled or not self.config:
+            logger.warning("Email notifier is not configured or disabled")
+            return False
+
+        severity = max((a['severity'] for a in alerts), key=lambda s: SEVERITY_ORDER.get(s, 0))
+        servers = sorted({a['server_name'] for a in alerts})
+        if len(alerts) == 1:
+            subject = f"[{severity.upper()}] Server Alert: {alerts[0]['message'][:50]}..."
+        else:
+            subject = f"[{severity.upper()}] {len(alerts)} Server Alerts on {', '.join(servers[:3])}" + \
+                ("..." if len(servers) > 3 else "")
+
+        text_body = "Server Alert Digest\n\n" + "\n".join(
+            f"[{a['severity'].upper()}] {a['timestamp']} {a['server_name']}: {a['message']} "
+            f"(current: {a['current_value']}, threshold: {a['threshold_value']})"
+            for a in alerts
+        ) + "\n\nThis is an automated message from the Server Monitor system."
+        rows = "".join(
+            f"<tr><td>{a['timestamp']}</td><td>{a['server_name']}</td><td>{a['severity'].upper()}</td>"
+            f"<td>{a['message']}</td><td>{a['current_value']}</td><td>{a['threshold_value']}</td></tr>"
+            for a in alerts
+        )
+        html_body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif;">
+            <h2>Server Alert Digest ({len(alerts)} alerts)</h2>
+            <table border="1" cellpadding="5" cellspacing="0">
+                <tr><th>Timestamp</th><th>Server</th><th>Severity</th><th>Message</th><th>Current</th><th>Threshold</th></tr>
+                {rows}
+            </table>
+            <p>This is an automated message from the Server Monitor system.</p>
+        </body>
+        </html>
+        """
+        if self._send_message(subject, text_body, html_body):
+            logger.info(f"Alert digest email sent with {len(alerts)} alerts")
+            return True
+        return False
+
+    def _send_message(self, subject: str, text_body: str, html_body: str) -> bool:
+        """通过SMTP发送一封邮件（阻塞调用，应在线程池中执行）"""
         try:
             # 创建邮件
             message = MIMEMultipart("alternative")
-            message["Subject"] = f"[{alert.severity.value.upper()}] Server Alert: {alert.message[:50]}..."
+            message["Subject"] = subject
             message["From"] = self.config.sender_email
             message["To"] = ", ".join(self.config.recipient_emails)
 
-            # 创建邮件正文
-            text_body = self._create_text_body(alert)
-            html_body = self._create_html_body(alert)
-
             # 添加文本和HTML部分
-            part1 = MIMEText(text_body, "plain")
-            part2 = MIMEText(html_body, "html")
-            message.attach(part1)
-            message.attach(part2)
+            message.attach(MIMEText(text_body, "plain"))
+            message.attach(MIMEText(html_body, "html"))
 
             # 发送邮件
             context = ssl.create_default_context()
@@ -63,8 +114,6 @@ class EmailNotifier:
                     server.starttls(context=context)
                 server.login(self.config.username, self.config.password)
                 server.sendmail(self.config.sender_email, self.config.recipient_emails, message.as_string())
-
-            logger.info(f"Alert email sent successfully for alert {alert.id}")
             return True
 
         except Exception as e:
@@ -166,59 +215,335 @@ class WebhookNotifier:
     def __init__(self, config: Optional[WebhookConfig] = None):
         self.config = config
         self.enabled = config is not None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
 
     def set_config(self, config: WebhookConfig):
         """设置Webhook配置"""
         self.config = config
         self.enabled = True
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """复用同一个HTTP会话（连接池），事件循环变化或会话关闭时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession()
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """关闭共享的HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def send_alert_webhook(self, alert: 'Alert') -> bool:
         """发送告警Webhook"""
+        return await self.send_payloads([alert_to_payload(alert)])
+
+    async def send_payloads(self, payloads: List[dict]) -> bool:
+        """
+        发送告警Webhook，单条告警保持原有的 server_alert 格式，
+        多条告警合并为一次 server_alert_batch 请求
+        """
         if not self.enabled or not self.config:
             logger.warning("Webhook notifier is not configured or disabled")
             return False
 
-        try:
-            # 创建Webhook负载
-            payload = {
-                "event": "server_alert",
-                "alert_id": alert.id,
-                "server_name": alert.server_name,
-                "alert_type": alert.alert_type.value,
-                "severity": alert.severity.value,
-                "message": alert.message,
-                "current_value": alert.current_value,
-                "threshold_value": alert.threshold_value,
-                "timestamp": alert.timestamp.isoformat() if hasattr(alert.timestamp, 'isoformat') else str(alert.timestamp),
-                "acknowledged": alert.acknowledged
-            }
+        if len(payloads) == 1:
+            body = payloads[0]
+        else:
+            body = {"event": "server_alert_batch", "count": len(payloads), "alerts": payloads}
 
+        try:
             # 设置请求头
-            headers = self.config.headers or {}
+            headers = dict(self.config.headers or {})
             headers['Content-Type'] = 'application/json'
 
             # 发送Webhook请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.config.url,
-                    json=payload,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=self.config.timeout)
-                ) as response:
-                    if response.status in [200, 201, 202]:
-                        logger.info(f"Alert webhook sent successfully for alert {alert.id}")
-                        return True
-                    else:
-                        logger.error(f"Failed to send webhook: HTTP {response.status}")
-                        return False
+            async with self._get_session().post(
+                self.config.url,
+                json=body,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout)
+            ) as response:
+                if response.status in [200, 201, 202]:
+                    logger.info(f"Alert webhook sent successfully with {len(payloads)} alerts")
+                    return True
+                else:
+                    logger.error(f"Failed to send webhook: HTTP {response.status}")
+                    return False
 
         except Exception as e:
             logger.error(f"Failed to send alert webhook: {e}")
             return False
 
+
+def alert_to_payload(alert: 'Alert') -> dict:
+    """将告警转换为可序列化的通知负载（Webhook格式，也用于摘要邮件和重试队列）"""
+    return {
+        "event": "server_alert",
+        "alert_id": alert.id,
+        "server_name": alert.server_name,
+        "alert_type": alert.alert_type.value,
+        "severity": alert.severity.value,
+        "message": alert.message,
+        "current_value": alert.current_value,
+        "threshold_value": alert.threshold_value,
+        "timestamp": alert.timestamp.isoformat() if hasattr(alert.timestamp, 'isoformat') else str(alert.timestamp),
+        "acknowledged": alert.acknowledged
+    }
+
+
+class NotificationDispatcher:
+    """
+    异步通知分发器
+    告警只放入有界队列（非阻塞、线程安全），后台任务按时间窗口合并：
+    每个窗口每个通知渠道（邮件收件人列表 / Webhook地址）只发送一封摘要邮件和一次批量Webhook。
+    发送失败的批次写入磁盘上的JSONL重试队列，按指数退避重试，重启后继续重试。
+    """
+    CHANNELS = ('email', 'webhook')
+
+    def __init__(self, max_queue: int = 1000, coalesce_window: float = 10.0, max_batch: int = 50,
+                 outbox_path: str = "notification_outbox.jsonl", max_retries: int = 8,
+                 retry_base_delay: float = 5.0, retry_max_delay: float = 600.0):
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.outbox_path = outbox_path
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Deque[dict] = deque(maxlen=max_queue)  # 启动前提交的告警
+        self._outbox: List[dict] = []
+        self._outbox_changed: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.dropped = 0
+        self.batches = 0
+        self.sent = {channel: 0 for channel in self.CHANNELS}
+        self.retried = 0
+        self.failed = 0
+
+    def configure(self, max_queue: int, coalesce_window: float, max_batch: int, outbox_path: str,
+                  max_retries: int, retry_base_delay: float, retry_max_delay: float):
+        """应用配置（在 start 之前调用）"""
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.outbox_path = outbox_path
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._pending = deque(self._pending, maxlen=max_queue)
+
+    def submit(self, alert: 'Alert') -> bool:
+        """提交一条告警（非阻塞，可在任意线程调用），队列已满时丢弃并返回False"""
+        payload = alert_to_payload(alert)
+        self.submitted += 1
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(payload)
+            return True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return self._enqueue(payload)
+        loop.call_soon_threadsafe(self._enqueue, payload)
+        return True
+
+    def _enqueue(self, payload: dict) -> bool:
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Notification queue full ({self.max_queue}), dropped {self.dropped} alerts so far")
+            return False
+
+    async def start(self):
+        """启动分发任务和重试任务，加载上次未发送完的重试队列"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._outbox_changed = asyncio.Event()
+        self._outbox = await asyncio.to_thread(self._load_outbox)
+        while self._pending:
+            self._enqueue(self._pending.popleft())
+        self._tasks = [
+            asyncio.create_task(self._dispatch_loop()),
+            asyncio.create_task(self._retry_loop())
+        ]
+        logger.info(f"Notification dispatcher started ({len(self._outbox)} batches in outbox)")
+
+    async def stop(self):
+        """停止分发：队列中剩余的告警写入重试队列，关闭HTTP会话"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        remaining = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                remaining.append(self._queue.get_nowait())
+        if remaining:
+            for channel in self._enabled_channels():
+                self._outbox.append(self._outbox_entry(channel, remaining, attempts=0))
+        await asyncio.to_thread(self._save_outbox)
+        await webhook_notifier.close()
+        self._loop = None
+        logger.info("Notification dispatcher stopped")
+
+    def stats(self) -> Dict:
+        """队列深度、发送和重试统计"""
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else len(self._pending),
+            'max_queue': self.max_queue,
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'sent': dict(self.sent),
+            'retried': self.retried,
+            'failed': self.failed,
+            'outbox': len(self._outbox),
+            'running': bool(self._tasks)
+        }
+
+    def _enabled_channels(self) -> List[str]:
+        channels = []
+        if email_notifier.enabled and email_notifier.config:
+            channels.append('email')
+        if webhook_notifier.enabled and webhook_notifier.config:
+            channels.append('webhook')
+        return channels
+
+    async def _collect_batch(self) -> List[dict]:
+        """等待第一条告警，然后在合并窗口内继续收集，直到窗口结束或达到批次上限"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.coalesce_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch_loop(self):
+        while True:
+            batch = await self._collect_batch()
+            self.batches += 1
+            channels = self._enabled_channels()
+            if not channels:
+                continue
+            results = await asyncio.gather(*(self._deliver(channel, batch) for channel in channels))
+            failed = [self._outbox_entry(channel, batch, attempts=1)
+                      for channel, ok in zip(channels, results) if not ok]
+            if failed:
+                self._outbox.extend(failed)
+                await asyncio.to_thread(self._save_outbox)
+                self._outbox_changed.set()
+
+    async def _deliver(self, channel: str, payloads: List[dict]) -> bool:
+        """通过一个渠道发送一批告警，邮件在线程池中发送"""
+        try:
+            if channel == 'email':
+                ok = await asyncio.to_thread(email_notifier.send_digest_email, payloads)
+            else:
+                ok = await webhook_notifier.send_payloads(payloads)
+        except Exception as e:
+            logger.error(f"Error delivering {channel} notification: {e}")
+            ok = False
+        if ok:
+            self.sent[channel] += 1
+        return ok
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_base_delay * (2 ** max(attempts - 1, 0)), self.retry_max_delay)
+
+    def _outbox_entry(self, channel: str, payloads: List[dict], attempts: int) -> dict:
+        return {
+            'channel': channel,
+            'alerts': payloads,
+            'attempts': attempts,
+            'next_attempt': time.time() + (self._backoff(attempts) if attempts else 0)
+        }
+
+    async def _retry_loop(self):
+        """按 next_attempt 重试重试队列中的批次，失败后指数退避，超过最大次数后放弃"""
+        while True:
+            now = time.time()
+            due = [entry for entry in self._outbox if entry['next_attempt'] <= now]
+            if due:
+                for entry in due:
+                    self.retried += 1
+                    if await self._deliver(entry['channel'], entry['alerts']):
+                        self._outbox.remove(entry)
+                        continue
+                    entry['attempts'] += 1
+                    if entry['attempts'] >= self.max_retries:
+                        self.failed += 1
+                        self._outbox.remove(entry)
+                        logger.error(f"Giving up {entry['channel']} notification with "
+                                     f"{len(entry['alerts'])} alerts after {entry['attempts']} attempts")
+                    else:
+                        entry['next_attempt'] = time.time() + self._backoff(entry['attempts'])
+                await asyncio.to_thread(self._save_outbox)
+                continue
+
+            # 等待到最早的重试时间，或有新的失败批次加入
+            timeout = min((entry['next_attempt'] for entry in self._outbox), default=now + 60) - now
+            self._outbox_changed.clear()
+            try:
+                await asyncio.wait_for(self._outbox_changed.wait(), max(timeout, 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    def _load_outbox(self) -> List[dict]:
+        if not os.path.exists(self.outbox_path):
+            return []
+        entries = []
+        try:
+            with open(self.outbox_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entries.append(json.loads(line))
+        except Exception as e:
+            logger.error(f"Error loading notification outbox: {e}")
+        return entries
+
+    def _save_outbox(self):
+        """原子地重写重试队列文件（先写临时文件再替换）"""
+        try:
+            if not self._outbox:
+                if os.path.exists(self.outbox_path):
+                    os.remove(self.outbox_path)
+                return
+            tmp_path = self.outbox_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in list(self._outbox):
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.outbox_path)
+        except Exception as e:
+            logger.error(f"Error saving notification outbox: {e}")
+
 # 全局通知器实例
 email_notifier = EmailNotifier()
 webhook_notifier = WebhookNotifier()
+notification_dispatcher = NotificationDispatcher()
 
 def setup_email_notifier_from_config():
     """根据配置设置邮件通知器"""
@@ -257,6 +582,21 @@ def setup_webhook_notifier_from_config():
     else:
         logger.info("Webhook notifications are disabled")
 
+def setup_notification_dispatcher_from_config():
+    """根据配置设置通知分发器"""
+    from config import config
+    dispatch_cfg = config.monitoring.notification_dispatch
+    notification_dispatcher.configure(
+        max_queue=dispatch_cfg.queue_size,
+        coalesce_window=dispatch_cfg.coalesce_window,
+        max_batch=dispatch_cfg.max_batch,
+        outbox_path=dispatch_cfg.outbox_path,
+        max_retries=dispatch_cfg.max_retries,
+        retry_base_delay=dispatch_cfg.retry_base_delay,
+        retry_max_delay=dispatch_cfg.retry_max_delay
+    )
+
 # 初始化通知器
 setup_email_notifier_from_config()
-setup_webhook_notifier_from_config()
\ No newline at end of file
+setup_webhook_notifier_from_config()
+setup_notification_dispatcher_from_config()
\ No newline at end of file
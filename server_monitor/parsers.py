@@ -1,10 +1,11 @@
 import re
 import json
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import time
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, asdict
 
 
-@dataclass
+@dataclass(slots=True)
 class OllamaModelInfo:
     """Ollama模型信息"""
     name: str
@@ -18,7 +19,7 @@ class OllamaModelInfo:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class GPUMemoryInfo:
     """GPU显存信息"""
     used: int  # MB
@@ -30,7 +31,7 @@ class GPUMemoryInfo:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class GPUInfo:
     """GPU信息"""
     index: int
@@ -52,10 +53,7 @@ class GPUInfo:
         }
 
 
-from dataclasses import dataclass, asdict
-import json
-
-@dataclass
+@dataclass(slots=True)
 class DiskInfo:
     """磁盘信息"""
     filesystem: str
@@ -70,7 +68,7 @@ class DiskInfo:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class NetworkInfo:
     """网络信息"""
     interface: str
@@ -78,13 +76,30 @@ class NetworkInfo:
     transmit_bytes: int
     receive_packets: int
     transmit_packets: int
+    receive_rate: Optional[float] = None  # 字节/秒，由相邻两次 /proc/net/dev 计数计算
+    transmit_rate: Optional[float] = None
+
+    def to_dict(self):
+        """转换为字典格式以便JSON序列化"""
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class DiskIOInfo:
+    """块设备I/O速率（由相邻两次 /proc/diskstats 计数计算）"""
+    device: str
+    read_bytes_rate: float  # 字节/秒
+    write_bytes_rate: float
+    reads_per_sec: float
+    writes_per_sec: float
+    busy_percent: float  # 设备忙碌时间占比
 
     def to_dict(self):
         """转换为字典格式以便JSON序列化"""
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class ProcessInfo:
     """进程信息"""
     pid: str
@@ -98,7 +113,7 @@ class ProcessInfo:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class CustomCommandResult:
     """自定义命令执行结果"""
     command: str
@@ -112,7 +127,7 @@ class CustomCommandResult:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class HardwareTempInfo:
     """硬件温度信息"""
     sensor_name: str
@@ -125,7 +140,7 @@ class HardwareTempInfo:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class SystemResourceInfo:
     """系统资源信息"""
     cpu_percent: float
@@ -137,6 +152,7 @@ class SystemResourceInfo:
     hardware_temp_info: Optional[List[HardwareTempInfo]] = None
     custom_command_results: Optional[List[CustomCommandResult]] = None
     load_average: Optional[List[float]] = None
+    disk_io: Optional[List[DiskIOInfo]] = None
 
     def to_dict(self):
         """转换为字典格式以便JSON序列化"""
@@ -149,7 +165,8 @@ class SystemResourceInfo:
             'process_info': [proc.to_dict() for proc in self.process_info] if self.process_info else [],
             'hardware_temp_info': [temp.to_dict() for temp in self.hardware_temp_info] if self.hardware_temp_info else [],
             'custom_command_results': [cmd.to_dict() for cmd in self.custom_command_results] if self.custom_command_results else [],
-            'load_average': self.load_average
+            'load_average': self.load_average,
+            'disk_io': [io.to_dict() for io in self.disk_io] if self.disk_io else []
         }
         return result
 
@@ -341,26 +358,18 @@ def parse_df(output: str) -> List[DiskInfo]:
     lines = output.strip().split('\n')[1:] if output.strip() else []
 
     for line in lines:
-        # 使用正则表达式匹配 df -h 输出的格式
         # 例如: /dev/sda1        20G   10G  9.0G  50% /
-        match = re.match(r'^(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\d+)%\s+(.*)', line)
-        if match:
-            filesystem = match.group(1)
-            size = match.group(2)
-            used = match.group(3)
-            available = match.group(4)
-            percent = int(match.group(5))
-            mount_point = match.group(6)
-
-            disk_info = DiskInfo(
-                filesystem=filesystem,
-                size=size,
-                used=used,
-                available=available,
-                percent=percent,
-                mount_point=mount_point
-            )
-            disks.append(disk_info)
+        # 按空白切分前5列，挂载点可能包含空格
+        parts = line.split(None, 5)
+        if len(parts) == 6 and parts[4].endswith('%') and parts[4][:-1].isdigit():
+            disks.append(DiskInfo(
+                filesystem=parts[0],
+                size=parts[1],
+                used=parts[2],
+                available=parts[3],
+                percent=int(parts[4][:-1]),
+                mount_point=parts[5]
+            ))
 
     return disks
 
@@ -422,24 +431,20 @@ def parse_processes(output: str) -> List[ProcessInfo]:
     lines = output.strip().split('\n')[1:] if output.strip() else []
 
     for line in lines:
-        # 使用正则表达式匹配 ps aux 或类似命令的输出格式
         # 例如: USER PID %CPU %MEM VSZ RSS TTY STAT START TIME COMMAND
-        match = re.match(r'^(\S+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(.*)', line)
-        if match:
-            user = match.group(1)
-            pid = match.group(2)
-            cpu_percent = float(match.group(3))
-            memory_percent = float(match.group(4))
-            command = match.group(5)
-
-            process_info = ProcessInfo(
-                pid=pid,
-                user=user,
-                cpu_percent=cpu_percent,
-                memory_percent=memory_percent,
-                command=command
-            )
-            processes.append(process_info)
+        # 按空白切分前10列，命令行可能包含空格
+        parts = line.split(None, 10)
+        if len(parts) == 11 and parts[1].isdigit():
+            try:
+                processes.append(ProcessInfo(
+                    pid=parts[1],
+                    user=parts[0],
+                    cpu_percent=float(parts[2]),
+                    memory_percent=float(parts[3]),
+                    command=parts[10]
+                ))
+            except ValueError:
+                continue
 
     return processes
 
@@ -447,8 +452,12 @@ def parse_processes(output: str) -> List[ProcessInfo]:
 def parse_hardware_temps(output: str) -> List[HardwareTempInfo]:
     """
     解析 'sensors' 或 'cat /sys/class/thermal/thermal_zone*/temp' 命令的输出来获取硬件温度信息
+    device 为 "<适配器>/<传感器名>"（多路CPU的 "Core 0"、多块网卡的 "temp1" 等重名传感器各自区分），
+    thermal_zone 输出按出现顺序编号
     """
     temps = []
+    adapter = None
+    zone_index = 0
 
     # 分割输出行
     lines = output.strip().split('\n') if output.strip() else []
@@ -463,6 +472,11 @@ def parse_hardware_temps(output: str) -> List[HardwareTempInfo]:
         # 或者解析 /sys/class/thermal/ 下的温度文件
         # 例如: 45000 (表示 45.0°C)
 
+        # 适配器（芯片）名称行，如 coretemp-isa-0000
+        if re.match(r'^[A-Za-z][\w.-]*-[\w.-]+$', line.strip()) and not line.startswith(' '):
+            adapter = line.strip()
+            continue
+
         # 匹配 sensors 输出格式
         sensor_match = re.match(r'^\s*(.+?):\s*\+([\d.]+)°C', line)
         if sensor_match:
@@ -472,7 +486,8 @@ def parse_hardware_temps(output: str) -> List[HardwareTempInfo]:
             temp_info = HardwareTempInfo(
                 sensor_name=sensor_name,
                 temperature=temperature,
-                unit="°C"
+                unit="°C",
+                device=f"{adapter}/{sensor_name}" if adapter else None
             )
             temps.append(temp_info)
 
@@ -486,8 +501,346 @@ def parse_hardware_temps(output: str) -> List[HardwareTempInfo]:
             temp_info = HardwareTempInfo(
                 sensor_name="Thermal Zone",
                 temperature=temperature,
-                unit="°C"
+                unit="°C",
+                device=f"thermal_zone{zone_index}"
             )
+            zone_index += 1
             temps.append(temp_info)
 
-    return temps
\ No newline at end of file
+    return temps
+
+
+# 挂载点和温度传感器的设备键字段（按优先级）
+DISK_DEVICE_FIELDS = ('mount_point', 'filesystem')
+SENSOR_DEVICE_FIELDS = ('device', 'sensor_name')
+
+
+def unique_devices(items: List[Dict], fields: Tuple[str, ...], default: str = 'unknown') -> List[str]:
+    """
+    为一次采集中的设备列表生成唯一的设备键（告警状态和时序序列共用）
+    取第一个非空字段；仍然重名的设备按出现顺序加 #2、#3 后缀，避免同名设备共用一个序列或告警状态
+    """
+    keys = []
+    seen: Dict[str, int] = {}
+    for item in items:
+        name = next((str(item[field]) for field in fields if item.get(field)), default)
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        keys.append(name if count == 1 else f"{name}#{count}")
+    return keys
+
+
+# 磁盘扇区大小（/proc/diskstats 中固定以512字节为单位）
+DISKSTATS_SECTOR_SIZE = 512
+
+
+def parse_host_facts(output: str) -> Dict:
+    """
+    解析主机静态信息探测的输出（每行一项）:
+    getconf CLK_TCK; getconf PAGESIZE; nproc; uname -r
+    """
+    lines = [line.strip() for line in output.splitlines()]
+    facts = {}
+    for key, index in (('clk_tck', 0), ('page_size', 1), ('cpu_count', 2)):
+        if index < len(lines) and lines[index].isdigit():
+            facts[key] = int(lines[index])
+    if len(lines) > 3 and lines[3]:
+        facts['kernel'] = lines[3]
+    return facts
+
+
+def parse_proc_stat_cpu(output: str) -> Optional[Tuple[int, int]]:
+    """
+    解析 /proc/stat 的cpu汇总行，返回 (总jiffies, 空闲jiffies)
+    cpu  user nice system idle iowait irq softirq steal guest guest_nice
+    """
+    for line in output.splitlines():
+        if line.startswith('cpu '):
+            fields = [int(value) for value in line.split()[1:]]
+            if len(fields) < 4:
+                return None
+            # guest/guest_nice 已计入 user/nice，只累加前8列
+            total = sum(fields[:8])
+            idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+            return total, idle
+    return None
+
+
+def parse_meminfo(output: str) -> Dict[str, int]:
+    """解析 /proc/meminfo，返回 {字段名: kB}"""
+    values = {}
+    for line in output.splitlines():
+        key, sep, rest = line.partition(':')
+        if sep:
+            parts = rest.split()
+            if parts and parts[0].isdigit():
+                values[key] = int(parts[0])
+    return values
+
+
+def parse_loadavg(output: str) -> Optional[List[float]]:
+    """解析 /proc/loadavg，返回1/5/15分钟平均负载"""
+    parts = output.split()
+    if len(parts) < 3:
+        return None
+    try:
+        return [float(part) for part in parts[:3]]
+    except ValueError:
+        return None
+
+
+def parse_diskstats(output: str) -> Dict[str, Tuple[int, int, int, int, int]]:
+    """
+    解析 /proc/diskstats，返回 {设备: (读完成次数, 读扇区数, 写完成次数, 写扇区数, I/O耗时ms)}
+    跳过 loop/ram 设备和分区（只保留整盘，避免重复计算）
+    """
+    counters = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 14:
+            continue
+        name = parts[2]
+        if name.startswith(('loop', 'ram', 'zram')):
+            continue
+        try:
+            counters[name] = (int(parts[3]), int(parts[5]), int(parts[7]), int(parts[9]), int(parts[12]))
+        except ValueError:
+            continue
+
+    names = set(counters)
+    for name in list(counters):
+        for base in names:
+            if base != name and name.startswith(base) and name[len(base):].lstrip('p').isdigit():
+                del counters[name]
+                break
+    return counters
+
+
+def parse_proc_pid_stat(output: str) -> Dict[str, Tuple[int, str]]:
+    """
+    解析进程CPU计数探测的输出，每行: <pid> <utime+stime jiffies> <comm>
+    返回 {pid: (jiffies, comm)}
+    """
+    processes = {}
+    for line in output.splitlines():
+        parts = line.split(' ', 2)
+        if len(parts) >= 2 and parts[0].isdigit() and parts[1].isdigit():
+            processes[parts[0]] = (int(parts[1]), parts[2] if len(parts) > 2 else '')
+    return processes
+
+
+class HostParser:
+    """
+    单台主机的增量解析器
+    - 静态信息（时钟频率、CPU核数、GPU型号和显存总量）首次解析后缓存，高频探测不再重复获取
+    - 保存上一次的 /proc 原始计数，计算CPU使用率、网络/磁盘速率和进程CPU占用
+    - 传入的输出与上次是同一对象时（未到期探测复用的输出）直接返回上次的结果，不重复解析
+    """
+    def __init__(self):
+        self.facts: Dict = {'clk_tck': 100, 'page_size': 4096, 'cpu_count': 1}
+        self.gpu_static: Dict[int, Tuple[str, int]] = {}
+        self._last: Dict[str, Tuple[object, object]] = {}
+        self._prev_cpu: Optional[Tuple[int, int]] = None
+        self._prev_net: Optional[Tuple[float, Dict[str, Tuple[int, int]]]] = None
+        self._prev_disk: Optional[Tuple[float, Dict[str, Tuple[int, int, int, int, int]]]] = None
+        self._prev_proc: Optional[Tuple[float, Dict[str, int]]] = None
+        self._proc_rates: Dict[str, Tuple[float, str]] = {}
+
+    def _cached(self, kind: str, key):
+        last = self._last.get(kind)
+        if last is not None and last[0] is key:
+            return last[1]
+        return None
+
+    def _store(self, kind: str, key, result):
+        self._last[kind] = (key, result)
+        return result
+
+    def update_facts(self, output: str):
+        """更新主机静态信息"""
+        if output and self._cached('facts', output) is None:
+            self.facts.update(parse_host_facts(output))
+            self._store('facts', output, True)
+
+    def update_gpu_static(self, output: str):
+        """更新GPU静态信息: index, name, memory.total"""
+        if not output or self._cached('gpu_static', output) is not None:
+            return
+        gpu_static = {}
+        for line in output.splitlines():
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) >= 3 and parts[0].isdigit():
+                try:
+                    gpu_static[int(parts[0])] = (parts[1], int(parts[2]))
+                except ValueError:
+                    continue
+        self.gpu_static = gpu_static
+        self._store('gpu_static', output, True)
+
+    def gpus(self, basic_output: str, proc_output: str) -> List[GPUInfo]:
+        """
+        解析GPU动态信息: index, utilization, memory.used, temperature
+        型号和显存总量来自缓存的静态信息（也兼容包含name和memory.total的6列格式）
+        """
+        key = (basic_output, proc_output)
+        last = self._last.get('gpus')
+        if last is not None and last[0][0] is basic_output and last[0][1] is proc_output:
+            return last[1]
+
+        # 由于nvidia-smi的进程查询不包含GPU索引，所有进程暂时归到第一个GPU
+        processes = []
+        for line in proc_output.splitlines():
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) >= 3 and parts[2].isdigit():
+                processes.append({'pid': parts[0], 'process_name': parts[1], 'memory_used': int(parts[2])})
+
+        gpus = []
+        for line in basic_output.splitlines():
+            parts = [part.strip() for part in line.split(',')]
+            try:
+                if len(parts) >= 6:
+                    index, name, util, mem_used, mem_total, temp = (
+                        int(parts[0]), parts[1], int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]))
+                elif len(parts) >= 4:
+                    index, util, mem_used, temp = int(parts[0]), int(parts[1]), int(parts[2]), int(parts[3])
+                    name, mem_total = self.gpu_static.get(index, ('', 0))
+                else:
+                    continue
+            except ValueError:
+                continue
+            gpus.append(GPUInfo(
+                index=index,
+                name=name,
+                utilization=util,
+                memory_info=GPUMemoryInfo(used=mem_used, total=mem_total),
+                temperature=temp,
+                processes=processes if index == 0 else []
+            ))
+        return self._store('gpus', key, gpus)
+
+    def cpu_percent(self, output: str) -> Optional[float]:
+        """由相邻两次 /proc/stat 计数计算CPU使用率，首次采样返回None"""
+        cached = self._cached('cpu', output)
+        if cached is not None:
+            return cached[0]
+        counters = parse_proc_stat_cpu(output)
+        percent = None
+        if counters is not None and self._prev_cpu is not None:
+            total_delta = counters[0] - self._prev_cpu[0]
+            idle_delta = counters[1] - self._prev_cpu[1]
+            if total_delta > 0:
+                percent = round((1 - idle_delta / total_delta) * 100, 2)
+        if counters is not None:
+            self._prev_cpu = counters
+        self._store('cpu', output, (percent,))
+        return percent
+
+    def memory(self, output: str) -> Tuple[float, float]:
+        """由 /proc/meminfo 计算 (已用GB, 总量GB)，已用 = MemTotal - MemAvailable"""
+        cached = self._cached('memory', output)
+        if cached is not None:
+            return cached
+        values = parse_meminfo(output)
+        total_kb = values.get('MemTotal', 0)
+        available_kb = values.get('MemAvailable', values.get('MemFree', 0))
+        result = ((total_kb - available_kb) / (1024 * 1024), total_kb / (1024 * 1024))
+        return self._store('memory', output, result)
+
+    def load_average(self, output: str) -> Optional[List[float]]:
+        """解析 /proc/loadavg"""
+        cached = self._cached('loadavg', output)
+        if cached is not None:
+            return cached[0]
+        return self._store('loadavg', output, (parse_loadavg(output),))[0]
+
+    def network(self, output: str, now: float = None) -> List[NetworkInfo]:
+        """解析 /proc/net/dev，并由相邻两次计数计算收发速率（字节/秒）"""
+        cached = self._cached('network', output)
+        if cached is not None:
+            return cached
+        now = time.monotonic() if now is None else now
+        networks = parse_network_stats(output)
+        counters = {net.interface: (net.receive_bytes, net.transmit_bytes) for net in networks}
+        if self._prev_net is not None:
+            elapsed = now - self._prev_net[0]
+            previous = self._prev_net[1]
+            for net in networks:
+                prev = previous.get(net.interface)
+                # 计数回绕或网卡重置时不计算速率
+                if prev is not None and elapsed > 0 and net.receive_bytes >= prev[0] and net.transmit_bytes >= prev[1]:
+                    net.receive_rate = round((net.receive_bytes - prev[0]) / elapsed, 1)
+                    net.transmit_rate = round((net.transmit_bytes - prev[1]) / elapsed, 1)
+        self._prev_net = (now, counters)
+        return self._store('network', output, networks)
+
+    def disk_io(self, output: str, now: float = None) -> List[DiskIOInfo]:
+        """由相邻两次 /proc/diskstats 计数计算各磁盘的读写速率，首次采样返回空列表"""
+        cached = self._cached('disk_io', output)
+        if cached is not None:
+            return cached
+        now = time.monotonic() if now is None else now
+        counters = parse_diskstats(output)
+        result = []
+        if self._prev_disk is not None:
+            elapsed = now - self._prev_disk[0]
+            previous = self._prev_disk[1]
+            for device, current in counters.items():
+                prev = previous.get(device)
+                if prev is None or elapsed <= 0 or any(c < p for c, p in zip(current, prev)):
+                    continue
+                reads, read_sectors, writes, write_sectors, io_ms = (c - p for c, p in zip(current, prev))
+                result.append(DiskIOInfo(
+                    device=device,
+                    read_bytes_rate=round(read_sectors * DISKSTATS_SECTOR_SIZE / elapsed, 1),
+                    write_bytes_rate=round(write_sectors * DISKSTATS_SECTOR_SIZE / elapsed, 1),
+                    reads_per_sec=round(reads / elapsed, 2),
+                    writes_per_sec=round(writes / elapsed, 2),
+                    busy_percent=round(min(io_ms / (elapsed * 1000) * 100, 100.0), 2)
+                ))
+        self._prev_disk = (now, counters)
+        return self._store('disk_io', output, result)
+
+    def processes(self, ps_output: str, stat_output: str, now: float = None, limit: int = 20) -> List[ProcessInfo]:
+        """
+        进程列表：CPU占用由相邻两次 /proc/<pid>/stat 的 utime+stime 差值计算（与top一致，单核100%），
+        而不是ps给出的进程生命周期内的平均值；用户、内存和完整命令行来自ps
+        """
+        last = self._last.get('processes')
+        if last is not None and last[0][0] is ps_output and last[0][1] is stat_output:
+            return last[1]
+
+        if self._cached('proc_stat', stat_output) is None and stat_output:
+            now = time.monotonic() if now is None else now
+            stats = parse_proc_pid_stat(stat_output)
+            jiffies = {pid: value for pid, (value, _) in stats.items()}
+            rates = {}
+            if self._prev_proc is not None:
+                elapsed = now - self._prev_proc[0]
+                previous = self._prev_proc[1]
+                clk_tck = self.facts.get('clk_tck', 100)
+                if elapsed > 0:
+                    for pid, value in jiffies.items():
+                        prev = previous.get(pid)
+                        if prev is not None and value >= prev:
+                            rates[pid] = (value - prev) / clk_tck / elapsed * 100
+            self._prev_proc = (now, jiffies)
+            self._proc_rates = {pid: (rate, stats[pid][1]) for pid, rate in rates.items()}
+            self._store('proc_stat', stat_output, True)
+
+        listed = parse_processes(ps_output) if ps_output else []
+        if not self._proc_rates:
+            processes = listed[:limit]
+        else:
+            by_pid = {proc.pid: proc for proc in listed}
+            processes = []
+            for pid, (rate, comm) in self._proc_rates.items():
+                proc = by_pid.get(pid)
+                if proc is not None:
+                    proc.cpu_percent = round(rate, 1)
+                    processes.append(proc)
+                elif rate > 0:
+                    processes.append(ProcessInfo(pid=pid, user='', cpu_percent=round(rate, 1),
+                                                 memory_percent=0.0, command=comm))
+            processes.sort(key=lambda proc: proc.cpu_percent, reverse=True)
+            processes = processes[:limit]
+        return self._store('processes', (ps_output, stat_output), processes)
@@ -1,11 +1,16 @@
 import os
+import asyncio
 import importlib.util
 import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Callable
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import logging
 
+from instrumentation import PLUGIN_SECONDS
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -16,6 +21,122 @@ class PluginMetadata:
     author: str
     description: str
     enabled: bool = True
+    # 执行方式：sync 在工作线程池中执行，async 在事件循环中执行，auto 按钩子方法是否为协程自动判断
+    execution: str = "auto"
+    timeout: Optional[float] = None  # 单次钩子调用的超时时间（秒），None 使用 monitoring.plugins.default_timeout
+    max_concurrency: Optional[int] = None  # 同时执行的最大调用数，None 使用 monitoring.plugins.default_max_concurrency
+
+
+class PluginRunner:
+    """
+    单个插件的执行器：超时、并发限制、延迟/错误统计和自动禁用
+    并发调用已满时本次调用直接跳过，慢插件不会让采集排队等待；
+    同步插件超时后工作线程仍在运行，其并发名额在线程真正结束后才释放
+    """
+    def __init__(self, name: str, plugin: 'BasePlugin', settings):
+        metadata = plugin.metadata
+        self.name = name
+        self.execution = metadata.execution if metadata else "auto"
+        self.timeout = (metadata.timeout if metadata and metadata.timeout else None) or settings.default_timeout
+        self.max_concurrency = (metadata.max_concurrency if metadata and metadata.max_concurrency else None) \
+            or settings.default_max_concurrency
+        self.max_failures = settings.max_consecutive_failures
+        self.active = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.disabled = False
+        self.disabled_reason: Optional[str] = None
+
+    def _is_async(self, func: Callable) -> bool:
+        if self.execution == "auto":
+            return inspect.iscoroutinefunction(func)
+        return self.execution == "async"
+
+    def _release(self, *_):
+        self.active -= 1
+
+    def _record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.max_failures and self.consecutive_failures >= self.max_failures and not self.disabled:
+            self.disabled = True
+            self.disabled_reason = f"{self.consecutive_failures} consecutive failures, last: {error}"
+            logger.error(f"Plugin {self.name} disabled automatically: {self.disabled_reason}")
+
+    async def call(self, hook: str, func: Callable, *args, executor: Optional[ThreadPoolExecutor] = None):
+        """
+        执行一次钩子调用
+        返回 (是否成功, 结果)；插件已禁用、并发已满、超时或出错时返回 (False, None)
+        """
+        if self.disabled:
+            return False, None
+        if self.active >= self.max_concurrency:
+            self.skipped += 1
+            return False, None
+
+        self.active += 1
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            if self._is_async(func):
+                try:
+                    result = await asyncio.wait_for(func(*args), self.timeout)
+                finally:
+                    self._release()
+            else:
+                future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+                future.add_done_callback(self._release)
+                # 超时后不取消线程中的任务（无法中断），名额在线程结束时释放
+                result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._record_failure(f"{hook} timed out after {self.timeout}s")
+            logger.warning(f"Plugin {self.name} {hook} timed out after {self.timeout}s")
+            return False, None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            self._record_failure(f"{hook}: {e}")
+            logger.error(f"Error in plugin {self.name} {hook}: {e}")
+            return False, None
+        finally:
+            elapsed = PLUGIN_SECONDS.since(started, self.name, hook)
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+        self.consecutive_failures = 0
+        return True, result
+
+    def enable(self):
+        """重新启用（清除自动禁用状态和连续失败计数）"""
+        self.disabled = False
+        self.disabled_reason = None
+        self.consecutive_failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'execution': self.execution,
+            'timeout': self.timeout,
+            'max_concurrency': self.max_concurrency,
+            'active': self.active,
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'skipped': self.skipped,
+            'avg_ms': round(self.total_seconds / self.calls * 1000, 3) if self.calls else None,
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'disabled': self.disabled,
+            'disabled_reason': self.disabled_reason
+        }
 
 class BasePlugin(ABC):
     """插件基类"""
@@ -64,6 +185,10 @@ class PluginManager:
         self.plugins: Dict[str, BasePlugin] = {}
         self.enabled_plugins: List[str] = []
         self.hooks: Dict[str, List[Callable]] = {}
+        self.runners: Dict[str, PluginRunner] = {}
+        self.settings = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._metrics_task: Optional[asyncio.Future] = None
 
         # 确保插件目录存在
         os.makedirs(plugins_dir, exist_ok=True)
@@ -79,9 +204,9 @@ class PluginManager:
             module = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(module)
 
-            # 查找继承自BasePlugin的类
+            # 查找模块中定义的、继承自BasePlugin的具体类（跳过导入的插件基类）
             for name, obj in inspect.getmembers(module, inspect.isclass):
-                if obj != BasePlugin and issubclass(obj, BasePlugin):
+                if issubclass(obj, BasePlugin) and not inspect.isabstract(obj) and obj.__module__ == module.__name__:
                     # 实例化插件
                     plugin_instance = obj(self.plugins_dir)
 
@@ -121,7 +246,10 @@ class PluginManager:
             try:
                 success = plugin.initialize()
                 if success:
-                    self.enabled_plugins.append(plugin_name)
+                    if plugin_name not in self.enabled_plugins:
+                        self.enabled_plugins.append(plugin_name)
+                    # 重新加载后的插件使用新的执行器（统计和禁用状态重置）
+                    self.runners[plugin_name] = PluginRunner(plugin_name, plugin, self._settings())
                     logger.info(f"Initialized plugin: {plugin_name}")
                 else:
                     logger.error(f"Failed to initialize plugin: {plugin_name}")
@@ -146,10 +274,52 @@ class PluginManager:
                     logger.error(f"Error in hook {hook_name} callback: {e}")
         return results
 
+    def configure(self, settings):
+        """设置插件执行参数（monitoring.plugins）"""
+        self.settings = settings
+
+    def _settings(self):
+        if self.settings is None:
+            from config import config
+            self.settings = config.monitoring.plugins
+        return self.settings
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """同步插件使用的工作线程池（与默认线程池隔离，阻塞的插件不影响 asyncio.to_thread 的其它任务）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._settings().worker_threads,
+                                                thread_name_prefix="plugin")
+        return self._executor
+
+    def _runner(self, plugin: BasePlugin) -> PluginRunner:
+        name = plugin.__class__.__name__
+        runner = self.runners.get(name)
+        if runner is None:
+            runner = self.runners[name] = PluginRunner(name, plugin, self._settings())
+        return runner
+
     def get_enabled_plugins(self) -> List[BasePlugin]:
-        """获取所有启用的插件"""
+        """获取所有启用的插件（不包括被自动禁用的插件）"""
+        return [self.plugins[name] for name in self.enabled_plugins
+                if name in self.plugins and not (name in self.runners and self.runners[name].disabled)]
+
+    def get_initialized_plugins(self) -> List[BasePlugin]:
+        """获取所有初始化成功的插件（包括被自动禁用的插件）"""
         return [self.plugins[name] for name in self.enabled_plugins if name in self.plugins]
 
+    def plugin_stats(self, plugin_name: str) -> Optional[Dict[str, Any]]:
+        """插件的执行统计（延迟、错误、超时、跳过次数和禁用状态）"""
+        runner = self.runners.get(plugin_name)
+        return runner.stats() if runner is not None else None
+
+    def enable_plugin(self, plugin_name: str) -> bool:
+        """重新启用被自动禁用的插件"""
+        runner = self.runners.get(plugin_name)
+        if runner is None:
+            return False
+        runner.enable()
+        return True
+
     def get_monitor_plugins(self) -> List[MonitorPlugin]:
         """获取所有监控插件"""
         return [plugin for plugin in self.get_enabled_plugins() if isinstance(plugin, MonitorPlugin)]
@@ -163,37 +333,65 @@ class PluginManager:
         return [plugin for plugin in self.get_enabled_plugins() if isinstance(plugin, DataProcessorPlugin)]
 
     async def collect_additional_metrics(self) -> Dict[str, Any]:
-        """收集所有插件的额外指标"""
-        all_metrics = {}
+        """
+        收集所有插件的额外指标（各插件并发执行，超时或出错的插件不影响其它插件）
+        该钩子与服务器无关：多个服务器同时采集时共享同一次正在进行的收集
+        """
+        if not self.get_monitor_plugins():
+            return {}
+        if self._metrics_task is None or self._metrics_task.done():
+            self._metrics_task = asyncio.ensure_future(self._collect_additional_metrics())
+        return dict(await asyncio.shield(self._metrics_task))
+
+    async def _collect_additional_metrics(self) -> Dict[str, Any]:
+        plugins = self.get_monitor_plugins()
+        executor = self._get_executor()
+        results = await asyncio.gather(*(
+            self._runner(plugin).call('collect_additional_metrics', plugin.collect_additional_metrics,
+                                      executor=executor)
+            for plugin in plugins
+        ))
 
-        for plugin in self.get_monitor_plugins():
-            try:
-                plugin_metrics = plugin.collect_additional_metrics()
+        all_metrics = {}
+        for success, plugin_metrics in results:
+            if success and isinstance(plugin_metrics, dict):
                 all_metrics.update(plugin_metrics)
-            except Exception as e:
-                logger.error(f"Error collecting metrics from plugin {plugin.__class__.__name__}: {e}")
-
         return all_metrics
 
     async def send_notifications(self, alert_data: Dict[str, Any]):
-        """通过所有通知插件发送通知"""
-        for plugin in self.get_notification_plugins():
-            try:
-                await plugin.send_notification(alert_data)
-            except Exception as e:
-                logger.error(f"Error sending notification via plugin {plugin.__class__.__name__}: {e}")
-
-    def process_data_with_plugins(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """使用所有数据处理插件处理数据"""
+        """通过所有通知插件并发发送通知"""
+        plugins = self.get_notification_plugins()
+        if not plugins:
+            return
+
+        executor = self._get_executor()
+        await asyncio.gather(*(
+            self._runner(plugin).call('send_notification', plugin.send_notification, alert_data, executor=executor)
+            for plugin in plugins
+        ))
+
+    async def process_data_with_plugins(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        使用所有数据处理插件依次处理数据（前一个插件的输出是下一个插件的输入）
+        超时或出错的插件被跳过，沿用上一步的数据
+        """
         processed_data = data.copy()
 
+        executor = self._get_executor()
         for plugin in self.get_data_processor_plugins():
-            try:
-                processed_data = plugin.process_data(processed_data)
-            except Exception as e:
-                logger.error(f"Error processing data with plugin {plugin.__class__.__name__}: {e}")
+            # 传入副本：超时的同步插件仍在线程中运行时，不会修改后续步骤使用的数据
+            success, result = await self._runner(plugin).call('process_data', plugin.process_data,
+                                                              processed_data.copy(), executor=executor)
+            if success and isinstance(result, dict):
+                processed_data = result
 
         return processed_data
 
+    def shutdown(self):
+        """关闭同步插件的工作线程池（不等待仍在运行的插件调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
 # 全局插件管理器实例
 plugin_manager = PluginManager()
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+按探测命令的自适应采集调度
+
+每个服务器一个 AdaptivePoller，为每个探测命令（nvidia-smi、/proc/stat、df、sensors、自定义命令等）
+维护独立的采集间隔：
+- 基础间隔可按探测命令配置，df、sensors 等分钟级变化的探测默认低频执行
+- 指标接近告警阈值或变化较快时缩短间隔；长时间不变时逐步放慢
+- 主机不可达时按指数退避重试
+- 每次排期加入随机抖动，避免多台服务器同时采集
+未到期的探测复用上一次的输出，SSH开销取决于信号的变化情况而不是固定的时钟频率。
+"""
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from alerts import AlertType, alert_manager
+
+
+def _resources(result: Dict) -> Dict:
+    return result.get('system_resources') or {}
+
+
+def _max(values) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+
+def _memory_percent(resources: Dict) -> Optional[float]:
+    used, total = resources.get('memory_used'), resources.get('memory_total')
+    return used / total * 100 if used is not None and total else None
+
+
+# 探测命令 -> 从采集结果中提取用于调整间隔的信号 [(告警类型, 数值)]
+PROBE_SIGNALS: Dict[str, Callable[[Dict], List[Tuple[AlertType, Optional[float]]]]] = {
+    'proc_stat': lambda r: [(AlertType.CPU_USAGE, _resources(r).get('cpu_percent'))],
+    'meminfo': lambda r: [(AlertType.MEMORY_USAGE, _memory_percent(_resources(r)))],
+    'nvidia_smi_basic': lambda r: [(AlertType.GPU_UTILIZATION,
+                                    _max(gpu.get('utilization') for gpu in r.get('gpu_info') or []))],
+    'df': lambda r: [(AlertType.DISK_USAGE,
+                      _max(disk.get('percent') for disk in _resources(r).get('disk_info') or []))],
+    'hardware_temps': lambda r: [(AlertType.TEMPERATURE,
+                                  _max(temp.get('temperature') for temp in _resources(r).get('hardware_temp_info') or []))],
+}
+
+
+class ProbeState:
+    """单个探测命令的调度状态"""
+    __slots__ = ('base_interval', 'interval', 'next_due', 'last_values', 'stable_count', 'polls')
+
+    def __init__(self, base_interval: float, next_due: float):
+        self.base_interval = base_interval
+        self.interval = base_interval
+        self.next_due = next_due
+        self.last_values: List[Optional[float]] = []
+        self.stable_count = 0
+        self.polls = 0
+
+
+class AdaptivePoller:
+    """单个服务器的探测调度器"""
+    def __init__(self, server_name: str, base_intervals: Dict[str, float], settings, rng: random.Random = None):
+        self.server_name = server_name
+        self.settings = settings
+        self.rng = rng or random.Random()
+        # 首次采集执行全部探测，之后每次排期都加入随机抖动
+        now = time.monotonic()
+        self.probes: Dict[str, ProbeState] = {
+            name: ProbeState(interval, now) for name, interval in base_intervals.items()
+        }
+        self.failures = 0
+        self.retry_at = 0.0
+        self.executed = 0  # 实际执行的探测次数
+        self.skipped = 0  # 未到期、复用上次输出的探测次数
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def due_probes(self, now: float = None) -> List[str]:
+        """本轮需要执行的探测命令"""
+        if not self.enabled:
+            return list(self.probes)
+        now = time.monotonic() if now is None else now
+        if now < self.retry_at:
+            return []
+        # 即将到期的探测合并到本轮执行，减少SSH往返
+        horizon = now + self.settings.min_interval / 2
+        return [name for name, state in self.probes.items() if state.next_due <= horizon]
+
+    def next_delay(self, now: float = None) -> float:
+        """距离下一个探测到期的时间（秒）"""
+        now = time.monotonic() if now is None else now
+        earliest = min((state.next_due for state in self.probes.values()), default=now + self.settings.min_interval)
+        return max(0.0, max(earliest, self.retry_at) - now)
+
+    def complete(self, polled: List[str], result: Optional[Dict], success: bool, now: float = None):
+        """一轮采集结束：根据新数据调整间隔并安排下次执行；失败时按指数退避"""
+        now = time.monotonic() if now is None else now
+        if not success:
+            self.failures += 1
+            backoff = min(self.settings.min_interval * (2 ** self.failures), self.settings.max_backoff)
+            self.retry_at = now + self._jitter(backoff)
+            return
+        if not polled:
+            # 本轮没有到期的探测（如退避期间的接口调用），不改变调度状态
+            return
+
+        self.failures = 0
+        self.retry_at = 0.0
+        self.executed += len(polled)
+        self.skipped += len(self.probes) - len(polled)
+
+        adapted = set()
+        for name in polled:
+            state = self.probes.get(name)
+            extractor = PROBE_SIGNALS.get(name)
+            if state is not None and extractor is not None and result is not None:
+                if self._adapt(state, extractor(result)):
+                    adapted.add(name)
+
+        # 没有信号的探测（进程列表、网络计数、无GPU主机上的nvidia-smi等）跟随主机整体的空闲程度放慢
+        host_factor = self._host_idle_factor()
+        for name in polled:
+            state = self.probes.get(name)
+            if state is None:
+                continue
+            state.polls += 1
+            if name not in adapted:
+                state.interval = state.base_interval * host_factor
+            state.next_due = now + self._jitter(state.interval)
+
+    def _adapt(self, state: ProbeState, signals: List[Tuple[AlertType, Optional[float]]]) -> bool:
+        """接近告警阈值或变化快时加速，持续平稳时减速；没有有效数值时返回False"""
+        settings = self.settings
+        values = [value for _, value in signals]
+        if all(value is None for value in values):
+            state.last_values = []
+            state.stable_count = 0
+            return False
+
+        near = False
+        for alert_type, value in signals:
+            threshold = alert_manager.min_threshold(alert_type)
+            if value is not None and threshold is not None and value >= threshold * (1 - settings.near_threshold_margin):
+                near = True
+
+        changes = [abs(value - last) for value, last in zip(values, state.last_values)
+                   if value is not None and last is not None]
+        state.last_values = values
+
+        if near or any(change >= settings.fast_change for change in changes):
+            state.stable_count = 0
+            state.interval = max(settings.min_interval, state.base_interval * settings.fast_factor)
+        elif changes and max(changes) < settings.idle_change:
+            state.stable_count += 1
+            state.interval = state.base_interval * self._idle_factor(state.stable_count)
+        else:
+            state.stable_count = 0
+            state.interval = state.base_interval
+        return True
+
+    def _idle_factor(self, stable_count: int) -> float:
+        """每连续平稳 idle_after 次，间隔翻倍，最多 max_idle_factor 倍"""
+        return min(2 ** (stable_count // self.settings.idle_after), self.settings.max_idle_factor)
+
+    def _host_idle_factor(self) -> float:
+        factors = [self._idle_factor(state.stable_count)
+                   for name, state in self.probes.items() if name in PROBE_SIGNALS and state.last_values]
+        return min(factors) if factors else 1.0
+
+    def _jitter(self, interval: float) -> float:
+        jitter = self.settings.jitter
+        return max(0.0, interval * (1 + self.rng.uniform(-jitter, jitter)))
+
+    def stats(self) -> Dict:
+        """各探测命令的当前间隔和执行统计"""
+        now = time.monotonic()
+        return {
+            'enabled': self.enabled,
+            'failures': self.failures,
+            'retry_in': round(max(0.0, self.retry_at - now), 2),
+            'executed': self.executed,
+            'skipped': self.skipped,
+            'probes': {
+                name: {
+                    'base_interval': state.base_interval,
+                    'interval': round(state.interval, 2),
+                    'next_in': round(max(0.0, state.next_due - now), 2),
+                    'polls': state.polls,
+                    'stable_count': state.stable_count
+                }
+                for name, state in self.probes.items()
+            }
+        }
@@ -0,0 +1,246 @@
+"""
+结构化指标查询
+
+一个查询包含：指标、服务器/设备过滤、时间范围、分组间隔和聚合函数，例如
+    {"metric": "gpu_utilization", "servers": ["gpu-01"], "devices": ["*"],
+     "hours": 6, "interval": 300, "aggregations": ["avg", "max", "p95"]}
+
+所有匹配的序列通过一次时序存储扫描读取（落盘数据块为单条SQL查询），在服务端完成分组聚合，
+仪表盘只取回实际绘制的聚合点。分组间隔是汇总层级宽度的整数倍且聚合函数都能由汇总桶得到时，
+直接读取 1m/5m/1h 汇总层级（p95 为近似值），查询代价与返回的点数成正比。
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rollup import rollup_manager, ROLLUP_TIERS
+from tsdb import ts_store, to_epoch
+
+# 支持的聚合函数
+AGGREGATIONS = ('avg', 'min', 'max', 'sum', 'count', 'last', 'p50', 'p90', 'p95', 'p99')
+# 可以由汇总桶直接得到的聚合函数
+ROLLUP_AGGREGATIONS = {'avg', 'min', 'max', 'sum', 'count', 'p95'}
+# 可以分组的维度
+GROUP_BY_FIELDS = ('server', 'device')
+# 单个查询最多返回的序列数和每条序列最多的分组数
+MAX_QUERY_SERIES = 500
+MAX_QUERY_BUCKETS = 5000
+# 未指定时间范围时的默认查询范围（小时）
+DEFAULT_QUERY_HOURS = 1
+
+
+@dataclass
+class MetricQuery:
+    """一个结构化查询"""
+    metric: str
+    servers: Optional[List[str]] = None  # None 表示所有服务器
+    devices: Optional[List[str]] = None  # None 表示主机级序列，['*'] 表示所有设备
+    start: Optional[float] = None  # Unix时间戳（秒）
+    end: Optional[float] = None
+    interval: int = 0  # 分组间隔（秒），0 表示整个时间范围聚合为一个点
+    aggregations: List[str] = field(default_factory=lambda: ['avg'])
+    group_by: List[str] = field(default_factory=lambda: list(GROUP_BY_FIELDS))
+    resolution: str = 'auto'  # auto: 可行时读取汇总层级；raw: 总是读取原始数据
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MetricQuery':
+        """从请求参数构造查询（hours 与 start/end 二选一，时间可以是ISO字符串或Unix时间戳）"""
+        if not data.get('metric'):
+            raise ValueError("Query requires a metric")
+
+        def as_list(value):
+            if value is None:
+                return None
+            if isinstance(value, str):
+                return [item.strip() for item in value.split(',') if item.strip()]
+            return [str(item) for item in value]
+
+        def as_epoch(value):
+            if value is None or value == '':
+                return None
+            if isinstance(value, str):
+                try:
+                    return float(value)
+                except ValueError:
+                    from datetime import datetime
+                    return datetime.fromisoformat(value).timestamp()
+            return to_epoch(value)
+
+        end = as_epoch(data.get('end'))
+        start = as_epoch(data.get('start'))
+        if start is None and data.get('hours') is not None:
+            start = (end or time.time()) - float(data['hours']) * 3600
+
+        query = cls(
+            metric=str(data['metric']),
+            servers=as_list(data.get('servers')),
+            devices=as_list(data.get('devices')),
+            start=start,
+            end=end,
+            interval=int(data.get('interval') or 0),
+            aggregations=as_list(data.get('aggregations')) or ['avg'],
+            group_by=as_list(data.get('group_by')) if data.get('group_by') is not None else list(GROUP_BY_FIELDS),
+            resolution=data.get('resolution') or 'auto'
+        )
+        query.validate()
+        return query
+
+    def validate(self):
+        unknown = [agg for agg in self.aggregations if agg not in AGGREGATIONS]
+        if unknown:
+            raise ValueError(f"Unknown aggregations {unknown}, supported: {list(AGGREGATIONS)}")
+        unknown = [name for name in self.group_by if name not in GROUP_BY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown group_by fields {unknown}, supported: {list(GROUP_BY_FIELDS)}")
+        if self.interval < 0:
+            raise ValueError("interval must be >= 0")
+        if self.resolution not in ('auto', 'raw'):
+            raise ValueError("resolution must be 'auto' or 'raw'")
+
+    def time_range(self) -> Tuple[float, float]:
+        end = self.end if self.end is not None else time.time()
+        start = self.start if self.start is not None else end - DEFAULT_QUERY_HOURS * 3600
+        if start > end:
+            raise ValueError("start must be before end")
+        return start, end
+
+    def rollup_tier(self) -> Optional[str]:
+        """能直接满足本查询的最粗汇总层级，None 表示需要读取原始数据"""
+        if self.resolution != 'auto' or not self.interval or not set(self.aggregations) <= ROLLUP_AGGREGATIONS:
+            return None
+        selected = None
+        for tier, width in ROLLUP_TIERS:
+            if self.interval % width == 0:
+                selected = tier
+        return selected
+
+
+def _group_key(query: MetricQuery, key: Tuple[str, str, str]) -> Tuple[str, str]:
+    server_name, _, device = key
+    return (server_name if 'server' in query.group_by else '*',
+            device if 'device' in query.group_by else '*')
+
+
+def _aggregate_raw(query: MetricQuery, timestamps: np.ndarray, values: np.ndarray,
+                   start: float) -> Dict[str, List]:
+    """对原始数据点按时间分组并计算聚合（时间戳需升序）"""
+    if query.interval:
+        bucket_ids = np.floor(timestamps / query.interval).astype(np.int64)
+    else:
+        bucket_ids = np.zeros(len(timestamps), dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket_ids)) + 1))
+    ends = np.append(starts[1:], len(values))
+    counts = ends - starts
+
+    result = {
+        'timestamps': (bucket_ids[starts] * query.interval).astype(float).tolist() if query.interval else [start]
+    }
+    sums = np.add.reduceat(values, starts)
+    for agg in query.aggregations:
+        if agg == 'avg':
+            column = sums / counts
+        elif agg == 'sum':
+            column = sums
+        elif agg == 'count':
+            column = counts
+        elif agg == 'min':
+            column = np.minimum.reduceat(values, starts)
+        elif agg == 'max':
+            column = np.maximum.reduceat(values, starts)
+        elif agg == 'last':
+            column = values[ends - 1]
+        else:
+            q = float(agg[1:])
+            column = np.array([np.percentile(values[s:e], q) for s, e in zip(starts, ends)])
+        result[agg] = [round(float(v), 4) for v in column] if agg != 'count' else [int(v) for v in column]
+    return result
+
+
+def _aggregate_rollup(query: MetricQuery, buckets: List[Dict], start: float) -> Dict[str, List]:
+    """将汇总桶合并为查询的分组（分组间隔是桶宽度的整数倍，每个桶完整落入一个分组）"""
+    groups: Dict[float, Dict] = {}
+    for bucket in buckets:
+        if not bucket['count']:
+            continue
+        group_start = bucket['bucket_start'] // query.interval * query.interval
+        group = groups.get(group_start)
+        if group is None:
+            groups[group_start] = dict(bucket)
+            continue
+        group['count'] += bucket['count']
+        group['sum'] += bucket['sum']
+        group['min'] = min(group['min'], bucket['min'])
+        group['max'] = max(group['max'], bucket['max'])
+        # 与汇总表合并同一个桶时一致：p95 取较大值（近似）
+        if bucket['p95'] is not None:
+            group['p95'] = max(group['p95'] if group['p95'] is not None else bucket['p95'], bucket['p95'])
+
+    ordered = [groups[k] for k in sorted(groups)]
+    result = {'timestamps': [float(group_start) for group_start in sorted(groups)]}
+    for agg in query.aggregations:
+        if agg == 'avg':
+            result[agg] = [round(g['sum'] / g['count'], 4) for g in ordered]
+        elif agg == 'count':
+            result[agg] = [int(g['count']) for g in ordered]
+        else:
+            result[agg] = [round(float(g[agg]), 4) if g[agg] is not None else None for g in ordered]
+    return result
+
+
+def execute_query(query: MetricQuery) -> Dict:
+    """执行一个结构化查询"""
+    start, end = query.time_range()
+    if query.interval and (end - start) / query.interval > MAX_QUERY_BUCKETS:
+        raise ValueError(f"Query would return more than {MAX_QUERY_BUCKETS} points per series, increase interval")
+
+    series = ts_store.match_series([query.metric], query.servers, query.devices)
+    if len(series) > MAX_QUERY_SERIES:
+        raise ValueError(f"Query matches {len(series)} series, limit is {MAX_QUERY_SERIES}")
+
+    # 按分组维度合并序列
+    groups: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = {}
+    for key in sorted(series):
+        groups.setdefault(_group_key(query, key), []).append(key)
+
+    tier = query.rollup_tier()
+    output = []
+    if tier is not None:
+        data = rollup_manager.scan(series, tier, start, end)
+        for (server_name, device), keys in groups.items():
+            buckets = [bucket for key in keys for bucket in data[key]]
+            if buckets:
+                output.append({'server': server_name, 'device': device, **_aggregate_rollup(query, buckets, start)})
+    else:
+        data = ts_store.scan(series, start, end)
+        for (server_name, device), keys in groups.items():
+            timestamps = np.concatenate([np.asarray(data[key][0], dtype=float) for key in keys])
+            values = np.concatenate([np.asarray(data[key][1], dtype=float) for key in keys])
+            if not len(values):
+                continue
+            if len(keys) > 1:
+                order = np.argsort(timestamps, kind='stable')
+                timestamps, values = timestamps[order], values[order]
+            output.append({'server': server_name, 'device': device, **_aggregate_raw(query, timestamps, values, start)})
+
+    return {
+        'metric': query.metric,
+        'start': start,
+        'end': end,
+        'interval': query.interval,
+        'aggregations': query.aggregations,
+        'source': tier or 'raw',
+        'series': output
+    }
+
+
+def execute_queries(queries: List[Dict]) -> List[Dict]:
+    """批量执行查询（一个仪表盘的所有面板一次请求）；单个查询出错不影响其它查询"""
+    results = []
+    for data in queries:
+        try:
+            results.append(execute_query(MetricQuery.from_dict(data)))
+        except Exception as e:
+            results.append({'metric': data.get('metric') if isinstance(data, dict) else None, 'error': str(e)})
+    return results
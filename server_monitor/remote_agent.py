@@ -0,0 +1,216 @@
+"""
+远程采样代理
+
+代理脚本通过一个长连接SSH通道启动一次，在远程主机上按配置的频率读取
+/proc 文本数据，并让 nvidia-smi 以 -lms 循环模式常驻输出GPU数据，
+避免每次采样都创建新进程。
+
+代理以换行分隔的JSON帧输出扁平化的状态：
+    {"type": "keyframe", "ts": ..., "data": {...完整状态...}}
+    {"type": "delta", "ts": ..., "data": {...变化的字段...}, "removed": [...]}
+本地使用 AgentStateDecoder 合并增量帧，得到完整状态。
+"""
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 远程代理脚本（仅依赖python3标准库），参数: <采样间隔秒> <关键帧间隔帧数>
+AGENT_SCRIPT = r'''
+import json, sys, time, subprocess, threading
+
+interval = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+keyframe_every = max(1, int(sys.argv[2])) if len(sys.argv) > 2 else 60
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+prev_cpu = [None]
+
+
+def cpu(state):
+    values = [int(v) for v in read('/proc/stat').split('\n', 1)[0].split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    total = sum(values[:8])
+    if prev_cpu[0] is not None:
+        d_total = total - prev_cpu[0][0]
+        d_idle = idle - prev_cpu[0][1]
+        state['cpu_percent'] = round(100.0 * (d_total - d_idle) / d_total, 2) if d_total > 0 else 0.0
+    prev_cpu[0] = (total, idle)
+
+
+def memory(state):
+    info = {}
+    for line in read('/proc/meminfo').splitlines():
+        key, _, value = line.partition(':')
+        parts = value.split()
+        if parts:
+            info[key] = int(parts[0])
+    total = info.get('MemTotal', 0)
+    available = info.get('MemAvailable', info.get('MemFree', 0))
+    state['memory_total'] = round(total / 1048576.0, 2)
+    state['memory_used'] = round((total - available) / 1048576.0, 2)
+
+
+def network(state):
+    for line in read('/proc/net/dev').splitlines()[2:]:
+        name, _, rest = line.partition(':')
+        stats = rest.split()
+        if len(stats) >= 16:
+            name = name.strip()
+            state['net.%s.receive_bytes' % name] = int(stats[0])
+            state['net.%s.receive_packets' % name] = int(stats[1])
+            state['net.%s.transmit_bytes' % name] = int(stats[8])
+            state['net.%s.transmit_packets' % name] = int(stats[9])
+
+
+gpu_rows = {}
+
+
+def gpu_reader():
+    try:
+        proc = subprocess.Popen(
+            ['nvidia-smi', '--query-gpu=index,name,utilization.gpu,memory.used,memory.total,temperature.gpu',
+             '--format=csv,noheader,nounits', '-lms', str(max(100, int(interval * 1000)))],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return
+    for line in proc.stdout:
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) >= 6:
+            gpu_rows[parts[0]] = parts
+
+
+def gpu(state):
+    for index, parts in list(gpu_rows.items()):
+        try:
+            state['gpu.%s.name' % index] = parts[1]
+            state['gpu.%s.utilization' % index] = int(parts[2])
+            state['gpu.%s.memory_used' % index] = int(parts[3])
+            state['gpu.%s.memory_total' % index] = int(parts[4])
+            state['gpu.%s.temperature' % index] = int(parts[5])
+        except ValueError:
+            pass
+
+
+thread = threading.Thread(target=gpu_reader)
+thread.daemon = True
+thread.start()
+
+last = {}
+frame_no = 0
+deadline = time.time()
+while True:
+    state = {}
+    cpu(state)
+    memory(state)
+    network(state)
+    state['load_average'] = [float(x) for x in read('/proc/loadavg').split()[:3]]
+    gpu(state)
+
+    if frame_no % keyframe_every == 0:
+        frame = {'type': 'keyframe', 'ts': time.time(), 'data': state}
+    else:
+        frame = {'type': 'delta', 'ts': time.time(),
+                 'data': dict((k, v) for k, v in state.items() if last.get(k) != v)}
+        removed = [k for k in last if k not in state]
+        if removed:
+            frame['removed'] = removed
+    sys.stdout.write(json.dumps(frame, separators=(',', ':')) + '\n')
+    sys.stdout.flush()
+
+    last = state
+    frame_no += 1
+    deadline += interval
+    time.sleep(max(0.0, deadline - time.time()))
+'''
+
+
+def build_agent_command(interval: float, keyframe_interval: int) -> str:
+    """构建启动代理的远程命令，脚本内容通过stdin发送"""
+    return f"python3 -u - {interval} {keyframe_interval}"
+
+
+class AgentStateDecoder:
+    """合并代理输出的关键帧和增量帧"""
+    def __init__(self):
+        self.state: Dict = {}
+        self.timestamp: Optional[float] = None
+        self.synced = False
+
+    def feed(self, line: str) -> Optional[Dict]:
+        """
+        处理一行代理输出
+        返回合并后的完整状态；在收到第一个关键帧之前或行无效时返回None
+        """
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            frame = json.loads(line)
+        except ValueError:
+            logger.debug(f"Ignoring non-JSON agent output: {line[:100]}")
+            return None
+
+        frame_type = frame.get('type')
+        if frame_type == 'keyframe':
+            self.state = dict(frame.get('data') or {})
+            self.synced = True
+        elif frame_type == 'delta':
+            if not self.synced:
+                return None
+            self.state.update(frame.get('data') or {})
+            for key in frame.get('removed') or []:
+                self.state.pop(key, None)
+        else:
+            return None
+
+        self.timestamp = frame.get('ts')
+        return dict(self.state)
+
+
+def agent_state_to_metrics(server_name: str, timestamp: float, state: Dict) -> Dict:
+    """将代理的扁平状态转换为与 collect_all 结果相同结构的字典"""
+    gpus: Dict[str, Dict] = {}
+    networks: Dict[str, Dict] = {}
+    for key, value in state.items():
+        if key.startswith('gpu.'):
+            _, index, field = key.split('.', 2)
+            gpus.setdefault(index, {})[field] = value
+        elif key.startswith('net.'):
+            name, field = key[4:].rsplit('.', 1)
+            networks.setdefault(name, {'interface': name})[field] = value
+
+    gpu_info: List[Dict] = []
+    for index in sorted(gpus, key=lambda i: int(i) if i.isdigit() else i):
+        gpu = gpus[index]
+        gpu_info.append({
+            'index': int(index) if index.isdigit() else index,
+            'name': gpu.get('name', ''),
+            'utilization': gpu.get('utilization'),
+            'memory_info': {
+                'used': gpu.get('memory_used'),
+                'total': gpu.get('memory_total'),
+                'unit': 'MiB'
+            },
+            'temperature': gpu.get('temperature'),
+            'processes': []
+        })
+
+    return {
+        'server_name': server_name,
+        'timestamp': timestamp,
+        'source': 'agent',
+        'gpu_info': gpu_info,
+        'system_resources': {
+            'cpu_percent': state.get('cpu_percent'),
+            'memory_used': state.get('memory_used'),
+            'memory_total': state.get('memory_total'),
+            'load_average': state.get('load_average'),
+            'network_info': [networks[name] for name in sorted(networks)]
+        }
+    }
@@ -0,0 +1,445 @@
+"""
+数据保留策略
+
+按层级配置保留天数，后台定期删除过期数据，数据库占用的磁盘空间保持有界：
+- server_metrics 完整采样记录、全分辨率时序数据块、1m / 5m / 1h 汇总分别配置保留天数
+- server_metrics 和 metric_chunks 按本地日期分区（每天一张表，见 db.DailyPartitions），过期时整表删除，
+  不逐行删除、不维护索引；汇总层级仍按行删除（从最旧的一天开始）。配置了 archive_dir 时
+  过期的原始数据先按层级和天导出为 Parquet 归档（<archive_dir>/<层级>/day=<日期>，见 archive.py），
+  只导出有数据的日期，导出成功后才删除
+- 配置了 max_db_size_mb 时，有效数据超过上限后提前删除最旧的整天原始数据（至少保留 min_days 天）
+
+每个分区的删除是一个短事务；按行删除（汇总层级、启用分区之前写入基表的旧数据）按 batch_size 行分成多个短事务，
+批次之间暂停 batch_pause 秒让出写锁，后台写入线程不会被长时间阻塞。
+删除后通过增量 auto_vacuum 分步把空闲页归还给文件系统，并执行不阻塞读写的 WAL 检查点。
+旧数据库（auto_vacuum=NONE）的空闲页会被新数据复用，文件大小不会继续增长；
+需要缩小文件时离线执行一次 `python cleanup_old_data.py --vacuum` 切换为增量模式。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+
+from db import ServerMetrics, MetricChunk, MetricRollup, Server, metrics_partitions, chunk_partitions
+from tsdb import ts_store
+from rollup import TIER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 启动后第一次清理前的等待时间（秒），避开启动时的预热和连接
+INITIAL_DELAY = 60.0
+# auto_vacuum 模式：2 表示增量
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def day_start(epoch: float) -> float:
+    """时间戳所在本地日期的零点"""
+    return datetime.fromtimestamp(epoch).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def next_day(epoch: float) -> float:
+    """下一个本地零点"""
+    return (datetime.fromtimestamp(day_start(epoch)) + timedelta(days=1)).timestamp()
+
+
+class RetentionManager:
+    """
+    后台保留策略执行器
+    每个周期在线程池中执行一次 run_once，同一时间只有一次清理在执行
+    """
+
+    def __init__(self):
+        self.settings = None
+        self.engine = None
+        self.session_factory = None
+        self.store = ts_store
+        self.task: Optional[asyncio.Task] = None
+        self._run_lock = threading.Lock()
+
+        # 统计
+        self.passes = 0
+        self.errors = 0
+        self.deleted: Dict[str, int] = {}
+        self.archived_days: List[str] = []
+        self.vacuumed_pages = 0
+        self.max_batch_ms = 0.0
+        self.last_run: Optional[Dict] = None
+        # 最近一次读取的数据库大小（启动、每次清理和 /api/retention/stats 时更新；/metrics 仪表读取这里，不在事件循环中查询SQLite）
+        self.size: Optional[Dict[str, int]] = None
+
+    def bind(self, engine, session_factory, store=ts_store):
+        """绑定数据库引擎和会话工厂；store 为归档时读取序列的时序存储，需绑定到同一个数据库"""
+        self.engine = engine
+        self.session_factory = session_factory
+        self.store = store
+
+    def configure(self, settings):
+        self.settings = settings
+
+    def _settings(self):
+        if self.settings is None:
+            from config import config
+            self.settings = config.monitoring.retention
+        return self.settings
+
+    # ------------------------------------------------------------------
+    # 后台任务
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动后台清理任务"""
+        if self.task is None and self._settings().enabled:
+            self.task = asyncio.create_task(self._loop())
+            logger.info("Retention manager started")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _loop(self):
+        await asyncio.sleep(INITIAL_DELAY)
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error applying retention policy: {e}")
+            await asyncio.sleep(self._settings().interval)
+
+    # ------------------------------------------------------------------
+    # 清理
+    # ------------------------------------------------------------------
+
+    def cutoffs(self, now: Optional[float] = None) -> Dict[str, float]:
+        """
+        各层级的过期边界（本地零点，早于边界的整天数据过期）
+        返回 {'server_metrics': ..., 'series': ..., 'rollup_1m': ..., ...}，保留天数 <= 0 的层级不清理
+        """
+        settings = self._settings()
+        today = day_start(now if now is not None else time.time())
+
+        def cutoff(days: int) -> Optional[float]:
+            if days <= 0:
+                return None
+            return (datetime.fromtimestamp(today) - timedelta(days=days - 1)).timestamp()
+
+        result = {'server_metrics': cutoff(settings.raw_days), 'series': cutoff(settings.series_days)}
+        for tier in TIER_SECONDS:
+            result[f'rollup_{tier}'] = cutoff(settings.rollup_days.get(tier, 0))
+        return {name: value for name, value in result.items() if value is not None}
+
+    def run_once(self, now: Optional[float] = None) -> Dict:
+        """
+        执行一次清理（阻塞调用）：按层级删除过期的整天数据，超出容量上限时继续删除最旧的整天原始数据，
+        最后增量回收空闲页并执行WAL检查点。返回本次清理的统计
+        """
+        if self.session_factory is None:
+            raise RuntimeError("Retention manager is not bound to a database")
+        if not self._run_lock.acquire(blocking=False):
+            return {'skipped': 'another retention pass is running'}
+        try:
+            started = time.time()
+            now = now if now is not None else started
+            result = {'deleted': {}, 'archived_days': [], 'budget_days': [], 'errors': []}
+
+            for name, cutoff in self.cutoffs(now).items():
+                if name in ('server_metrics', 'series') and not self._archive_before(cutoff, (name,), result):
+                    continue
+                result['deleted'][name] = result['deleted'].get(name, 0) + self._expire(name, cutoff)
+
+            self._enforce_budget(now, result)
+            result['vacuumed_pages'] = self.incremental_vacuum()
+            self.checkpoint()
+            result['database'] = self.refresh_size()
+
+            result['duration'] = round(time.time() - started, 3)
+            result['max_batch_ms'] = round(self.max_batch_ms, 2)
+            result['finished_at'] = datetime.fromtimestamp(time.time()).isoformat()
+            for name, count in result['deleted'].items():
+                self.deleted[name] = self.deleted.get(name, 0) + count
+            self.passes += 1
+            self.last_run = result
+            if any(result['deleted'].values()):
+                logger.info(f"Retention pass deleted {result['deleted']} in {result['duration']}s")
+            return result
+        finally:
+            self._run_lock.release()
+
+    def _expire(self, name: str, cutoff: float) -> int:
+        """删除一个层级中早于 cutoff 的数据，返回删除行数"""
+        if name == 'server_metrics':
+            session = self.session_factory()
+            try:
+                server_ids = [server_id for (server_id,) in session.query(Server.id)]
+            finally:
+                session.close()
+            cutoff_dt = datetime.fromtimestamp(cutoff)
+            # 基表中的旧数据每台服务器分别删除，子查询使用 (server_id, timestamp) 索引
+            deleted = sum(self._delete_batches(ServerMetrics, (ServerMetrics.server_id == server_id,
+                                                               ServerMetrics.timestamp < cutoff_dt))
+                          for server_id in server_ids)
+            return deleted + self._drop_partitions(metrics_partitions, cutoff)
+        if name == 'series':
+            deleted = self._delete_batches(MetricChunk, (MetricChunk.end_time < cutoff,))
+            return deleted + self._drop_partitions(chunk_partitions, cutoff)
+        tier = name[len('rollup_'):]
+        return self._delete_batches(MetricRollup, (MetricRollup.tier == tier,
+                                                   MetricRollup.bucket_start + TIER_SECONDS[tier] <= cutoff))
+
+    def _expired_partitions(self, partitions, cutoff: float) -> List[Tuple[float, object]]:
+        """日期早于 cutoff（整天在 cutoff 之前）的分区 [(日期零点, Table)]"""
+        session = self.session_factory()
+        try:
+            return [(day, table) for day, day_end, table in partitions.partitions(session.connection())
+                    if day_end <= cutoff]
+        finally:
+            session.close()
+
+    def _drop_partitions(self, partitions, cutoff: float) -> int:
+        """整表删除过期的分区，每个分区一个短事务，返回删除的行数"""
+        deleted = 0
+        for _, table in self._expired_partitions(partitions, cutoff):
+            started = time.perf_counter()
+            session = self.session_factory()
+            try:
+                deleted += partitions.drop(session.connection(), table)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+            self.max_batch_ms = max(self.max_batch_ms, (time.perf_counter() - started) * 1000)
+            time.sleep(self._settings().batch_pause)
+        return deleted
+
+    def _delete_batches(self, model, conditions: Tuple) -> int:
+        """按 batch_size 分批删除满足条件的行，每批一个短事务，批次之间让出写锁"""
+        settings = self._settings()
+        deleted = 0
+        while True:
+            batch_started = time.perf_counter()
+            session = self.session_factory()
+            try:
+                ids = select(model.id).where(*conditions).limit(settings.batch_size).scalar_subquery()
+                count = session.execute(delete(model).where(model.id.in_(ids))).rowcount
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+            self.max_batch_ms = max(self.max_batch_ms, (time.perf_counter() - batch_started) * 1000)
+            deleted += count
+            if count < settings.batch_size:
+                return deleted
+            time.sleep(settings.batch_pause)
+
+    def _oldest_raw_day(self) -> Optional[float]:
+        """原始数据（完整记录和数据块）中最旧一天的零点（基表中的数据块按结束时间，与删除条件一致）"""
+        session = self.session_factory()
+        try:
+            oldest_row = session.query(func.min(ServerMetrics.timestamp)).scalar()
+            oldest_chunk = session.query(func.min(MetricChunk.end_time)).scalar()
+            oldest_partitions = [partitions.partitions(session.connection())[:1]
+                                 for partitions in (metrics_partitions, chunk_partitions)]
+        finally:
+            session.close()
+        candidates = [found[0][0] for found in oldest_partitions if found]
+        if oldest_row is not None:
+            if isinstance(oldest_row, str):
+                oldest_row = datetime.fromisoformat(oldest_row)
+            candidates.append(oldest_row.timestamp())
+        if oldest_chunk is not None:
+            candidates.append(oldest_chunk)
+        return day_start(min(candidates)) if candidates else None
+
+    def _days_with_data(self, name: str, cutoff: float) -> List[str]:
+        """
+        一个原始数据层级中 cutoff 之前实际有数据的本地日期（YYYY-MM-DD，升序）
+        只返回有数据的日期，个别错误时间戳（如1970年）不会导致逐日遍历中间的空白日期
+        """
+        session = self.session_factory()
+        try:
+            days = set()
+            if name == 'server_metrics':
+                cutoff_dt = datetime.fromtimestamp(cutoff)
+                # 基表每台服务器分别查询，使用 (server_id, timestamp) 覆盖索引
+                for (server_id,) in session.query(Server.id):
+                    days.update(day for (day,) in session.query(func.date(ServerMetrics.timestamp)).filter(
+                        ServerMetrics.server_id == server_id, ServerMetrics.timestamp < cutoff_dt).distinct())
+                # 过期分区的数据都在分区日期当天
+                days.update(datetime.fromtimestamp(day).strftime('%Y-%m-%d')
+                            for day, _ in self._expired_partitions(metrics_partitions, cutoff))
+            else:
+                # 跨零点的数据块在开始和结束两天都有数据点（分区按结束时间，开始时间可能在前一天）
+                tables = [MetricChunk.__table__] + [table for _, table in
+                                                    self._expired_partitions(chunk_partitions, cutoff)]
+                for table in tables:
+                    for column in (table.c.start_time, table.c.end_time):
+                        days.update(day for (day,) in session.execute(
+                            select(func.date(column, 'unixepoch', 'localtime')).where(
+                                table.c.end_time < cutoff).distinct()))
+        finally:
+            session.close()
+        return sorted(day for day in days if day)
+
+    def _archive_before(self, cutoff: float, names: Tuple[str, ...], result: Dict) -> bool:
+        """
+        配置了 archive_dir 时，把各原始数据层级 cutoff 之前有数据的每一天导出为一个归档目录
+        （<archive_dir>/<层级>/day=<日期>，已导出的跳过）
+        返回是否可以删除（导出失败时保留数据，下个周期重试）
+        """
+        archive_dir = self._settings().archive_dir
+        if not archive_dir:
+            return True
+        from archive import export_archive
+
+        for name in names:
+            for label in self._days_with_data(name, cutoff):
+                out_dir = os.path.join(archive_dir, name, f"day={label}")
+                if os.path.exists(os.path.join(out_dir, 'manifest.json')):
+                    continue
+                day = datetime.strptime(label, '%Y-%m-%d').timestamp()
+                try:
+                    export_archive(out_dir, self.session_factory, start_time=day,
+                                   end_time=next_day(day) - 0.001, datasets=(name,), store=self.store)
+                except Exception as e:
+                    self.errors += 1
+                    result['errors'].append(f"archive {name} {label}: {e}")
+                    logger.error(f"Error archiving {name} for {label}, keeping expired data: {e}")
+                    return False
+                result['archived_days'].append(f"{name}/{label}")
+                self.archived_days.append(f"{name}/{label}")
+        return True
+
+    # ------------------------------------------------------------------
+    # 容量与空间回收
+    # ------------------------------------------------------------------
+
+    def _pragma(self, name: str):
+        session = self.session_factory()
+        try:
+            return session.execute(text(f"PRAGMA {name}")).scalar()
+        finally:
+            session.close()
+
+    def refresh_size(self) -> Dict[str, int]:
+        """重新读取数据库大小并缓存（阻塞调用）"""
+        self.size = self.database_size()
+        return self.size
+
+    def database_size(self) -> Dict[str, int]:
+        """数据库文件大小和有效数据大小（字节，不含空闲页）"""
+        page_size = self._pragma('page_size') or 0
+        page_count = self._pragma('page_count') or 0
+        freelist = self._pragma('freelist_count') or 0
+        return {
+            'file_bytes': page_count * page_size,
+            'live_bytes': (page_count - freelist) * page_size,
+            'free_bytes': freelist * page_size
+        }
+
+    def _enforce_budget(self, now: float, result: Dict):
+        """有效数据超过 max_db_size_mb 时，从最旧的一天开始整天删除原始数据"""
+        settings = self._settings()
+        if settings.max_db_size_mb <= 0:
+            return
+        budget = settings.max_db_size_mb * 1024 * 1024
+        # 最近 min_days 天的数据不会因容量限制被删除
+        floor = (datetime.fromtimestamp(day_start(now)) - timedelta(days=max(settings.min_days, 1) - 1)).timestamp()
+        while self.database_size()['live_bytes'] > budget:
+            day = self._oldest_raw_day()
+            if day is None or day >= floor:
+                logger.warning(f"Database exceeds {settings.max_db_size_mb}MB but only the last "
+                               f"{settings.min_days} days remain")
+                return
+            cutoff = next_day(day)
+            if not self._archive_before(cutoff, ('server_metrics', 'series'), result):
+                return
+            deleted = 0
+            for name in ('server_metrics', 'series'):
+                count = self._expire(name, cutoff)
+                result['deleted'][name] = result['deleted'].get(name, 0) + count
+                deleted += count
+            result['budget_days'].append(datetime.fromtimestamp(day).strftime('%Y-%m-%d'))
+            if not deleted:
+                return
+
+    def incremental_vacuum(self) -> int:
+        """增量模式下分步归还空闲页，每步一个短事务，返回回收的页数"""
+        if self._pragma('auto_vacuum') != AUTO_VACUUM_INCREMENTAL:
+            return 0
+        settings = self._settings()
+        reclaimed = 0
+        while True:
+            free_before = self._pragma('freelist_count') or 0
+            if not free_before:
+                break
+            step_started = time.perf_counter()
+            session = self.session_factory()
+            try:
+                session.execute(text(f"PRAGMA incremental_vacuum({int(settings.vacuum_pages)})"))
+                session.commit()
+            finally:
+                session.close()
+            self.max_batch_ms = max(self.max_batch_ms, (time.perf_counter() - step_started) * 1000)
+            free_after = self._pragma('freelist_count') or 0
+            reclaimed += free_before - free_after
+            if free_after >= free_before:
+                break
+            time.sleep(settings.batch_pause)
+        self.vacuumed_pages += reclaimed
+        return reclaimed
+
+    def checkpoint(self):
+        """PASSIVE 检查点：不等待读写，把WAL中的内容写回主数据库（之后WAL按 journal_size_limit 截断）"""
+        session = self.session_factory()
+        try:
+            session.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).fetchall()
+        finally:
+            session.close()
+
+    def vacuum(self):
+        """
+        完整 VACUUM 并切换到增量 auto_vacuum（阻塞调用，期间数据库被锁定，只应离线执行）
+        """
+        with self.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            connection.execute(text("VACUUM"))
+
+    def stats(self) -> Dict:
+        settings = self._settings()
+        stats = {
+            'enabled': settings.enabled,
+            'running': self.task is not None and not self.task.done(),
+            'cutoffs': {name: datetime.fromtimestamp(value).isoformat() for name, value in self.cutoffs().items()},
+            'passes': self.passes,
+            'errors': self.errors,
+            'deleted': dict(self.deleted),
+            'archived_days': list(self.archived_days[-30:]),
+            'vacuumed_pages': self.vacuumed_pages,
+            'max_batch_ms': round(self.max_batch_ms, 2),
+            'last_run': self.last_run
+        }
+        if self.session_factory is not None:
+            stats['database'] = dict(self.refresh_size())
+            stats['database']['incremental_vacuum'] = self._pragma('auto_vacuum') == AUTO_VACUUM_INCREMENTAL
+        return stats
+
+
+# 全局保留策略执行器
+retention_manager = RetentionManager()
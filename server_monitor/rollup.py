@@ -0,0 +1,514 @@
+"""
+时序数据降采样汇总
+
+为每条序列维护 1m / 5m / 1h 三个汇总层级，每个时间桶保存 count/min/max/sum/p95。
+- 1m 层级由原始数据点实时增量更新
+- 5m 层级由关闭的 1m 桶级联汇总，1h 层级由关闭的 5m 桶级联汇总
+  （级联层级的 p95 取子桶 p95 的 p95，是近似值）
+- 关闭的桶由写入线程在每批样本之后用一个事务批量写入；未关闭的桶按检查点间隔写入当前部分，
+  进程异常退出时最多丢失一个检查点间隔的汇总
+
+查询时根据时间范围和期望的点数选择桶数不超过期望点数的最细层级，
+结果仍超过期望点数时（原始数据或超长时间范围）按对齐的时间网格合并，返回的点覆盖整个时间范围。
+长时间范围的查询代价与返回的点数成正比，而与原始采样数无关。
+"""
+import math
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from db import MetricRollup
+from tsdb import ts_store, to_epoch, TimeValue
+
+logger = logging.getLogger(__name__)
+
+# 汇总层级：(名称, 桶宽度秒数)，从细到粗
+ROLLUP_TIERS: List[Tuple[str, int]] = [('1m', 60), ('5m', 300), ('1h', 3600)]
+TIER_SECONDS = dict(ROLLUP_TIERS)
+# 未关闭的桶写入数据库的间隔（秒）
+CHECKPOINT_INTERVAL = 60.0
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """计算分位数（线性插值）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lower = math.floor(pos)
+    upper = math.ceil(pos)
+    if lower == upper:
+        return ordered[int(pos)]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+
+def grid_step(start: float, end: float, max_points: int) -> int:
+    """
+    降采样网格的步长（整秒）
+    按步长对齐的网格覆盖 [start, end] 时格子数不超过 max_points
+    """
+    # 对齐后首尾各可能多出一个不完整的格子
+    return max(1, math.ceil((end - start) / max(max_points - 2, 1)))
+
+
+def downsample(series: Dict[str, List], step: float) -> Dict[str, List]:
+    """
+    把 query_auto 格式的结果按对齐到 step 的时间网格合并
+    平均值按点数加权，p95 取各点 p95 的最大值（近似值）
+    同一步长下不同序列的时间戳相同，可以直接对齐
+    """
+    merged: Dict[float, List[float]] = {}
+    for ts, avg, count, low, high, p95 in zip(series['timestamps'], series['values'], series['count'],
+                                              series['min'], series['max'], series['p95']):
+        if avg is None or not count:
+            continue
+        cell = math.floor(ts / step) * step
+        entry = merged.get(cell)
+        if entry is None:
+            merged[cell] = [avg * count, count, low, high, p95]
+        else:
+            entry[0] += avg * count
+            entry[1] += count
+            entry[2] = min(entry[2], low)
+            entry[3] = max(entry[3], high)
+            if p95 is not None:
+                entry[4] = p95 if entry[4] is None else max(entry[4], p95)
+
+    cells = sorted(merged)
+    return {
+        'tier': series['tier'],
+        'timestamps': cells,
+        'values': [merged[c][0] / merged[c][1] if merged[c][1] else 0.0 for c in cells],
+        'count': [merged[c][1] for c in cells],
+        'min': [merged[c][2] for c in cells],
+        'max': [merged[c][3] for c in cells],
+        'p95': [merged[c][4] for c in cells],
+    }
+
+class RollupBucket:
+    """一个汇总时间桶"""
+    __slots__ = ('start', 'count', 'min', 'max', 'sum', 'samples', 'saved_count', 'saved_sum', 'base_p95')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        # 1m 层级保存原始值，级联层级保存子桶 p95，用于计算本桶 p95
+        self.samples: List[float] = []
+        # 已写入数据库的部分（检查点之后只写增量）和写入前数据库中已有的p95
+        self.saved_count = 0
+        self.saved_sum = 0.0
+        self.base_p95: Optional[float] = None
+
+    def add_value(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def add_bucket(self, child: 'RollupBucket'):
+        self.count += child.count
+        self.sum += child.sum
+        self.min = min(self.min, child.min)
+        self.max = max(self.max, child.max)
+        self.samples.append(child.p95)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return percentile(self.samples, 95)
+
+    def to_dict(self) -> Dict:
+        return {
+            'bucket_start': self.start,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'avg': self.sum / self.count if self.count else None,
+            'p95': self.p95
+        }
+
+
+class RollupManager:
+    """汇总层级管理器，作为时序存储的观察者增量维护各层级"""
+    def __init__(self, store=ts_store, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.store = store
+        self.checkpoint_interval = checkpoint_interval
+        self._open: Dict[Tuple[Tuple[str, str, str], str], RollupBucket] = {}
+        # 已关闭、等待写入的桶
+        self._closed: List[Tuple[Tuple[str, str, str], str, RollupBucket]] = []
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.RLock()
+        self._persist_lock = threading.Lock()
+        store.add_observer(self.observe)
+
+    def observe(self, key: Tuple[str, str, str], timestamp: float, value: float):
+        """接收一个原始数据点"""
+        with self._lock:
+            self._add_to_tier(key, 0, timestamp, value=value)
+
+    def _add_to_tier(self, key, tier_index: int, timestamp: float, value: float = None,
+                     child: RollupBucket = None):
+        tier, width = ROLLUP_TIERS[tier_index]
+        bucket_start = math.floor(timestamp / width) * width
+        open_key = (key, tier)
+
+        bucket = self._open.get(open_key)
+        if bucket is not None and bucket.start != bucket_start:
+            if bucket_start < bucket.start:
+                # 早于当前桶的数据不再回填
+                return
+            self._close_bucket(key, tier_index, bucket)
+            bucket = None
+        if bucket is None:
+            bucket = self._open[open_key] = RollupBucket(bucket_start)
+
+        if child is not None:
+            bucket.add_bucket(child)
+        else:
+            bucket.add_value(value)
+
+    def _close_bucket(self, key, tier_index: int, bucket: RollupBucket):
+        """关闭一个桶：加入待写入列表并向上级联（在时序存储的锁内调用，不访问数据库）"""
+        tier = ROLLUP_TIERS[tier_index][0]
+        self._closed.append((key, tier, bucket))
+        if tier_index + 1 < len(ROLLUP_TIERS):
+            self._add_to_tier(key, tier_index + 1, bucket.start, child=bucket)
+
+    def persist(self, checkpoint: bool = None):
+        """
+        用一个事务写入已关闭的桶；到达检查点间隔（或 checkpoint=True）时同时写入未关闭的桶的当前部分
+        checkpoint 为None时按 checkpoint_interval 判断
+        """
+        with self._persist_lock:
+            now = time.monotonic()
+            with self._lock:
+                if checkpoint is None:
+                    checkpoint = now - self._last_checkpoint >= self.checkpoint_interval
+                closed, self._closed = self._closed, []
+                items = list(closed)
+                if checkpoint:
+                    items.extend((key, tier, bucket) for (key, tier), bucket in self._open.items())
+                    self._last_checkpoint = now
+                # 写入期间观察者可能继续更新未关闭的桶，先取快照
+                writes = [(key, tier, bucket, bucket.count, bucket.sum, bucket.min, bucket.max, bucket.p95)
+                          for key, tier, bucket in items if bucket.count > bucket.saved_count]
+            if not writes:
+                return
+            if self.store.session_factory is None:
+                return
+
+            if not self._write(writes):
+                # 写入失败时保留已关闭的桶，下次重试；未关闭的桶在下个检查点重试
+                with self._lock:
+                    self._closed[:0] = closed
+                return
+            with self._lock:
+                for _, _, bucket, count, total, _, _, _ in writes:
+                    bucket.saved_count = count
+                    bucket.saved_sum = total
+
+    def _write(self, writes) -> bool:
+        """批量合并写入汇总表：同一个桶只累加上次写入之后的增量"""
+        session = self.store.session_factory()
+        try:
+            series_ids = {key: self.store.get_series_id(session, key) for key in {w[0] for w in writes}}
+            rows = session.query(MetricRollup).filter(
+                MetricRollup.series_id.in_(set(series_ids.values())),
+                MetricRollup.tier.in_({w[1] for w in writes}),
+                MetricRollup.bucket_start.in_({w[2].start for w in writes})
+            )
+            existing = {(row.series_id, row.tier, row.bucket_start): row for row in rows}
+
+            for key, tier, bucket, count, total, low, high, p95 in writes:
+                series_id = series_ids[key]
+                row = existing.get((series_id, tier, bucket.start))
+                if row is None:
+                    row = existing[(series_id, tier, bucket.start)] = MetricRollup(
+                        series_id=series_id, tier=tier, bucket_start=bucket.start,
+                        count=0, min_value=low, max_value=high, sum_value=0.0, p95_value=None
+                    )
+                    session.add(row)
+                elif not bucket.saved_count:
+                    # 首次写入时数据库中已有的部分（如重启前写入的同一个桶）
+                    bucket.base_p95 = row.p95_value
+                row.count += count - bucket.saved_count
+                row.sum_value += total - bucket.saved_sum
+                row.min_value = min(row.min_value, low)
+                row.max_value = max(row.max_value, high)
+                row.p95_value = p95 if bucket.base_p95 is None or p95 is None else max(bucket.base_p95, p95)
+            session.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error persisting {len(writes)} rollup buckets: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def flush(self):
+        """持久化所有已关闭和未关闭的桶（用于停止服务前）"""
+        self.persist(checkpoint=True)
+        with self._lock:
+            self._open.clear()
+
+    def rebuild(self, key: Tuple[str, str, str], start_time: TimeValue, end_time: TimeValue) -> int:
+        """
+        由原始数据重新计算一条序列在时间范围内的各层级汇总桶（如导入归档之后）
+        范围按1h边界对齐、逐天读取，覆盖数据库中已有的桶；内存中未关闭的桶及之后的时间不受影响
+        返回写入的桶数
+        """
+        if self.store.session_factory is None:
+            return 0
+        widest = ROLLUP_TIERS[-1][1]
+        start = math.floor(to_epoch(start_time) / widest) * widest
+        end = (math.floor(to_epoch(end_time) / widest) + 1) * widest
+        with self._lock:
+            open_starts = {tier: bucket.start for (open_key, tier), bucket in self._open.items() if open_key == key}
+
+        written = 0
+        window = 24 * 3600
+        for window_start in range(int(start), int(end), window):
+            window_end = min(window_start + window, end)
+            timestamps, values = self.store.query(key[0], key[1], window_start, window_end, key[2])
+            tiers = {}
+            for tier, width in ROLLUP_TIERS:
+                limit = min(window_end, open_starts.get(tier, window_end))
+                buckets: Dict[float, RollupBucket] = {}
+                for timestamp, value in zip(timestamps, values):
+                    if timestamp < window_start or timestamp >= limit:
+                        continue
+                    bucket_start = math.floor(timestamp / width) * width
+                    bucket = buckets.get(bucket_start)
+                    if bucket is None:
+                        bucket = buckets[bucket_start] = RollupBucket(bucket_start)
+                    bucket.add_value(value)
+                tiers[tier] = (limit, buckets)
+
+            session = self.store.session_factory()
+            try:
+                series_id = self.store.get_series_id(session, key)
+                for tier, (limit, buckets) in tiers.items():
+                    session.query(MetricRollup).filter(
+                        MetricRollup.series_id == series_id,
+                        MetricRollup.tier == tier,
+                        MetricRollup.bucket_start >= window_start,
+                        MetricRollup.bucket_start < limit
+                    ).delete(synchronize_session=False)
+                    session.add_all(MetricRollup(
+                        series_id=series_id,
+                        tier=tier,
+                        bucket_start=bucket.start,
+                        count=bucket.count,
+                        min_value=bucket.min,
+                        max_value=bucket.max,
+                        sum_value=bucket.sum,
+                        p95_value=bucket.p95
+                    ) for bucket in buckets.values())
+                    written += len(buckets)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+        return written
+
+    @staticmethod
+    def select_tier(start: float, end: float, max_points: int) -> Optional[str]:
+        """
+        选择桶数不超过 max_points 的最细层级
+        返回None表示时间范围短于最细层级的分辨率，需要原始数据（由调用方降采样）；
+        时间范围过长时返回最粗层级
+        """
+        if max_points <= 0:
+            return None
+        resolution = (end - start) / max_points
+        if resolution < ROLLUP_TIERS[0][1]:
+            return None
+        for tier, width in ROLLUP_TIERS:
+            if width >= resolution:
+                return tier
+        return ROLLUP_TIERS[-1][0]
+
+    def query(self, server_name: str, metric: str, tier: str, start_time: TimeValue = None,
+              end_time: TimeValue = None, device: str = '') -> Dict[str, List]:
+        """查询指定层级的汇总数据（包含尚未关闭的桶）"""
+        key = (server_name, metric, device)
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        # 包含起点所在的桶
+        bucket_floor = math.floor(start / TIER_SECONDS[tier]) * TIER_SECONDS[tier] if start is not None else None
+
+        buckets: Dict[float, Dict] = {}
+        if self.store.session_factory is not None:
+            session = self.store.session_factory()
+            try:
+                series_id = self.store.get_series_id(session, key, create=False)
+                if series_id is not None:
+                    rows = session.query(MetricRollup).filter(
+                        MetricRollup.series_id == series_id,
+                        MetricRollup.tier == tier
+                    )
+                    if bucket_floor is not None:
+                        rows = rows.filter(MetricRollup.bucket_start >= bucket_floor)
+                    if end is not None:
+                        rows = rows.filter(MetricRollup.bucket_start <= end)
+                    for row in rows.order_by(MetricRollup.bucket_start.asc()):
+                        buckets[row.bucket_start] = {
+                            'bucket_start': row.bucket_start,
+                            'count': row.count,
+                            'min': row.min_value,
+                            'max': row.max_value,
+                            'avg': row.sum_value / row.count if row.count else None,
+                            'p95': row.p95_value
+                        }
+            finally:
+                session.close()
+
+        with self._lock:
+            bucket = self._open.get((key, tier))
+            if bucket is not None and bucket.count:
+                in_range = ((bucket_floor is None or bucket.start >= bucket_floor)
+                            and (end is None or bucket.start <= end))
+                if in_range:
+                    buckets[bucket.start] = bucket.to_dict()
+
+        ordered = [buckets[k] for k in sorted(buckets)]
+        return {
+            'tier': tier,
+            'timestamps': [b['bucket_start'] for b in ordered],
+            'count': [b['count'] for b in ordered],
+            'min': [b['min'] for b in ordered],
+            'max': [b['max'] for b in ordered],
+            'avg': [b['avg'] for b in ordered],
+            'p95': [b['p95'] for b in ordered]
+        }
+
+    def scan(self, series: Dict[Tuple[str, str, str], Optional[int]], tier: str, start_time: TimeValue = None,
+             end_time: TimeValue = None) -> Dict[Tuple[str, str, str], List[Dict]]:
+        """
+        一次读取多条序列指定层级的汇总桶（单条SQL查询，包含尚未关闭的桶）
+        :param series: ts_store.match_series 的返回值
+        返回: {序列键: [桶字典, ...]}（按桶起始时间升序）
+        """
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        width = TIER_SECONDS[tier]
+        bucket_floor = math.floor(start / width) * width if start is not None else None
+
+        buckets: Dict[Tuple[str, str, str], Dict[float, Dict]] = {key: {} for key in series}
+        keys_by_id = {series_id: key for key, series_id in series.items() if series_id is not None}
+
+        if keys_by_id and self.store.session_factory is not None:
+            session = self.store.session_factory()
+            try:
+                rows = session.query(MetricRollup).filter(
+                    MetricRollup.series_id.in_(list(keys_by_id)),
+                    MetricRollup.tier == tier
+                )
+                if bucket_floor is not None:
+                    rows = rows.filter(MetricRollup.bucket_start >= bucket_floor)
+                if end is not None:
+                    rows = rows.filter(MetricRollup.bucket_start <= end)
+                for row in rows:
+                    buckets[keys_by_id[row.series_id]][row.bucket_start] = {
+                        'bucket_start': row.bucket_start,
+                        'count': row.count,
+                        'min': row.min_value,
+                        'max': row.max_value,
+                        'sum': row.sum_value,
+                        'p95': row.p95_value
+                    }
+            finally:
+                session.close()
+
+        with self._lock:
+            for key in series:
+                bucket = self._open.get((key, tier))
+                if bucket is not None and bucket.count:
+                    in_range = ((bucket_floor is None or bucket.start >= bucket_floor)
+                                and (end is None or bucket.start <= end))
+                    if in_range:
+                        entry = bucket.to_dict()
+                        entry['sum'] = bucket.sum
+                        buckets[key][bucket.start] = entry
+
+        return {key: [by_start[k] for k in sorted(by_start)] for key, by_start in buckets.items()}
+
+    def query_auto(self, server_name: str, metric: str, start_time: TimeValue = None,
+                   end_time: TimeValue = None, max_points: int = 500, device: str = '') -> Dict[str, List]:
+        """
+        按时间范围和期望点数自动选择层级
+        返回的 values 为每个点的平均值；原始数据时 min/max/p95 与 values 相同
+        """
+        end = to_epoch(end_time) or time.time()
+        start = to_epoch(start_time)
+        if start is None:
+            start = end - 24 * 3600
+
+        tier = self.select_tier(start, end, max_points)
+        if tier is None:
+            result = _raw_result(*self.store.query(server_name, metric, start, end, device))
+        else:
+            result = self.query(server_name, metric, tier, start, end, device)
+            result['values'] = result.pop('avg')
+
+        if max_points > 0 and len(result['timestamps']) > max_points:
+            result = downsample(result, grid_step(start, end, max_points))
+        return result
+
+    def scan_auto(self, series: Dict[Tuple[str, str, str], Optional[int]], start_time: TimeValue = None,
+                  end_time: TimeValue = None, max_points: int = 500) -> Dict[Tuple[str, str, str], Dict[str, List]]:
+        """
+        query_auto 的批量版本：所有序列使用同一层级，原始数据或汇总桶各通过一次 scan 读取
+        :param series: ts_store.match_series 的返回值
+        返回: {序列键: 与 query_auto 相同格式的结果}
+        """
+        end = to_epoch(end_time) or time.time()
+        start = to_epoch(start_time)
+        if start is None:
+            start = end - 24 * 3600
+
+        tier = self.select_tier(start, end, max_points)
+        if tier is None:
+            result = {key: _raw_result(timestamps, values)
+                      for key, (timestamps, values) in self.store.scan(series, start, end).items()}
+        else:
+            result = {key: {
+                'tier': tier,
+                'timestamps': [b['bucket_start'] for b in buckets],
+                'values': [b['sum'] / b['count'] if b['count'] else None for b in buckets],
+                'count': [b['count'] for b in buckets],
+                'min': [b['min'] for b in buckets],
+                'max': [b['max'] for b in buckets],
+                'p95': [b['p95'] for b in buckets]
+            } for key, buckets in self.scan(series, tier, start, end).items()}
+
+        if max_points > 0:
+            step = grid_step(start, end, max_points)
+            for key, data in result.items():
+                if len(data['timestamps']) > max_points:
+                    result[key] = downsample(data, step)
+        return result
+
+
+def _raw_result(timestamps: List[float], values: List[float]) -> Dict[str, List]:
+    """原始数据转为 query_auto 格式（每个点的 count 为1，min/max/p95 与 values 相同）"""
+    return {
+        'tier': 'raw',
+        'timestamps': timestamps,
+        'values': values,
+        'count': [1] * len(values),
+        'min': values,
+        'max': values,
+        'p95': values
+    }
+
+
+# 全局汇总管理器实例
+rollup_manager = RollupManager()
@@ -0,0 +1,329 @@
+"""
+分片多进程采集
+
+服务器较多时，SSH采集、输出解析和结果序列化都在同一个事件循环上执行，单轮采集会超过刷新间隔。
+分片模式下启动 N 个工作进程，每个进程负责一部分服务器，拥有独立的SSH连接池和采集调度：
+- 工作进程执行探测、解析并将结果序列化为JSON，通过本地管道（socketpair）发送给API进程
+- API进程的读取线程接收结果，发布到广播中心（直接复用收到的JSON文本，不再重复序列化），
+  再提交到后台写入队列并评估告警，数据库写入和告警状态仍只在API进程中
+- 工作进程退出后由监督任务按指数退避重启
+采集吞吐量随CPU核数扩展。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set
+
+from broadcast import CollectionScheduler, ALL_SERVERS_TOPIC
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# 消息类型：采集结果 / 工作进程统计
+MESSAGE_RESULT = 'R'
+MESSAGE_STATS = 'S'
+
+
+def partition_servers(server_names: List[str], workers: int) -> List[List[str]]:
+    """按名称排序后轮流分配到各分片（重启后分配保持不变）"""
+    ordered = sorted(server_names)
+    workers = max(1, min(workers, len(ordered)))
+    return [ordered[index::workers] for index in range(workers)]
+
+
+def encode_message(kind: str, server_name: str, data) -> bytes:
+    return f"{kind}\t{server_name}\t{json.dumps(data, ensure_ascii=False)}".encode('utf-8')
+
+
+def decode_message(payload: bytes):
+    """返回 (消息类型, 服务器名, 数据, JSON文本)"""
+    kind, server_name, text = payload.decode('utf-8').split('\t', 2)
+    return kind, server_name, json.loads(text), text
+
+
+# ---------------------------------------------------------------------------
+# 工作进程
+# ---------------------------------------------------------------------------
+
+class WorkerScheduler(CollectionScheduler):
+    """工作进程内的采集调度：只执行采集和解析，结果编码后放入发送队列"""
+    def __init__(self, collectors: Dict, outbox: asyncio.Queue):
+        super().__init__(SimpleNamespace(collectors=collectors), hub=None)
+        self.outbox = outbox
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        for server_name in self.monitor.collectors:
+            if server_name not in self.tasks:
+                self.tasks[server_name] = asyncio.create_task(self._run_server(server_name))
+
+    async def _collect(self, collector) -> Dict:
+        return await collector.collect()
+
+    def _emit(self, server_name: str, data: Dict):
+        self.enqueue(encode_message(MESSAGE_RESULT, server_name, data))
+
+    def enqueue(self, payload: bytes):
+        # API进程处理不过来时丢弃最旧的消息，采集不被阻塞
+        if self.outbox.full():
+            try:
+                self.outbox.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.outbox.put_nowait(payload)
+
+
+async def _send_loop(conn, scheduler: WorkerScheduler):
+    """将发送队列中的消息写入管道；API进程退出（管道断开）时返回"""
+    while True:
+        payload = await scheduler.outbox.get()
+        try:
+            await asyncio.to_thread(conn.send_bytes, payload)
+            scheduler.sent += 1
+        except (BrokenPipeError, EOFError, OSError):
+            logger.warning("Connection to API process closed, shard worker exiting")
+            return
+
+
+async def _stats_loop(scheduler: WorkerScheduler, pool, interval: float):
+    """定期上报本分片的探测调度、SSH连接池和插件执行统计"""
+    from plugins import plugin_manager
+
+    while True:
+        await asyncio.sleep(interval)
+        stats = {
+            'polling': scheduler.polling_stats(),
+            'ssh_pool': pool.stats(),
+            'plugins': {name: runner.stats() for name, runner in plugin_manager.runners.items()},
+            'sent': scheduler.sent,
+            'dropped': scheduler.dropped,
+            'queued': scheduler.outbox.qsize(),
+            # 工作进程内的自监控指标（SSH/探测/解析耗时），由API进程合并后输出
+            'metrics': metrics.export_state()
+        }
+        scheduler.enqueue(encode_message(MESSAGE_STATS, '', stats))
+
+
+async def _worker_main(shard_index: int, server_names: List[str], conn, queue_size: int, stats_interval: float):
+    from config import config
+    from ssh_client import SSHConnectionPool
+    from monitor import MonitorCollector
+    from plugins import plugin_manager
+
+    # 插件的数据处理在采集结果序列化之前执行，工作进程需要加载相同的插件
+    plugin_manager.load_plugins()
+    plugin_manager.initialize_plugins()
+
+    pool = SSHConnectionPool()
+    await pool.initialize_connections([server for server in config.servers if server.name in server_names])
+    collectors = {name: MonitorCollector(client, None) for name, client in pool.connections.items()}
+
+    scheduler = WorkerScheduler(collectors, asyncio.Queue(maxsize=queue_size))
+    scheduler.start()
+    stats_task = asyncio.create_task(_stats_loop(scheduler, pool, stats_interval))
+    logger.info(f"Shard {shard_index} collecting {len(collectors)} servers")
+    try:
+        await _send_loop(conn, scheduler)
+    finally:
+        stats_task.cancel()
+        await scheduler.stop()
+        await pool.close_all_connections()
+
+
+def run_worker(shard_index: int, server_names: List[str], conn, queue_size: int = 100, stats_interval: float = 5.0):
+    """工作进程入口"""
+    logging.basicConfig(level=logging.INFO,
+                        format=f'%(asctime)s [shard {shard_index}] %(name)s %(levelname)s: %(message)s')
+    try:
+        asyncio.run(_worker_main(shard_index, server_names, conn, queue_size, stats_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# API进程
+# ---------------------------------------------------------------------------
+
+class Shard:
+    """一个分片工作进程的状态"""
+    def __init__(self, index: int, server_names: List[str]):
+        self.index = index
+        self.server_names = server_names
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = 1.0
+        self.retry_at = 0.0
+        self.received = 0
+        self.received_bytes = 0
+        self.last_message_at = 0.0
+        self.worker_stats: Dict = {}
+
+    def stats(self) -> Dict:
+        now = time.time()
+        return {
+            'index': self.index,
+            'pid': self.process.pid if self.process is not None else None,
+            'alive': self.process is not None and self.process.is_alive(),
+            'servers': self.server_names,
+            'restarts': self.restarts,
+            'uptime': round(now - self.started_at, 1) if self.started_at else 0.0,
+            'frames_received': self.received,
+            'bytes_received': self.received_bytes,
+            'last_message_age': round(now - self.last_message_at, 2) if self.last_message_at else None,
+            'sent': self.worker_stats.get('sent', 0),
+            'dropped': self.worker_stats.get('dropped', 0),
+            'queued': self.worker_stats.get('queued', 0)
+        }
+
+
+class ShardedCollectionScheduler(CollectionScheduler):
+    """将服务器分配到多个工作进程采集，接收结果后在API进程发布、写库和评估告警"""
+    def __init__(self, monitor, hub, settings):
+        super().__init__(monitor, hub)
+        self.settings = settings
+        self.shards: List[Shard] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._pending: Set[asyncio.Task] = set()
+
+    def worker_count(self) -> int:
+        workers = self.settings.workers or os.cpu_count() or 1
+        return max(1, min(workers, len(self.monitor.collectors)))
+
+    def start(self):
+        """启动所有工作进程、监督任务和汇总帧任务"""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        if not self.shards and self.monitor.collectors:
+            for index, server_names in enumerate(partition_servers(list(self.monitor.collectors), self.worker_count())):
+                shard = Shard(index, server_names)
+                self.shards.append(shard)
+                self._spawn(shard)
+        if 'supervisor' not in self.tasks:
+            self.tasks['supervisor'] = asyncio.create_task(self._supervise())
+        if ALL_SERVERS_TOPIC not in self.tasks:
+            self.tasks[ALL_SERVERS_TOPIC] = asyncio.create_task(self._run_aggregate())
+        self._start_alert_sweep()
+        logger.info(f"Sharded collection started: {len(self.monitor.collectors)} servers "
+                    f"across {len(self.shards)} worker processes")
+
+    async def stop(self):
+        """停止工作进程和后台任务"""
+        self._stopping = True
+        await super().stop()
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is not None:
+                await asyncio.to_thread(shard.process.join, 5)
+                if shard.process.is_alive():
+                    shard.process.kill()
+            if shard.conn is not None:
+                shard.conn.close()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def _spawn(self, shard: Shard):
+        """启动（或重启）一个分片的工作进程和对应的读取线程"""
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=run_worker,
+            args=(shard.index, shard.server_names, sender, self.settings.queue_size, self.settings.stats_interval),
+            name=f"collector-shard-{shard.index}",
+            daemon=True
+        )
+        process.start()
+        sender.close()
+        shard.process = process
+        shard.conn = receiver
+        shard.started_at = time.time()
+        threading.Thread(target=self._read_loop, args=(shard, receiver),
+                         name=f"shard-reader-{shard.index}", daemon=True).start()
+        logger.info(f"Started collection shard {shard.index} (pid {process.pid}) for {len(shard.server_names)} servers")
+
+    def _read_loop(self, shard: Shard, conn):
+        """读取线程：接收并解码工作进程的消息，交给事件循环处理"""
+        while True:
+            try:
+                payload = conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            try:
+                kind, server_name, data, text = decode_message(payload)
+            except ValueError as e:
+                logger.error(f"Invalid message from shard {shard.index}: {e}")
+                continue
+            shard.received += 1
+            shard.received_bytes += len(payload)
+            shard.last_message_at = time.time()
+            try:
+                self._loop.call_soon_threadsafe(self._on_message, shard, kind, server_name, data, text)
+            except RuntimeError:
+                # 事件循环已关闭
+                break
+
+    def _on_message(self, shard: Shard, kind: str, server_name: str, data: Dict, text: str):
+        if kind == MESSAGE_STATS:
+            metrics.set_remote_state(f"shard-{shard.index}", data.pop('metrics', {}))
+            shard.worker_stats = data
+            return
+        if self._stopping:
+            return
+
+        self.hub.publish(server_name, data, text=text)
+        collector = self.monitor.collectors.get(server_name)
+        if collector is not None and 'error' not in data:
+            task = asyncio.create_task(collector.process_result(data))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _supervise(self):
+        """重启退出的工作进程（指数退避，稳定运行一段时间后重置退避）"""
+        while True:
+            await asyncio.sleep(1)
+            now = time.time()
+            for shard in self.shards:
+                if shard.process is None or shard.process.is_alive():
+                    if shard.started_at and now - shard.started_at > self.settings.max_restart_backoff:
+                        shard.backoff = 1.0
+                    continue
+                if not shard.retry_at:
+                    logger.error(f"Collection shard {shard.index} exited with code {shard.process.exitcode}, "
+                                 f"restarting in {shard.backoff:.0f}s")
+                    shard.retry_at = now + shard.backoff
+                    shard.backoff = min(shard.backoff * 2, self.settings.max_restart_backoff)
+                elif now >= shard.retry_at:
+                    shard.retry_at = 0.0
+                    shard.restarts += 1
+                    if shard.conn is not None:
+                        shard.conn.close()
+                    self._spawn(shard)
+
+    def polling_stats(self) -> Dict:
+        """各分片上报的探测调度统计"""
+        stats = {}
+        for shard in self.shards:
+            stats.update(shard.worker_stats.get('polling', {}))
+        return stats
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': True,
+            'workers': len(self.shards),
+            'shards': [shard.stats() for shard in self.shards],
+            'ssh_pools': {shard.index: shard.worker_stats.get('ssh_pool') for shard in self.shards},
+            'plugins': {shard.index: shard.worker_stats.get('plugins') for shard in self.shards}
+        }
@@ -1,25 +1,180 @@
 import asyncio
 import asyncssh
-from typing import Dict, Optional, Tuple
-from config import ServerConfig
+import shlex
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+from config import ServerConfig, SSHPoolConfig
 import logging
 import time
 from collections import deque
 from pathlib import Path
+from instrumentation import SSH_CHANNEL_SECONDS, SSH_CHANNEL_WAIT_SECONDS
+from remote_agent import AGENT_SCRIPT, AgentStateDecoder, build_agent_command
 
 logger = logging.getLogger(__name__)
 
 
+def build_section_script(sections: Dict[str, str], boundary: str) -> str:
+    """
+    构建单次往返的采集脚本
+    每个探测命令在远程主机上并发执行，输出写入临时目录，全部完成后按分段格式输出
+    （start_ns/end_ns 为远程主机上记录的命令起止时间，date 不支持 %N 时为非数字）：
+        <boundary> BEGIN <name> <exit_code> [<start_ns> <end_ns>]
+        <stdout>
+        <boundary> STDERR
+        <stderr>
+        <boundary> END
+    """
+    lines = [
+        'SM_DIR=$(mktemp -d 2>/dev/null || echo /tmp/.server_monitor.$$)',
+        'mkdir -p "$SM_DIR"',
+    ]
+    for index, command in enumerate(sections.values()):
+        lines.append(
+            f'{{ SM_T0=$(date +%s%N 2>/dev/null); ( {command} ) >"$SM_DIR/{index}.out" 2>"$SM_DIR/{index}.err"; '
+            f'SM_RC=$?; echo "$SM_RC $SM_T0 $(date +%s%N 2>/dev/null)" >"$SM_DIR/{index}.rc"; }} &'
+        )
+    lines.append('wait')
+    for index, name in enumerate(sections.keys()):
+        lines.append(f'printf "%s BEGIN %s %s\\n" "{boundary}" "{name}" "$(cat "$SM_DIR/{index}.rc" 2>/dev/null || echo 255)"')
+        lines.append(f'cat "$SM_DIR/{index}.out" 2>/dev/null')
+        lines.append(f'printf "\\n%s STDERR\\n" "{boundary}"')
+        lines.append(f'cat "$SM_DIR/{index}.err" 2>/dev/null')
+        lines.append(f'printf "\\n%s END\\n" "{boundary}"')
+    lines.append('rm -rf "$SM_DIR"')
+    return '\n'.join(lines)
+
+
+def parse_section_output(output: str, boundary: str,
+                         durations: Optional[Dict[str, float]] = None) -> Dict[str, Tuple[bool, str, str]]:
+    """
+    解析采集脚本的分段输出，返回 {段名: (success, stdout, stderr)}
+    传入 durations 时填入各段在远程主机上的执行耗时（秒）
+    """
+    results = {}
+    begin_marker = f"{boundary} BEGIN "
+    pos = 0
+    while True:
+        start = output.find(begin_marker, pos)
+        if start < 0:
+            break
+        header_end = output.find('\n', start)
+        if header_end < 0:
+            break
+        header = output[start + len(begin_marker):header_end].split()
+        stderr_marker = output.find(f"\n{boundary} STDERR\n", header_end)
+        end_marker = output.find(f"\n{boundary} END\n", stderr_marker)
+        if len(header) < 2 or stderr_marker < 0 or end_marker < 0:
+            break
+
+        name, exit_code = header[0], header[1]
+        stdout = output[header_end + 1:stderr_marker]
+        stderr = output[stderr_marker + len(boundary) + 9:end_marker]
+        results[name] = (exit_code == '0', stdout, stderr)
+        if durations is not None and len(header) >= 4 and header[2].isdigit() and header[3].isdigit():
+            durations[name] = max(0, int(header[3]) - int(header[2])) / 1e9
+        pos = end_marker + len(boundary) + 6
+    return results
+
+
+class CircuitBreaker:
+    """
+    连接熔断器
+    连续失败 failure_threshold 次后断开（open），期间的请求直接失败、不再尝试连接；
+    冷却时间过后进入半开（half_open）状态，只放行一次试探，成功则恢复，失败则再次断开并加倍冷却时间
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_count = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def cooldown(self) -> float:
+        """当前的冷却时间（每次重新断开后加倍）"""
+        return min(self.reset_timeout * (2 ** max(self.open_count - 1, 0)), self.max_reset_timeout)
+
+    def retry_in(self) -> float:
+        """距离允许下一次试探的秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        """是否允许发起请求"""
+        if self.state == self.OPEN and self.retry_in() == 0:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_count = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+
+
 class SSHClient:
-    def __init__(self, server_config: ServerConfig):
+    def __init__(self, server_config: ServerConfig, pool_config=None):
         self.server_config = server_config
+        self.pool_config = pool_config or SSHPoolConfig()
         self.connection = None
         self.last_used = time.time()
         self.command_count = 0  # 统计命令执行次数
-        self.reconnect_threshold = 100  # 每执行100个命令后重连，避免长时间连接问题
+
+        # 一个连接上复用多个通道，用信号量限制每台主机的并发通道数
+        self._channels = asyncio.Semaphore(self.pool_config.max_channels)
+        self._connect_lock = asyncio.Lock()
+        self.breaker = CircuitBreaker(
+            self.pool_config.breaker_threshold,
+            self.pool_config.breaker_reset_timeout,
+            self.pool_config.breaker_max_reset_timeout
+        )
+
+        # 连接池指标
+        self.in_flight = 0
+        self.waiting = 0
+        self.failures = 0
+        self.connect_attempts = 0
+        self._connects_finished = 0  # 已结束（成功或失败）的连接尝试次数
+        self.rtt_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.connected_at: Optional[float] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connection is not None and not self.connection.is_closed()
 
     async def connect(self):
         """建立SSH连接"""
+        self.connect_attempts += 1
+        try:
+            return await self._connect()
+        finally:
+            self._connects_finished += 1
+
+    async def _connect(self):
         try:
             # 准备连接参数
             conn_args = {
@@ -27,7 +182,9 @@ class SSHClient:
                 "port": self.server_config.port,
                 "username": self.server_config.username,
                 "known_hosts": None,
-                "connect_timeout": 10,  # 添加10秒连接超时
+                "connect_timeout": self.pool_config.connect_timeout,
+                # 保活探测，及时发现已断开的连接
+                "keepalive_interval": self.pool_config.keepalive_interval,
             }
 
             # 根据认证方式选择参数
@@ -47,169 +204,299 @@ class SSHClient:
             # 建立连接
             self.connection = await asyncssh.connect(**conn_args)
             self.last_used = time.time()
-            self.command_count = 0
+            self.connected_at = time.time()
+            self.breaker.record_success()
             logger.info(
                 f"Connected to {self.server_config.name} ({self.server_config.host})"
             )
             return True
 
         except asyncio.TimeoutError:
+            self._record_connection_failure("Connection timeout")
             logger.error(f"Connection timeout to {self.server_config.name}: {self.server_config.host}:{self.server_config.port}")
             return False
         except Exception as e:
+            self._record_connection_failure(str(e))
             logger.error(f"Failed to connect to {self.server_config.name}: {str(e)}")
             return False
 
     async def disconnect(self):
         """断开SSH连接"""
         if self.connection:
-            self.connection.close()
-            await self.connection.wait_closed()
+            connection, self.connection = self.connection, None
+            connection.close()
+            await connection.wait_closed()
             logger.info(f"Disconnected from {self.server_config.name}")
 
     async def ensure_connection(self):
-        """确保连接有效，如果无效则重新连接"""
-        if not self.connection:
+        """
+        确保连接有效，断开时重新连接
+        熔断器断开期间直接返回False；多个并发调用只会发起一次连接
+        """
+        if self.is_connected:
+            return True
+        if not self.breaker.allow():
+            return False
+
+        finished = self._connects_finished
+        async with self._connect_lock:
+            if self.is_connected:
+                return True
+            # 等锁期间其他调用已经尝试连接并失败，或熔断器已断开：不再重复尝试，
+            # 否则 N 个并发调用会串行发起 N 次连接，每次等待 connect_timeout
+            # （半开状态下 allow() 已为本次调用保留试探名额，不能再调用一次）
+            if self._connects_finished != finished or self.breaker.state == CircuitBreaker.OPEN:
+                return False
             logger.info(
                 f"Connection to {self.server_config.name} is not established, connecting..."
             )
+            self.connection = None
             return await self.connect()
 
-        # 检查连接是否仍然有效
-        try:
-            # 尝试发送一个简单的命令来检查连接状态
-            result = await self.connection.run("echo ping", check=False, timeout=5)
-            if result.exit_status != 0:
-                logger.warning(
-                    f"Connection to {self.server_config.name} appears to be broken, reconnecting..."
-                )
-                await self.disconnect()
-                return await self.connect()
-        except Exception as e:
-            logger.warning(
-                f"Connection to {self.server_config.name} failed check, reconnecting: {str(e)}"
-            )
-            await self.disconnect()
-            return await self.connect()
+    def _record_connection_failure(self, error: str):
+        self.failures += 1
+        self.last_error = error
+        self.breaker.record_failure()
 
-        return True
-
-    async def execute_command(
-        self, command: str, use_sudo: bool = False
-    ) -> Tuple[bool, str, str]:
+    async def _acquire_channel(self):
+        """等待一个通道名额（计入 waiting/in_flight 指标），使用完后必须调用 _release_channel"""
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._channels.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        SSH_CHANNEL_WAIT_SECONDS.since(started, self.server_config.name)
+
+    def _release_channel(self):
+        self.in_flight -= 1
+        self._channels.release()
+
+    def _build_command(self, command: str, use_sudo: bool) -> str:
+        # 如果需要sudo且有sudo密码，则通过管道传递密码
+        if use_sudo and self.server_config.sudo_password:
+            return f'echo "{self.server_config.sudo_password}" | sudo -S {command}'
+        elif use_sudo:
+            # 如果需要sudo但没有密码，则直接执行sudo命令（假设已配置免密或用户已认证）
+            return f"sudo {command}"
+        return command
+
+    async def _run(self, command: str, timeout: float = 30, kind: str = 'command') -> Tuple[bool, str, str]:
         """
-        执行远程命令
+        在共享连接上打开一个通道执行命令（受每台主机的并发通道数限制）
+        单条命令失败不影响其他通道；只有连接本身断开时才记为连接失败
+        kind 为自监控指标中的通道类型（command/script/health）
         返回: (success, stdout, stderr)
         """
-        # 确保连接有效
         if not await self.ensure_connection():
-            logger.error("Unable to establish connection to execute command")
-            return False, "", "Unable to establish connection"
+            error = "Circuit open" if self.breaker.state != CircuitBreaker.CLOSED else "Unable to establish connection"
+            return False, "", error
 
+        server_name = self.server_config.name
+        started = time.perf_counter()
+        await self._acquire_channel()
         try:
-            # 如果需要sudo且有sudo密码，则使用expect脚本或类似方法
-            if use_sudo and self.server_config.sudo_password:
-                # 构建带sudo密码的命令
-                sudo_command = (
-                    f'echo "{self.server_config.sudo_password}" | sudo -S {command}'
-                )
-                result = await self.connection.run(
-                    sudo_command, check=False, timeout=30
-                )
-            elif use_sudo:
-                # 如果需要sudo但没有密码，则直接执行sudo命令（假设已配置免密或用户已认证）
-                result = await self.connection.run(
-                    f"sudo {command}", check=False, timeout=30
-                )
-            else:
-                # 普通命令执行
-                result = await self.connection.run(command, check=False, timeout=30)
-
-            success = result.exit_status == 0
-            stdout = result.stdout if result.stdout else ""
-            stderr = result.stderr if result.stderr else ""
-
-            # 更新使用统计
+            if not self.is_connected and not await self.ensure_connection():
+                return False, "", "Unable to establish connection"
+            result = await self.connection.run(command, check=False, timeout=timeout)
             self.last_used = time.time()
             self.command_count += 1
-
-            # 如果命令执行次数达到阈值，考虑重连以避免长时间连接问题
-            if self.command_count >= self.reconnect_threshold:
-                logger.info(
-                    f"Command count threshold reached for {self.server_config.name}, preparing for reconnect after next command"
-                )
-                # 标记下次使用时重连
-                await self.disconnect()
-
-            return success, stdout, stderr
+            return (result.exit_status == 0, result.stdout if result.stdout else "",
+                    result.stderr if result.stderr else "")
         except Exception as e:
-            logger.error(
-                f"Error executing command '{command}' on {self.server_config.name}: {str(e)}"
-            )
-            # 发生错误时断开连接，下次会自动重连
-            await self.disconnect()
-            return False, "", str(e)
+            error = str(e) or type(e).__name__
+            if not self.is_connected or isinstance(e, asyncssh.DisconnectError):
+                # 连接已断开：丢弃连接，由下次调用或连接池后台任务重连
+                self._record_connection_failure(error)
+                self.connection = None
+            else:
+                self.last_error = error
+            return False, "", error
+        finally:
+            self._release_channel()
+            SSH_CHANNEL_SECONDS.since(started, server_name, kind)
+
+    async def execute_command(
+        self, command: str, use_sudo: bool = False
+    ) -> Tuple[bool, str, str]:
+        """
+        执行远程命令
+        返回: (success, stdout, stderr)
+        """
+        success, stdout, stderr = await self._run(self._build_command(command, use_sudo))
+        if not success and stderr and not stdout:
+            logger.error(f"Error executing command '{command}' on {self.server_config.name}: {stderr}")
+        return success, stdout, stderr
 
     async def execute_commands_batch(
-        self, commands: list, use_sudo: bool = False
+        self, commands: list, use_sudo: bool = False, durations: Optional[Dict[str, float]] = None
     ) -> Dict[str, Tuple[bool, str, str]]:
         """
-        批量执行命令 - 通过单个会话优化
+        批量执行命令 - 在同一连接上并发打开多个通道，单条命令失败不影响其余命令
+        传入 durations 时填入每条命令的耗时（秒，包含网络往返）
         """
-        # 确保连接有效
-        if not await self.ensure_connection():
-            logger.error("Unable to establish connection to execute commands")
-            return {
-                cmd: (False, "", "Unable to establish connection") for cmd in commands
-            }
+        async def run(cmd: str):
+            started = time.perf_counter()
+            output = await self._run(self._build_command(cmd, use_sudo))
+            if durations is not None:
+                durations[cmd] = time.perf_counter() - started
+            return output
+
+        outputs = await asyncio.gather(*(run(cmd) for cmd in commands))
+        return dict(zip(commands, outputs))
+
+    async def execute_script(
+        self, sections: Dict[str, str], timeout: int = 30, durations: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Tuple[bool, str, str]]:
+        """
+        通过单个SSH通道执行多个探测命令
+        所有命令在远程主机上并发执行，结果按段名返回，只需一次网络往返
+        传入 durations 时填入各段在远程主机上的执行耗时（秒）
+        """
+        boundary = f"__SM_{uuid.uuid4().hex}__"
+        script = build_section_script(sections, boundary)
+
+        success, stdout, stderr = await self._run(script, timeout=timeout, kind='script')
+        results = parse_section_output(stdout, boundary, durations)
+        if not results and not success:
+            logger.error(f"Error executing collection script on {self.server_config.name}: {stderr}")
+        for name in sections:
+            if name not in results:
+                results[name] = (False, "", stderr if stderr else "Missing section in script output")
+        return results
 
-        results = {}
-        for cmd in commands:
-            try:
-                # 如果需要sudo且有sudo密码，则使用expect脚本或类似方法
-                if use_sudo and self.server_config.sudo_password:
-                    # 构建带sudo密码的命令
-                    sudo_command = (
-                        f'echo "{self.server_config.sudo_password}" | sudo -S {cmd}'
-                    )
-                    result = await self.connection.run(
-                        sudo_command, check=False, timeout=30
-                    )
-                elif use_sudo:
-                    # 如果需要sudo但没有密码，则直接执行sudo命令（假设已配置免密或用户已认证）
-                    result = await self.connection.run(
-                        f"sudo {cmd}", check=False, timeout=30
-                    )
-                else:
-                    # 普通命令执行
-                    result = await self.connection.run(cmd, check=False, timeout=30)
+    async def check_health(self) -> bool:
+        """执行一次空命令测量往返时间（RTT）"""
+        started = time.perf_counter()
+        success, _, _ = await self._run("true", timeout=self.pool_config.health_check_timeout, kind='health')
+        if success:
+            rtt = (time.perf_counter() - started) * 1000
+            self.rtt_ms = rtt if self.rtt_ms is None else self.rtt_ms * 0.8 + rtt * 0.2
+        return success
+
+    def stats(self) -> Dict:
+        """连接、熔断器和通道使用情况"""
+        return {
+            'host': self.server_config.host,
+            'connected': self.is_connected,
+            'circuit': self.breaker.state,
+            'circuit_retry_in': round(self.breaker.retry_in(), 2),
+            'consecutive_failures': self.breaker.failures,
+            'failures': self.failures,
+            'connect_attempts': self.connect_attempts,
+            'commands': self.command_count,
+            'rtt_ms': round(self.rtt_ms, 2) if self.rtt_ms is not None else None,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'max_channels': self.pool_config.max_channels,
+            'idle_seconds': round(time.time() - self.last_used, 1),
+            'last_error': self.last_error
+        }
+
+    async def stream_agent(self, interval: float = 0.5, keyframe_interval: int = 60):
+        """
+        在长连接通道上启动远程采样代理，返回异步生成器
+        每次产出 (时间戳, 合并后的完整状态)；通道关闭时生成器结束
+        代理存续期间占用一个通道名额，每台主机的通道总数不超过 max_channels
+        """
+        if not await self.ensure_connection():
+            logger.error(f"Unable to establish connection to start agent on {self.server_config.name}")
+            return
 
-                success = result.exit_status == 0
-                stdout = result.stdout if result.stdout else ""
-                stderr = result.stderr if result.stderr else ""
-                results[cmd] = (success, stdout, stderr)
+        await self._acquire_channel()
+        process = None
+        try:
+            if not self.is_connected and not await self.ensure_connection():
+                return
+            process = await self.connection.create_process(build_agent_command(interval, keyframe_interval))
+            process.stdin.write(AGENT_SCRIPT)
+            process.stdin.write_eof()
+            logger.info(f"Remote sampling agent started on {self.server_config.name}")
+
+            decoder = AgentStateDecoder()
+            async for line in process.stdout:
+                state = decoder.feed(line)
+                if state is not None:
+                    self.last_used = time.time()
+                    yield decoder.timestamp, state
+        finally:
+            if process is not None:
+                process.close()
+                stderr = ""
+                try:
+                    stderr = await asyncio.wait_for(process.stderr.read(), timeout=1)
+                except Exception:
+                    pass
+                if stderr:
+                    logger.warning(f"Remote agent on {self.server_config.name} exited: {stderr.strip()[:200]}")
+            self._release_channel()
+
+    async def stream_lines(self, command: str, use_sudo: bool = False):
+        """
+        在长连接通道上执行持续输出的命令（如 docker events），逐行产出标准输出，返回异步生成器
+        流存续期间占用一个通道名额（每台主机的通道总数不超过 max_channels），空闲清理不会断开连接；
+        通道关闭时生成器结束
+        """
+        if not await self.ensure_connection():
+            return
 
-                # 更新使用统计
+        await self._acquire_channel()
+        process = None
+        try:
+            if not self.is_connected and not await self.ensure_connection():
+                return
+            process = await self.connection.create_process(self._build_command(command, use_sudo))
+            async for line in process.stdout:
                 self.last_used = time.time()
-                self.command_count += 1
-
-                # 检查是否需要重连
-                if self.command_count >= self.reconnect_threshold:
-                    logger.info(
-                        f"Command count threshold reached for {self.server_config.name}, preparing for reconnect"
-                    )
-                    await self.disconnect()
-                    break  # 退出循环，下次批量操作时会重连
-            except Exception as e:
-                logger.error(
-                    f"Error executing command '{cmd}' on {self.server_config.name}: {str(e)}"
-                )
-                results[cmd] = (False, "", str(e))
-                # 发生错误时断开连接，下次会自动重连
-                await self.disconnect()
-                break  # 退出循环，避免连续错误
+                yield line
+        finally:
+            if process is not None:
+                process.close()
+            self._release_channel()
+
+    async def run_streaming(self, command: str, on_output: Callable[[str, str], None],
+                            use_sudo: bool = False) -> Optional[int]:
+        """
+        在共享连接上执行命令，逐行回调输出 on_output(stream, line)，stream 为 stdout/stderr
+        与 _run 一样占用每台主机的并发通道名额；调用方取消（超时或用户取消）时关闭远程进程
+        连接不可用或通道出错时抛出异常
+        返回: 退出码（进程被信号终止时为 None）
+        """
+        if not await self.ensure_connection():
+            raise ConnectionError(
+                "Circuit open" if self.breaker.state != CircuitBreaker.CLOSED else "Unable to establish connection")
+
+        server_name = self.server_config.name
+        full_command = self._build_command(f"bash -c {shlex.quote(command)}", use_sudo)
+        started = time.perf_counter()
+        await self._acquire_channel()
+        process = None
+        try:
+            if not self.is_connected and not await self.ensure_connection():
+                raise ConnectionError("Unable to establish connection")
+            process = await self.connection.create_process(full_command, errors='replace')
+            process.stdin.write_eof()
 
-        return results
+            async def pump(stream: str, reader):
+                async for line in reader:
+                    self.last_used = time.time()
+                    on_output(stream, line)
+
+            await asyncio.gather(pump('stdout', process.stdout), pump('stderr', process.stderr))
+            result = await process.wait()
+            self.command_count += 1
+            return result.exit_status
+        except (OSError, asyncssh.Error) as e:
+            if not self.is_connected or isinstance(e, asyncssh.DisconnectError):
+                self._record_connection_failure(str(e) or type(e).__name__)
+                self.connection = None
+            raise
+        finally:
+            if process is not None:
+                process.close()
+            self._release_channel()
+            SSH_CHANNEL_SECONDS.since(started, server_name, 'cli')
 
     async def execute_interactive_command(self, command: str, use_sudo: bool = False):
         """
@@ -266,34 +553,62 @@ class SSHClient:
             logger.error(
                 f"Error executing interactive command '{command}' on {self.server_config.name}: {str(e)}"
             )
+            # 连接本身已断开时才丢弃连接（其他通道共用同一连接），下次会自动重连
+            if not self.is_connected:
+                self._record_connection_failure(str(e))
+                self.connection = None
             yield False, "", str(e)
-            # 发生错误时断开连接，下次会自动重连
-            await self.disconnect()
 
 
 class SSHConnectionPool:
     def __init__(self):
         self.connections: Dict[str, SSHClient] = {}
-        self.max_idle_time = 300  # 最大空闲时间（秒），超过此时间将关闭连接
+        self.config = None
         self.cleanup_task = None
+        self.eager = True  # 是否主动保持所有服务器的连接
 
-    async def initialize_connections(self, server_configs):
-        """初始化所有服务器连接"""
-        for server_config in server_configs:
-            client = SSHClient(server_config)
-            if await client.connect():
-                self.connections[server_config.name] = client
-            else:
-                logger.warning(f"Failed to connect to {server_config.name}")
+    @property
+    def max_idle_time(self) -> float:
+        """最大空闲时间（秒），超过此时间将断开连接（下次使用时自动重连）"""
+        return self.config.max_idle_time if self.config else 300
 
-        # 启动定期清理任务
-        self.cleanup_task = asyncio.create_task(self.periodic_cleanup())
+    async def initialize_connections(self, server_configs, connect: bool = True):
+        """
+        初始化所有服务器连接
+        所有服务器并行连接，最多等待 startup_budget 秒；未连上的服务器仍保留在连接池中，
+        由后台维护任务按熔断器的退避时间重连。连接经过 ensure_connection，与同时到达的命令共享同一次连接尝试。
+        connect=False 时只登记客户端，使用时再连接（分片采集模式下API进程只用于交互式命令）
+        """
+        from config import config
+        self.config = config.monitoring.ssh_pool
+        self.eager = connect
+
+        for server_config in server_configs:
+            if server_config.name not in self.connections:
+                self.connections[server_config.name] = SSHClient(server_config, self.config)
+
+        tasks = {asyncio.create_task(client.ensure_connection()): name for name, client in self.connections.items()
+                 if connect and not client.is_connected}
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.config.startup_budget)
+            connected = sum(1 for task in done if not task.cancelled() and task.result())
+            logger.info(f"Connected to {connected}/{len(tasks)} servers "
+                        f"({len(pending)} still connecting in background)")
+            for task in done:
+                if not task.result():
+                    logger.warning(f"Failed to connect to {tasks[task]}, will retry in background")
+
+        # 启动后台维护任务（重连、健康检查、空闲清理）
+        if self.cleanup_task is None:
+            self.cleanup_task = asyncio.create_task(self.periodic_cleanup())
 
     async def periodic_cleanup(self):
-        """定期清理空闲连接"""
+        """定期维护连接：重连断开的服务器、测量RTT、断开空闲连接"""
         while True:
             try:
-                await asyncio.sleep(60)  # 每分钟检查一次
+                await asyncio.sleep(self.config.health_check_interval if self.config else 60)
+                await self.reconnect_failed()
+                await self.check_health()
                 await self.cleanup_idle_connections()
             except asyncio.CancelledError:
                 logger.info("Connection pool cleanup task cancelled")
@@ -301,20 +616,28 @@ class SSHConnectionPool:
             except Exception as e:
                 logger.error(f"Error in connection pool cleanup: {e}")
 
+    async def reconnect_failed(self):
+        """并行重连已断开、且熔断器允许重试的服务器"""
+        if not self.eager:
+            return
+        clients = [client for client in self.connections.values()
+                   if not client.is_connected and client.breaker.retry_in() == 0]
+        if clients:
+            await asyncio.gather(*(client.ensure_connection() for client in clients), return_exceptions=True)
+
+    async def check_health(self):
+        """并行测量已连接服务器的RTT"""
+        clients = [client for client in self.connections.values() if client.is_connected]
+        if clients:
+            await asyncio.gather(*(client.check_health() for client in clients), return_exceptions=True)
+
     async def cleanup_idle_connections(self):
-        """清理空闲连接"""
+        """断开空闲连接（客户端保留在连接池中，下次使用时自动重连）"""
         current_time = time.time()
-        idle_connections = []
-
         for name, client in self.connections.items():
-            if current_time - client.last_used > self.max_idle_time:
-                idle_connections.append(name)
-
-        for name in idle_connections:
-            client = self.connections[name]
-            logger.info(f"Cleaning up idle connection to {name}")
-            await client.disconnect()
-            del self.connections[name]
+            if client.is_connected and client.in_flight == 0 and current_time - client.last_used > self.max_idle_time:
+                logger.info(f"Cleaning up idle connection to {name}")
+                await client.disconnect()
 
     async def close_all_connections(self):
         """关闭所有连接"""
@@ -324,6 +647,7 @@ class SSHConnectionPool:
                 await self.cleanup_task
             except asyncio.CancelledError:
                 pass
+            self.cleanup_task = None
 
         for client in self.connections.values():
             await client.disconnect()
@@ -337,6 +661,18 @@ class SSHConnectionPool:
         """获取所有SSH客户端"""
         return self.connections.values()
 
+    def stats(self) -> Dict:
+        """连接池指标：每台服务器的连接状态、熔断器、RTT、失败次数和通道排队深度"""
+        servers = {name: client.stats() for name, client in self.connections.items()}
+        return {
+            'total': len(servers),
+            'connected': sum(1 for item in servers.values() if item['connected']),
+            'circuit_open': sum(1 for item in servers.values() if item['circuit'] != CircuitBreaker.CLOSED),
+            'in_flight': sum(item['in_flight'] for item in servers.values()),
+            'waiting': sum(item['waiting'] for item in servers.values()),
+            'servers': servers
+        }
+
 
 # 全局连接池实例
 ssh_pool = SSHConnectionPool()
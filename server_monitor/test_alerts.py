@@ -0,0 +1,112 @@
+"""
+测试脚本 - 告警评估（规则表查找、滞回、持续时间、设备键、过期状态清理）
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from alerts import AlertManager, AlertRule, AlertType, AlertSeverity, CompiledRule, RuleTable
+
+
+def _manager(*rules):
+    manager = AlertManager()
+    fired = []
+    manager.register_callback(fired.append)
+    for rule in rules:
+        manager.add_rule(rule)
+    return manager, fired
+
+
+def _temps(timestamp, *readings):
+    return {'timestamp': timestamp,
+            'system_resources': {'hardware_temp_info': [{'sensor_name': name, 'temperature': value}
+                                                        for name, value in readings]}}
+
+
+def _cpu(timestamp, value):
+    return {'timestamp': timestamp, 'system_resources': {'cpu_percent': value}}
+
+
+def test_rule_table_matching():
+    """规则按触发值排序，二分查找返回数值达到的所有规则"""
+    table = RuleTable([CompiledRule(AlertRule(name, AlertType.CPU_USAGE, threshold, AlertSeverity.HIGH))
+                       for name, threshold in (('critical', 95), ('warn', 70), ('high', 85))])
+    assert table.thresholds == [70, 85, 95]
+    assert [c.rule.name for c in table.matching(69.9)] == []
+    assert [c.rule.name for c in table.matching(85)] == ['warn', 'high']
+    assert [c.rule.name for c in table.matching(100)] == ['warn', 'high', 'critical']
+
+
+def test_hysteresis_keeps_alert_until_clear_value():
+    """触发后回落到滞回区间内保持告警，低于 阈值-滞回 才恢复"""
+    manager, fired = _manager(AlertRule('cpu', AlertType.CPU_USAGE, 80, AlertSeverity.HIGH, hysteresis=5))
+    manager.evaluate_metrics('gpu01', _cpu(1000.0, 85.0))
+    assert len(manager.active_alerts) == 1
+
+    # 在阈值附近抖动不会反复触发和恢复
+    for tick, value in enumerate((78.0, 82.0, 76.0)):
+        manager.evaluate_metrics('gpu01', _cpu(1001.0 + tick, value))
+    assert len(fired) == 1
+    assert manager.active_alerts[0].current_value == 76.0
+
+    manager.evaluate_metrics('gpu01', _cpu(1010.0, 74.0))
+    assert manager.active_alerts == []
+    assert fired[0].status == 'resolved'
+    assert manager._states == {}
+
+
+def test_for_duration_requires_sustained_breach():
+    """持续超过阈值 for_duration 秒才触发；期间回落则重新计时"""
+    manager, fired = _manager(AlertRule('cpu', AlertType.CPU_USAGE, 80, AlertSeverity.HIGH, for_duration=60))
+    manager.evaluate_metrics('gpu01', _cpu(1000.0, 90.0))
+    manager.evaluate_metrics('gpu01', _cpu(1030.0, 90.0))
+    manager.evaluate_metrics('gpu01', _cpu(1040.0, 50.0))
+    assert fired == []
+    assert manager._states == {}
+
+    manager.evaluate_metrics('gpu01', _cpu(1050.0, 90.0))
+    manager.evaluate_metrics('gpu01', _cpu(1100.0, 90.0))
+    assert fired == []
+    manager.evaluate_metrics('gpu01', _cpu(1110.0, 90.0))
+    assert len(fired) == 1 and fired[0].rule_name == 'cpu'
+
+
+def test_same_named_sensors_keep_separate_state():
+    """同名传感器各自一个告警状态，不会在每次采集时反复触发和恢复"""
+    manager, fired = _manager(AlertRule('hot', AlertType.TEMPERATURE, 80, AlertSeverity.HIGH))
+    for tick in range(4):
+        manager.evaluate_metrics('gpu01', _temps(1000.0 + tick, ('Core 0', 90.0), ('Core 0', 50.0)))
+
+    assert len(fired) == 1
+    assert [alert.device for alert in manager.active_alerts] == ['Core 0']
+
+
+def test_clear_stale_alert_states():
+    """长时间未收到数据的设备：活跃告警自动恢复，状态和索引被清理"""
+    manager, fired = _manager(AlertRule('hot', AlertType.TEMPERATURE, 80, AlertSeverity.HIGH))
+    manager.evaluate_metrics('gpu01', _temps(1000.0, ('Core 0', 90.0)))
+    manager.evaluate_metrics('gpu02', _temps(1500.0, ('Core 0', 95.0)))
+    assert len(manager.active_alerts) == 2
+
+    # gpu01 已下线 600 秒，gpu02 仍在上报
+    assert manager.clear_resolved_alerts(max_age=300, now=1600.0) == 1
+    assert [alert.server_name for alert in manager.active_alerts] == ['gpu02']
+    resolved = [alert for alert in fired if alert.server_name == 'gpu01']
+    assert resolved[0].status == 'resolved'
+    assert list(manager._states) == [('gpu02', 'hot', 'Core 0')]
+    assert list(manager._open) == [('gpu02', AlertType.TEMPERATURE, 'Core 0')]
+
+    # 服务器恢复上报后重新触发
+    manager.evaluate_metrics('gpu01', _temps(1700.0, ('Core 0', 90.0)))
+    assert len(fired) == 3
+
+
+if __name__ == "__main__":
+    test_rule_table_matching()
+    test_hysteresis_keeps_alert_until_clear_value()
+    test_for_duration_requires_sustained_breach()
+    test_same_named_sensors_keep_separate_state()
+    test_clear_stale_alert_states()
+    print("[OK] alert tests passed")
@@ -0,0 +1,75 @@
+"""
+测试脚本 - 趋势分析（批量读取与堆叠数组上的设备统计）
+"""
+import os
+import random
+import sys
+import time
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analytics
+from analytics import SeriesWindow, compute_statistics, compute_device_statistics, get_batch_analysis
+from rollup import RollupManager
+from tsdb import TimeSeriesStore
+
+
+def _window(timestamps, values):
+    return SeriesWindow({'tier': 'raw', 'timestamps': timestamps, 'values': values, 'count': [1] * len(values),
+                         'min': values, 'max': values, 'p95': values})
+
+
+def test_device_statistics_match_single_window():
+    """不同长度的窗口堆叠后逐行计算的结果与逐个窗口计算相同"""
+    rng = random.Random(7)
+    windows = []
+    for length, drift in ((1, 0.0), (5, 1.0), (40, -0.5), (120, 0.0)):
+        timestamps = [1_760_000_000.0 + i * 30 for i in range(length)]
+        windows.append(_window(timestamps, [50 + drift * i + rng.uniform(-2, 2) for i in range(length)]))
+
+    for window, stats in zip(windows, compute_device_statistics(windows)):
+        expected = compute_statistics(window)
+        for key in ("average", "min", "max", "current", "ewma", "slope_per_hour"):
+            assert stats[key] == pytest.approx(expected[key], abs=1e-2)
+        assert stats["percentiles"] == pytest.approx(expected["percentiles"], abs=1e-2)
+        assert stats["trend"] == expected["trend"]
+
+
+def test_batch_analysis_reads_all_series_once():
+    """多台服务器、所有设备的序列通过一次 scan 读取"""
+    store = TimeSeriesStore()
+    manager = RollupManager(store)
+    now = time.time()
+    for server_name in ('gpu01', 'gpu02'):
+        for i in range(30):
+            timestamp = now - 600 + i * 10
+            store.append(server_name, 'cpu_percent', timestamp, 10.0 + i)
+            store.append(server_name, 'gpu_utilization', timestamp, 50.0)
+            for gpu in ('0', '1'):
+                store.append(server_name, 'gpu_utilization', timestamp, 40.0 + int(gpu) * 20, device=gpu)
+
+    scans = []
+    scan_auto = manager.scan_auto
+    manager.scan_auto = lambda *args, **kwargs: scans.append(args) or scan_auto(*args, **kwargs)
+
+    saved = analytics.ts_store, analytics.rollup_manager
+    analytics.ts_store, analytics.rollup_manager = store, manager
+    try:
+        report = get_batch_analysis(None, ['gpu01', 'gpu02'], hours=1)
+    finally:
+        analytics.ts_store, analytics.rollup_manager = saved
+    assert len(scans) == 1
+    gpu = report['servers']['gpu02']['gpu_analysis']
+    assert gpu['average'] == 50.0
+    assert [gpu['devices'][device]['average'] for device in ('0', '1')] == [40.0, 60.0]
+    assert report['servers']['gpu01']['cpu_analysis']['trend'] == 'increasing'
+    assert 'error' in report['servers']['gpu01']['disk_analysis']
+
+
+if __name__ == "__main__":
+    test_device_statistics_match_single_window()
+    test_batch_analysis_reads_all_series_once()
+    print("[OK] analytics tests passed")
@@ -0,0 +1,92 @@
+"""
+测试脚本 - LRU缓存的淘汰和字节预算
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cache import LRUCache, estimate_size
+
+
+def test_evicts_least_recently_used():
+    """超过容量时淘汰最久未使用的项，读取会刷新使用顺序"""
+    cache = LRUCache(capacity=3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key)
+    assert cache.get('a') == 'a'
+
+    cache.put('d', 'd')
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in ('a', 'c', 'd')] == ['a', 'c', 'd']
+    assert cache.evictions == 1
+
+
+def test_byte_budget():
+    """总字节数超过预算时从最久未使用的一端淘汰，直到满足预算"""
+    cache = LRUCache(capacity=100, max_bytes=100)
+    assert cache.put('a', 'x', size=40)
+    assert cache.put('b', 'x', size=40)
+    assert cache.put('c', 'x', size=40)
+    assert cache.get('a') is None
+    assert cache.bytes == 80
+
+    # 覆盖已有的键时按新大小重新计数
+    assert cache.put('b', 'y', size=10)
+    assert cache.bytes == 50
+
+    # 单个值超过预算时不缓存，并删除旧值
+    assert not cache.put('c', 'z', size=101)
+    assert cache.get('c') is None
+    assert cache.bytes == 10
+
+
+def test_estimated_size_and_invalidate():
+    """未指定大小时按JSON编码长度估算；按服务器失效时同步更新字节数"""
+    value = {'gpu': [1, 2, 3]}
+    cache = LRUCache(capacity=10, max_bytes=1000)
+    cache.put(('history', 'gpu01', 1), value)
+    cache.put(('history', 'gpu02', 1), value)
+    assert cache.bytes == 2 * estimate_size(value)
+
+    assert cache.invalidate_server('gpu01') == 1
+    assert cache.bytes == estimate_size(value)
+    assert cache.invalidate('history') == 1
+    assert cache.bytes == 0 and len(cache.cache) == 0
+
+
+def test_expired_entries():
+    """过期的项视为未命中并被删除"""
+    cache = LRUCache(capacity=10, ttl=-1)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert cache.expirations == 1 and cache.bytes == 0
+
+
+def test_get_or_load_single_flight():
+    """同一个键并发未命中时只加载一次"""
+    cache = LRUCache(capacity=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load('k', loader) for _ in range(10)))
+
+    assert asyncio.run(run()) == [42] * 10
+    assert len(calls) == 1
+    assert cache.coalesced == 9
+
+
+if __name__ == "__main__":
+    test_evicts_least_recently_used()
+    test_byte_budget()
+    test_estimated_size_and_invalidate()
+    test_expired_entries()
+    test_get_or_load_single_flight()
+    print("[OK] LRU cache tests passed")
@@ -0,0 +1,107 @@
+"""
+测试脚本 - WebSocket增量协议的字段级差异与补丁
+"""
+import copy
+import json
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from delta import diff, apply_patch, DeltaEncoder
+from broadcast import Frame
+
+
+OLD = {
+    'server_name': 'gpu01',
+    'timestamp': 1.0,
+    'gpu_info': [
+        {'index': 0, 'utilization': 10, 'memory_info': {'used': 100, 'total': 40000}},
+        {'index': 1, 'utilization': 20, 'memory_info': {'used': 200, 'total': 40000}},
+    ],
+    'system_resources': {'cpu_percent': 5.0, 'disk_info': [{'mount_point': '/'}]},
+    'error': None,
+}
+
+
+def _round_trip(old, new):
+    """差异经JSON传输（路径中的整数下标保持为整数）后应用到旧对象的副本"""
+    sets, unsets = diff(old, new)
+    payload = json.loads(json.dumps({'set': sets, 'unset': unsets}))
+    return sets, unsets, apply_patch(copy.deepcopy(old), payload['set'], payload['unset'])
+
+
+def test_diff_only_changed_fields():
+    """只有变化的叶子字段出现在补丁中"""
+    new = copy.deepcopy(OLD)
+    new['timestamp'] = 2.0
+    new['gpu_info'][1]['memory_info']['used'] = 250
+    sets, unsets, patched = _round_trip(OLD, new)
+    assert sets == [(['timestamp'], 2.0), (['gpu_info', 1, 'memory_info', 'used'], 250)]
+    assert unsets == []
+    assert patched == new
+
+
+def test_diff_added_and_removed_keys():
+    """新增的键整体设置，删除的键进入unset列表"""
+    new = copy.deepcopy(OLD)
+    del new['error']
+    new['system_resources']['load_average'] = [1.0, 0.5, 0.25]
+    sets, unsets, patched = _round_trip(OLD, new)
+    assert (['system_resources', 'load_average'], [1.0, 0.5, 0.25]) in sets
+    assert unsets == [['error']]
+    assert patched == new
+
+
+def test_diff_list_length_change_replaces_list():
+    """长度变化的列表整体替换"""
+    new = copy.deepcopy(OLD)
+    new['gpu_info'].pop()
+    sets, unsets, patched = _round_trip(OLD, new)
+    assert sets == [(['gpu_info'], new['gpu_info'])]
+    assert patched == new
+
+
+def test_diff_identical_and_root_replacement():
+    """相同对象没有差异；类型不同时替换根对象"""
+    assert diff(OLD, copy.deepcopy(OLD)) == ([], [])
+    sets, unsets = diff(OLD, [1, 2])
+    assert sets == [([], [1, 2])]
+    assert apply_patch(copy.deepcopy(OLD), sets, unsets) == [1, 2]
+
+
+def test_encoder_keyframes_and_deltas():
+    """编码器首帧和间隔到期时发送关键帧，请求重新同步后立即发送关键帧"""
+    encoder = DeltaEncoder(keyframe_interval=2)
+    frames = []
+    for seq in range(5):
+        data = copy.deepcopy(OLD)
+        data['timestamp'] = float(seq)
+        frames.append(Frame(seq, data))
+
+    types = [json.loads(encoder.encode(frame))['type'] for frame in frames[:4]]
+    assert types == ['keyframe', 'delta', 'delta', 'keyframe']
+
+    encoder.request_keyframe()
+    assert json.loads(encoder.encode(frames[4]))['type'] == 'keyframe'
+
+    # 客户端按增量帧重建的状态与服务端一致
+    state = None
+    replay = DeltaEncoder(keyframe_interval=10)
+    for frame in frames:
+        message = json.loads(replay.encode(frame))
+        if message['type'] == 'keyframe':
+            state = message['data']
+        else:
+            state = apply_patch(state, message['set'], message.get('unset', []))
+    assert state == frames[-1].data
+
+
+if __name__ == "__main__":
+    test_diff_only_changed_fields()
+    test_diff_added_and_removed_keys()
+    test_diff_list_length_change_replaces_list()
+    test_diff_identical_and_root_replacement()
+    test_encoder_keyframes_and_deltas()
+    print("[OK] delta tests passed")
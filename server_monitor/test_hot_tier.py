@@ -0,0 +1,92 @@
+"""
+测试脚本 - 内存热层（环形缓冲区回绕、覆盖起点、完整记录回落判断）
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hot_tier import HotTier, RecordRing, RingBuffer
+
+
+def test_ring_buffer_wraparound():
+    """写满后覆盖最旧的点，ordered/window 仍按时间升序返回"""
+    ring = RingBuffer(4, covered_from=0.0)
+    for second in range(1, 7):
+        assert ring.append(float(second), second * 10.0)
+    assert ring.size == 4 and ring.next == 2
+    timestamps, values = ring.ordered()
+    assert timestamps.tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert values.tolist() == [30.0, 40.0, 50.0, 60.0]
+    assert ring.last_timestamp() == 6.0
+
+    # 窗口跨越数组末尾
+    timestamps, values = ring.window(4.0, 5.5)
+    assert timestamps.tolist() == [4.0, 5.0] and values.tolist() == [40.0, 50.0]
+    assert ring.window(None, None)[0].tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert len(ring.window(7.0, None)[0]) == 0
+
+    # 返回副本，之后的写入不影响已返回的结果
+    snapshot, _ = ring.window(None, None)
+    ring.append(7.0, 70.0)
+    assert snapshot.tolist() == [3.0, 4.0, 5.0, 6.0]
+
+
+def test_ring_buffer_covered_from():
+    """覆盖起点：未写满时不变，每覆盖一个点前移到剩余最旧的点；乱序点丢弃"""
+    ring = RingBuffer(3, covered_from=100.0)
+    for timestamp in (101.0, 102.0, 103.0):
+        ring.append(timestamp, 1.0)
+    assert ring.covered_from == 100.0
+
+    ring.append(104.0, 1.0)
+    assert ring.covered_from == 102.0
+    assert ring.ordered()[0][0] == ring.covered_from
+    for timestamp in (105.0, 106.0, 107.0):
+        ring.append(timestamp, 1.0)
+        assert ring.covered_from == ring.ordered()[0][0]
+
+    assert not ring.append(107.0, 2.0)
+    assert not ring.append(50.0, 2.0)
+    assert ring.ordered()[0].tolist() == [105.0, 106.0, 107.0]
+    assert ring.covered_from == 105.0
+
+
+def test_record_ring_covered_from():
+    """完整记录环：淘汰最旧的记录后覆盖起点前移"""
+    ring = RecordRing(2, covered_from=0.0)
+    for timestamp in (1.0, 2.0, 3.0):
+        ring.append(timestamp, {'timestamp': timestamp})
+    assert [timestamp for timestamp, _ in ring.records] == [2.0, 3.0]
+    assert ring.covered_from == 2.0
+
+
+def test_hot_tier_reads_and_fallback():
+    """查询起点早于覆盖起点时完整记录回落到数据库，序列覆盖起点随回绕前移"""
+    tier = HotTier()
+    tier.capacity, tier.records_capacity, tier.since = 3, 2, 1000.0
+    for second in range(5):
+        tier.append_sample('gpu01', {'timestamp': 1001.0 + second, 'system_resources': {'cpu_percent': float(second)}})
+
+    key = ('gpu01', 'cpu_percent', '')
+    assert tier.coverage(key) == 1003.0
+    assert tier.coverage(('gpu02', 'cpu_percent', '')) == 1000.0
+    assert tier.read(key, 1003.0, None) == ([1003.0, 1004.0, 1005.0], [2.0, 3.0, 4.0])
+
+    assert len(tier.recent_records('gpu01', start_time=1004.0)) == 2
+    assert tier.recent_records('gpu01', start_time=1002.0, limit=5) is None
+    assert tier.record_reads == {'memory': 1, 'disk': 1}
+
+    # 末尾连续超过阈值的一段从 1004 开始
+    assert tier.breach_start(key, 3.0, now=2000.0) == 1004.0
+    assert tier.breach_start(key, 5.0, now=2000.0) == 2000.0
+    assert tier.breach_start(key, 0.0, now=2000.0) == 1003.0
+
+
+if __name__ == "__main__":
+    test_ring_buffer_wraparound()
+    test_ring_buffer_covered_from()
+    test_record_ring_covered_from()
+    test_hot_tier_reads_and_fallback()
+    print("[OK] hot tier tests passed")
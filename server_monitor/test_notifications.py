@@ -0,0 +1,105 @@
+"""
+测试脚本 - 通知分发器（合并窗口、重试队列持久化、指数退避）
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from alerts import Alert, AlertSeverity, AlertType
+from notifications import NotificationDispatcher
+
+
+def _alert(index: int) -> Alert:
+    return Alert(id=f"cpu_gpu01_{index}", server_name='gpu01', alert_type=AlertType.CPU_USAGE,
+                 message=f"alert {index}", severity=AlertSeverity.HIGH, current_value=90.0,
+                 threshold_value=80.0, timestamp=datetime(2026, 10, 1, 12, 0, index))
+
+
+def _dispatcher(results, **kwargs):
+    """不连接真实邮件/Webhook的分发器：记录每次发送的 (渠道, 告警ID列表)，按 results 返回是否成功"""
+    outbox_path = os.path.join(tempfile.mkdtemp(), 'outbox.jsonl')
+    dispatcher = NotificationDispatcher(outbox_path=outbox_path, **kwargs)
+    deliveries = []
+
+    async def deliver(channel, payloads):
+        deliveries.append((channel, [payload['alert_id'] for payload in payloads]))
+        return results[channel]
+
+    dispatcher._enabled_channels = lambda: list(results)
+    dispatcher._deliver = deliver
+    return dispatcher, deliveries
+
+
+def test_coalesces_alerts_into_one_batch_per_channel():
+    """合并窗口内的告警每个渠道只发送一次；超过批次上限时拆分"""
+    dispatcher, deliveries = _dispatcher({'email': True, 'webhook': True}, coalesce_window=0.05, max_batch=4)
+
+    async def run():
+        await dispatcher.start()
+        for index in range(6):
+            dispatcher.submit(_alert(index))
+        await asyncio.sleep(0.2)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    ids = [f"cpu_gpu01_{index}" for index in range(6)]
+    assert sorted(deliveries) == sorted([('email', ids[:4]), ('webhook', ids[:4]),
+                                         ('email', ids[4:]), ('webhook', ids[4:])])
+    assert dispatcher.batches == 2
+
+
+def test_failed_batch_persisted_and_reloaded():
+    """发送失败的批次写入重试队列文件，重启后重新加载"""
+    dispatcher, deliveries = _dispatcher({'email': True, 'webhook': False}, coalesce_window=0.01,
+                                         retry_base_delay=60.0)
+
+    async def run():
+        await dispatcher.start()
+        dispatcher.submit(_alert(1))
+        await asyncio.sleep(0.1)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    with open(dispatcher.outbox_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry['channel'], entry['attempts']) for entry in entries] == [('webhook', 1)]
+    assert entries[0]['alerts'][0]['alert_id'] == 'cpu_gpu01_1'
+
+    restarted, _ = _dispatcher({'webhook': True}, retry_base_delay=60.0)
+    restarted.outbox_path = dispatcher.outbox_path
+    assert restarted._load_outbox() == entries
+
+
+def test_retry_backoff_and_give_up():
+    """重试间隔按指数增长并有上限；超过最大次数后放弃并从重试队列删除"""
+    dispatcher, deliveries = _dispatcher({'webhook': False}, retry_base_delay=5.0, retry_max_delay=30.0)
+    assert [dispatcher._backoff(attempts) for attempts in (1, 2, 3, 4, 5)] == [5.0, 10.0, 20.0, 30.0, 30.0]
+
+    dispatcher, deliveries = _dispatcher({'webhook': False}, coalesce_window=0.01, max_retries=3,
+                                         retry_base_delay=0.01, retry_max_delay=0.02)
+
+    async def run():
+        await dispatcher.start()
+        dispatcher.submit(_alert(1))
+        await asyncio.sleep(0.5)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    # 首次发送 + 两次重试
+    assert len(deliveries) == 3
+    assert dispatcher.failed == 1
+    assert dispatcher.stats()['outbox'] == 0
+    assert not os.path.exists(dispatcher.outbox_path)
+
+
+if __name__ == "__main__":
+    test_coalesces_alerts_into_one_batch_per_channel()
+    test_failed_batch_persisted_and_reloaded()
+    test_retry_backoff_and_give_up()
+    print("[OK] notification dispatcher tests passed")
@@ -0,0 +1,104 @@
+"""
+测试脚本 - 结构化指标查询（原始数据与汇总层级两条聚合路径）
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import query as query_module
+from db import create_database
+from query import MetricQuery, execute_query
+from rollup import RollupManager
+from tsdb import TimeSeriesStore
+
+HOUR = 3600
+BASE = 1_760_000_400.0  # 1h 对齐
+
+
+def _run(query: MetricQuery, store, manager):
+    """使用测试用的时序存储和汇总管理器执行查询"""
+    saved = query_module.ts_store, query_module.rollup_manager
+    query_module.ts_store, query_module.rollup_manager = store, manager
+    try:
+        return execute_query(query)
+    finally:
+        query_module.ts_store, query_module.rollup_manager = saved
+
+
+def _populate():
+    """两台服务器各一小时、每10秒一个点的数据，所有汇总桶已关闭并写入数据库"""
+    _, Session = create_database(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'monitoring.db')}")
+    store = TimeSeriesStore()
+    store.bind(Session)
+    manager = RollupManager(store)
+    for offset, server_name in enumerate(('gpu01', 'gpu02')):
+        for second in range(0, HOUR + 10, 10):
+            store.append(server_name, 'cpu_percent', BASE + second, float(second % 600) / 10 + offset)
+    store.flush()
+    manager.persist()
+    return store, manager
+
+
+def test_rollup_tier_selection():
+    """间隔是层级宽度的整数倍且聚合函数都可由汇总桶得到时使用最粗的层级"""
+    assert MetricQuery('cpu_percent', interval=300, aggregations=['avg', 'max']).rollup_tier() == '5m'
+    assert MetricQuery('cpu_percent', interval=7200, aggregations=['p95']).rollup_tier() == '1h'
+    assert MetricQuery('cpu_percent', interval=120).rollup_tier() == '1m'
+    assert MetricQuery('cpu_percent', interval=90).rollup_tier() is None
+    assert MetricQuery('cpu_percent', interval=300, aggregations=['p50']).rollup_tier() is None
+    assert MetricQuery('cpu_percent', interval=300, resolution='raw').rollup_tier() is None
+    assert MetricQuery('cpu_percent').rollup_tier() is None
+
+
+def test_raw_and_rollup_paths_agree():
+    """同一查询分别读取原始数据和汇总层级，精确聚合的结果相同"""
+    store, manager = _populate()
+    params = dict(metric='cpu_percent', start=BASE, end=BASE + HOUR - 1, interval=600,
+                  aggregations=['avg', 'min', 'max', 'sum', 'count'])
+    rollup = _run(MetricQuery(**params), store, manager)
+    raw = _run(MetricQuery(resolution='raw', **params), store, manager)
+
+    assert rollup['source'] == '5m' and raw['source'] == 'raw'
+    assert [(s['server'], s['device']) for s in rollup['series']] == [('gpu01', ''), ('gpu02', '')]
+    for rollup_series, raw_series in zip(rollup['series'], raw['series']):
+        assert rollup_series['timestamps'] == raw_series['timestamps'] == [BASE + i * 600 for i in range(6)]
+        for agg in ('avg', 'min', 'max', 'sum', 'count'):
+            assert rollup_series[agg] == pytest.approx(raw_series[agg])
+    assert raw['series'][0]['count'] == [60] * 6
+    assert raw['series'][1]['min'] == [1.0] * 6
+
+
+def test_group_by_merges_servers():
+    """不按服务器分组时所有服务器的点合并为一条序列"""
+    store, manager = _populate()
+    for resolution in ('auto', 'raw'):
+        result = _run(MetricQuery('cpu_percent', start=BASE, end=BASE + HOUR - 1, aggregations=['count', 'max'],
+                                  group_by=[], resolution=resolution), store, manager)
+        assert [(s['server'], s['count'], s['max']) for s in result['series']] == [('*', [720], [60.0])]
+
+
+def test_from_dict_validation():
+    """请求参数解析：逗号分隔的列表、hours 换算为时间范围、非法参数报错"""
+    query = MetricQuery.from_dict({'metric': 'gpu_utilization', 'servers': 'gpu01, gpu02', 'devices': '*',
+                                   'end': BASE, 'hours': 2, 'interval': '300', 'aggregations': 'avg,p95'})
+    assert query.servers == ['gpu01', 'gpu02'] and query.devices == ['*']
+    assert query.time_range() == (BASE - 2 * HOUR, BASE)
+    assert query.interval == 300 and query.aggregations == ['avg', 'p95']
+
+    for bad in ({}, {'metric': 'cpu_percent', 'aggregations': 'median'},
+                {'metric': 'cpu_percent', 'group_by': 'rack'}, {'metric': 'cpu_percent', 'resolution': 'fine'}):
+        with pytest.raises(ValueError):
+            MetricQuery.from_dict(bad)
+
+
+if __name__ == "__main__":
+    test_rollup_tier_selection()
+    test_raw_and_rollup_paths_agree()
+    test_group_by_merges_servers()
+    test_from_dict_validation()
+    print("[OK] metric query tests passed")
@@ -0,0 +1,145 @@
+"""
+测试脚本 - 数据保留策略（过期分区整表删除、基表旧数据按行删除与删除前归档）
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import RetentionConfig
+from sqlalchemy import func, inspect, select
+
+from db import (create_database, get_or_create_server, insert_metrics_records, metrics_partitions, chunk_partitions,
+                ServerMetrics)
+from retention import RetentionManager, day_start
+from tsdb import TimeSeriesStore
+
+DAY = 24 * 3600
+NOW = day_start(time.time()) + 12 * 3600
+OLD = NOW - 10 * DAY
+RECENT = NOW - 3600
+
+
+def _setup(bind_store: bool = True, archive: bool = False, legacy: bool = False):
+    """
+    临时数据库：一条过期和一条近期的完整记录，以及对应的两个数据块
+    legacy=True 时完整记录写入基表（启用分区之前的旧数据）
+    """
+    tmp = tempfile.mkdtemp()
+    archive_dir = os.path.join(tmp, 'archive') if archive else ''
+    engine, Session = create_database(f"sqlite:///{os.path.join(tmp, 'monitoring.db')}")
+
+    session = Session()
+    server_id = get_or_create_server(session, 'gpu01').id
+    records = [{'server_id': server_id, 'timestamp': datetime.fromtimestamp(epoch), 'cpu_percent': 1.0}
+               for epoch in (OLD, RECENT)]
+    if legacy:
+        session.bulk_insert_mappings(ServerMetrics, records)
+    else:
+        insert_metrics_records(session, records)
+    session.commit()
+    session.close()
+
+    store = TimeSeriesStore()
+    store.bind(Session)
+    for epoch in (OLD, RECENT):
+        for offset in range(3):
+            store.append('gpu01', 'cpu_percent', epoch + offset, float(offset))
+        store.flush()
+    if not bind_store:
+        store = TimeSeriesStore()
+
+    manager = RetentionManager()
+    manager.configure(RetentionConfig(enabled=True, raw_days=2, series_days=2, rollup_days={},
+                                      batch_pause=0.0, archive_dir=archive_dir))
+    manager.bind(engine, Session, store)
+    return archive_dir, Session, manager
+
+
+def _counts(Session):
+    """各表（基表和所有分区）的总行数：(server_metrics, metric_chunks)"""
+    session = Session()
+    try:
+        return tuple(sum(session.execute(select(func.count()).select_from(table)).scalar()
+                         for table in partitions.tables(session.connection()))
+                     for partitions in (metrics_partitions, chunk_partitions))
+    finally:
+        session.close()
+
+
+def _partition_names(Session):
+    session = Session()
+    try:
+        return sorted(name for name in inspect(session.connection()).get_table_names() if '_p' in name)
+    finally:
+        session.close()
+
+
+def test_expire_deletes_only_expired_days():
+    """未配置归档时直接删除过期的整天数据，近期数据保留"""
+    _, Session, manager = _setup()
+    old_day = datetime.fromtimestamp(OLD).strftime('%Y%m%d')
+    recent_day = datetime.fromtimestamp(RECENT).strftime('%Y%m%d')
+    assert f'server_metrics_p{old_day}' in _partition_names(Session)
+
+    result = manager.run_once(NOW)
+    assert result['deleted'] == {'server_metrics': 1, 'series': 1}
+    assert _counts(Session) == (1, 1)
+    # 过期的分区整表删除
+    assert _partition_names(Session) == [f'metric_chunks_p{recent_day}', f'server_metrics_p{recent_day}']
+
+
+def test_expire_legacy_rows():
+    """启用分区之前写入基表的旧数据按行删除"""
+    _, Session, manager = _setup(legacy=True)
+    result = manager.run_once(NOW)
+    assert result['deleted'] == {'server_metrics': 1, 'series': 1}
+    assert _counts(Session) == (1, 1)
+
+
+def test_archive_failure_keeps_data():
+    """时序存储未绑定数据库时归档失败，过期数据不删除"""
+    pytest.importorskip('pyarrow')
+    _, Session, manager = _setup(bind_store=False, archive=True)
+
+    result = manager.run_once(NOW)
+    assert 'series' not in result['deleted']
+    assert any('series' in error and 'not bound' in error for error in result['errors'])
+    # server_metrics 不依赖时序存储，归档后照常删除
+    assert result['deleted'].get('server_metrics') == 1
+    assert _counts(Session) == (1, 2)
+
+
+def test_archive_then_expire():
+    """过期数据先按天归档再删除，归档包含被删除的记录和数据点"""
+    pytest.importorskip('pyarrow')
+    archive_dir, Session, manager = _setup(archive=True)
+
+    result = manager.run_once(NOW)
+    label = datetime.fromtimestamp(OLD).strftime('%Y-%m-%d')
+    assert sorted(result['archived_days']) == [f'series/{label}', f'server_metrics/{label}']
+    assert result['deleted'] == {'server_metrics': 1, 'series': 1}
+    assert _counts(Session) == (1, 1)
+
+    for name, rows in (('server_metrics', 1), ('series', 3)):
+        with open(os.path.join(archive_dir, name, f'day={label}', 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert manifest['datasets'][name]['rows'] == rows
+
+    # 已归档的日期不会重复导出
+    assert manager.run_once(NOW)['archived_days'] == []
+
+
+if __name__ == "__main__":
+    test_expire_deletes_only_expired_days()
+    test_expire_legacy_rows()
+    test_archive_failure_keeps_data()
+    test_archive_then_expire()
+    print("[OK] retention tests passed")
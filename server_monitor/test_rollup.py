@@ -0,0 +1,96 @@
+"""
+测试脚本 - 汇总层级（分桶、层级选择和降采样）
+"""
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import create_database
+from rollup import RollupManager, TIER_SECONDS, downsample, grid_step
+from tsdb import TimeSeriesStore
+
+HOUR = 3600
+BASE = 1_760_000_400.0  # 1h 对齐
+
+
+def _manager():
+    """绑定临时数据库的时序存储和汇总管理器（关闭的桶写入数据库后才能查询）"""
+    _, Session = create_database(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'monitoring.db')}")
+    store = TimeSeriesStore()
+    store.bind(Session)
+    return store, RollupManager(store)
+
+
+def test_buckets_and_cascade():
+    """原始点按 1m 分桶，关闭的桶级联到 5m 层级"""
+    store, manager = _manager()
+    for second in range(0, 600, 10):
+        store.append('gpu01', 'cpu_percent', BASE + second, float(second // 60))
+    # 下一分钟的点关闭最后一个 1m 桶
+    store.append('gpu01', 'cpu_percent', BASE + 600, 10.0)
+    manager.persist()
+
+    minute = manager.query('gpu01', 'cpu_percent', '1m', BASE, BASE + 600)
+    assert minute['timestamps'][:3] == [BASE, BASE + 60, BASE + 120]
+    assert minute['count'][0] == 6
+    assert minute['avg'][:3] == [0.0, 1.0, 2.0]
+
+    five = manager.query('gpu01', 'cpu_percent', '5m', BASE, BASE + 600)
+    assert five['timestamps'] == [BASE, BASE + 300]
+    assert five['count'] == [30, 30]
+    assert five['min'] == [0.0, 5.0] and five['max'] == [4.0, 9.0]
+    assert five['avg'] == [2.0, 7.0]
+
+
+def test_select_tier_fits_max_points():
+    """选择桶数不超过期望点数的最细层级，不会返回数倍于期望的点数"""
+    select = RollupManager.select_tier
+    assert select(0, HOUR, 500) is None
+    assert select(0, 24 * HOUR, 500) == '5m'
+    assert select(0, 24 * HOUR, 1440) == '1m'
+    assert select(0, 7 * 24 * HOUR, 500) == '1h'
+    assert select(0, 365 * 24 * HOUR, 500) == '1h'
+    for hours in (12, 24, 24 * 3, 24 * 7, 24 * 20):
+        tier = select(0, hours * HOUR, 500)
+        assert hours * HOUR / TIER_SECONDS[tier] <= 500
+
+
+def test_query_auto_covers_whole_range():
+    """原始数据超过期望点数时按时间网格合并，结果覆盖整个时间范围"""
+    store, manager = _manager()
+    for second in range(HOUR):
+        store.append('gpu01', 'cpu_percent', BASE + second, float(second))
+
+    result = manager.query_auto('gpu01', 'cpu_percent', BASE, BASE + HOUR, max_points=100)
+    assert result['tier'] == 'raw'
+    assert len(result['timestamps']) <= 100
+    assert result['timestamps'][0] <= BASE + 60
+    assert result['timestamps'][-1] >= BASE + HOUR - 60
+    assert sum(result['count']) == HOUR
+    assert result['min'][0] == 0.0 and result['max'][-1] == HOUR - 1
+
+
+def test_downsample_grid_alignment():
+    """同一步长下不同序列落在相同的网格时间戳上，平均值按点数加权"""
+    step = grid_step(0, 1000, 10)
+    assert step == 125
+    series = {'tier': '1m', 'timestamps': [0, 60, 120, 130], 'values': [1.0, 3.0, 5.0, 10.0],
+              'count': [1, 3, 2, 2], 'min': [1.0, 2.0, 4.0, 9.0], 'max': [1.0, 4.0, 6.0, 11.0],
+              'p95': [1.0, 4.0, None, 11.0]}
+    merged = downsample(series, step)
+    assert merged['timestamps'] == [0, 125]
+    assert merged['count'] == [6, 2]
+    assert merged['values'] == [(1.0 + 9.0 + 10.0) / 6, 10.0]
+    assert merged['min'] == [1.0, 9.0] and merged['max'] == [6.0, 11.0]
+    assert merged['p95'] == [4.0, 11.0]
+
+
+if __name__ == "__main__":
+    test_buckets_and_cascade()
+    test_select_tier_fits_max_points()
+    test_query_auto_covers_whole_range()
+    test_downsample_grid_alignment()
+    print("[OK] rollup tests passed")
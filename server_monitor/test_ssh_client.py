@@ -0,0 +1,149 @@
+"""
+测试脚本 - SSH连接熔断器、单次连接和通道计数
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import ServerConfig
+from ssh_client import CircuitBreaker, SSHClient, SSHConnectionPool
+
+
+class _FakeConnection:
+    def is_closed(self):
+        return False
+
+
+def _client():
+    return SSHClient(ServerConfig(name='test', host='127.0.0.1', port=22, username='test', password='x'))
+
+
+def _expire_cooldown(breaker: CircuitBreaker):
+    """模拟冷却时间已过"""
+    breaker.opened_at -= breaker.cooldown
+
+
+def test_breaker_opens_after_threshold():
+    """连续失败达到阈值后断开，断开期间拒绝请求"""
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert 0 < breaker.retry_in() <= 30
+
+
+def test_breaker_half_open_allows_single_trial():
+    """冷却后进入半开状态，只放行一次试探；试探成功后恢复"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    _expire_cooldown(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_failed_trial_doubles_cooldown():
+    """半开试探失败后再次断开，冷却时间加倍且不超过上限"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, max_reset_timeout=100)
+    breaker.record_failure()
+    assert breaker.cooldown == 30
+
+    for expected in (60, 100, 100):
+        _expire_cooldown(breaker)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.cooldown == expected
+
+
+def test_concurrent_ensure_connection_single_attempt():
+    """并发的 ensure_connection 只发起一次连接，失败后等待者不再串行重试"""
+    client = _client()
+    calls = []
+
+    async def failing_connect():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        client._record_connection_failure("refused")
+        return False
+
+    client._connect = failing_connect
+
+    async def run():
+        return await asyncio.gather(*(client.ensure_connection() for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert results == [False] * 20
+    assert len(calls) == 1
+
+
+def test_startup_shares_connect_attempt():
+    """启动连接与同时到达的命令共享同一次连接尝试"""
+    client = _client()
+    calls = []
+
+    async def connect():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        client.connection = _FakeConnection()
+        return True
+
+    client._connect = connect
+    pool = SSHConnectionPool()
+    pool.connections['test'] = client
+
+    async def run():
+        try:
+            return await asyncio.gather(pool.initialize_connections([client.server_config]),
+                                        client.ensure_connection())
+        finally:
+            pool.cleanup_task.cancel()
+
+    assert asyncio.run(run())[1] is True
+    assert len(calls) == 1
+
+
+def test_cancelled_wait_releases_counters():
+    """等待通道时被取消：waiting 计数恢复，不占用通道名额"""
+    client = _client()
+    client.connection = _FakeConnection()
+
+    async def run():
+        for _ in range(client.pool_config.max_channels):
+            await client._acquire_channel()
+        task = asyncio.create_task(client._run('true'))
+        await asyncio.sleep(0.01)
+        assert client.waiting == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert client.waiting == 0
+        for _ in range(client.pool_config.max_channels):
+            client._release_channel()
+
+    asyncio.run(run())
+    assert client.in_flight == 0
+    assert not client._channels.locked()
+
+
+if __name__ == "__main__":
+    test_breaker_opens_after_threshold()
+    test_breaker_half_open_allows_single_trial()
+    test_breaker_failed_trial_doubles_cooldown()
+    test_concurrent_ensure_connection_single_attempt()
+    test_startup_shares_connect_attempt()
+    test_cancelled_wait_releases_counters()
+    print("[OK] SSH client tests passed")
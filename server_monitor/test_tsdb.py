@@ -0,0 +1,86 @@
+"""
+测试脚本 - 时序存储（数据块编解码、采集样本的序列提取）
+"""
+import math
+import os
+import random
+import struct
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tsdb import encode_chunk, decode_chunk, encode_timestamps, decode_timestamps, extract_sample_metrics, TimeSeriesStore
+
+
+def _bits(values):
+    """按IEEE754位比较浮点数（NaN、-0.0 也必须原样还原）"""
+    return [struct.pack('>d', value) for value in values]
+
+
+def test_chunk_round_trip():
+    """规则间隔、抖动间隔和各种浮点值编码后能原样解码"""
+    rng = random.Random(42)
+    base = 1_760_000_000_000
+    timestamps = [base]
+    for _ in range(499):
+        timestamps.append(timestamps[-1] + rng.choice([1000, 1000, 1000, 998, 1003, 5000, 1]))
+    values = [round(rng.uniform(0, 100), 2) for _ in range(490)]
+    values += [0.0, -0.0, 1e300, -1e-300, math.inf, -math.inf, math.nan, 42.0, 42.0, 42.0]
+
+    decoded_timestamps, decoded_values = decode_chunk(encode_chunk(timestamps, values))
+    assert decoded_timestamps == timestamps
+    assert _bits(decoded_values) == _bits(values)
+
+
+def test_chunk_compresses_regular_series():
+    """固定间隔、少量变化的序列每个点远小于16字节"""
+    timestamps = [1_760_000_000_000 + i * 1000 for i in range(1000)]
+    values = [50.0 + (i % 3) for i in range(1000)]
+    data = encode_chunk(timestamps, values)
+    assert len(data) < 1000 * 4
+    assert decode_chunk(data) == (timestamps, values)
+
+
+def test_single_point_chunk():
+    """只有一个点的数据块"""
+    assert decode_chunk(encode_chunk([1_760_000_000_123], [3.5])) == ([1_760_000_000_123], [3.5])
+
+
+def test_timestamps_round_trip():
+    """时间戳单独编码时返回解码结束的位置"""
+    timestamps = [0, 1, 3, 2, 1_760_000_000_000, 1_760_000_000_000]
+    data = encode_timestamps(timestamps)
+    decoded, pos = decode_timestamps(data, len(timestamps))
+    assert decoded == timestamps
+    assert pos == len(data)
+
+
+def test_duplicate_sensor_names_get_separate_series():
+    """同名传感器和挂载点各自一个序列，同一时间戳的值都不会被丢弃"""
+    sample = {
+        'timestamp': 1_760_000_000.0,
+        'system_resources': {
+            'hardware_temp_info': [{'sensor_name': 'Core 0', 'temperature': 90.0},
+                                   {'sensor_name': 'Core 0', 'temperature': 50.0}],
+            'disk_info': [{'mount_point': '/data', 'percent': 10.0}, {'mount_point': '/data', 'percent': 20.0}],
+        }
+    }
+    points = extract_sample_metrics(sample)
+    assert ('temperature', 'Core 0', 90.0) in points
+    assert ('temperature', 'Core 0#2', 50.0) in points
+    assert ('disk_percent', '/data#2', 20.0) in points
+
+    store = TimeSeriesStore()
+    store.append_sample('gpu01', sample)
+    assert store.query('gpu01', 'temperature', device='Core 0')[1] == [90.0]
+    assert store.query('gpu01', 'temperature', device='Core 0#2')[1] == [50.0]
+
+
+if __name__ == "__main__":
+    test_chunk_round_trip()
+    test_chunk_compresses_regular_series()
+    test_single_point_chunk()
+    test_timestamps_round_trip()
+    test_duplicate_sensor_names_get_separate_series()
+    print("[OK] tsdb tests passed")
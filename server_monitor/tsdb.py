@@ -0,0 +1,654 @@
+"""
+时序存储引擎
+
+按 (服务器, 指标, 设备) 组织列式数据块：
+- 时间戳列使用 delta-of-delta + zigzag varint 编码
+- 数值列使用 Gorilla 风格的 XOR 编码（按字节对齐）
+- 最新数据保存在内存中的头部块，写满或超时后压缩落盘（按数据块结束时间写入按天分区的 metric_chunks 表）
+
+查询只读取请求的序列和时间窗口内的数据块，不需要解码 JSON 列；
+挂接内存热层（hot_tier.py）后，热层覆盖范围内的部分直接从内存读取。
+"""
+import struct
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import select
+
+from db import MetricSeries, get_or_create_server, insert_metric_chunks, select_metric_chunks
+from parsers import unique_devices, DISK_DEVICE_FIELDS, SENSOR_DEVICE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# 每个数据块最多保存的点数
+CHUNK_MAX_POINTS = 120
+# 头部块最长在内存中保留的时间（秒），超过后即使未写满也落盘
+CHUNK_MAX_AGE = 600
+
+TimeValue = Union[datetime, float, int, None]
+
+
+# ---------------------------------------------------------------------------
+# 编码工具
+# ---------------------------------------------------------------------------
+
+def _zigzag(n: int) -> int:
+    return (n << 1) if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def _write_varint(buf: bytearray, n: int):
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_timestamps(timestamps_ms: List[int]) -> bytes:
+    """使用 delta-of-delta 编码毫秒时间戳列"""
+    buf = bytearray()
+    prev = 0
+    prev_delta = 0
+    for i, ts in enumerate(timestamps_ms):
+        if i == 0:
+            _write_varint(buf, _zigzag(ts))
+        else:
+            delta = ts - prev
+            _write_varint(buf, _zigzag(delta - prev_delta))
+            prev_delta = delta
+        prev = ts
+    return bytes(buf)
+
+
+def decode_timestamps(data: bytes, count: int) -> Tuple[List[int], int]:
+    """解码时间戳列，返回 (时间戳列表, 结束位置)"""
+    timestamps = []
+    pos = 0
+    prev = 0
+    prev_delta = 0
+    for i in range(count):
+        raw, pos = _read_varint(data, pos)
+        if i == 0:
+            prev = _unzigzag(raw)
+        else:
+            prev_delta += _unzigzag(raw)
+            prev += prev_delta
+        timestamps.append(prev)
+    return timestamps, pos
+
+
+def encode_values(values: List[float]) -> bytes:
+    """
+    使用 XOR 编码浮点数值列
+    与前一个值相同时只写一个0字节；否则写控制字节(前导零字节数、尾随零字节数)和有效字节
+    """
+    buf = bytearray()
+    prev_bits = 0
+    for i, value in enumerate(values):
+        bits = struct.unpack('>Q', struct.pack('>d', value))[0]
+        if i == 0:
+            buf += struct.pack('>Q', bits)
+        else:
+            xor = bits ^ prev_bits
+            if xor == 0:
+                buf.append(0)
+            else:
+                raw = xor.to_bytes(8, 'big')
+                leading = len(raw) - len(raw.lstrip(b'\x00'))
+                trailing = len(raw) - len(raw.rstrip(b'\x00'))
+                buf.append(0x80 | (leading << 3) | trailing)
+                buf += raw[leading:8 - trailing]
+        prev_bits = bits
+    return bytes(buf)
+
+
+def decode_values(data: bytes, count: int, pos: int = 0) -> List[float]:
+    """解码 XOR 编码的数值列"""
+    values = []
+    prev_bits = 0
+    for i in range(count):
+        if i == 0:
+            prev_bits = struct.unpack_from('>Q', data, pos)[0]
+            pos += 8
+        else:
+            control = data[pos]
+            pos += 1
+            if control:
+                leading = (control >> 3) & 0x07
+                trailing = control & 0x07
+                size = 8 - leading - trailing
+                xor = int.from_bytes(data[pos:pos + size], 'big') << (trailing * 8)
+                pos += size
+                prev_bits ^= xor
+        values.append(struct.unpack('>d', struct.pack('>Q', prev_bits))[0])
+    return values
+
+
+def encode_chunk(timestamps_ms: List[int], values: List[float]) -> bytes:
+    """编码一个数据块：时间戳列 + 数值列"""
+    ts_bytes = encode_timestamps(timestamps_ms)
+    buf = bytearray()
+    _write_varint(buf, len(timestamps_ms))
+    _write_varint(buf, len(ts_bytes))
+    buf += ts_bytes
+    buf += encode_values(values)
+    return bytes(buf)
+
+
+def decode_chunk(data: bytes) -> Tuple[List[int], List[float]]:
+    """解码一个数据块，返回 (毫秒时间戳列表, 数值列表)"""
+    count, pos = _read_varint(data, 0)
+    ts_len, pos = _read_varint(data, pos)
+    timestamps, _ = decode_timestamps(data[pos:pos + ts_len], count)
+    values = decode_values(data, count, pos + ts_len)
+    return timestamps, values
+
+
+def to_epoch(value: TimeValue) -> Optional[float]:
+    """将 datetime 或数值统一转换为Unix时间戳（秒）"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+# ---------------------------------------------------------------------------
+# 采样指标提取
+# ---------------------------------------------------------------------------
+
+# 远程采样代理覆盖的序列；代理在线并写入采样时，轮询结果中的这些指标不再写入（每个序列只有一个来源）
+AGENT_SERIES = frozenset({
+    'cpu_percent', 'memory_used', 'memory_total', 'memory_percent',
+    'gpu_utilization', 'gpu_memory_used', 'gpu_memory_total', 'gpu_temperature'
+})
+
+
+def extract_sample_metrics(metrics_data: Dict) -> List[Tuple[str, str, float]]:
+    """
+    从 collect_all 的结果中提取主机级和设备级指标
+    主机级指标的设备为空字符串；设备级指标按GPU序号、挂载点、网卡名、传感器（适配器/名称）区分
+    结果中 agent_series 为真时跳过 AGENT_SERIES（由代理采样写入）
+    返回: [(指标名, 设备, 数值), ...]
+    """
+    points = []
+    system_resources = metrics_data.get('system_resources') or {}
+    excluded = AGENT_SERIES if metrics_data.get('agent_series') else ()
+
+    def add(metric, value, device=''):
+        if value is None or metric in excluded:
+            return
+        try:
+            points.append((metric, device, float(value)))
+        except (TypeError, ValueError):
+            pass
+
+    add('cpu_percent', system_resources.get('cpu_percent'))
+
+    memory_used = system_resources.get('memory_used')
+    memory_total = system_resources.get('memory_total')
+    add('memory_used', memory_used)
+    add('memory_total', memory_total)
+    if memory_used is not None and memory_total:
+        add('memory_percent', memory_used / memory_total * 100)
+
+    gpu_info_list = metrics_data.get('gpu_info') or []
+    for position, gpu_info in enumerate(gpu_info_list):
+        memory_info = gpu_info.get('memory_info') or {}
+        gpu_values = (
+            ('gpu_utilization', gpu_info.get('utilization')),
+            ('gpu_memory_used', memory_info.get('used')),
+            ('gpu_memory_total', memory_info.get('total')),
+            ('gpu_temperature', gpu_info.get('temperature')),
+        )
+        # 每个GPU一条序列，设备为GPU序号
+        device = str(gpu_info.get('index', position))
+        for metric, value in gpu_values:
+            add(metric, value, device)
+        # 与 server_metrics 表保持一致，主机级GPU指标取第一个GPU
+        if position == 0:
+            for metric, value in gpu_values:
+                add(metric, value)
+
+    # 每个挂载点一条序列，主机级为所有分区的平均使用率
+    disk_percents = []
+    # 设备键与告警一致，同名的挂载点/传感器各自唯一（否则同一时间戳的第二个值会被当作乱序点丢弃）
+    disks = system_resources.get('disk_info') or []
+    for disk, device in zip(disks, unique_devices(disks, DISK_DEVICE_FIELDS)):
+        if disk.get('percent') is None:
+            continue
+        disk_percents.append(disk['percent'])
+        add('disk_percent', disk['percent'], device)
+    if disk_percents:
+        add('disk_percent', sum(disk_percents) / len(disk_percents))
+
+    # 每个网卡的累计收发字节数
+    for network in system_resources.get('network_info') or []:
+        interface = network.get('interface')
+        if interface:
+            add('network_receive_bytes', network.get('receive_bytes'), interface)
+            add('network_transmit_bytes', network.get('transmit_bytes'), interface)
+
+    # 每个传感器一条序列，主机级为所有传感器的平均温度
+    temps = []
+    sensors = system_resources.get('hardware_temp_info') or []
+    for sensor, device in zip(sensors, unique_devices(sensors, SENSOR_DEVICE_FIELDS)):
+        if sensor.get('temperature') is None:
+            continue
+        temps.append(sensor['temperature'])
+        add('temperature', sensor['temperature'], device)
+    if temps:
+        add('temperature', sum(temps) / len(temps))
+
+    return points
+
+
+# ---------------------------------------------------------------------------
+# 存储引擎
+# ---------------------------------------------------------------------------
+
+class HeadChunk:
+    """内存中尚未落盘的头部块"""
+    __slots__ = ('timestamps', 'values', 'created_at')
+
+    def __init__(self):
+        self.timestamps: List[int] = []
+        self.values: List[float] = []
+        self.created_at = time.time()
+
+
+class TimeSeriesStore:
+    """
+    列式时序存储
+    每条序列由 (服务器名, 指标名, 设备) 唯一确定
+    """
+    def __init__(self, chunk_max_points: int = CHUNK_MAX_POINTS, chunk_max_age: float = CHUNK_MAX_AGE):
+        self.chunk_max_points = chunk_max_points
+        self.chunk_max_age = chunk_max_age
+        self.session_factory = None
+        self._heads: Dict[Tuple[str, str, str], HeadChunk] = {}
+        self._series_ids: Dict[Tuple[str, str, str], int] = {}
+        self._observers: List[Callable[[Tuple[str, str, str], float, float], None]] = []
+        self._lock = threading.RLock()
+        # 最近数据的内存热层（见 hot_tier.py），覆盖范围内的查询不访问数据库
+        self.hot_tier = None
+
+    def bind(self, session_factory):
+        """绑定数据库会话工厂"""
+        self.session_factory = session_factory
+
+    def attach_hot_tier(self, hot_tier):
+        """挂接内存热层：查询时覆盖起点之后的部分从内存读取，只有更早的部分读取数据块"""
+        self.hot_tier = hot_tier
+
+    def _hot_coverage(self, key: Tuple[str, str, str]) -> Optional[int]:
+        """序列在内存热层中的覆盖起点（毫秒），未挂接热层时返回 None"""
+        if self.hot_tier is None:
+            return None
+        covered_from = self.hot_tier.coverage(key)
+        return int(round(covered_from * 1000)) if covered_from is not None else None
+
+    def add_observer(self, callback: Callable[[Tuple[str, str, str], float, float], None]):
+        """注册数据点观察者，每个新数据点会以 (序列键, 时间戳秒, 数值) 回调"""
+        self._observers.append(callback)
+
+    def append(self, server_name: str, metric: str, timestamp: TimeValue, value: float, device: str = ''):
+        """追加一个数据点"""
+        key = (server_name, metric, device)
+        ts_ms = int(round(to_epoch(timestamp) * 1000))
+        with self._lock:
+            head = self._heads.get(key)
+            if head is None:
+                head = self._heads[key] = HeadChunk()
+            elif head.timestamps and ts_ms <= head.timestamps[-1]:
+                # 时间戳必须单调递增，乱序点直接丢弃
+                return
+            head.timestamps.append(ts_ms)
+            head.values.append(float(value))
+
+            for callback in self._observers:
+                try:
+                    callback(key, ts_ms / 1000.0, float(value))
+                except Exception as e:
+                    logger.error(f"Error in time series observer: {e}")
+
+            if (len(head.timestamps) >= self.chunk_max_points
+                    or time.time() - head.created_at >= self.chunk_max_age):
+                self._flush_key(key)
+
+    def append_sample(self, server_name: str, metrics_data: Dict):
+        """追加一次完整采集结果中的所有主机级指标"""
+        timestamp = metrics_data.get('timestamp', time.time())
+        for metric, device, value in extract_sample_metrics(metrics_data):
+            self.append(server_name, metric, timestamp, value, device)
+
+    def get_series_id(self, session, key: Tuple[str, str, str], create: bool = True) -> Optional[int]:
+        """获取序列ID，供汇总等模块复用序列索引"""
+        return self._get_series_id(session, key, create)
+
+    def _get_series_id(self, session, key: Tuple[str, str, str], create: bool = True) -> Optional[int]:
+        """获取序列ID（带缓存）"""
+        series_id = self._series_ids.get(key)
+        if series_id is not None:
+            return series_id
+
+        server_name, metric, device = key
+        if create:
+            server = get_or_create_server(session, server_name)
+        else:
+            from db import Server
+            server = session.query(Server).filter(Server.name == server_name).first()
+            if not server:
+                return None
+
+        series = session.query(MetricSeries).filter(
+            MetricSeries.server_id == server.id,
+            MetricSeries.metric == metric,
+            MetricSeries.device == device
+        ).first()
+        if not series:
+            if not create:
+                return None
+            series = MetricSeries(server_id=server.id, metric=metric, device=device)
+            session.add(series)
+            session.commit()
+
+        self._series_ids[key] = series.id
+        return series.id
+
+    def _flush_key(self, key: Tuple[str, str, str]):
+        """将一条序列的头部块压缩落盘（调用方需持有锁）"""
+        head = self._heads.pop(key, None)
+        if head is None or not head.timestamps:
+            return
+        if self.session_factory is None:
+            # 未绑定数据库时保留在内存中
+            self._heads[key] = head
+            return
+
+        session = self.session_factory()
+        try:
+            series_id = self._get_series_id(session, key)
+            insert_metric_chunks(session, [{
+                'series_id': series_id,
+                'start_time': head.timestamps[0] / 1000.0,
+                'end_time': head.timestamps[-1] / 1000.0,
+                'count': len(head.timestamps),
+                'data': encode_chunk(head.timestamps, head.values)
+            }])
+            session.commit()
+        except Exception as e:
+            logger.error(f"Error flushing time series chunk {key}: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def flush(self):
+        """将所有头部块落盘"""
+        with self._lock:
+            for key in list(self._heads.keys()):
+                self._flush_key(key)
+
+    def list_series(self, server_name: str) -> List[Dict[str, str]]:
+        """列出服务器的所有序列"""
+        with self._lock:
+            keys = {(m, d) for (s, m, d) in self._heads if s == server_name}
+        if self.session_factory is not None:
+            from db import Server
+            session = self.session_factory()
+            try:
+                rows = session.query(MetricSeries.metric, MetricSeries.device).join(
+                    Server, Server.id == MetricSeries.server_id
+                ).filter(Server.name == server_name).all()
+                keys.update((metric, device) for metric, device in rows)
+            finally:
+                session.close()
+        return [{'metric': metric, 'device': device} for metric, device in sorted(keys)]
+
+    def query(self, server_name: str, metric: str, start_time: TimeValue = None,
+              end_time: TimeValue = None, device: str = '') -> Tuple[List[float], List[float]]:
+        """
+        查询单条序列
+        返回: (时间戳列表（秒，升序）, 数值列表)
+        """
+        key = (server_name, metric, device)
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        start_ms = int(start * 1000) if start is not None else None
+        end_ms = int(end * 1000) if end is not None else None
+
+        hot_end = end_ms / 1000.0 if end_ms is not None else None
+
+        hot_ms = self._hot_coverage(key)
+        if hot_ms is not None and start_ms is not None and start_ms >= hot_ms:
+            # 窗口完全在内存热层的覆盖范围内，不访问数据库
+            self.hot_tier.count_read('memory')
+            return self.hot_tier.read(key, start_ms / 1000.0, hot_end)
+        # 覆盖起点之后的数据从热层读取，数据块只需读到覆盖起点为止
+        disk_end = end
+        if hot_ms is not None:
+            disk_end = min(end, hot_ms / 1000.0) if end is not None else hot_ms / 1000.0
+
+        timestamps: List[int] = []
+        values: List[float] = []
+
+        if self.session_factory is not None:
+            session = self.session_factory()
+            try:
+                series_id = self._get_series_id(session, key, create=False)
+                if series_id is not None:
+                    chunks = select_metric_chunks(session, [series_id], start, disk_end)
+                    for (data,) in session.execute(select(chunks.c.data).order_by(chunks.c.start_time.asc())):
+                        chunk_ts, chunk_values = decode_chunk(data)
+                        timestamps.extend(chunk_ts)
+                        values.extend(chunk_values)
+            finally:
+                session.close()
+
+        with self._lock:
+            head = self._heads.get(key)
+            if head is not None:
+                timestamps.extend(head.timestamps)
+                values.extend(head.values)
+
+        result_ts = []
+        result_values = []
+        for ts, value in zip(timestamps, values):
+            if start_ms is not None and ts < start_ms:
+                continue
+            if end_ms is not None and ts > end_ms:
+                continue
+            if hot_ms is not None and ts >= hot_ms:
+                continue
+            result_ts.append(ts / 1000.0)
+            result_values.append(value)
+
+        if hot_ms is not None:
+            hot_ts, hot_values = self.hot_tier.read(key, hot_ms / 1000.0, hot_end)
+            self.hot_tier.count_read('partial' if hot_ts else 'disk')
+            result_ts.extend(hot_ts)
+            result_values.extend(hot_values)
+        return result_ts, result_values
+
+    def match_series(self, metrics: List[str], servers: Optional[List[str]] = None,
+                     devices: Optional[List[str]] = None) -> Dict[Tuple[str, str, str], Optional[int]]:
+        """
+        一次查询匹配多条序列
+        :param servers: 服务器名列表，None 表示所有服务器
+        :param devices: 设备列表，None 表示主机级序列，['*'] 表示所有设备级序列
+        返回: {序列键: 序列ID（仅在内存中的序列为None）}
+        """
+        def accept(server_name, device):
+            if servers is not None and server_name not in servers:
+                return False
+            if devices is None:
+                return device == ''
+            if '*' in devices:
+                return device != ''
+            return device in devices
+
+        with self._lock:
+            matched = {key: self._series_ids.get(key) for key in self._heads
+                       if key[1] in metrics and accept(key[0], key[2])}
+
+        if self.session_factory is not None:
+            from db import Server
+            session = self.session_factory()
+            try:
+                rows = session.query(MetricSeries.id, Server.name, MetricSeries.metric, MetricSeries.device).join(
+                    Server, Server.id == MetricSeries.server_id
+                ).filter(MetricSeries.metric.in_(metrics))
+                if servers is not None:
+                    rows = rows.filter(Server.name.in_(servers))
+                if devices is None:
+                    rows = rows.filter(MetricSeries.device == '')
+                elif '*' in devices:
+                    rows = rows.filter(MetricSeries.device != '')
+                else:
+                    rows = rows.filter(MetricSeries.device.in_(devices))
+                for series_id, server_name, metric, device in rows:
+                    key = (server_name, metric, device)
+                    matched[key] = series_id
+                    self._series_ids.setdefault(key, series_id)
+            finally:
+                session.close()
+        return matched
+
+    def scan(self, series: Dict[Tuple[str, str, str], Optional[int]], start_time: TimeValue = None,
+             end_time: TimeValue = None) -> Dict[Tuple[str, str, str], Tuple[List[float], List[float]]]:
+        """
+        一次读取多条序列在时间窗口内的数据（所有落盘数据块通过单条SQL查询读取）
+        :param series: match_series 的返回值
+        返回: {序列键: (时间戳列表（秒，升序）, 数值列表)}
+        """
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        start_ms = int(start * 1000) if start is not None else None
+        end_ms = int(end * 1000) if end is not None else None
+        hot_end = end_ms / 1000.0 if end_ms is not None else None
+
+        # 窗口完全在内存热层覆盖范围内的序列直接从内存读取，其余序列的数据块读到各自的覆盖起点为止
+        coverage = {key: self._hot_coverage(key) for key in series}
+        result = {}
+        for key, hot_ms in coverage.items():
+            if hot_ms is not None and start_ms is not None and start_ms >= hot_ms:
+                self.hot_tier.count_read('memory')
+                result[key] = self.hot_tier.read(key, start_ms / 1000.0, hot_end)
+        disk_keys = [key for key in series if key not in result]
+        if not disk_keys:
+            return result
+
+        disk_end = end
+        if all(coverage[key] is not None for key in disk_keys):
+            latest = max(coverage[key] for key in disk_keys) / 1000.0
+            disk_end = min(end, latest) if end is not None else latest
+
+        raw: Dict[Tuple[str, str, str], Tuple[List[int], List[float]]] = {key: ([], []) for key in disk_keys}
+        keys_by_id = {series[key]: key for key in disk_keys if series[key] is not None}
+
+        if keys_by_id and self.session_factory is not None:
+            session = self.session_factory()
+            try:
+                chunks = select_metric_chunks(session, keys_by_id, start, disk_end)
+                for series_id, data in session.execute(select(chunks.c.series_id, chunks.c.data).order_by(
+                        chunks.c.series_id, chunks.c.start_time.asc())):
+                    chunk_ts, chunk_values = decode_chunk(data)
+                    timestamps, values = raw[keys_by_id[series_id]]
+                    timestamps.extend(chunk_ts)
+                    values.extend(chunk_values)
+            finally:
+                session.close()
+
+        with self._lock:
+            for key in disk_keys:
+                head = self._heads.get(key)
+                if head is not None:
+                    raw[key][0].extend(head.timestamps)
+                    raw[key][1].extend(head.values)
+
+        for key, (timestamps, values) in raw.items():
+            hot_ms = coverage[key]
+            result_ts = []
+            result_values = []
+            for ts, value in zip(timestamps, values):
+                if ((start_ms is None or ts >= start_ms) and (end_ms is None or ts <= end_ms)
+                        and (hot_ms is None or ts < hot_ms)):
+                    result_ts.append(ts / 1000.0)
+                    result_values.append(value)
+            if hot_ms is not None:
+                hot_ts, hot_values = self.hot_tier.read(key, hot_ms / 1000.0, hot_end)
+                self.hot_tier.count_read('partial' if hot_ts else 'disk')
+                result_ts.extend(hot_ts)
+                result_values.extend(hot_values)
+            result[key] = (result_ts, result_values)
+        return result
+
+    def iter_chunks(self, key: Tuple[str, str, str], series_id: Optional[int], start_time: TimeValue = None,
+                    end_time: TimeValue = None):
+        """
+        按时间顺序逐块产出一条序列的原始数据 (毫秒时间戳列表, 数值列表)，最后是内存中的头部块
+        数据块流式读取，不把整个时间窗口一次载入内存（供批量导出使用）；块内的点不按窗口过滤
+        """
+        start = to_epoch(start_time)
+        end = to_epoch(end_time)
+        if series_id is not None and self.session_factory is not None:
+            session = self.session_factory()
+            try:
+                chunks = select_metric_chunks(session, [series_id], start, end)
+                rows = session.execute(select(chunks.c.data).order_by(chunks.c.start_time.asc())
+                                       .execution_options(yield_per=100))
+                for (data,) in rows:
+                    yield decode_chunk(data)
+            finally:
+                session.close()
+
+        with self._lock:
+            head = self._heads.get(key)
+            head_data = (list(head.timestamps), list(head.values)) if head is not None else None
+        if head_data and head_data[0]:
+            yield head_data
+
+    def list_devices(self, server_name: str, metric: str) -> List[str]:
+        """列出服务器某个指标的所有设备（不含主机级序列）"""
+        return [series['device'] for series in self.list_series(server_name)
+                if series['metric'] == metric and series['device']]
+
+    def query_devices(self, server_name: str, metric: str, start_time: TimeValue = None,
+                      end_time: TimeValue = None) -> Dict[str, Dict[str, List[float]]]:
+        """查询某个指标所有设备的序列，返回 {设备: {'timestamps': [...], 'values': [...]}}"""
+        result = {}
+        for device in self.list_devices(server_name, metric):
+            timestamps, values = self.query(server_name, metric, start_time, end_time, device)
+            result[device] = {'timestamps': timestamps, 'values': values}
+        return result
+
+    def query_many(self, server_name: str, metrics: List[str], start_time: TimeValue = None,
+                   end_time: TimeValue = None, device: str = '') -> Dict[str, Dict[str, List[float]]]:
+        """查询多条序列，返回 {指标名: {'timestamps': [...], 'values': [...]}}"""
+        result = {}
+        for metric in metrics:
+            timestamps, values = self.query(server_name, metric, start_time, end_time, device)
+            result[metric] = {'timestamps': timestamps, 'values': values}
+        return result
+
+
+# 全局时序存储实例
+ts_store = TimeSeriesStore()